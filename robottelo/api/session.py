@@ -0,0 +1,185 @@
+"""Pooled keep-alive HTTP session shared by all NailGun requests.
+
+NailGun sends every request through the module level functions of
+``requests``, which open a new connection, and do a new TLS handshake, for
+each API call. :func:`install_session` makes ``nailgun.client`` use a
+:class:`NailgunSession` instead, which keeps connections alive in a pool,
+retries idempotent requests failing with connection errors or gateway
+errors, and records the latency of every endpoint.
+
+Usage::
+
+    from robottelo.api.session import API_METRICS, install_session
+
+    install_session(pool_size=20, max_retries=3, backoff_factor=0.5)
+    entities.Organization().search()
+    for endpoint, histogram in API_METRICS.items():
+        print(endpoint, histogram.summary())
+
+Cookies are never stored by the session: tests use NailGun server configs
+with different credentials, and a session cookie set for one user must not
+authenticate the requests of another.
+"""
+import os
+import re
+import threading
+import time
+
+import requests
+
+from nailgun import client
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from robottelo.metrics import LatencyRecorder
+from six.moves import http_cookiejar
+from six.moves.urllib.parse import urlparse
+
+#: Latencies of the API requests, recorded per endpoint
+API_METRICS = LatencyRecorder()
+
+#: Response statuses retried for idempotent requests
+RETRY_STATUSES = (502, 503, 504)
+
+# Path segments replaced by ":id" when naming endpoints
+_ID_SEGMENT = re.compile(
+    r'^(\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$',
+    re.IGNORECASE
+)
+
+
+def endpoint_name(method, url):
+    """Return the name under which a request latency is recorded.
+
+    Ids in the URL path are replaced by ``:id`` so every request to the same
+    endpoint is recorded together, e.g. ``GET /api/v2/hosts/:id``.
+    """
+    path = '/'.join(
+        ':id' if _ID_SEGMENT.match(segment) else segment
+        for segment in urlparse(url).path.split('/')
+    )
+    return u'{0} {1}'.format(method.upper(), path)
+
+
+class NailgunSession(requests.Session):
+    """Session keeping up to ``pool_size`` connections alive per host.
+
+    :param int pool_size: number of connections kept alive per host
+    :param int max_retries: number of retries of failed requests. Requests
+        failing to connect are always retried, other failures and
+        ``RETRY_STATUSES`` responses are only retried for idempotent
+        methods.
+    :param float backoff_factor: the retries wait ``backoff_factor * (2 **
+        (retry - 1))`` seconds
+    :param metrics: :class:`robottelo.metrics.LatencyRecorder` receiving the
+        latency of every request, ``None`` to not record latencies
+    """
+
+    def __init__(self, pool_size=10, max_retries=3, backoff_factor=0.5,
+                 metrics=API_METRICS):
+        super(NailgunSession, self).__init__()
+        self.metrics = metrics
+        self.cookies.set_policy(
+            http_cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=max_retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUSES,
+                raise_on_status=False,
+            ),
+        )
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        """Send a request and record its latency."""
+        if self.metrics is None:
+            return super(NailgunSession, self).request(
+                method, url, *args, **kwargs)
+        start = time.time()
+        error = True
+        try:
+            response = super(NailgunSession, self).request(
+                method, url, *args, **kwargs)
+            error = not response.ok
+            return response
+        finally:
+            self.metrics.record(
+                endpoint_name(method, url), time.time() - start, error=error)
+
+
+class _SessionRequests(object):
+    """Stand-in for the ``requests`` module in ``nailgun.client``.
+
+    It provides the request functions NailGun uses, sending them through a
+    :class:`NailgunSession`. A new session is created in forked processes,
+    pooled connections must not be shared between processes.
+
+    :param session_kwargs: arguments used to create the sessions
+    """
+
+    def __init__(self, **session_kwargs):
+        self.session_kwargs = session_kwargs
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The session of the current process."""
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                self._session = NailgunSession(**self.session_kwargs)
+                self._pid = os.getpid()
+            return self._session
+
+    def request(self, method, url, **kwargs):
+        """Send a ``method`` request."""
+        return self.session.request(method, url, **kwargs)
+
+    def head(self, url, **kwargs):
+        """Send a HEAD request."""
+        kwargs.setdefault('allow_redirects', False)
+        return self.session.request('HEAD', url, **kwargs)
+
+    def get(self, url, params=None, **kwargs):
+        """Send a GET request."""
+        kwargs.setdefault('allow_redirects', True)
+        return self.session.request('GET', url, params=params, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        """Send a POST request."""
+        return self.session.request(
+            'POST', url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        """Send a PUT request."""
+        return self.session.request('PUT', url, data=data, **kwargs)
+
+    def patch(self, url, data=None, **kwargs):
+        """Send a PATCH request."""
+        return self.session.request('PATCH', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        """Send a DELETE request."""
+        return self.session.request('DELETE', url, **kwargs)
+
+
+def install_session(pool_size=10, max_retries=3, backoff_factor=0.5):
+    """Make NailGun send all its requests through a :class:`NailgunSession`.
+
+    Installing again replaces the previous session. See
+    :class:`NailgunSession` for the parameters.
+    """
+    client.requests = _SessionRequests(
+        pool_size=pool_size,
+        max_retries=max_retries,
+        backoff_factor=backoff_factor,
+    )
+
+
+def uninstall_session():
+    """Make NailGun send its requests with the ``requests`` module again."""
+    client.requests = requests
@@ -1,12 +1,20 @@
 # -*- encoding: utf-8 -*-
 """Module containing convenience functions for working with the API."""
+import logging
+import os
+import six
+import threading
 import time
 
+from collections import OrderedDict
+from functools import partial
 from fauxfactory import gen_string
+from multiprocessing.pool import ThreadPool
 from inflector import Inflector
 from nailgun import entities, entity_mixins
 from robottelo import manifests
 from robottelo import ssh
+from robottelo.api.session import NailgunSession
 from robottelo.cli.proxy import Proxy
 from robottelo.config import settings
 from robottelo.constants import (
@@ -23,6 +31,127 @@ from robottelo.constants import (
     RHEL_7_MAJOR_VERSION,
 )
 from robottelo.decorators import bz_bug_is_open
+from robottelo.env_snapshot import EnvironmentSnapshot
+from robottelo.pipeline import Pipeline, PipelineError
+from requests.exceptions import HTTPError
+
+#: Maximum number of names combined in a single search query
+SEARCH_BATCH_SIZE = 50
+#: Page size of the batched searches, large enough to get all the results
+SEARCH_PER_PAGE = 10000
+#: Number of entities read at the same time
+READ_WORKERS = 10
+#: Number of entities read or updated at the same time by
+#: :func:`configure_provisioning`
+PROVISIONING_WORKERS = 6
+
+LOGGER = logging.getLogger(__name__)
+
+# HTTP session reused by the batched reads and the process it was created
+# in, see ``_get_read_session``
+_read_session = None
+_read_session_pid = None
+_read_session_lock = threading.Lock()
+# Permissions index built once per session, see ``get_permissions_index``
+_permissions_index = None
+
+
+def _get_read_session():
+    """Return the HTTP session used by :func:`read_entities`, keeping up to
+    ``READ_WORKERS`` connections alive. A new session is created in forked
+    processes, pooled connections must not be shared between processes.
+    """
+    global _read_session, _read_session_pid  # pylint:disable=global-statement
+    with _read_session_lock:
+        if _read_session is None or _read_session_pid != os.getpid():
+            _read_session = NailgunSession(pool_size=READ_WORKERS)
+            _read_session_pid = os.getpid()
+        return _read_session
+
+
+def search_by_names(entity_cls, names, field='name', query=None,
+                    **kwargs):
+    """Search the entities matching any of ``names`` with as few requests as
+    possible, combining up to ``SEARCH_BATCH_SIZE`` names in each search.
+
+    Usage::
+
+        classes = search_by_names(entities.PuppetClass, ['ntp', 'motd'])
+        ntp_classes = classes['ntp']
+
+    :param entity_cls: nailgun entity class to search
+    :param names: names to look for
+    :param str field: search field matched with the names
+    :param dict query: extra search query parameters, e.g. the organization
+    :param kwargs: fields of the searching entity, e.g. the ``product`` of the
+        repository sets
+    :return: an ordered dictionary mapping every name to the list of entities
+        found for it
+    """
+    results = OrderedDict((name, []) for name in names)
+    names = list(results)
+    for index in range(0, len(names), SEARCH_BATCH_SIZE):
+        search = ' or '.join(
+            u'{0} = "{1}"'.format(field, name.replace('"', '\\"'))
+            for name in names[index:index + SEARCH_BATCH_SIZE]
+        )
+        batch_query = dict(query or {})
+        if batch_query.get('search'):
+            search = u'({0}) and ({1})'.format(batch_query['search'], search)
+        batch_query.update({'search': search, 'per_page': SEARCH_PER_PAGE})
+        for entity in entity_cls(**kwargs).search(query=batch_query):
+            results.setdefault(getattr(entity, field), []).append(entity)
+    return results
+
+
+def read_entities(entity_list, workers=READ_WORKERS):
+    """Read the entities of ``entity_list`` concurrently.
+
+    The entities are fetched with ``workers`` threads sharing a keep-alive
+    HTTP session, then read from the fetched attributes.
+
+    :param entity_list: nailgun entities to read
+    :param int workers: number of entities read at the same time
+    :return: the list of read entities, in the same order
+    """
+    session = _get_read_session()
+
+    def read(entity):
+        """Fetch and read a single entity"""
+        response = session.get(
+            entity.path('self'),
+            **entity._server_config.get_client_kwargs()
+        )
+        response.raise_for_status()
+        return entity.read(attrs=response.json())
+
+    entity_list = list(entity_list)
+    if workers <= 1 or len(entity_list) <= 1:
+        return [read(entity) for entity in entity_list]
+    pool = ThreadPool(min(workers, len(entity_list)))
+    try:
+        return pool.map(read, entity_list)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def get_permissions_index(refresh=False):
+    """Return a dictionary mapping every permission name to its entity.
+
+    The index is built with a single search and kept for the whole session,
+    permissions do not change while the tests run.
+
+    :param bool refresh: whether to build the index again
+    """
+    global _permissions_index  # pylint:disable=global-statement
+    if _permissions_index is None or refresh:
+        _permissions_index = OrderedDict(
+            (permission.name, permission)
+            for permission in entities.Permission().search(
+                query={'per_page': SEARCH_PER_PAGE})
+        )
+    return _permissions_index
 
 
 def enable_rhrepo_and_fetchid(basearch, org_id, product, repo,
@@ -39,23 +168,26 @@ def enable_rhrepo_and_fetchid(basearch, org_id, product, repo,
     :rtype: str
 
     """
-    product = entities.Product(name=product, organization=org_id).search()[0]
-    r_set = entities.RepositorySet(name=reposet, product=product).search()[0]
+    org_query = {'organization_id': org_id}
+    product = search_by_names(
+        entities.Product, [product], query=org_query)[product][0]
+    r_set = search_by_names(
+        entities.RepositorySet, [reposet], product=product)[reposet][0]
     payload = {}
     if basearch is not None:
         payload['basearch'] = basearch
     if releasever is not None:
         payload['releasever'] = releasever
     r_set.enable(data=payload)
-    result = entities.Repository(name=repo).search(
-        query={'organization_id': org_id})
+    result = search_by_names(
+        entities.Repository, [repo], query=org_query)[repo]
     if bz_bug_is_open(1252101):
         for _ in range(5):
             if len(result) > 0:
                 break
             time.sleep(5)
-            result = entities.Repository(name=repo).search(
-                query={'organization_id': org_id})
+            result = search_by_names(
+                entities.Repository, [repo], query=org_query)[repo]
     return result[0].id
 
 
@@ -145,17 +277,14 @@ def delete_puppet_class(puppetclass_name, puppet_module=None,
     :param str environment_name: Name of environment where puppet module was
         imported.
     """
-    # Find puppet class
-    puppet_classes = entities.PuppetClass().search(
-        query={'search': 'name = "{0}"'.format(puppetclass_name)}
-    )
-    # And all subclasses
-    puppet_classes.extend(entities.PuppetClass().search(
-        query={'search': 'name ~ "{0}::"'.format(puppetclass_name)})
-    )
-    for puppet_class in puppet_classes:
+    # Find puppet class and all subclasses
+    puppet_classes = entities.PuppetClass().search(query={
+        'search': 'name = "{0}" or name ~ "{0}::"'.format(puppetclass_name),
+        'per_page': SEARCH_PER_PAGE,
+    })
+    for puppet_class in read_entities(puppet_classes):
         # Search and remove puppet class from affected hostgroups
-        for hostgroup in puppet_class.read().hostgroup:
+        for hostgroup in puppet_class.hostgroup:
             hostgroup.delete_puppetclass(
                 data={'puppetclass_id': puppet_class.id}
             )
@@ -208,142 +337,254 @@ def one_to_many_names(name):
     return set((name, name + '_ids', Inflector().pluralize(name)))
 
 
-def configure_provisioning(org=None, loc=None, compute=False):
+def _ids(field):
+    """Return the ids of the entities of a one to many ``field``"""
+    return {entity.id for entity in field or ()}
+
+
+def _ref_id(field):
+    """Return the id of the entity of a one to one ``field``, if any"""
+    return getattr(field, 'id', None)
+
+
+def _entity_verifier(entity_cls, check=None):
+    """Return a snapshot ``verify`` callable checking that the entity with
+    the stored ``id`` still exists.
+
+    :param entity_cls: The nailgun entity class of the stored entity
+    :param check: A callable receiving the entity read and the stored info,
+        returning whether the associations configured for the entity still
+        hold
+    """
+    def verify(stored):
+        """Return ``stored`` if the entity can still be read and its
+        associations are still configured
+        """
+        try:
+            entity = entity_cls(id=stored['id']).read()
+        except HTTPError:
+            return None
+        if check is not None and not check(entity, stored):
+            LOGGER.info(
+                'The associations of %s %s changed',
+                entity_cls.__name__, stored['id'])
+            return None
+        return stored
+    return verify
+
+
+def _libvirt_url():
+    """Return the URL of the Libvirt compute resource"""
+    return u'qemu+ssh://root@{0}/system'.format(
+        settings.compute_resources.libvirt_hostname)
+
+
+def configure_provisioning(org=None, loc=None, compute=False, reuse=False):
     """Create and configure org, loc, product, repo, cv, env. Update proxy,
     domain, subnet, compute resource, provision templates and medium with
     previously created entities and create a hostgroup using all mentioned
     entities.
 
+    The ids of the configured entities are recorded in an
+    :class:`robottelo.env_snapshot.EnvironmentSnapshot`, fingerprinted by the
+    arguments and the related settings. When ``reuse`` is set, later calls
+    with the same inputs only check that the recorded entities still exist
+    with their associations and rebuild the others along with the pieces
+    depending on them.
+
     :param org: Default Organization that should be used in both host
         discovering and host provisioning procedures
     :param loc: Default Location that should be used in both host
         discovering and host provisioning procedures
+    :param reuse: Whether the entities configured by a previous call with the
+        same inputs can be reused
     :return: List of created entities that can be re-used further in
         provisioning or validation procedure (e.g. hostgroup or domain)
     """
+    inputs = {
+        'org': org.id if org is not None else None,
+        'loc': loc.id if loc is not None else None,
+        'compute': compute,
+        'hostname': settings.server.hostname,
+        'libvirt_hostname': settings.compute_resources.libvirt_hostname,
+        'netmask': settings.vlan_networking.netmask,
+        'network': settings.vlan_networking.subnet,
+        'rhel7_os': settings.rhel7_os,
+    }
+    with EnvironmentSnapshot(
+            'configure_provisioning', inputs, reuse=reuse) as snapshot:
+        return _configure_provisioning(snapshot, org, loc, compute)
+
+
+def _configure_provisioning(snapshot, org, loc, compute):
+    """Configure the provisioning entities as pieces of ``snapshot``. See
+    :func:`configure_provisioning`.
+
+    The content pieces (lifecycle environment, repository and content view)
+    are built in the current thread, as waiting for their tasks must happen
+    in the main thread. Meanwhile the other pieces are configured in two
+    concurrent phases: a read phase searching and reading all the existing
+    entities the pieces to build will update, then a write phase updating or
+    creating them in dependency order. The puppet environment is searched
+    once the content view is published, as it depends on it.
+    """
     # Create new organization and location in case they were not passed
     if org is None:
-        org = entities.Organization().create()
+        org = entities.Organization(id=snapshot.get_or_build(
+            'org',
+            lambda: {'id': entities.Organization().create().id},
+            _entity_verifier(entities.Organization),
+        )['id'])
     if loc is None:
-        loc = entities.Location(organization=[org]).create()
-    # Create a new Life-Cycle environment
-    lc_env = entities.LifecycleEnvironment(organization=org).create()
-    # Create a Product, Repository for custom RHEL6 contents
-    product = entities.Product(organization=org).create()
-    repo = entities.Repository(
-        product=product,
-        url=settings.rhel7_os
-    ).create()
-
-    # Increased timeout value for repo sync
-    try:
-        old_task_timeout = entity_mixins.TASK_TIMEOUT
-        entity_mixins.TASK_TIMEOUT = 3600
-        repo.sync()
-        # Create, Publish and promote CV
-        content_view = entities.ContentView(organization=org).create()
-        content_view.repository = [repo]
-        content_view = content_view.update(['repository'])
-        content_view.publish()
-        content_view = content_view.read()
-        promote(content_view.version[0], lc_env.id)
-    finally:
-        entity_mixins.TASK_TIMEOUT = old_task_timeout
-    # Search for puppet environment and associate location
-    environment = entities.Environment(
-        organization=[org.id]).search()[0].read()
-    environment.location.append(loc)
-    environment = environment.update(['location'])
-
-    # Search for SmartProxy, and associate location
-    proxy = entities.SmartProxy().search(
-        query={
-            u'search': u'name={0}'.format(
-                settings.server.hostname)
-        }
-    )
-    proxy = proxy[0].read()
-    proxy.location.append(loc)
-    proxy = proxy.update(['location'])
-    proxy.organization.append(org)
-    proxy = proxy.update(['organization'])
-
-    # Search for existing domain or create new otherwise. Associate org,
-    # location and dns to it
-    _, _, domain = settings.server.hostname.partition('.')
-    domain = entities.Domain().search(
-        query={
-            u'search': u'name="{0}"'.format(domain)
-        }
-    )
-    if len(domain) == 1:
-        domain = domain[0].read()
-        domain.location.append(loc)
-        domain.organization.append(org)
-        domain.dns = proxy
-        domain = domain.update(['dns', 'location', 'organization'])
-    else:
-        domain = entities.Domain(
-            dns=proxy,
-            location=[loc],
-            organization=[org],
-        ).create()
-
-    # Search if subnet is defined with given network.
-    # If so, just update its relevant fields otherwise,
-    # Create new subnet
-    network = settings.vlan_networking.subnet
-    subnet = entities.Subnet().search(
-        query={u'search': u'network={0}'.format(network)}
-    )
-    if len(subnet) == 1:
-        subnet = subnet[0].read()
-        subnet.domain = [domain]
-        subnet.location.append(loc)
-        subnet.organization.append(org)
-        subnet.dns = proxy
-        subnet.dhcp = proxy
-        subnet.tftp = proxy
-        subnet.discovery = proxy
-        subnet = subnet.update([
-            'domain',
-            'dhcp',
-            'tftp',
-            'dns',
-            'discovery',
-            'location',
-            'organization',
-        ])
-    else:
-        # Create new subnet
-        subnet = entities.Subnet(
-            network=network,
-            mask=settings.vlan_networking.netmask,
-            domain=[domain],
-            location=[loc],
-            organization=[org],
-            dns=proxy,
-            dhcp=proxy,
-            tftp=proxy,
-            discovery=proxy
-        ).create()
-
-    # Search if Libvirt compute-resource already exists
-    # If so, just update its relevant fields otherwise,
-    # Create new compute-resource with 'libvirt' provider.
-    # compute boolean is added to not block existing test's that depend on
-    # Libvirt resource and use this same functionality to all CR's.
-    if compute is False:
-        resource_url = u'qemu+ssh://root@{0}/system'.format(
-            settings.compute_resources.libvirt_hostname
-        )
+        loc = entities.Location(id=snapshot.get_or_build(
+            'loc',
+            lambda: {
+                'id': entities.Location(organization=[org]).create().id},
+            _entity_verifier(entities.Location),
+            requires=('org',),
+        )['id'])
+
+    def search_one(entity_cls, search, **kwargs):
+        """Return the first entity matching ``search``, read"""
+        return entity_cls(**kwargs).search(
+            query={u'search': search})[0].read()
+
+    def search_existing(entity_cls, search):
+        """Return the single entity matching ``search`` read, ``None`` if
+        none or many match
+        """
+        results = entity_cls().search(query={u'search': search})
+        if len(results) == 1:
+            return results[0].read()
+        return None
+
+    def read_compute_resource():
+        """Return the Libvirt compute resource with the configured URL"""
         comp_res = [
             res for res in entities.LibvirtComputeResource().search()
-            if res.provider == 'Libvirt' and res.url == resource_url
+            if res.provider == 'Libvirt' and res.url == _libvirt_url()
         ]
-        if len(comp_res) > 0:
-            computeresource = entities.LibvirtComputeResource(
-                id=comp_res[0].id).read()
+        if comp_res:
+            return entities.LibvirtComputeResource(id=comp_res[0].id).read()
+        return None
+
+    # Entities read by the pieces: read name, piece and read function
+    reads = (
+        ('proxy', 'proxy', lambda: search_one(
+            entities.SmartProxy,
+            u'name={0}'.format(settings.server.hostname))),
+        ('domain', 'domain', lambda: search_existing(
+            entities.Domain,
+            u'name="{0}"'.format(settings.server.hostname.partition('.')[2])
+        )),
+        ('subnet', 'subnet', lambda: search_existing(
+            entities.Subnet,
+            u'network={0}'.format(settings.vlan_networking.subnet))),
+        ('compute_resource', 'compute_resource', read_compute_resource),
+        ('ptable', 'operating_system', lambda: search_one(
+            entities.PartitionTable, u'name="{0}"'.format(DEFAULT_PTABLE))),
+        ('os', 'operating_system', lambda: search_one(
+            entities.OperatingSystem,
+            u'name="RedHat" AND (major="{0}" OR major="{1}")'.format(
+                RHEL_6_MAJOR_VERSION, RHEL_7_MAJOR_VERSION))),
+        ('provisioning_template', 'operating_system', lambda: search_one(
+            entities.ConfigTemplate, u'name="{0}"'.format(DEFAULT_TEMPLATE))),
+        ('pxe_template', 'operating_system', lambda: search_one(
+            entities.ConfigTemplate,
+            u'name="{0}"'.format(DEFAULT_PXE_TEMPLATE))),
+        ('arch', 'operating_system', lambda: search_one(
+            entities.Architecture, u'name="x86_64"')),
+    )
+    read_functions = {name: function for name, _, function in reads}
+    read_results = {}
+
+    def fetched(name):
+        """Return the entity read for ``name`` in the read phase, reading it
+        now if it was skipped
+        """
+        if name in read_results:
+            return read_results[name]
+        return read_functions[name]()
+
+    def build_environment():
+        """Search for puppet environment and associate location"""
+        environment = entities.Environment(
+            organization=[org.id]).search()[0].read()
+        environment.location.append(loc)
+        environment = environment.update(['location'])
+        return {'id': environment.id, 'name': environment.name}
+
+    def build_proxy():
+        """Search for SmartProxy, and associate location"""
+        proxy = fetched('proxy')
+        proxy.location.append(loc)
+        proxy.organization.append(org)
+        proxy = proxy.update(['location', 'organization'])
+        return {'id': proxy.id}
+
+    def build_domain(proxy):
+        """Search for existing domain or create new otherwise. Associate org,
+        location and dns to it
+        """
+        domain = fetched('domain')
+        if domain is not None:
+            domain.location.append(loc)
+            domain.organization.append(org)
+            domain.dns = proxy
+            domain = domain.update(['dns', 'location', 'organization'])
+        else:
+            domain = entities.Domain(
+                dns=proxy,
+                location=[loc],
+                organization=[org],
+            ).create()
+        return {'id': domain.id, 'name': domain.name}
+
+    def build_subnet(proxy, domain):
+        """Search if subnet is defined with given network.
+        If so, just update its relevant fields otherwise,
+        Create new subnet
+        """
+        subnet = fetched('subnet')
+        if subnet is not None:
+            subnet.domain = [entities.Domain(id=domain['id'])]
+            subnet.location.append(loc)
+            subnet.organization.append(org)
+            subnet.dns = proxy
+            subnet.dhcp = proxy
+            subnet.tftp = proxy
+            subnet.discovery = proxy
+            subnet = subnet.update([
+                'domain',
+                'dhcp',
+                'tftp',
+                'dns',
+                'discovery',
+                'location',
+                'organization',
+            ])
+        else:
+            # Create new subnet
+            subnet = entities.Subnet(
+                network=settings.vlan_networking.subnet,
+                mask=settings.vlan_networking.netmask,
+                domain=[entities.Domain(id=domain['id'])],
+                location=[loc],
+                organization=[org],
+                dns=proxy,
+                dhcp=proxy,
+                tftp=proxy,
+                discovery=proxy
+            ).create()
+        return {'id': subnet.id}
+
+    def build_compute_resource():
+        """Search if Libvirt compute-resource already exists
+        If so, just update its relevant fields otherwise,
+        Create new compute-resource with 'libvirt' provider.
+        """
+        computeresource = fetched('compute_resource')
+        if computeresource is not None:
             computeresource.location.append(loc)
             computeresource.organization.append(org)
             computeresource = computeresource.update([
@@ -352,94 +593,282 @@ def configure_provisioning(org=None, loc=None, compute=False):
             # Create Libvirt compute-resource
             computeresource = entities.LibvirtComputeResource(
                 provider=u'libvirt',
-                url=resource_url,
+                url=_libvirt_url(),
                 set_console_password=False,
                 display_type=u'VNC',
                 location=[loc.id],
                 organization=[org.id],
             ).create()
-    # Get the Partition table ID
-    ptable = entities.PartitionTable().search(
-        query={
-            u'search': u'name="{0}"'.format(DEFAULT_PTABLE)
-        }
-    )[0].read()
-
-    # Get the OS ID
-    os = entities.OperatingSystem().search(query={
-        u'search': u'name="RedHat" AND (major="{0}" OR major="{1}")'
-        .format(RHEL_6_MAJOR_VERSION, RHEL_7_MAJOR_VERSION)
-        })[0].read()
-
-    # Get the Provisioning template_ID and update with OS, Org, Location
-    provisioning_template = entities.ConfigTemplate().search(
-        query={
-            u'search': u'name="{0}"'.format(DEFAULT_TEMPLATE)
-        }
-    )
-    provisioning_template = provisioning_template[0].read()
-    provisioning_template.operatingsystem.append(os)
-    provisioning_template.organization.append(org)
-    provisioning_template.location.append(loc)
-    provisioning_template = provisioning_template.update([
-        'location',
-        'operatingsystem',
-        'organization'
-    ])
-
-    # Get the PXE template ID and update with OS, Org, location
-    pxe_template = entities.ConfigTemplate().search(
-        query={
-            u'search': u'name="{0}"'.format(DEFAULT_PXE_TEMPLATE)
+        return {'id': computeresource.id}
+
+    def build_operating_system():
+        """Associate the OS with the architecture, partition table and
+        templates, updating the templates with OS, Org and Location
+        """
+        ptable = fetched('ptable')
+        os = fetched('os')
+        arch = fetched('arch')
+
+        def update_template(template):
+            """Update a template with OS, Org and Location"""
+            template.operatingsystem.append(os)
+            template.organization.append(org)
+            template.location.append(loc)
+            return template.update(
+                ['location', 'operatingsystem', 'organization'])
+
+        pool = ThreadPool(2)
+        try:
+            provisioning_template, pxe_template = pool.map(
+                update_template,
+                [fetched('provisioning_template'), fetched('pxe_template')],
+            )
+        finally:
+            pool.close()
+            pool.join()
+
+        # Update the OS to associate arch, ptable, templates
+        os.architecture.append(arch)
+        os.ptable.append(ptable)
+        os.config_template.append(provisioning_template)
+        os.config_template.append(pxe_template)
+        os = os.update([
+            'architecture',
+            'config_template',
+            'ptable',
+        ])
+        return {
+            'id': os.id,
+            'architecture_id': arch.id,
+            'ptable': {'id': ptable.id, 'name': ptable.name},
+            'templates': [provisioning_template.id, pxe_template.id],
         }
+
+    def associated(entity):
+        """Whether ``entity`` is still associated to the org and location"""
+        return (org.id in _ids(entity.organization) and
+                loc.id in _ids(entity.location))
+
+    def check_domain(results, domain, stored):
+        """Whether the domain is still associated and uses the proxy"""
+        return (associated(domain) and
+                _ref_id(domain.dns) == results['proxy']['id'])
+
+    def check_subnet(results, subnet, stored):
+        """Whether the subnet is still associated to the domain and uses the
+        proxy for all its features
+        """
+        proxy_id = results['proxy']['id']
+        return (
+            associated(subnet) and
+            results['domain']['id'] in _ids(subnet.domain) and
+            all(
+                _ref_id(getattr(subnet, feature)) == proxy_id
+                for feature in ('dhcp', 'discovery', 'dns', 'tftp')
+            )
+        )
+
+    def check_operating_system(results, os, stored):
+        """Whether the OS is still associated to the architecture, partition
+        table and templates, and the templates to the OS, org and location
+        """
+        templates = stored.get('templates')
+        if (not templates or
+                stored['architecture_id'] not in _ids(os.architecture) or
+                stored['ptable']['id'] not in _ids(os.ptable) or
+                not set(templates) <= _ids(os.config_template)):
+            return False
+        for template_id in templates:
+            template = entities.ConfigTemplate(id=template_id).read()
+            if (not associated(template) or
+                    os.id not in _ids(template.operatingsystem)):
+                return False
+        return True
+
+    # Pieces configured in the write phase: piece, build function receiving
+    # the completed pieces, entity class, required pieces and check of the
+    # associations of a reused entity, receiving the completed pieces too
+    pieces = [
+        ('proxy', lambda results: build_proxy(),
+         entities.SmartProxy, ('org', 'loc'),
+         lambda results, proxy, stored: associated(proxy)),
+        ('domain', lambda results: build_domain(
+            entities.SmartProxy(id=results['proxy']['id'])),
+         entities.Domain, ('org', 'loc', 'proxy'), check_domain),
+        ('subnet', lambda results: build_subnet(
+            entities.SmartProxy(id=results['proxy']['id']),
+            results['domain']),
+         entities.Subnet, ('org', 'loc', 'proxy', 'domain'), check_subnet),
+        ('operating_system', lambda results: build_operating_system(),
+         entities.OperatingSystem, ('org', 'loc'), check_operating_system),
+    ]
+    # compute boolean is added to not block existing test's that depend on
+    # Libvirt resource and use this same functionality to all CR's.
+    if compute is False:
+        pieces.append((
+            'compute_resource', lambda results: build_compute_resource(),
+            entities.LibvirtComputeResource, ('org', 'loc'),
+            lambda results, compute_resource, stored: associated(
+                compute_resource),
+        ))
+    piece_names = {piece[0] for piece in pieces}
+
+    read_pipeline = Pipeline(
+        'configure_provisioning-read', workers=PROVISIONING_WORKERS)
+    for name, piece, function in reads:
+        # Pieces stored by a previous setup are likely reused
+        if piece in piece_names and snapshot.stored(piece) is None:
+            read_pipeline.add_stage(
+                name, lambda results, function=function: function())
+    write_pipeline = Pipeline(
+        'configure_provisioning-write', workers=PROVISIONING_WORKERS)
+    for piece, build, entity_cls, requires, check in pieces:
+        write_pipeline.add_stage(
+            piece,
+            lambda results, piece=piece, build=build, entity_cls=entity_cls,
+            requires=requires, check=check: snapshot.get_or_build(
+                piece,
+                lambda: build(results),
+                _entity_verifier(entity_cls, partial(check, results)),
+                requires=requires,
+            ),
+            requires=[
+                required for required in requires if required in piece_names
+            ],
+        )
+
+    phases = {}
+
+    def run_phases():
+        """Run the read phase, then the write phase"""
+        try:
+            for phase, pipeline in (('read', read_pipeline),
+                                    ('write', write_pipeline)):
+                start = time.time()
+                phases[phase] = pipeline.run(resume=False)
+                LOGGER.info(
+                    'configure_provisioning %s phase finished in %.2f '
+                    'seconds', phase, time.time() - start)
+                if phase == 'read':
+                    read_results.update(phases[phase])
+        except PipelineError as err:
+            phases['error'] = err
+
+    phases_thread = threading.Thread(target=run_phases)
+    phases_thread.daemon = True
+    phases_thread.start()
+
+    # Create a new Life-Cycle environment
+    start = time.time()
+    try:
+        lc_env_id = snapshot.get_or_build(
+            'lc_env',
+            lambda: {
+                'id': entities.LifecycleEnvironment(
+                    organization=org).create().id
+            },
+            _entity_verifier(entities.LifecycleEnvironment),
+            requires=('org',),
+        )['id']
+
+        def build_repo():
+            """Create a Product, Repository for custom RHEL contents and sync
+            it
+            """
+            product = entities.Product(organization=org).create()
+            repo = entities.Repository(
+                product=product,
+                url=settings.rhel7_os
+            ).create()
+            repo.sync()
+            return {'id': repo.id}
+
+        def build_content_view():
+            """Create, Publish and promote CV"""
+            content_view = entities.ContentView(organization=org).create()
+            content_view.repository = [entities.Repository(id=repo_id)]
+            content_view = content_view.update(['repository'])
+            content_view.publish()
+            content_view = content_view.read()
+            promote(content_view.version[0], lc_env_id)
+            return {'id': content_view.id}
+
+        # Increased timeout value for repo sync
+        old_task_timeout = entity_mixins.TASK_TIMEOUT
+        try:
+            entity_mixins.TASK_TIMEOUT = 3600
+            repo_id = snapshot.get_or_build(
+                'repo',
+                build_repo,
+                _entity_verifier(entities.Repository),
+                requires=('org',),
+            )['id']
+            content_view_id = snapshot.get_or_build(
+                'content_view',
+                build_content_view,
+                _entity_verifier(entities.ContentView),
+                requires=('lc_env', 'repo'),
+            )['id']
+        finally:
+            entity_mixins.TASK_TIMEOUT = old_task_timeout
+        LOGGER.info(
+            'configure_provisioning content phase finished in %.2f seconds',
+            time.time() - start)
+    finally:
+        phases_thread.join()
+    if 'error' in phases:
+        error = phases['error']
+        six.reraise(type(error.error), error.error, error.traceback)
+    # The puppet environments of the organization depend on its content
+    environment = snapshot.get_or_build(
+        'environment',
+        build_environment,
+        _entity_verifier(
+            entities.Environment,
+            lambda environment, stored: loc.id in _ids(environment.location),
+        ),
+        requires=('org', 'loc', 'content_view'),
     )
-    pxe_template = pxe_template[0].read()
-    pxe_template.operatingsystem.append(os)
-    pxe_template.organization.append(org)
-    pxe_template.location.append(loc)
-    pxe_template = pxe_template.update(
-        ['location', 'operatingsystem', 'organization']
+    proxy = entities.SmartProxy(id=phases['write']['proxy']['id'])
+    domain = phases['write']['domain']
+    subnet_id = phases['write']['subnet']['id']
+    os = phases['write']['operating_system']
+
+    def build_host_group():
+        """Create Hostgroup"""
+        host_group = entities.HostGroup(
+            architecture=entities.Architecture(id=os['architecture_id']),
+            domain=domain['id'],
+            subnet=subnet_id,
+            lifecycle_environment=lc_env_id,
+            content_view=content_view_id,
+            location=[loc.id],
+            environment=environment['id'],
+            puppet_proxy=proxy,
+            puppet_ca_proxy=proxy,
+            content_source=proxy,
+            root_pass=gen_string('alphanumeric'),
+            operatingsystem=os['id'],
+            organization=[org.id],
+            ptable=os['ptable']['id'],
+        ).create()
+        return {'id': host_group.id, 'name': host_group.name}
+
+    host_group = snapshot.get_or_build(
+        'host_group',
+        build_host_group,
+        _entity_verifier(entities.HostGroup),
+        requires=(
+            'org', 'loc', 'lc_env', 'content_view', 'environment', 'proxy',
+            'domain', 'subnet', 'operating_system',
+        ),
     )
 
-    # Get the arch ID
-    arch = entities.Architecture().search(
-        query={u'search': u'name="x86_64"'}
-    )[0].read()
-
-    # Update the OS to associate arch, ptable, templates
-    os.architecture.append(arch)
-    os.ptable.append(ptable)
-    os.config_template.append(provisioning_template)
-    os.config_template.append(pxe_template)
-    os = os.update([
-        'architecture',
-        'config_template',
-        'ptable',
-    ])
-
-    # Create Hostgroup
-    host_group = entities.HostGroup(
-        architecture=arch,
-        domain=domain.id,
-        subnet=subnet.id,
-        lifecycle_environment=lc_env.id,
-        content_view=content_view.id,
-        location=[loc.id],
-        environment=environment.id,
-        puppet_proxy=proxy,
-        puppet_ca_proxy=proxy,
-        content_source=proxy,
-        root_pass=gen_string('alphanumeric'),
-        operatingsystem=os.id,
-        organization=[org.id],
-        ptable=ptable.id,
-    ).create()
-
     return {
-        'host_group': host_group.name,
-        'domain': domain.name,
-        'environment': environment.name,
-        'ptable': ptable.name,
+        'host_group': host_group['name'],
+        'domain': domain['name'],
+        'environment': environment['name'],
+        'ptable': os['ptable']['name'],
     }
 
 
@@ -456,11 +885,12 @@ def get_role_by_bz(bz_id):
      :return: A single role entity will be created from all the created filters
      """
     role = entities.Role().create()
+    permissions_index = get_permissions_index()
     for perms in PERMISSIONS_WITH_BZ.values():
         perms_with_bz = [x for x in perms if bz_id in x.get('bz', [])]
         if perms_with_bz:
             permissions = [
-                entities.Permission(name=perm['name']).search()[0]
+                permissions_index[perm['name']]
                 for perm in perms_with_bz
                 ]
             entities.Filter(permission=permissions, role=role).create()
@@ -489,34 +919,24 @@ def create_role_permissions(role, permissions_types_names):  # pragma: no cover
            role = entities.Role(name='example_role_name').create()
            create_role_permissions(role, permissions_types_names)
     """
+    permissions_index = get_permissions_index()
     for resource_type, permissions_name in permissions_types_names.items():
         if resource_type is None:
             permissions_entities = []
             for name in permissions_name:
-                result = entities.Permission(name=name).search()
-                if not result:
+                if name not in permissions_index:
                     raise entities.APIResponseError(
                         'permission "{}" not found'.format(name))
-                if len(result) > 1:
-                    raise entities.APIResponseError(
-                        'found more than one entity for permission'
-                        ' "{}"'.format(name)
-                    )
-                entity_permission = result[0]
-                if entity_permission.name != name:
-                    raise entities.APIResponseError(
-                        'the returned permission is different from the'
-                        ' requested one "{0} != {1}"'.format(
-                            entity_permission.name, name)
-                    )
-                permissions_entities.append(entity_permission)
+                permissions_entities.append(permissions_index[name])
         else:
             if not permissions_name:
                 raise ValueError('resource type "{}" empty. You must select at'
                                  ' least one permission'.format(resource_type))
 
-            resource_type_permissions_entities = entities.Permission(
-                resource_type=resource_type).search()
+            resource_type_permissions_entities = [
+                entity for entity in permissions_index.values()
+                if entity.resource_type == resource_type
+            ]
             if not resource_type_permissions_entities:
                 raise entities.APIResponseError(
                     'resource type "{}" permissions not found'.format(
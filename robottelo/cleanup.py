@@ -1,16 +1,49 @@
 # -*- encoding: utf-8 -*-
-"""Cleanup module for different entities"""
+"""Cleanup module for different entities
+
+Depending on the ``cleanup_mode`` setting, the entities created by a test case
+are cleaned in its ``tearDownClass`` (``class``), or recorded in a
+:class:`CleanupJournal` and cleaned all together at the end of the session
+(``deferred``) or by a :class:`CleanupReaper` process while the tests keep
+running (``background``).
+
+The journal survives crashed runs, so the entities they left behind can be
+cleaned from the ``manage shell``::
+
+    rt.cleanup.CleanupJournal(settings.cleanup_journal).reap(
+        released_only=False)
+
+The session cleanup is started by :func:`start_session_cleanup` and finished
+by :func:`finish_session_cleanup`, both called by the session process only.
+"""
+import json
 import logging
-from collections import deque, defaultdict
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, deque, defaultdict
+from multiprocessing.pool import ThreadPool
 from nailgun import entities, signals
+from pytest_services.locks import file_lock
 from robottelo.cli.base import CLIReturnCodeError
 from robottelo.cli.proxy import Proxy
+from robottelo.config import settings
 from robottelo.constants import DEFAULT_ORG_ID
 from robottelo.decorators import bz_bug_is_open
+from robottelo.helpers import process_alive
+from robottelo.pipeline import Pipeline, PipelineError
 
 
 LOGGER = logging.getLogger(__name__)
 
+#: Number of threads used to update or delete the entities of a cleanup step
+CLEANUP_WORKERS = 10
+#: Seconds a process waits for another one reaping the same journal
+REAP_LOCK_TIMEOUT = 3600
+
+# The background reaper process of this test session, if started
+_REAPER = None
+
 
 def capsule_cleanup(proxy_id=None):
     """Deletes the capsule with the given id"""
@@ -47,13 +80,106 @@ def vm_cleanup(vm):
     vm.destroy()
 
 
+def _search_by_ids(entity, field, ids, **query):
+    """Search ``entity`` for records whose ``field`` is any of ``ids`` with a
+    single request.
+    """
+    ids = sorted(ids)
+    query.update({
+        'search': ' or '.join(
+            '{0} = {1}'.format(field, entity_id) for entity_id in ids),
+        'per_page': max(len(ids), query.get('per_page', 0)),
+    })
+    return entity.search(query=query)
+
+
+def wait_for_cleanup_tasks(timeout=None, poll_rate=5, journal=None):
+    """Wait for the asynchronous deletions submitted by the cleaners of all
+    the processes, as recorded in the cleanup journal.
+
+    All pending tasks are polled together with one search request per
+    ``poll_rate`` seconds. Cleanup failures are logged, not raised, as they
+    must not fail the test session. The tasks which did not finish in time
+    stay pending in the journal.
+
+    :param timeout: maximum number of seconds to wait, ``None`` to wait
+        until all tasks are finished
+    :param poll_rate: seconds between polls
+    :param CleanupJournal journal: the journal recording the tasks, by
+        default the one of the ``cleanup_journal`` setting
+    :return: the ids of the tasks which failed or did not finish in time
+    """
+    if journal is None:
+        journal = CleanupJournal(settings.cleanup_journal)
+    pending = set(journal.pending_tasks())
+    if not pending:
+        return []
+    LOGGER.debug('Waiting for %s cleanup tasks', len(pending))
+    failed = []
+    start = time.time()
+    while pending:
+        try:
+            tasks = _search_by_ids(entities.ForemanTask(), 'id', pending)
+        except Exception as err:
+            LOGGER.warning('Error polling cleanup tasks: %s', err)
+            failed.extend(sorted(pending))
+            break
+        missing = pending - {task.id for task in tasks}
+        if missing:
+            LOGGER.warning(
+                'Cleanup tasks not found: %s', ', '.join(sorted(missing)))
+        for task_id in missing:
+            pending.discard(task_id)
+            journal.mark_cleaned(entities.ForemanTask.__name__, task_id)
+        for task in tasks:
+            if task.id not in pending or task.state not in (
+                    'paused', 'stopped'):
+                continue
+            pending.discard(task.id)
+            journal.mark_cleaned(entities.ForemanTask.__name__, task.id)
+            if task.result != 'success':
+                failed.append(task.id)
+                LOGGER.warning(
+                    'Cleanup task %s finished with result %s',
+                    task.id, task.result)
+        if not pending:
+            break
+        if timeout is not None and time.time() - start >= timeout:
+            LOGGER.warning(
+                'Timed out waiting for cleanup tasks: %s',
+                ', '.join(sorted(pending)))
+            failed.extend(sorted(pending))
+            break
+        time.sleep(poll_rate)
+    return failed
+
+
 class EntitiesCleaner(object):
-    """Register and clean entities for cleanup using signals"""
+    """Register and clean entities for cleanup using signals
+
+    Entities are cleaned in steps, one per entity type. Steps run as the
+    stages of a :class:`robottelo.pipeline.Pipeline`, so a step starts as soon
+    as the steps of the types it depends on are done (e.g. organizations are
+    deleted once their hosts and host groups were moved to the default
+    organization), and the entities of a step are updated or deleted
+    concurrently by a pool of ``workers`` threads.
+
+    Organizations are deleted asynchronously, their deletion tasks are
+    recorded in a :class:`CleanupJournal` and awaited together by
+    :func:`wait_for_cleanup_tasks`.
 
-    def __init__(self, *types_to_cleanup):
+    :param types_to_cleanup: nailgun entity classes to register for cleanup
+    :param int workers: number of threads of each cleanup step
+    :param CleanupJournal journal: the journal recording the deletion tasks,
+        by default the one of the ``cleanup_journal`` setting
+    """
+
+    def __init__(self, *types_to_cleanup, **kwargs):
         self.cleanup_queue = defaultdict(deque)
         self.deleted_entities = defaultdict(set)
         self.types_to_cleanup = types_to_cleanup
+        self.workers = kwargs.pop('workers', CLEANUP_WORKERS)
+        self.journal = kwargs.pop('journal', None)
         self.logger = logging.getLogger('robottelo')
         self.connect_cleanup_signals()
 
@@ -64,70 +190,497 @@ class EntitiesCleaner(object):
             signals.post_create.connect(self.register_entity_for_cleanup,
                                         sender=entity_type)
 
+    def disconnect_cleanup_signals(self):
+        """Stop registering the entities created from now on"""
+        for entity_type in self.types_to_cleanup:
+            signals.post_create.disconnect(
+                self.register_entity_for_cleanup, sender=entity_type)
+
     def register_entity_for_cleanup(self, sender, entity, **kwargs):
         """Put a new entity in the queue to be cleaned"""
         self.logger.info(
             'Adding {0}:{1} for cleanup_queue'.format(sender, entity.id))
         self.cleanup_queue[entity.__class__.__name__].appendleft(entity)
 
+    def _queued(self, entity_type):
+        """Return the registered entities of ``entity_type``"""
+        return list(self.cleanup_queue.get(entity_type.__name__, []))
+
     def clean(self):
         """This method is called in TearDownClass only when cleanup=true"""
         default_org = entities.Organization(id=DEFAULT_ORG_ID)
+        pipeline = Pipeline('cleanup', workers=3)
         # reassign created hosts to default org
-        self.update_entities(
-            self.cleanup_queue.get(entities.Host.__name__, []),
-            hostgroup=None,
-            managed=False,
-            organization=default_org
+        pipeline.add_stage(
+            entities.Host.__name__,
+            lambda results: self.update_entities(
+                self._queued(entities.Host),
+                hostgroup=None,
+                managed=False,
+                organization=default_org
+            ),
         )
         # reassign created host groups to default org
-        self.update_entities(
-            self.cleanup_queue.get(entities.HostGroup.__name__, []),
-            lifecycle_environment=None,
-            content_view=None,
-            organization=[default_org]
+        pipeline.add_stage(
+            entities.HostGroup.__name__,
+            lambda results: self.update_entities(
+                self._queued(entities.HostGroup),
+                lifecycle_environment=None,
+                content_view=None,
+                organization=[default_org]
+            ),
+            requires=(entities.Host.__name__,),
         )
         # delete organizations
-        self.delete_entities(
-            self.cleanup_queue.get(entities.Organization.__name__, []),
-            synchronous=False
+        pipeline.add_stage(
+            entities.Organization.__name__,
+            lambda results: self.delete_entities(
+                self._queued(entities.Organization),
+                synchronous=False
+            ),
+            requires=(entities.Host.__name__, entities.HostGroup.__name__),
         )
+        try:
+            pipeline.run(resume=False)
+        except PipelineError as err:
+            self.logger.warn('Error cleaning entities %s', str(err))
 
         self.logger.debug(
-            'Cleanup deleted %s entities', len(self.deleted_entities))
+            'Cleanup deleted %s entities',
+            sum(len(ids) for ids in self.deleted_entities.values())
+        )
+
+    def _map(self, function, entity_list):
+        """Call ``function`` for every entity of ``entity_list`` using a pool
+        of ``workers`` threads.
+        """
+        if self.workers <= 1 or len(entity_list) <= 1:
+            return [function(entity) for entity in entity_list]
+        pool = ThreadPool(min(self.workers, len(entity_list)))
+        try:
+            return pool.map(function, entity_list)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _organizations_with_hosts(self, org_ids):
+        """Return the ids of the organizations among ``org_ids`` owning hosts
+        using a single host search.
+        """
+        if not org_ids:
+            return set()
+        hosts = _search_by_ids(
+            entities.Host(), 'organization_id', org_ids, per_page=10000)
+        return {
+            host.organization.id for host in hosts
+            if host.organization is not None
+        }
 
     def delete_entities(self, entity_list, **kwargs):
+        """Delete concurrently the entities of ``entity_list`` not deleted
+        yet.
+
+        Organizations owning hosts are not deleted. When deleting
+        asynchronously (``synchronous=False``) the returned task ids are
+        recorded in the journal, to be awaited by
+        :func:`wait_for_cleanup_tasks`.
+        """
         self.logger.debug(
             'Cleanup got %s entities to delete', len(entity_list))
-        for entity in entity_list:
-            entity_type = entity.__class__.__name__
-            if entity.id in self.deleted_entities[entity_type]:
-                # skip already deleted entities
-                continue
+        entity_list = [
+            entity for entity in entity_list
+            # skip already deleted entities
+            if entity.id not in self.deleted_entities[
+                entity.__class__.__name__]
+        ]
+        try:
+            orgs_with_hosts = self._organizations_with_hosts({
+                entity.id for entity in entity_list
+                if isinstance(entity, entities.Organization)
+            })
+        except Exception as e:
+            self.logger.warn('Error searching organization hosts %s', str(e))
+            return
+        for org_id in orgs_with_hosts:
+            # Do not delete organizations with hosts
+            self.logger.debug(
+                'Org %s can\'t be deleted as it has hosts', org_id)
+        entity_list = [
+            entity for entity in entity_list
+            if not (isinstance(entity, entities.Organization) and
+                    entity.id in orgs_with_hosts)
+        ]
+
+        def delete(entity):
+            """Delete the entity, registering its deletion task if any"""
             try:
-                if isinstance(entity, entities.Organization):
-                    query = {'search': 'organization_id={0}'.format(entity.id)}
-                    org_hosts = entities.Host().search(query=query)
-                    if org_hosts:  # Do not delete organizations with hosts
-                        self.logger.debug(
-                            'Org %s can\'t be deleted as it has %s hosts',
-                            entity.id,
-                            len(org_hosts)
-                        )
-                        return
-                entity.delete(**kwargs)
+                response = entity.delete(**kwargs)
             except Exception as e:
                 self.logger.warn('Error deleting entity %s', str(e))
-            else:
-                self.deleted_entities[entity_type].add(entity.id)
+                return
+            self.deleted_entities[entity.__class__.__name__].add(entity.id)
+            if (kwargs.get('synchronous') is False and
+                    isinstance(response, dict) and 'id' in response):
+                journal = self.journal or CleanupJournal(
+                    settings.cleanup_journal)
+                journal.register_task(response['id'])
+
+        self._map(delete, entity_list)
 
     def update_entities(self, entity_list, **kwargs):
+        """Update concurrently the entities of ``entity_list`` setting the
+        fields and values of ``kwargs``.
+        """
         self.logger.debug(
             'Cleanup got %s entities to update', len(entity_list))
-        for entity in entity_list:
+
+        def update(entity):
+            """Update the entity fields"""
             try:
                 for key, value in kwargs.items():
                     setattr(entity, key, value)
-                entity.update(fields=kwargs.keys())
+                entity.update(fields=list(kwargs.keys()))
             except Exception as e:
                 self.logger.warn('Error updating entity %s', str(e))
+
+        self._map(update, entity_list)
+
+
+class CleanupJournal(object):
+    """Durable log of the entities created by the tests.
+
+    Every process appends JSON records to its own file of the journal
+    directory:
+
+    * ``create`` when an entity is created, with its type, id, creation time
+      and owner (the test case which created it);
+    * ``release`` when an owner no longer needs its entities;
+    * ``task`` when an asynchronous deletion task was submitted;
+    * ``cleaned`` when an entity was cleaned or a task finished.
+
+    :param str path: the journal directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _lock(self):
+        """Return the file lock of the processes reaping or compacting the
+        journal.
+        """
+        return file_lock(self.path.rstrip(os.sep) + '.lock',
+                         timeout=REAP_LOCK_TIMEOUT)
+
+    def _files(self):
+        """Return the journal files, by name."""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            name for name in os.listdir(self.path) if name.endswith('.jsonl'))
+
+    def _read(self, name):
+        """Return the records of the journal file ``name``, ignoring the
+        lines truncated by crashed processes.
+        """
+        records = []
+        with open(os.path.join(self.path, name)) as handler:
+            for line in handler:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def _append(self, *records):
+        """Append ``records`` to the journal file of the current process."""
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                if not os.path.isdir(self.path):
+                    raise
+        journal_file = os.path.join(
+            self.path, '{0}.jsonl'.format(os.getpid()))
+        with open(journal_file, 'a') as handler:
+            for record in records:
+                handler.write(json.dumps(record) + '\n')
+
+    def register(self, entity, owner):
+        """Record the creation of ``entity`` by ``owner``."""
+        self._append({
+            'event': 'create',
+            'type': entity.__class__.__name__,
+            'id': entity.id,
+            'created': time.time(),
+            'owner': owner,
+        })
+
+    def release(self, owner):
+        """Record that the entities of ``owner`` can be cleaned."""
+        self._append({'event': 'release', 'owner': owner})
+
+    def register_task(self, task_id):
+        """Record an asynchronous deletion task to wait for."""
+        self._append({
+            'event': 'task',
+            'type': entities.ForemanTask.__name__,
+            'id': task_id,
+        })
+
+    def mark_cleaned(self, entity_type, entity_id):
+        """Record that an entity was cleaned or a task finished."""
+        self._append({
+            'event': 'cleaned', 'type': entity_type, 'id': entity_id})
+
+    def records(self):
+        """Return the records of every journal file, ignoring the lines
+        truncated by crashed processes.
+        """
+        records = []
+        for name in self._files():
+            records.extend(self._read(name))
+        return records
+
+    def compact(self):
+        """Merge the journal files of the processes which are gone into the
+        file of the current process, dropping the records of the entities
+        already cleaned and of the tasks finished, so the journal does not
+        grow from session to session. The entities left by crashed runs and
+        the unfinished tasks stay pending.
+
+        :return: the number of dropped records
+        """
+        with self._lock():
+            gone, running = [], []
+            for name in self._files():
+                try:
+                    pid = int(name[:-len('.jsonl')])
+                except ValueError:
+                    pid = None
+                if pid is not None and pid != os.getpid() and (
+                        not process_alive(pid)):
+                    gone.append(name)
+                else:
+                    running.append(name)
+            if not gone:
+                return 0
+            old = []
+            for name in gone:
+                old.extend(self._read(name))
+            running_created = set()
+            for name in running:
+                running_created.update(
+                    (record['type'], record['id'])
+                    for record in self._read(name)
+                    if record['event'] in ('create', 'task')
+                )
+            cleaned = {
+                (record['type'], record['id'])
+                for record in old if record['event'] == 'cleaned'
+            }
+            kept = []
+            for record in old:
+                if record['event'] in ('create', 'task'):
+                    key = (record['type'], record['id'])
+                    if key not in cleaned:
+                        kept.append(record)
+            owners = {
+                record['owner'] for record in kept
+                if record['event'] == 'create'
+            }
+            kept.extend(
+                record for record in old
+                if record['event'] == 'release' and record['owner'] in owners
+            )
+            # Entities and tasks of running processes cleaned by gone ones
+            kept.extend(
+                record for record in old
+                if record['event'] == 'cleaned' and
+                (record['type'], record['id']) in running_created
+            )
+            if kept:
+                self._append(*kept)
+            for name in gone:
+                os.remove(os.path.join(self.path, name))
+        dropped = len(old) - len(kept)
+        LOGGER.debug('Cleanup journal compacted, %s records dropped', dropped)
+        return dropped
+
+    def pending(self, released_only=True):
+        """Return the ``create`` records of the entities not cleaned yet.
+
+        :param bool released_only: whether to return only the entities
+            released by their owner. Pass ``False`` to clean up after crashed
+            runs.
+        """
+        created = OrderedDict()
+        released = set()
+        cleaned = set()
+        # The files are not read in chronological order, an entity may be
+        # cleaned in a file read before the one of its creation
+        for record in self.records():
+            if record['event'] == 'create':
+                created[(record['type'], record['id'])] = record
+            elif record['event'] == 'release':
+                released.add(record['owner'])
+            elif record['event'] == 'cleaned':
+                cleaned.add((record['type'], record['id']))
+        return [
+            record for key, record in created.items()
+            if key not in cleaned and (
+                not released_only or record['owner'] in released)
+        ]
+
+    def pending_tasks(self):
+        """Return the ids of the deletion tasks not finished yet."""
+        tasks = OrderedDict()
+        finished = set()
+        for record in self.records():
+            if record['event'] == 'task':
+                tasks[record['id']] = None
+            elif (record['event'] == 'cleaned' and
+                    record['type'] == entities.ForemanTask.__name__):
+                finished.add(record['id'])
+        return [task_id for task_id in tasks if task_id not in finished]
+
+    def reap(self, released_only=True, workers=CLEANUP_WORKERS):
+        """Clean the pending entities with an :class:`EntitiesCleaner`.
+
+        A file lock makes sure only one process reaps at a time, the other
+        processes wait for it and then reap what is still pending. Entities
+        which could not be cleaned (e.g. organizations with hosts) stay
+        pending.
+
+        :param bool released_only: see :meth:`pending`
+        :param int workers: number of threads of each cleanup step
+        :return: the number of cleaned entities
+        """
+        with self._lock():
+            pending = self.pending(released_only)
+            if not pending:
+                return 0
+            cleaner = EntitiesCleaner(workers=workers, journal=self)
+            for record in pending:
+                entity_cls = getattr(entities, record['type'])
+                cleaner.cleanup_queue[record['type']].appendleft(
+                    entity_cls(id=record['id']))
+            cleaner.clean()
+            cleaned = 0
+            for record in pending:
+                if (record['type'] == entities.Organization.__name__ and
+                        record['id'] not in cleaner.deleted_entities[
+                            record['type']]):
+                    continue
+                self.mark_cleaned(record['type'], record['id'])
+                cleaned += 1
+        LOGGER.debug('Cleanup journal reaped %s entities', cleaned)
+        return cleaned
+
+
+class JournalEntitiesCleaner(EntitiesCleaner):
+    """Record the created entities in a :class:`CleanupJournal` instead of
+    cleaning them in ``tearDownClass``.
+
+    :param CleanupJournal journal: the journal to record the entities in
+    :param str owner: name of the test case creating the entities
+    :param types_to_cleanup: nailgun entity classes to register for cleanup
+    """
+
+    def __init__(self, journal, owner, *types_to_cleanup, **kwargs):
+        self.owner = owner
+        kwargs['journal'] = journal
+        super(JournalEntitiesCleaner, self).__init__(
+            *types_to_cleanup, **kwargs)
+
+    def register_entity_for_cleanup(self, sender, entity, **kwargs):
+        """Record a new entity in the journal"""
+        self.logger.info(
+            'Adding {0}:{1} to cleanup journal'.format(sender, entity.id))
+        self.journal.register(entity, self.owner)
+
+    def clean(self):
+        """Release the entities of the owner, they will be cleaned by the
+        reaper or at the end of the session.
+        """
+        self.disconnect_cleanup_signals()
+        self.journal.release(self.owner)
+
+
+class CleanupReaper(multiprocessing.Process):
+    """Process reaping a :class:`CleanupJournal` every ``interval`` seconds,
+    while the tests keep running.
+
+    :param CleanupJournal journal: the journal to reap
+    :param int interval: seconds between reaps
+    """
+
+    def __init__(self, journal, interval=60):
+        super(CleanupReaper, self).__init__(name='cleanup-reaper')
+        self.daemon = True
+        self.journal = journal
+        self.interval = interval
+        self._stopped = multiprocessing.Event()
+
+    def run(self):
+        """Reap the journal until stopped."""
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    self.journal.reap()
+                except Exception as err:
+                    LOGGER.warning('Cleanup reaper error: %s', err)
+        finally:
+            wait_for_cleanup_tasks(journal=self.journal)
+
+    def stop(self, timeout=None):
+        """Stop reaping and wait for the process to finish its last reap."""
+        self._stopped.set()
+        self.join(timeout)
+
+
+def get_entities_cleaner(owner, *types_to_cleanup):
+    """Return the cleaner of the test case ``owner``, according to the
+    ``cleanup_mode`` setting.
+
+    :param str owner: unique name of the test case creating the entities
+    :param types_to_cleanup: nailgun entity classes to register for cleanup
+    """
+    if settings.cleanup_mode == 'class':
+        return EntitiesCleaner(*types_to_cleanup)
+    return JournalEntitiesCleaner(
+        CleanupJournal(settings.cleanup_journal), owner, *types_to_cleanup)
+
+
+def start_session_cleanup():
+    """Prepare the cleanup of the test session: compact the journal left by
+    the previous sessions and start the background reaper if the
+    ``cleanup_mode`` setting is ``background``.
+    """
+    global _REAPER  # pylint:disable=global-statement
+    journal = CleanupJournal(settings.cleanup_journal)
+    try:
+        journal.compact()
+    except Exception as err:
+        LOGGER.warning('Error compacting cleanup journal: %s', err)
+    if settings.cleanup_mode == 'background' and _REAPER is None:
+        _REAPER = CleanupReaper(journal)
+        _REAPER.start()
+
+
+def finish_session_cleanup():
+    """Clean everything left at the end of the test session: stop the
+    background reaper, reap the released entities and wait for all the
+    asynchronous deletions recorded by the test processes.
+
+    :return: the ids of the cleanup tasks which did not succeed
+    """
+    global _REAPER  # pylint:disable=global-statement
+    if _REAPER is not None:
+        _REAPER.stop()
+        _REAPER = None
+    if settings.cleanup_mode != 'class':
+        try:
+            CleanupJournal(settings.cleanup_journal).reap()
+        except Exception as err:
+            LOGGER.warning('Error reaping cleanup journal: %s', err)
+    return wait_for_cleanup_tasks()
@@ -37,6 +37,7 @@ Options::
 
 from robottelo.cli import hammer
 from robottelo.cli.base import Base, CLIError
+from robottelo.cli.task import TASKS_TIMEOUT, Task
 
 
 class ContentViewFilterRule(Base):
@@ -122,6 +123,31 @@ class ContentView(Base):
             timeout=timeout,
         )
 
+    @classmethod
+    def publish_async(cls, options):
+        """Start a content-view publish without waiting for it.
+
+        :return: the UUID of the publish task
+        """
+        cls.command_sub = 'publish'
+        options = dict(options, **{u'async': True})
+        return Task.get_task_id(cls.execute(
+            cls._construct_command(options),
+            output_format='csv',
+            ignore_stderr=True,
+        ))
+
+    @classmethod
+    def publish_many(cls, options_list, timeout=TASKS_TIMEOUT):
+        """Publish several content-views concurrently.
+
+        :param options_list: list of options, one per content-view to publish
+        :param int timeout: maximum number of seconds to wait for all tasks
+        :return: a dictionary mapping every task id to its final task info
+        """
+        task_ids = [cls.publish_async(options) for options in options_list]
+        return Task.wait_for_tasks(task_ids, timeout=timeout)
+
     @classmethod
     def version_info(cls, options):
         """Provides version info related to content-view's version."""
@@ -180,6 +206,32 @@ class ContentView(Base):
             ignore_stderr=True,
         )
 
+    @classmethod
+    def version_promote_async(cls, options):
+        """Start a content-view version promotion without waiting for it.
+
+        :return: the UUID of the promotion task
+        """
+        cls.command_sub = 'version promote'
+        options = dict(options, **{u'async': True})
+        return Task.get_task_id(cls.execute(
+            cls._construct_command(options),
+            output_format='csv',
+            ignore_stderr=True,
+        ))
+
+    @classmethod
+    def version_promote_many(cls, options_list, timeout=TASKS_TIMEOUT):
+        """Promote several content-view versions concurrently.
+
+        :param options_list: list of options, one per version to promote
+        :param int timeout: maximum number of seconds to wait for all tasks
+        :return: a dictionary mapping every task id to its final task info
+        """
+        task_ids = [
+            cls.version_promote_async(options) for options in options_list]
+        return Task.wait_for_tasks(task_ids, timeout=timeout)
+
     @classmethod
     def version_delete(cls, options):
         """Removes content-view version."""
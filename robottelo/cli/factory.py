@@ -17,11 +17,12 @@ from fauxfactory import (
     gen_netmask,
     gen_string,
 )
+from multiprocessing import Pool
 from os import chmod
 from robottelo import manifests, ssh
 from robottelo.cli.activationkey import ActivationKey
 from robottelo.cli.architecture import Architecture
-from robottelo.cli.base import CLIReturnCodeError
+from robottelo.cli.base import CLIError, CLIReturnCodeError
 from robottelo.cli.capsule import Capsule
 from robottelo.cli.computeresource import ComputeResource
 from robottelo.cli.contentview import (
@@ -84,11 +85,13 @@ from robottelo.constants import (
     TEMPLATE_TYPES,
 )
 from robottelo.decorators import bz_bug_is_open, cacheable
+from robottelo.env_snapshot import EnvironmentSnapshot, fingerprint
 from robottelo.helpers import (
     update_dictionary, default_url_on_new_port, get_available_capsule_port
 )
+from robottelo.pipeline import Pipeline, PipelineError
 from robottelo.ssh import download_file, upload_file
-from tempfile import mkstemp
+from tempfile import gettempdir, mkstemp
 from time import sleep
 
 logger = logging.getLogger(__name__)
@@ -96,6 +99,8 @@ logger = logging.getLogger(__name__)
 ORG_KEYS = ['organization', 'organization-id', 'organization-label']
 CONTENT_VIEW_KEYS = ['content-view', 'content-view-id']
 LIFECYCLE_KEYS = ['lifecycle-environment', 'lifecycle-environment-id']
+# Maximum number of hammer processes started at once by the bulk factories
+BULK_CREATE_WORKERS = 10
 
 
 class CLIFactoryError(Exception):
@@ -144,6 +149,45 @@ def create_object(cli_object, options, values):
     return result
 
 
+def create_objects(factory, count, options=None, workers=None):
+    """Creates ``count`` entities concurrently using a ``make_*`` factory.
+
+    Every entity is created by its own hammer process, and up to ``workers``
+    of them run at the same time, so creating many similar entities costs
+    roughly ``count / workers`` round trips instead of ``count``.
+
+    Entities are created in separate processes because CLI wrapper classes
+    keep the command being built as class state, which is not safe to share
+    between threads. Each worker process is reseeded so random default values
+    (names, logins, MACs) do not repeat across workers.
+
+    :param factory: a module level factory function such as ``make_user``.
+    :param int count: number of entities to create.
+    :param dict options: options passed to every factory call.
+    :param int workers: maximum number of concurrent hammer processes.
+        Defaults to ``BULK_CREATE_WORKERS``.
+    :raise robottelo.cli.factory.CLIFactoryError: Raise an exception if any
+        of the objects cannot be created.
+    :rtype: list
+    :return: A list of dictionaries representing the new resources.
+
+    """
+    if count < 1:
+        return []
+    if workers is None:
+        workers = BULK_CREATE_WORKERS
+    workers = max(1, min(workers, count))
+    options_list = [dict(options or {}) for _ in range(count)]
+    if workers == 1:
+        return [factory(item) for item in options_list]
+    pool = Pool(workers, initializer=random.seed)
+    try:
+        return pool.map(factory, options_list)
+    finally:
+        pool.close()
+        pool.join()
+
+
 @cacheable
 def make_activation_key(options=None):
     """
@@ -1093,6 +1137,14 @@ def make_subnet(options=None):
     return create_object(Subnet, args, options)
 
 
+def make_subnets(count, options=None, workers=None):
+    """Create ``count`` subnets concurrently.
+
+    :return: A list of dictionaries representing the new subnets.
+    """
+    return create_objects(make_subnet, count, options, workers)
+
+
 @cacheable
 def make_sync_plan(options=None):
     """
@@ -1371,10 +1423,9 @@ def make_host(options=None):
     return create_object(Host, args, options)
 
 
-@cacheable
-def make_fake_host(options=None):
-    """Wrapper function for make_host to pass all required options for creation
-    of a fake host
+def _prepare_fake_host_options(options=None):
+    """Fill the options required for creation of a fake host, using default
+    Satellite entities or creating new ones when they are not available.
     """
     if options is None:
         options = {}
@@ -1452,7 +1503,28 @@ def make_fake_host(options=None):
             'organizations': options.get('organization'),
         })['id']
 
-    return make_host(options)
+    return options
+
+
+@cacheable
+def make_fake_host(options=None):
+    """Wrapper function for make_host to pass all required options for creation
+    of a fake host
+    """
+    return make_host(_prepare_fake_host_options(options))
+
+
+def make_fake_hosts(count, options=None, workers=None):
+    """Create ``count`` fake hosts concurrently.
+
+    Required entities (organization, location, domain, architecture, operating
+    system, partition table and medium) are resolved or created only once and
+    shared by all the hosts.
+
+    :return: A list of dictionaries representing the new hosts.
+    """
+    return create_objects(
+        make_host, count, _prepare_fake_host_options(options), workers)
 
 
 @cacheable
@@ -1502,6 +1574,14 @@ def make_host_collection(options=None):
     return create_object(HostCollection, args, options)
 
 
+def make_host_collections(count, options=None, workers=None):
+    """Create ``count`` host collections concurrently.
+
+    :return: A list of dictionaries representing the new host collections.
+    """
+    return create_objects(make_host_collection, count, options, workers)
+
+
 @cacheable
 def make_job_invocation(options=None):
     """
@@ -1681,6 +1761,14 @@ def make_user(options=None):
     return create_object(User, args, options)
 
 
+def make_users(count, options=None, workers=None):
+    """Create ``count`` users concurrently, e.g. for RBAC tests.
+
+    :return: A list of dictionaries representing the new users.
+    """
+    return create_objects(make_user, count, options, workers)
+
+
 @cacheable
 def make_usergroup(options=None):
     """
@@ -2861,240 +2949,416 @@ def setup_org_for_a_rh_repo(options=None, force_manifest_upload=False,
         return result
 
 
-def configure_env_for_provision(org=None, loc=None):
+def _cli_entity_verifier(entity_cls, check=None):
+    """Return a snapshot ``verify`` callable checking that the entity with
+    the stored ``id`` still exists.
+
+    :param entity_cls: The CLI entity class of the stored entity
+    :param check: A callable receiving the entity info, returning whether the
+        associations configured for the entity still hold
+    """
+    def verify(stored):
+        """Return ``stored`` if the entity info can still be fetched and its
+        associations are still configured
+        """
+        try:
+            info = entity_cls.info({'id': stored['id']})
+        except CLIReturnCodeError:
+            return None
+        if check is not None and not check(info):
+            logger.info(
+                'The associations of %s %s changed',
+                entity_cls.__name__, stored['id'])
+            return None
+        return stored
+    return verify
+
+
+def configure_env_for_provision(org=None, loc=None, reuse=False):
     """Create and configure org, loc, product, repo, cv, env. Update proxy,
     domain, subnet, compute resource, provision templates and medium with
     previously created entities and create a hostgroup using all mentioned
     entities.
 
+    The ids of the configured entities are recorded in an
+    :class:`robottelo.env_snapshot.EnvironmentSnapshot`, fingerprinted by the
+    arguments and the related settings. When ``reuse`` is set, later calls
+    with the same inputs only check that the recorded entities still exist
+    with their associations and rebuild the others along with the pieces
+    depending on them.
+
     :param org: Default Organization that should be used in both host
         discovering and host provisioning procedures
     :param loc: Default Location that should be used in both host
         discovering and host provisioning procedures
+    :param reuse: Whether the entities configured by a previous call with the
+        same inputs can be reused
     :return: List of created entities that can be re-used further in
         provisioning or validation procedure (e.g. hostgroup or subnet)
     """
+    inputs = {
+        'org': org['id'] if org is not None else None,
+        'loc': loc['id'] if loc is not None else None,
+        'hostname': settings.server.hostname,
+        'libvirt_hostname': settings.compute_resources.libvirt_hostname,
+        'netmask': settings.vlan_networking.netmask,
+        'network': settings.vlan_networking.subnet,
+        'rhel7_os': settings.rhel7_os,
+    }
+    with EnvironmentSnapshot(
+            'configure_env_for_provision', inputs, reuse=reuse) as snapshot:
+        return _configure_env_for_provision(snapshot, org, loc)
+
+
+def _configure_env_for_provision(snapshot, org, loc):
+    """Configure the provisioning entities as pieces of ``snapshot``. See
+    :func:`configure_env_for_provision`.
+    """
     # Create new organization and location in case they were not passed
     if org is None:
-        org = make_org()
+        org = snapshot.get_or_build(
+            'org',
+            lambda: _id_and_name(make_org()),
+            _cli_entity_verifier(Org),
+        )
     if loc is None:
-        loc = make_location()
-
-    # Create a new Lifecycle environment
-    lce = make_lifecycle_environment({'organization-id': org['id']})
-
-    # Create a Product, Repository for custom content and sync it
-    new_product = make_product({'organization-id': org['id']})
-    new_repo = make_repository({
-        'product-id': new_product['id'],
-        'url': settings.rhel7_os,
-    })
-    Repository.synchronize({'id': new_repo['id']})
-
-    # Content View should be promoted to be used with LC Env
-    cv = make_content_view({'organization-id': org['id']})
-    ContentView.add_repository({
-        'id': cv['id'],
-        'organization-id': org['id'],
-        'repository-id': new_repo['id'],
-    })
-    ContentView.publish({'id': cv['id']})
-    cv = ContentView.info({'id': cv['id']})
-    ContentView.version_promote({
-        'id': cv['versions'][0]['id'],
-        'to-lifecycle-environment-id': lce['id'],
-    })
+        loc = snapshot.get_or_build(
+            'loc',
+            lambda: _id_and_name(make_location()),
+            _cli_entity_verifier(Location),
+        )
 
-    # Create puppet environment and associate organization and location
-    env = make_environment({
-        'location-ids': loc['id'],
-        'organization-ids': org['id'],
-    })
+    def associated(info):
+        """Whether the entity info lists the org and location"""
+        return (org['name'] in info['organizations'] and
+                loc['name'] in info['locations'])
 
-    # Search for SmartProxy, and associate location
-    puppet_proxy = Proxy.info({'id': Proxy.list()[0]['id']})
-    Proxy.update({
-        'id': puppet_proxy['id'],
-        'locations': list(set(puppet_proxy['locations']) | {loc['name']}),
-    })
+    # Create a new Lifecycle environment
+    lce = snapshot.get_or_build(
+        'lce',
+        lambda: _id_and_name(
+            make_lifecycle_environment({'organization-id': org['id']})),
+        _cli_entity_verifier(LifecycleEnvironment),
+        requires=('org',),
+    )
 
-    # Network
-    # Search for existing domain or create new otherwise. Associate org,
-    # location and dns to it
-    _, _, domain_name = settings.server.hostname.partition('.')
-    domain = Domain.list({'search': 'name={0}'.format(domain_name)})
-    if len(domain) == 1:
-        domain = Domain.info({'id': domain[0]['id']})
-        Domain.update({
-            'name': domain_name,
-            'locations': list(set(domain['locations']) | {loc['name']}),
-            'organizations': list(
-                set(domain['organizations']) | {org['name']}),
-            'dns-id': puppet_proxy['id'],
-        })
-    else:
-        # Create new domain
-        domain = make_domain({
-            'name': domain_name,
-            'location-ids': loc['id'],
-            'organization-ids': org['id'],
-            'dns-id': puppet_proxy['id'],
+    def build_repository():
+        """Create a Product, Repository for custom content and sync it"""
+        new_product = make_product({'organization-id': org['id']})
+        new_repo = make_repository({
+            'product-id': new_product['id'],
+            'url': settings.rhel7_os,
         })
-    # Search if subnet is defined with given network. If so, just update its
-    # relevant fields otherwise create new subnet
-    network = settings.vlan_networking.subnet
-    subnet = Subnet.list({'search': 'network={0}'.format(network)})
-    if len(subnet) == 1:
-        subnet = Subnet.info({'id': subnet[0]['id']})
-        Subnet.update({
-            'name': subnet['name'],
-            'domains': list(set(subnet['domains']) | {domain['name']}),
-            'locations': list(set(subnet['locations']) | {loc['name']}),
-            'organizations': list(
-                set(subnet['organizations']) | {org['name']}),
-            'dhcp-id': puppet_proxy['id'],
-            'dns-id': puppet_proxy['id'],
-            'tftp-id': puppet_proxy['id'],
+        Repository.synchronize({'id': new_repo['id']})
+        return _id_and_name(new_repo)
+
+    new_repo = snapshot.get_or_build(
+        'repository',
+        build_repository,
+        _cli_entity_verifier(Repository),
+        requires=('org',),
+    )
+
+    def build_content_view():
+        """Content View should be promoted to be used with LC Env"""
+        cv = make_content_view({'organization-id': org['id']})
+        ContentView.add_repository({
+            'id': cv['id'],
+            'organization-id': org['id'],
+            'repository-id': new_repo['id'],
         })
-    else:
-        # Create new subnet
-        subnet = make_subnet({
-            'name': gen_string('alpha'),
-            'network': network,
-            'mask': settings.vlan_networking.netmask,
-            'domain-ids': domain['id'],
-            'location-ids': loc['id'],
-            'organization-ids': org['id'],
-            'dhcp-id': puppet_proxy['id'],
-            'dns-id': puppet_proxy['id'],
-            'tftp-id': puppet_proxy['id'],
+        ContentView.publish({'id': cv['id']})
+        cv = ContentView.info({'id': cv['id']})
+        ContentView.version_promote({
+            'id': cv['versions'][0]['id'],
+            'to-lifecycle-environment-id': lce['id'],
         })
+        return _id_and_name(cv)
 
-    # Search if Libvirt compute-resource already exists. If so, just update its
-    # relevant fields otherwise, create new compute-resource with 'libvirt'
-    # provider.
-    current_libvirt_url = (
-        LIBVIRT_RESOURCE_URL % settings.compute_resources.libvirt_hostname
+    cv = snapshot.get_or_build(
+        'content_view',
+        build_content_view,
+        _cli_entity_verifier(ContentView),
+        requires=('lce', 'repository'),
     )
 
-    comp_resources = [
-        ComputeResource.info({'id': comp_res['id']}) for comp_res
-        in ComputeResource.list()
-    ]
-    libvirt_resources = [
-        comp_res for comp_res in comp_resources
-        if comp_res['url'] == 'url={0}'.format(current_libvirt_url) and
-        comp_res['provider'] == FOREMAN_PROVIDERS['libvirt']
-    ]
-    if len(libvirt_resources) >= 1:
-        libvirt_res = ComputeResource.info({'id': libvirt_resources[0]['id']})
-        ComputeResource.update({
-            'id': libvirt_res['id'],
-            'locations': list(set(libvirt_res['locations']) | {loc['name']}),
-            'organizations': list(
-                set(libvirt_res['organizations']) | {org['name']}),
-        })
-    else:
-        # Create Libvirt compute-resource
-        make_compute_resource({
-            'name': gen_string('alpha'),
-            'provider': 'libvirt',
-            'url': current_libvirt_url,
-            'set-console-password': False,
-            'display-type': 'VNC',
+    # Create puppet environment and associate organization and location
+    env = snapshot.get_or_build(
+        'environment',
+        lambda: _id_and_name(make_environment({
             'location-ids': loc['id'],
             'organization-ids': org['id'],
+        })),
+        _cli_entity_verifier(Environment),
+        requires=('org', 'loc'),
+    )
+
+    def build_proxy():
+        """Search for SmartProxy, and associate location"""
+        puppet_proxy = Proxy.info({'id': Proxy.list()[0]['id']})
+        Proxy.update({
+            'id': puppet_proxy['id'],
+            'locations': list(
+                set(puppet_proxy['locations']) | {loc['name']}),
         })
+        return _id_and_name(puppet_proxy)
+
+    puppet_proxy = snapshot.get_or_build(
+        'proxy',
+        build_proxy,
+        _cli_entity_verifier(
+            Proxy, lambda info: loc['name'] in info['locations']),
+        requires=('loc',),
+    )
 
-    # Get the Partition table entity
-    ptable = PartitionTable.info({'name': DEFAULT_PTABLE})
-
-    # Get the OS entity
-    os = OperatingSys.list({
-        'search': 'name="RedHat" AND major="{0}" OR major="{1}"'.format(
-            RHEL_6_MAJOR_VERSION, RHEL_7_MAJOR_VERSION)
-    })[0]
-
-    # Get proper Provisioning templates and update with OS, Org, Location
-    provisioning_template = Template.info({'name': DEFAULT_TEMPLATE})
-    pxe_template = Template.info({'name': DEFAULT_PXE_TEMPLATE})
-    for template in provisioning_template, pxe_template:
-        if os['title'] not in template['operating-systems']:
-            Template.update({
-                'id': template['id'],
-                'locations': list(set(template['locations']) | {loc['name']}),
-                'operatingsystems': list(
-                    set(template['operating-systems']) | {os['title']}),
+    def build_domain():
+        """Search for existing domain or create new otherwise. Associate org,
+        location and dns to it
+        """
+        _, _, domain_name = settings.server.hostname.partition('.')
+        domain = Domain.list({'search': 'name={0}'.format(domain_name)})
+        if len(domain) == 1:
+            domain = Domain.info({'id': domain[0]['id']})
+            Domain.update({
+                'name': domain_name,
+                'locations': list(set(domain['locations']) | {loc['name']}),
                 'organizations': list(
-                    set(template['organizations']) | {org['name']}),
+                    set(domain['organizations']) | {org['name']}),
+                'dns-id': puppet_proxy['id'],
             })
+        else:
+            # Create new domain
+            domain = make_domain({
+                'name': domain_name,
+                'location-ids': loc['id'],
+                'organization-ids': org['id'],
+                'dns-id': puppet_proxy['id'],
+            })
+        return _id_and_name(domain)
 
-    # Get the architecture entity
-    arch = Architecture.list(
-        {'search': 'name={0}'.format(DEFAULT_ARCHITECTURE)})[0]
-
-    os = OperatingSys.info({'id': os['id']})
-    # Get the media and update its location
-    medium = Medium.list({'organization-id': org['id']})
-    if medium:
-        media = Medium.info({'id': medium[0]['id']})
-        Medium.update({
-            'id': media['id'],
-            'operatingsystems': list(
-                set(media['operating-systems']) | {os['title']}),
-            'locations': list(set(media['locations']) | {loc['name']}),
-        })
-    else:
-        media = make_medium({
-            'location-ids': loc['id'],
-            'operatingsystem-ids': os['id'],
-            'organization-ids': org['id'],
-        })
+    # Network
+    domain = snapshot.get_or_build(
+        'domain',
+        build_domain,
+        _cli_entity_verifier(Domain, associated),
+        requires=('org', 'loc', 'proxy'),
+    )
 
-    # Update the OS with found arch, ptable, templates and media
-    OperatingSys.update({
-        'id': os['id'],
-        'architectures': list(set(os['architectures']) | {arch['name']}),
-        'media': list(set(os['installation-media']) | {media['name']}),
-        'partition-tables': list(
-            set(os['partition-tables']) | {ptable['name']}),
-    })
-    for template in (provisioning_template, pxe_template):
-        if '{} ({})'.format(template['name'], template['type']) not in os[
-                'templates']:
-            OperatingSys.update({
-                'id': os['id'],
-                'config-templates': list(
-                    set(os['templates']) | {template['name']}),
+    def build_subnet():
+        """Search if subnet is defined with given network. If so, just update
+        its relevant fields otherwise create new subnet
+        """
+        network = settings.vlan_networking.subnet
+        subnet = Subnet.list({'search': 'network={0}'.format(network)})
+        if len(subnet) == 1:
+            subnet = Subnet.info({'id': subnet[0]['id']})
+            Subnet.update({
+                'name': subnet['name'],
+                'domains': list(set(subnet['domains']) | {domain['name']}),
+                'locations': list(set(subnet['locations']) | {loc['name']}),
+                'organizations': list(
+                    set(subnet['organizations']) | {org['name']}),
+                'dhcp-id': puppet_proxy['id'],
+                'dns-id': puppet_proxy['id'],
+                'tftp-id': puppet_proxy['id'],
+            })
+        else:
+            # Create new subnet
+            subnet = make_subnet({
+                'name': gen_string('alpha'),
+                'network': network,
+                'mask': settings.vlan_networking.netmask,
+                'domain-ids': domain['id'],
+                'location-ids': loc['id'],
+                'organization-ids': org['id'],
+                'dhcp-id': puppet_proxy['id'],
+                'dns-id': puppet_proxy['id'],
+                'tftp-id': puppet_proxy['id'],
+            })
+        return _id_and_name(subnet)
+
+    subnet = snapshot.get_or_build(
+        'subnet',
+        build_subnet,
+        _cli_entity_verifier(
+            Subnet,
+            lambda info: (
+                associated(info) and domain['name'] in info['domains']),
+        ),
+        requires=('org', 'loc', 'proxy', 'domain'),
+    )
+
+    def build_compute_resource():
+        """Search if Libvirt compute-resource already exists. If so, just
+        update its relevant fields otherwise, create new compute-resource with
+        'libvirt' provider.
+        """
+        current_libvirt_url = (
+            LIBVIRT_RESOURCE_URL %
+            settings.compute_resources.libvirt_hostname
+        )
+
+        comp_resources = [
+            ComputeResource.info({'id': comp_res['id']}) for comp_res
+            in ComputeResource.list()
+        ]
+        libvirt_resources = [
+            comp_res for comp_res in comp_resources
+            if comp_res['url'] == 'url={0}'.format(current_libvirt_url) and
+            comp_res['provider'] == FOREMAN_PROVIDERS['libvirt']
+        ]
+        if len(libvirt_resources) >= 1:
+            libvirt_res = ComputeResource.info(
+                {'id': libvirt_resources[0]['id']})
+            ComputeResource.update({
+                'id': libvirt_res['id'],
+                'locations': list(
+                    set(libvirt_res['locations']) | {loc['name']}),
+                'organizations': list(
+                    set(libvirt_res['organizations']) | {org['name']}),
             })
+        else:
+            # Create Libvirt compute-resource
+            libvirt_res = make_compute_resource({
+                'name': gen_string('alpha'),
+                'provider': 'libvirt',
+                'url': current_libvirt_url,
+                'set-console-password': False,
+                'display-type': 'VNC',
+                'location-ids': loc['id'],
+                'organization-ids': org['id'],
+            })
+        return _id_and_name(libvirt_res)
+
+    snapshot.get_or_build(
+        'compute_resource',
+        build_compute_resource,
+        _cli_entity_verifier(ComputeResource, associated),
+        requires=('org', 'loc'),
+    )
+
+    def build_operating_system():
+        """Associate the OS with the architecture, partition table, media
+        and templates, updating them with OS, Org and Location
+        """
+        # Get the Partition table entity
+        ptable = PartitionTable.info({'name': DEFAULT_PTABLE})
+
+        # Get the OS entity
+        os = OperatingSys.list({
+            'search': 'name="RedHat" AND major="{0}" OR major="{1}"'.format(
+                RHEL_6_MAJOR_VERSION, RHEL_7_MAJOR_VERSION)
+        })[0]
+
+        # Get proper Provisioning templates and update with OS, Org, Location
+        provisioning_template = Template.info({'name': DEFAULT_TEMPLATE})
+        pxe_template = Template.info({'name': DEFAULT_PXE_TEMPLATE})
+        for template in provisioning_template, pxe_template:
+            if os['title'] not in template['operating-systems']:
+                Template.update({
+                    'id': template['id'],
+                    'locations': list(
+                        set(template['locations']) | {loc['name']}),
+                    'operatingsystems': list(
+                        set(template['operating-systems']) | {os['title']}),
+                    'organizations': list(
+                        set(template['organizations']) | {org['name']}),
+                })
+
+        # Get the architecture entity
+        arch = Architecture.list(
+            {'search': 'name={0}'.format(DEFAULT_ARCHITECTURE)})[0]
+
+        os = OperatingSys.info({'id': os['id']})
+        # Get the media and update its location
+        medium = Medium.list({'organization-id': org['id']})
+        if medium:
+            media = Medium.info({'id': medium[0]['id']})
+            Medium.update({
+                'id': media['id'],
+                'operatingsystems': list(
+                    set(media['operating-systems']) | {os['title']}),
+                'locations': list(set(media['locations']) | {loc['name']}),
+            })
+        else:
+            media = make_medium({
+                'location-ids': loc['id'],
+                'operatingsystem-ids': os['id'],
+                'organization-ids': org['id'],
+            })
+
+        # Update the OS with found arch, ptable, templates and media
+        OperatingSys.update({
+            'id': os['id'],
+            'architectures': list(set(os['architectures']) | {arch['name']}),
+            'media': list(set(os['installation-media']) | {media['name']}),
+            'partition-tables': list(
+                set(os['partition-tables']) | {ptable['name']}),
+        })
+        for template in (provisioning_template, pxe_template):
+            if '{} ({})'.format(template['name'], template['type']) not in os[
+                    'templates']:
+                OperatingSys.update({
+                    'id': os['id'],
+                    'config-templates': list(
+                        set(os['templates']) | {template['name']}),
+                })
+        return {
+            'id': os['id'],
+            'architecture_id': arch['id'],
+            'medium_id': media['id'],
+            'ptable_id': ptable['id'],
+        }
+
+    os = snapshot.get_or_build(
+        'operating_system',
+        build_operating_system,
+        _cli_entity_verifier(OperatingSys),
+        requires=('org', 'loc'),
+    )
 
     # Create new hostgroup using proper entities
-    hostgroup = make_hostgroup({
-        'location-ids': loc['id'],
-        'environment-id': env['id'],
-        'lifecycle-environment-id': lce['id'],
-        'puppet-proxy-id': puppet_proxy['id'],
-        'puppet-ca-proxy-id': puppet_proxy['id'],
-        'content-view-id': cv['id'],
-        'domain-id': domain['id'],
-        'subnet-id': subnet['id'],
-        'organization-ids': org['id'],
-        'architecture-id': arch['id'],
-        'partition-table-id': ptable['id'],
-        'medium-id': media['id'],
-        'operatingsystem-id': os['id'],
-        'content-source-id': puppet_proxy['id'],
-    })
+    hostgroup = snapshot.get_or_build(
+        'hostgroup',
+        lambda: _id_and_name(make_hostgroup({
+            'location-ids': loc['id'],
+            'environment-id': env['id'],
+            'lifecycle-environment-id': lce['id'],
+            'puppet-proxy-id': puppet_proxy['id'],
+            'puppet-ca-proxy-id': puppet_proxy['id'],
+            'content-view-id': cv['id'],
+            'domain-id': domain['id'],
+            'subnet-id': subnet['id'],
+            'organization-ids': org['id'],
+            'architecture-id': os['architecture_id'],
+            'partition-table-id': os['ptable_id'],
+            'medium-id': os['medium_id'],
+            'operatingsystem-id': os['id'],
+            'content-source-id': puppet_proxy['id'],
+        })),
+        _cli_entity_verifier(HostGroup),
+        requires=(
+            'org', 'loc', 'lce', 'content_view', 'environment', 'proxy',
+            'domain', 'subnet', 'operating_system',
+        ),
+    )
 
     return {
-        'hostgroup': hostgroup,
-        'subnet': subnet,
-        'domain': domain,
-        'ptable': ptable,
-        'os': os
+        'hostgroup': HostGroup.info({'id': hostgroup['id']}),
+        'subnet': Subnet.info({'id': subnet['id']}),
+        'domain': Domain.info({'id': domain['id']}),
+        'ptable': PartitionTable.info({'id': os['ptable_id']}),
+        'os': OperatingSys.info({'id': os['id']}),
     }
 
 
+def _id_and_name(entity):
+    """Return the id and name of a CLI entity info dictionary, which is what
+    :func:`configure_env_for_provision` records in its snapshot.
+    """
+    return {'id': entity['id'], 'name': entity.get('name')}
+
+
 def publish_puppet_module(puppet_modules, repo_url, organization_id=None):
     """Creates puppet repo, sync it via provided url and publish using
     Content View publishing mechanism. It makes puppet class available
@@ -3189,8 +3453,26 @@ def _get_capsule_vm_distro_repos(distro):
     return rh_product_arch, rh_product_releasever, rh_repos
 
 
+def _get_capsule_setup_state_path(capsule_vm, inputs):
+    """Return the path of the file where the capsule setup pipeline saves the
+    results of the completed stages of ``capsule_vm``. Setups with different
+    ``inputs``, e.g. another organization, do not share their results.
+    """
+    state_dir = os.path.join(gettempdir(), 'robottelo', 'capsule_setup')
+    if not os.path.exists(state_dir):
+        try:
+            os.makedirs(state_dir)
+        except OSError:
+            if not os.path.exists(state_dir):
+                raise
+    return os.path.join(state_dir, '{0}-{1}.json'.format(
+        capsule_vm.hostname, fingerprint(inputs)))
+
+
 def setup_capsule_virtual_machine(capsule_vm, org_id=None, lce_id=None,
-                                  organization_ids=None, location_ids=None):
+                                  organization_ids=None, location_ids=None,
+                                  resume=True, distro=None, install=True,
+                                  timings=None):
     """Setup a Virtual Machine to host a capsule node
 
     :param capsule_vm: the virtual machine to
@@ -3202,8 +3484,28 @@ def setup_capsule_virtual_machine(capsule_vm, org_id=None, lce_id=None,
      organizations that will use the capsule.
     :param location_ids: the location ids for which the content
      will be synchronized.
+    :param resume: whether to resume from the last completed stage when a
+     previous setup of the same virtual machine failed.
+    :param distro: the virtual machine distro, ``capsule_vm.capsule_distro``
+     by default.
+    :param install: whether to install the capsule. When ``False`` the
+     virtual machine is only registered and the capsule packages installed,
+     e.g. to save it as a capsule image, and no capsule is returned.
+    :param timings: a dictionary updated with the seconds taken by every
+     stage run.
     :return tuple: capsule, org, lce  objects
 
+    The setup is run as a :class:`robottelo.pipeline.Pipeline`. Capsule
+    certificate generation and the katello CA installation on the virtual
+    machine overlap with the Satellite side content preparation (manifest,
+    repositories, content view and activation key). The Satellite side hammer
+    stages are chained one after another as the CLI wrappers are not thread
+    safe. Per stage timings are logged, and when a stage fails, calling this
+    function again with the same virtual machine and organization, lifecycle
+    environment, organizations and locations resumes from that stage.
+    The capsule packages are only installed when missing, so virtual machines
+    created from a capsule image go straight to the installer.
+
     Notes:
 
     1. as this setup need the default manifest to be consumed, please ensure
@@ -3215,11 +3517,20 @@ def setup_capsule_virtual_machine(capsule_vm, org_id=None, lce_id=None,
        org_id and lce_id to be able to create and promote the capsule
        content view and to create the capsule subscription key.
     """
-    distro = capsule_vm.capsule_distro
+    if distro is None:
+        distro = capsule_vm.capsule_distro
     if distro not in (DISTRO_RHEL7,):
         raise CLIFactoryError(
             u'virtual machine distro "{}" not supported'.format(distro)
         )
+    # Results saved by a setup with other inputs must not be resumed
+    state_inputs = {
+        'org_id': org_id,
+        'lce_id': lce_id,
+        'organization_ids': organization_ids,
+        'location_ids': location_ids,
+        'distro': distro,
+    }
 
     # Get the necessary repositories info to setup a capsule host
     capsule_vm_distro_repos = _get_capsule_vm_distro_repos(distro)
@@ -3231,244 +3542,335 @@ def setup_capsule_virtual_machine(capsule_vm, org_id=None, lce_id=None,
     if location_ids is None:
         location_ids = []
 
-    if org_id is None:
-        # create a new org
-        capsule_org = make_org({
-            'name': 'capsule-{0}'.format(gen_string('alpha', 10))})
-        org_id = capsule_org['id']
-    else:
-        capsule_org = Org.info({'id': org_id})
+    def setup_org(results):
+        """Create a new org or read the given one"""
+        if org_id is None:
+            return make_org({
+                'name': 'capsule-{0}'.format(gen_string('alpha', 10))})
+        return Org.info({'id': org_id})
+
+    def setup_lce(results):
+        """Create a new lifecycle environment or read the given one"""
+        if lce_id is None:
+            # Create a new lifecycle environment for capsule only
+            return make_lifecycle_environment({
+                'name': 'capsule-{0}'.format(gen_string('alpha', 10)),
+                'organization-id': results['org']['id'],
+            })
+        return LifecycleEnvironment.info({
+            'id': lce_id, 'organization-id': results['org']['id']})
 
-    if lce_id is None:
-        # Create a new lifecycle environment for capsule only
-        capsule_lce = make_lifecycle_environment({
-            'name': 'capsule-{0}'.format(gen_string('alpha', 10)),
-            'organization-id': org_id
-        })
-        lce_id = capsule_lce['id']
-    else:
-        capsule_lce = LifecycleEnvironment.info({
-            'id': lce_id, 'organization-id': org_id})
+    def upload_manifest(results):
+        """Upload the org manifest"""
+        try:
+            manifests.upload_manifest_locked(
+                results['org']['id'],
+                manifests.clone(),
+                interface=manifests.INTERFACE_CLI
+            )
+        except CLIReturnCodeError as err:
+            raise CLIFactoryError(
+                u'Failed to upload manifest\n{0}'.format(err.msg))
 
-    # Upload the org manifest
-    try:
-        manifests.upload_manifest_locked(org_id, manifests.clone(),
-                                         interface=manifests.INTERFACE_CLI)
-    except CLIReturnCodeError as err:
-        raise CLIFactoryError(
-            u'Failed to upload manifest\n{0}'.format(err.msg))
+    def setup_repositories(results):
+        """Enable the RH capsule products and return the repositories info"""
+        capsule_org_id = results['org']['id']
+        for rh_repo in rh_repos:
+            try:
+                RepositorySet.enable({
+                    u'basearch': rh_product_arch,
+                    u'name': rh_repo['repository-set'],
+                    u'organization-id': capsule_org_id,
+                    u'product': rh_repo['product'],
+                    u'releasever': rh_repo.get('releasever'),
+                })
+            except CLIReturnCodeError as err:
+                raise CLIFactoryError(
+                    u'Failed to enable repository set\n{0}'.format(err.msg))
+        # Retrieve the repositories info
+        rh_repos_info = []
+        for rh_repo in rh_repos:
+            try:
+                rh_repo_info = Repository.info({
+                    u'name': rh_repo['repository'],
+                    u'organization-id': capsule_org_id,
+                    u'product': rh_repo['product'],
+                })
+                rh_repos_info.append(rh_repo_info)
+            except CLIReturnCodeError as err:
+                raise CLIFactoryError(
+                    u'Failed to fetch repository info\n{0}'.format(err.msg))
+        # If we aren't working with CDN, create custom repo with latest
+        # capsule repo available
+        if not settings.cdn and settings.capsule_repo:
+            prod = make_product_wait({
+                'name': 'capsule-{}'.format(gen_string('alphanumeric')),
+                'organization-id': capsule_org_id,
+            })
+            capsule_repo = make_repository({
+                'name': 'capsule-{}'.format(gen_string('alphanumeric')),
+                'product-id': prod['id'],
+                'organization-id': capsule_org_id,
+                'url': settings.capsule_repo,
+            })
+            rh_repos_info.append(capsule_repo)
+        # Set download policy to 'on demand'
+        for rh_repo in rh_repos_info:
+            Repository.update({
+                'download-policy': 'on_demand',
+                'id': rh_repo['id'],
+            })
+        return rh_repos_info
 
-    # Enable the RH capsule products
-    for rh_repo in rh_repos:
+    def synchronize_repositories(results):
+        """Synchronize all the repositories at once"""
         try:
-            RepositorySet.enable({
-                u'basearch': rh_product_arch,
-                u'name': rh_repo['repository-set'],
-                u'organization-id': org_id,
-                u'product': rh_repo['product'],
-                u'releasever': rh_repo.get('releasever'),
-            })
-        except CLIReturnCodeError as err:
+            Repository.synchronize_many(
+                [{'id': rh_repo['id']} for rh_repo in results['repositories']]
+            )
+        except (CLIError, CLIReturnCodeError) as err:
             raise CLIFactoryError(
-                u'Failed to enable repository set\n{0}'.format(err.msg))
-    # Retrieve the repositories info
-    rh_repos_info = []
-    for rh_repo in rh_repos:
+                u'Failed to synchronize repository\n{0}'.format(err))
+
+    def setup_content_view(results):
+        """Create, publish and promote the capsule content view"""
+        capsule_org_id = results['org']['id']
+        content_view_id = make_content_view({
+            u'organization-id': capsule_org_id,
+            u'name': 'capsule-{0}'.format(gen_string('alpha', 10))
+        })['id']
+        for rh_repo_info in results['repositories']:
+            try:
+                ContentView.add_repository({
+                    u'id': content_view_id,
+                    u'organization-id': capsule_org_id,
+                    u'repository-id': rh_repo_info['id'],
+                })
+            except CLIReturnCodeError as err:
+                raise CLIFactoryError(
+                    u'Failed to add repository to content view\n{0}'
+                    .format(err.msg)
+                )
+        # Publish the content view
         try:
-            rh_repo_info = Repository.info({
-                u'name': rh_repo['repository'],
-                u'organization-id': org_id,
-                u'product': rh_repo['product'],
-            })
-            rh_repos_info.append(rh_repo_info)
+            ContentView.publish({u'id': content_view_id})
         except CLIReturnCodeError as err:
             raise CLIFactoryError(
-                u'Failed to fetch repository info\n{0}'.format(err.msg))
-    # If we aren't working with CDN, create custom repo with latest capsule
-    # repo available
-    if not settings.cdn and settings.capsule_repo:
-        prod = make_product_wait({
-            'name': 'capsule-{}'.format(gen_string('alphanumeric')),
-            'organization-id': org_id,
-        })
-        capsule_repo = make_repository({
-            'name': 'capsule-{}'.format(gen_string('alphanumeric')),
-            'product-id': prod['id'],
-            'organization-id': org_id,
-            'url': settings.capsule_repo,
-        })
-        rh_repos_info.append(capsule_repo)
-    # Set download policy to 'on demand'
-    for rh_repo in rh_repos_info:
-        Repository.update({
-            'download-policy': 'on_demand',
-            'id': rh_repo['id'],
-        })
-    # Synchronize the repositories
-    for rh_repo in rh_repos_info:
+                u'Failed to publish new version of content view\n{0}'
+                .format(err.msg)
+            )
+        # Get the latest content view version id
         try:
-            Repository.synchronize({'id': rh_repo['id']})
+            content_view_version = ContentView.info(
+                {u'id': content_view_id}
+            )['versions'][-1]
         except CLIReturnCodeError as err:
             raise CLIFactoryError(
-                u'Failed to synchronize repository\n{0}'.format(err.msg))
-    # Create a content view
-    content_view_id = make_content_view({
-        u'organization-id': org_id,
-        u'name': 'capsule-{0}'.format(gen_string('alpha', 10))
-    })['id']
-    for rh_repo_info in rh_repos_info:
+                u'Failed to fetch content view info\n{0}'.format(err.msg))
+        # Promote content view version to lifecycle environment
         try:
-            ContentView.add_repository({
-                u'id': content_view_id,
-                u'organization-id': org_id,
-                u'repository-id': rh_repo_info['id'],
+            ContentView.version_promote({
+                u'id': content_view_version['id'],
+                u'organization-id': capsule_org_id,
+                u'to-lifecycle-environment-id': results['lce']['id'],
             })
         except CLIReturnCodeError as err:
             raise CLIFactoryError(
-                u'Failed to add repository to content view\n{0}'
+                u'Failed to promote version to next environment\n{0}'
                 .format(err.msg)
             )
-    # Publish the content view
-    try:
-        ContentView.publish({u'id': content_view_id})
-    except CLIReturnCodeError as err:
-        raise CLIFactoryError(
-            u'Failed to publish new version of content view\n{0}'
-            .format(err.msg)
-        )
-    # Get the latest content view version id
-    try:
-        content_view_version = ContentView.info(
-            {u'id': content_view_id}
-        )['versions'][-1]
-    except CLIReturnCodeError as err:
-        raise CLIFactoryError(
-            u'Failed to fetch content view info\n{0}'.format(err.msg))
-    # Promote content view version to lifecycle environment
-    try:
-        ContentView.version_promote({
-            u'id': content_view_version['id'],
-            u'organization-id': org_id,
-            u'to-lifecycle-environment-id': lce_id,
+        return content_view_id
+
+    def setup_activation_key(results):
+        """Create the capsule activation key with all the subscriptions"""
+        capsule_org_id = results['org']['id']
+        activation_key = make_activation_key({
+            u'organization-id': capsule_org_id,
+            u'lifecycle-environment-id': results['lce']['id'],
+            u'content-view-id': results['content_view'],
+            u'name': 'capsule-{0}'.format(gen_alphanumeric())
         })
-    except CLIReturnCodeError as err:
-        raise CLIFactoryError(
-            u'Failed to promote version to next environment\n{0}'
-            .format(err.msg)
-        )
-    activation_key = make_activation_key({
-        u'organization-id': org_id,
-        u'lifecycle-environment-id': lce_id,
-        u'content-view-id': content_view_id,
-        u'name': 'capsule-{0}'.format(gen_alphanumeric())
-    })
-    ActivationKey.update({
-        'auto-attach': 0,
-        'id': activation_key['id'],
-        'organization-id': org_id,
-    })
-    # Add subscriptions to activation-key
-    subscriptions = Subscription.list({'organization-id': org_id})
-    for subscription in subscriptions:
-        activationkey_add_subscription_to_repo({
-            'organization-id': org_id,
-            'activationkey-id': activation_key['id'],
-            'subscription': subscription['name']
+        ActivationKey.update({
+            'auto-attach': 0,
+            'id': activation_key['id'],
+            'organization-id': capsule_org_id,
         })
-    # Install katello ca on capsule virtual machine
-    capsule_vm.install_katello_ca()
-    # Register the capsule host to satellite
-    capsule_vm.register_contenthost(
-        capsule_org['name'],
-        activation_key=activation_key['name']
-    )
-    # Patch the os release version
-    capsule_vm.run(
-        "touch /etc/yum/vars/releasever "
-        "&& echo '{0}' > /etc/yum/vars/releasever"
-        .format(rh_product_releasever)
-    )
-    # Enable the repositories
-    for repo in rh_repos:
-        repo_id = repo['repository-id']
-        capsule_vm.enable_repo(repo_id)
+        # Add subscriptions to activation-key
+        subscriptions = Subscription.list(
+            {'organization-id': capsule_org_id})
+        for subscription in subscriptions:
+            activationkey_add_subscription_to_repo({
+                'organization-id': capsule_org_id,
+                'activationkey-id': activation_key['id'],
+                'subscription': subscription['name']
+            })
+        return activation_key
+
+    def generate_certificates(results):
+        """Generate the capsule certificates and return the installer
+        command
+        """
+        result = ssh.command(
+            'capsule-certs-generate '
+            '--foreman-proxy-fqdn {0} '
+            '--certs-tar {1}'
+            .format(capsule_vm.hostname, cert_file_path)
+        )
+        if result.return_code != 0:
+            raise CLIFactoryError(
+                u'was unable to generate certificate\n{}'.format(
+                    result.stderr))
+        # retrieve the installer command from the result output
+        return _extract_capsule_satellite_installer_command(result.stdout)
+
+    def copy_certificates(results):
+        """Copy the certificate to capsule vm"""
+        _, temporary_local_cert_file_path = mkstemp(suffix='-certs.tar')
+        try:
+            download_file(
+                remote_file=cert_file_path,
+                local_file=temporary_local_cert_file_path,
+                hostname=settings.server.hostname
+            )
+            upload_file(
+                local_file=temporary_local_cert_file_path,
+                remote_file=cert_file_path,
+                hostname=capsule_vm.hostname
+            )
+        finally:
+            # delete the temporary file
+            os.remove(temporary_local_cert_file_path)
+
+    def install_katello_ca(results):
+        """Install katello ca on capsule virtual machine"""
+        capsule_vm.install_katello_ca()
+
+    def register_capsule_host(results):
+        """Register the capsule host to satellite and enable the repos"""
+        capsule_vm.register_contenthost(
+            results['org']['name'],
+            activation_key=results['activation_key']['name']
+        )
+        # Patch the os release version
+        capsule_vm.run(
+            "touch /etc/yum/vars/releasever "
+            "&& echo '{0}' > /etc/yum/vars/releasever"
+            .format(rh_product_releasever)
+        )
+        # Enable the repositories
+        for repo in rh_repos:
+            capsule_vm.enable_repo(repo['repository-id'])
+        # Refresh the subscription
+        capsule_vm.run('subscription-manager refresh')
+        capsule_vm.run('yum clean all && yum repolist')
+
+    def install_capsule_packages(results):
+        """Install Satellite Capsule product, unless already installed"""
+        if capsule_vm.run('rpm -q satellite-capsule').return_code == 0:
+            logger.info(
+                'satellite-capsule already installed on %s',
+                capsule_vm.hostname)
+            return
+        capsule_vm.run('yum install -y satellite-capsule')
+        result = capsule_vm.run('rpm -q satellite-capsule')
+        if result.return_code != 0:
+            raise CLIFactoryError(
+                u'Failed to install satellite-capsule package\n{}'.format(
+                    result.stderr)
+            )
 
-    # Refresh the subscription
-    capsule_vm.run('subscription-manager refresh')
-    capsule_vm.run('yum clean all && yum repolist')
+    def run_installer(results):
+        """Run the capsule installer"""
+        satellite_installer_cmd = results['certificates']
+        if bz_bug_is_open(1458749):
+            if '--scenario foreman-proxy-content' in satellite_installer_cmd:
+                satellite_installer_cmd = satellite_installer_cmd.replace(
+                     '--scenario foreman-proxy-content', '--scenario capsule')
+        result = capsule_vm.run(satellite_installer_cmd)
+        if result.return_code != 0:
+            # before exit download the capsule log file
+            _, log_path = mkstemp(prefix='capsule_external-', suffix='.log')
+            download_file(
+                '/var/log/foreman-installer/capsule.log',
+                log_path,
+                capsule_vm.ip_addr
+            )
+            raise CLIFactoryError(result.return_code, result.stderr,
+                                  u'foreman installer failed at capsule host')
+
+        result = capsule_vm.run('systemctl status pulp_celerybeat.service')
+        if 'inactive (dead)' in '\n'.join(result.stdout):
+            raise CLIFactoryError('pulp_celerybeat service not running')
+
+    def setup_capsule(results):
+        """Read the capsule and associate it to organizations and
+        locations
+        """
+        capsule = Capsule.info({'name': capsule_vm.hostname})
+        if organization_ids:
+            # update the capsule with organization_ids and location_ids
+            if not location_ids:
+                location_ids.append(
+                    Location.info({'name': DEFAULT_LOC})['id'])
+
+            Capsule.update({
+                'id': capsule['id'],
+                'organization-ids': organization_ids,
+                'location-ids': location_ids
+            })
+        return capsule
 
     cert_file_path = '/tmp/{0}-certs.tar'.format(capsule_vm.hostname)
-    result = ssh.command(
-        'capsule-certs-generate '
-        '--foreman-proxy-fqdn {0} '
-        '--certs-tar {1}'
-        .format(capsule_vm.hostname, cert_file_path)
+    pipeline = Pipeline(
+        'capsule-setup-{0}'.format(capsule_vm.hostname),
+        state_path=_get_capsule_setup_state_path(capsule_vm, state_inputs),
     )
-    if result.return_code != 0:
-        raise CLIFactoryError(
-            u'was unable to generate certificate\n{}'.format(result.stderr))
-
-    # retrieve the installer command from the result output
-    satellite_installer_cmd = _extract_capsule_satellite_installer_command(
-        result.stdout
+    # Satellite side content preparation, chained as it uses hammer
+    pipeline.add_stage('org', setup_org)
+    pipeline.add_stage('lce', setup_lce, requires=('org',))
+    pipeline.add_stage('manifest', upload_manifest, requires=('lce',))
+    pipeline.add_stage(
+        'repositories', setup_repositories, requires=('manifest',))
+    pipeline.add_stage(
+        'synchronize', synchronize_repositories, requires=('repositories',))
+    pipeline.add_stage(
+        'content_view', setup_content_view, requires=('synchronize',))
+    pipeline.add_stage(
+        'activation_key', setup_activation_key, requires=('content_view',))
+    # Certificates and virtual machine preparation, run meanwhile
+    pipeline.add_stage('certificates', generate_certificates)
+    pipeline.add_stage(
+        'copy_certificates', copy_certificates, requires=('certificates',))
+    pipeline.add_stage('katello_ca', install_katello_ca)
+    # Capsule host registration and installation
+    pipeline.add_stage(
+        'register',
+        register_capsule_host,
+        requires=('activation_key', 'katello_ca'),
     )
-    # copy the certificate to capsule vm
-    _, temporary_local_cert_file_path = mkstemp(suffix='-certs.tar')
-    download_file(
-        remote_file=cert_file_path,
-        local_file=temporary_local_cert_file_path,
-        hostname=settings.server.hostname
+    pipeline.add_stage(
+        'packages', install_capsule_packages, requires=('register',))
+    pipeline.add_stage(
+        'installer',
+        run_installer,
+        requires=('packages', 'copy_certificates'),
     )
-    upload_file(
-        local_file=temporary_local_cert_file_path,
-        remote_file=cert_file_path,
-        hostname=capsule_vm.hostname
-    )
-    # delete the temporary file
-    os.remove(temporary_local_cert_file_path)
-    # Install Satellite Capsule product
-    capsule_vm.run('yum install -y satellite-capsule')
-    result = capsule_vm.run('rpm -q satellite-capsule')
-    if result.return_code != 0:
+    pipeline.add_stage('capsule', setup_capsule, requires=('installer',))
+    try:
+        results = pipeline.run(
+            resume=resume, targets=None if install else ('packages',))
+    except PipelineError as err:
+        if isinstance(err.error, CLIFactoryError):
+            raise err.error
         raise CLIFactoryError(
-            u'Failed to install satellite-capsule package\n{}'.format(
-                result.stderr)
+            u'Capsule setup failed at stage "{0}"\n{1}'.format(
+                err.stage, err.error)
         )
+    finally:
+        if timings is not None:
+            timings.update(pipeline.timings)
 
-    if bz_bug_is_open(1458749):
-        if '--scenario foreman-proxy-content' in satellite_installer_cmd:
-            satellite_installer_cmd = satellite_installer_cmd.replace(
-                 '--scenario foreman-proxy-content', '--scenario capsule')
-    result = capsule_vm.run(satellite_installer_cmd)
-    if result.return_code != 0:
-        # before exit download the capsule log file
-        _, log_path = mkstemp(prefix='capsule_external-', suffix='.log')
-        download_file(
-            '/var/log/foreman-installer/capsule.log',
-            log_path,
-            capsule_vm.ip_addr
-        )
-        raise CLIFactoryError(result.return_code, result.stderr,
-                              u'foreman installer failed at capsule host')
-
-    result = capsule_vm.run('systemctl status pulp_celerybeat.service')
-    if 'inactive (dead)' in '\n'.join(result.stdout):
-        raise CLIFactoryError('pulp_celerybeat service not running')
-
-    capsule = Capsule.info({'name': capsule_vm.hostname})
-
-    if organization_ids:
-        # update the capsule with organization_ids and location_ids
-        if not location_ids:
-            location_ids.append(Location.info({'name': DEFAULT_LOC})['id'])
-
-        Capsule.update({
-            'id': capsule['id'],
-            'organization-ids': organization_ids,
-            'location-ids': location_ids
-        })
-
-    return capsule, capsule_org, capsule_lce
+    return results.get('capsule'), results['org'], results['lce']
 
 
 def add_permissions_to_user(user_id, permissions_list):
@@ -22,6 +22,7 @@ Subcommands::
     upload-content                Upload content into the repository
 """
 from robottelo.cli.base import Base
+from robottelo.cli.task import TASKS_TIMEOUT, Task
 
 
 class Repository(Base):
@@ -77,6 +78,29 @@ class Repository(Base):
             return_raw_response=return_raw_response,
         )
 
+    @classmethod
+    def synchronize_async(cls, options):
+        """Start a repository synchronization without waiting for it.
+
+        :return: the UUID of the synchronization task
+        """
+        options = dict(options, **{u'async': True})
+        return Task.get_task_id(cls.synchronize(options))
+
+    @classmethod
+    def synchronize_many(cls, options_list, timeout=TASKS_TIMEOUT):
+        """Synchronize several repositories concurrently.
+
+        All synchronizations are started with ``--async`` and their tasks are
+        awaited together by :meth:`robottelo.cli.task.Task.wait_for_tasks`.
+
+        :param options_list: list of options, one per repository to sync
+        :param int timeout: maximum number of seconds to wait for all syncs
+        :return: a dictionary mapping every task id to its final task info
+        """
+        task_ids = [cls.synchronize_async(options) for options in options_list]
+        return Task.wait_for_tasks(task_ids, timeout=timeout)
+
     @classmethod
     def remove_content(cls, options):
         """Remove content from a repository"""
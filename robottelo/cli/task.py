@@ -15,8 +15,37 @@ Subcommands::
     progress                      Show the progress of the task
     resume                        Resume all tasks paused in error state
 """
+import re
+import time
 
-from robottelo.cli.base import Base
+from robottelo.cli.base import Base, CLIError
+
+TASK_ID_REGEX = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+#: Default seconds given to the tasks started by the ``*_many`` helpers
+TASKS_TIMEOUT = 3600
+#: States of the tasks which will not progress anymore, ``paused`` tasks
+#: stopped on an error
+FINISHED_STATES = ('paused', 'stopped')
+
+
+class TaskFailedError(CLIError):
+    """Indicates that a foreman task finished with a result different from
+    ``success``.
+
+    :param tasks: list of the task dictionaries which did not succeed
+
+    """
+
+    def __init__(self, tasks, msg):
+        self.tasks = tasks
+        super(TaskFailedError, self).__init__(msg)
+
+
+class TaskTimeoutError(CLIError):
+    """Indicates that some foreman tasks were still running after the
+    expected period of time.
+    """
 
 
 class Task(Base):
@@ -54,3 +83,85 @@ class Task(Base):
         """
         cls.command_sub = 'resume'
         return cls.execute(cls._construct_command(options))
+
+    @classmethod
+    def get_task_id(cls, result):
+        """Extract the task UUID from the output of an ``--async`` command.
+
+        Hammer prints the started task either as an ``id`` column or embedded
+        in the ``message`` column, depending on the command and version.
+
+        :param result: output of an async command executed with
+            ``output_format='csv'``
+        :return: the task UUID
+        :raises robottelo.cli.base.CLIError: if no task UUID can be found
+        """
+        if isinstance(result, list):
+            result = result[0] if result else {}
+        if isinstance(result, dict):
+            candidates = [result.get('id'), result.get('message')]
+        else:
+            candidates = [result]
+        for candidate in candidates:
+            match = TASK_ID_REGEX.search(candidate or u'')
+            if match:
+                return match.group(0)
+        raise CLIError(
+            u'Could not find a task id in async output: {0}'.format(result))
+
+    @classmethod
+    def wait_for_tasks(cls, task_ids, timeout=None, poll_rate=5):
+        """Wait for several tasks at once using a single poller.
+
+        Instead of calling ``hammer task progress`` for every task, which
+        serializes the waits, a single ``hammer task list`` query covering all
+        pending tasks is issued every ``poll_rate`` seconds. The total wait is
+        then bound by the slowest task instead of the sum of all of them.
+
+        :param task_ids: iterable of task UUIDs to wait for
+        :param int timeout: maximum number of seconds to wait for all tasks.
+            Defaults to ``None`` which means wait forever.
+        :param int poll_rate: seconds to sleep between polls
+        :return: a dictionary mapping every task id to its final task info
+        :raises robottelo.cli.task.TaskFailedError: if any task finished,
+            i.e. is ``stopped`` or ``paused``, with a result different from
+            ``success``
+        :raises robottelo.cli.task.TaskTimeoutError: if any task is still
+            pending after ``timeout`` seconds
+        """
+        pending = set(task_ids)
+        finished = {}
+        end_time = time.time() + timeout if timeout is not None else None
+        while pending:
+            search = u' or '.join(
+                u'id = {0}'.format(task_id) for task_id in sorted(pending))
+            for task in cls.list({u'search': search}):
+                if task.get('id') not in pending:
+                    continue
+                if task.get('state') in FINISHED_STATES:
+                    pending.discard(task['id'])
+                    finished[task['id']] = task
+            if not pending:
+                break
+            if end_time is not None and time.time() >= end_time:
+                raise TaskTimeoutError(
+                    u'Tasks {0} did not finish in {1} seconds'.format(
+                        u', '.join(sorted(pending)), timeout)
+                )
+            time.sleep(poll_rate)
+        failed = [
+            task for task in finished.values()
+            if task.get('result') != 'success'
+        ]
+        if failed:
+            raise TaskFailedError(
+                failed,
+                u'Tasks finished without success: {0}'.format(
+                    u', '.join(
+                        u'{0} ({1}, {2})'.format(
+                            task['id'], task.get('state'), task.get('result'))
+                        for task in failed
+                    )
+                )
+            )
+        return finished
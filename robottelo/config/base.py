@@ -8,6 +8,7 @@ from functools import partial
 from logging import config
 from nailgun import entities, entity_mixins
 from nailgun.config import ServerConfig
+from robottelo.api.session import install_session
 from robottelo.config import casts
 from six.moves.urllib.parse import urlunsplit, urljoin
 from six.moves.configparser import (
@@ -266,6 +267,7 @@ class CapsuleSettings(FeatureSettings):
         self.instance_name = None
         self.hash = None
         self.ddns_package_url = None
+        self.use_image = False
 
     def read(self, reader):
         """Read clients settings."""
@@ -273,6 +275,7 @@ class CapsuleSettings(FeatureSettings):
         self.instance_name = reader.get('capsule', 'instance_name')
         self.hash = reader.get('capsule', 'hash')
         self.ddns_package_url = reader.get('capsule', 'ddns_package_url')
+        self.use_image = reader.get('capsule', 'use_image', False, bool)
 
     @property
     def hostname(self):
@@ -304,6 +307,16 @@ class ClientsSettings(FeatureSettings):
         super(ClientsSettings, self).__init__(*args, **kwargs)
         self.image_dir = None
         self.provisioning_server = None
+        self.pool_size = 0
+        self.pool_quotas = {}
+        self.pool_max_lease_age = 7200
+        self.pool_dir = None
+        self.provisioning_concurrency = 4
+        self.provisioning_servers = []
+        self.scheduling = False
+        self.package_mirror = {}
+        self.background_destroy = False
+        self.sweep_tag = None
 
     def read(self, reader):
         """Read clients settings."""
@@ -311,6 +324,21 @@ class ClientsSettings(FeatureSettings):
             'clients', 'image_dir', '/opt/robottelo/images')
         self.provisioning_server = reader.get(
             'clients', 'provisioning_server')
+        self.pool_size = reader.get('clients', 'pool_size', 0, int)
+        self.pool_quotas = reader.get('clients', 'pool_quotas', {}, dict)
+        self.pool_max_lease_age = reader.get(
+            'clients', 'pool_max_lease_age', 7200, int)
+        self.pool_dir = reader.get('clients', 'pool_dir')
+        self.provisioning_concurrency = reader.get(
+            'clients', 'provisioning_concurrency', 4, int)
+        self.provisioning_servers = reader.get(
+            'clients', 'provisioning_servers', [], list)
+        self.scheduling = reader.get('clients', 'scheduling', False, bool)
+        self.package_mirror = reader.get(
+            'clients', 'package_mirror', {}, dict)
+        self.background_destroy = reader.get(
+            'clients', 'background_destroy', False, bool)
+        self.sweep_tag = reader.get('clients', 'sweep_tag')
 
     def validate(self):
         """Validate clients settings."""
@@ -318,6 +346,13 @@ class ClientsSettings(FeatureSettings):
         if self.provisioning_server is None:
             validation_errors.append(
                 '[clients] provisioning_server option must be provided.')
+        if self.pool_size < 0:
+            validation_errors.append(
+                '[clients] pool_size option must not be negative.')
+        if not all(quota.isdigit() for quota in self.pool_quotas.values()):
+            validation_errors.append(
+                '[clients] pool_quotas option must map distros to numbers '
+                'of virtual machines, e.g. rhel7=3,rhel6=1.')
         return validation_errors
 
 
@@ -439,6 +474,10 @@ class FakeManifestSettings(FeatureSettings):
         self.cert_url = None
         self.key_url = None
         self.url = None
+        self.pool_size = 0
+        self.pool_spill_dir = None
+        self.pool_spill_size = 0
+        self.upload_concurrency = 1
 
     def read(self, reader):
         """Read fake manifest settings."""
@@ -448,11 +487,19 @@ class FakeManifestSettings(FeatureSettings):
             'fake_manifest', 'key_url')
         self.url = reader.get(
             'fake_manifest', 'url')
+        self.pool_size = reader.get(
+            'fake_manifest', 'pool_size', 0, int)
+        self.pool_spill_dir = reader.get(
+            'fake_manifest', 'pool_spill_dir')
+        self.pool_spill_size = reader.get(
+            'fake_manifest', 'pool_spill_size', 0, int)
+        self.upload_concurrency = reader.get(
+            'fake_manifest', 'upload_concurrency', 1, int)
 
     def validate(self):
         """Validate fake manifest settings."""
         validation_errors = []
-        if not all(vars(self).values()):
+        if not all((self.cert_url, self.key_url, self.url)):
             validation_errors.append(
                 'All [fake_manifest] cert_url, key_url, url options must '
                 'be provided.'
@@ -495,6 +542,7 @@ class LibvirtHostSettings(FeatureSettings):
         super(LibvirtHostSettings, self).__init__(*args, **kwargs)
         self.libvirt_image_dir = None
         self.libvirt_hostname = None
+        self.libvirt_max_guests = 0
 
     def read(self, reader):
         """Read libvirt host settings."""
@@ -503,6 +551,8 @@ class LibvirtHostSettings(FeatureSettings):
         )
         self.libvirt_hostname = reader.get(
             'compute_resources', 'libvirt_hostname')
+        self.libvirt_max_guests = reader.get(
+            'compute_resources', 'libvirt_max_guests', 0, int)
 
     def validate(self):
         """Validate libvirt host settings."""
@@ -977,6 +1027,16 @@ class Settings(object):
         self.run_one_datapoint = self.reader.get(
             'robottelo', 'run_one_datapoint', False, bool)
         self.cleanup = self.reader.get('robottelo', 'cleanup', False, bool)
+        self.cleanup_mode = self.reader.get(
+            'robottelo', 'cleanup_mode', 'class')
+        self.cleanup_journal = self.reader.get(
+            'robottelo', 'cleanup_journal', '/tmp/robottelo/cleanup_journal')
+        self.api_pool_size = self.reader.get(
+            'robottelo', 'api_pool_size', 10, int)
+        self.api_max_retries = self.reader.get(
+            'robottelo', 'api_max_retries', 3, int)
+        self.api_retry_backoff = self.reader.get(
+            'robottelo', 'api_retry_backoff', 0.5, float)
         self.upstream = self.reader.get('robottelo', 'upstream', True, bool)
         self.verbosity = self.reader.get(
             'robottelo',
@@ -1016,6 +1076,15 @@ class Settings(object):
                 '[robottelo] webdriver should be one of {0}.'
                 .format(', '.join(webdrivers))
             )
+        cleanup_modes = ('class', 'deferred', 'background')
+        if self.cleanup_mode not in cleanup_modes:
+            validation_errors.append(
+                '[robottelo] cleanup_mode should be one of {0}.'
+                .format(', '.join(cleanup_modes))
+            )
+        if self.api_pool_size < 0:
+            validation_errors.append(
+                '[robottelo] api_pool_size should not be negative.')
         if self.browser == 'saucelabs':
             if self.saucelabs_user is None:
                 validation_errors.append(
@@ -1056,6 +1125,8 @@ class Settings(object):
         returned by :meth:`robottelo.helpers.get_nailgun_config`. See
         ``robottelo.entity_mixins.Entity`` for more information on the effects
         of this.
+        * Make NailGun send its requests through a pooled keep-alive session,
+          see :mod:`robottelo.api.session`, unless ``api_pool_size`` is 0.
         * Set a default value for ``nailgun.entities.GPGKey.content``.
         * Set the default value for
           ``nailgun.entities.DockerComputeResource.url``
@@ -1068,6 +1139,12 @@ class Settings(object):
             self.server.get_credentials(),
             verify=False,
         )
+        if self.api_pool_size:
+            install_session(
+                pool_size=self.api_pool_size,
+                max_retries=self.api_max_retries,
+                backoff_factor=self.api_retry_backoff,
+            )
 
         gpgkey_init = entities.GPGKey.__init__
 
@@ -0,0 +1,441 @@
+"""Simulate large fleets of content hosts talking to the RHSM API.
+
+Registers thousands of simulated consumers, using the random facts from
+:func:`robottelo.system_facts.generate_system_facts`, and keeps them checking
+in and uploading package profiles for a period of time. Per request latency is
+recorded in a :class:`robottelo.metrics.LatencyRecorder`, which allows
+measuring how Satellite behaves at fleet scale without real virtual machines.
+
+Usage::
+
+    from robottelo.consumer_simulator import ConsumerSimulator
+
+    simulator = ConsumerSimulator(
+        consumers=2000,
+        organization=org.label,
+        activation_key=activation_key.name,
+        arrival_rate=20,
+        concurrency=50,
+        checkin_interval=60,
+        profile_interval=300,
+        duration=900,
+    )
+    recorder = simulator.run()
+    print(recorder.summary())
+
+The simulator can also be exercised against a local stub server::
+
+    from robottelo.consumer_simulator import (
+        ConsumerSimulator,
+        StubCandlepinServer,
+    )
+
+    with StubCandlepinServer(latency=0.05) as server:
+        ConsumerSimulator(
+            consumers=500, url=server.url, organization='org').run()
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+from fauxfactory import gen_alpha, gen_choice, gen_integer
+from robottelo.config import settings
+from robottelo.metrics import LatencyRecorder
+from robottelo.system_facts import ARCHITECTURES, generate_system_facts
+from six.moves import BaseHTTPServer, queue, socketserver
+
+LOGGER = logging.getLogger(__name__)
+
+REGISTER = 'register'
+CHECKIN = 'checkin'
+UPLOAD_PACKAGE_PROFILE = 'upload_package_profile'
+
+
+def generate_package_profile(count=300):
+    """Generate a random package profile as uploaded by subscription-manager.
+
+    :param int count: number of packages in the profile
+    :return: A list of package dictionaries
+    :rtype: list
+    """
+    return [
+        {
+            u'name': gen_alpha(8).lower(),
+            u'version': u'{0}.{1}'.format(
+                gen_integer(0, 9), gen_integer(0, 20)),
+            u'release': u'{0}.el7'.format(gen_integer(1, 30)),
+            u'arch': gen_choice(ARCHITECTURES[1:2] + [u'noarch']),
+            u'epoch': 0,
+            u'vendor': u'Red Hat, Inc.',
+        }
+        for _ in range(count)
+    ]
+
+
+class SimulatedConsumer(object):
+    """A fake content host with random facts and package profile.
+
+    :param str name: consumer FQDN, a random one is generated if omitted
+    :param int packages: number of packages in the package profile
+    """
+
+    def __init__(self, name=None, packages=300):
+        self.facts = generate_system_facts(name)
+        self.name = self.facts['network.hostname']
+        self.package_profile = generate_package_profile(packages)
+        self.uuid = None
+        self.cert_file = None
+
+
+class RHSMClient(object):
+    """Minimal client of the candlepin API exposed by Satellite under
+    ``/rhsm``, issuing the same calls subscription-manager does.
+
+    :param str url: Satellite base URL, e.g. ``https://satellite.example.com``
+    :param session: a ``requests.Session`` shared by all consumers
+    :param str cert_dir: directory where consumer identity certificates are
+        stored. Identity certificates are not used when it is ``None``.
+    """
+
+    def __init__(self, url, session, cert_dir=None):
+        self.url = url.rstrip('/') + '/rhsm'
+        self.session = session
+        self.cert_dir = cert_dir
+
+    def _request(self, method, path, consumer=None, **kwargs):
+        """Issue a request and raise on HTTP errors."""
+        if consumer is not None and consumer.cert_file is not None:
+            kwargs['cert'] = consumer.cert_file
+        response = self.session.request(
+            method, self.url + path, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def register(self, consumer, organization, activation_key=None):
+        """Register ``consumer`` to ``organization`` and store its UUID and
+        identity certificate.
+        """
+        params = {'owner': organization}
+        if activation_key is not None:
+            params['activation_keys'] = activation_key
+        response = self._request(
+            'POST',
+            '/consumers',
+            params=params,
+            json={
+                u'name': consumer.name,
+                u'type': u'system',
+                u'facts': consumer.facts,
+            },
+        )
+        data = response.json()
+        consumer.uuid = data['uuid']
+        id_cert = data.get('idCert') or {}
+        if self.cert_dir is not None and id_cert.get('cert'):
+            consumer.cert_file = os.path.join(
+                self.cert_dir, '{0}.pem'.format(consumer.uuid))
+            with open(consumer.cert_file, 'w') as handler:
+                handler.write(id_cert['cert'])
+                handler.write(id_cert['key'])
+        return data
+
+    def checkin(self, consumer):
+        """Check in like rhsmcertd does, fetching the certificate serials."""
+        return self._request(
+            'GET',
+            '/consumers/{0}/certificates/serials'.format(consumer.uuid),
+            consumer=consumer,
+        ).json()
+
+    def upload_package_profile(self, consumer):
+        """Upload the consumer package profile."""
+        return self._request(
+            'PUT',
+            '/consumers/{0}/packages'.format(consumer.uuid),
+            consumer=consumer,
+            json=consumer.package_profile,
+        )
+
+
+class ConsumerSimulator(object):
+    """Register and drive many simulated consumers concurrently.
+
+    Registrations are started at ``arrival_rate`` per second and executed by
+    ``concurrency`` worker threads. Every registered consumer then checks in
+    every ``checkin_interval`` seconds and uploads its package profile every
+    ``profile_interval`` seconds until ``duration`` seconds have elapsed since
+    the simulation started.
+
+    :param int consumers: number of consumers to register
+    :param str organization: label of the organization to register to
+    :param str activation_key: optional activation key name
+    :param float arrival_rate: registrations started per second
+    :param int concurrency: number of requests in flight at most
+    :param float checkin_interval: seconds between check-ins, ``None`` to
+        disable check-ins
+    :param float profile_interval: seconds between package profile uploads,
+        ``None`` to disable uploads
+    :param float duration: seconds the simulation keeps consumers active, when
+        ``None`` consumers are only registered
+    :param str url: Satellite base URL, defaults to ``server`` configuration
+    :param tuple auth: credentials used for registration, defaults to
+        ``server`` configuration
+    :param int packages: number of packages in each package profile
+    """
+
+    def __init__(self, consumers, organization, activation_key=None,
+                 arrival_rate=10, concurrency=20, checkin_interval=None,
+                 profile_interval=None, duration=None, url=None, auth=None,
+                 packages=300):
+        self.consumers = consumers
+        self.organization = organization
+        self.activation_key = activation_key
+        self.arrival_rate = arrival_rate
+        self.concurrency = concurrency
+        self.intervals = {
+            CHECKIN: checkin_interval,
+            UPLOAD_PACKAGE_PROFILE: profile_interval,
+        }
+        self.duration = duration
+        self.url = url or settings.server.get_url()
+        self.auth = auth
+        if self.auth is None and url is None:
+            self.auth = settings.server.get_credentials()
+        self.packages = packages
+        self.recorder = LatencyRecorder()
+        self.registered = []
+        self._queue = queue.PriorityQueue()
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._end_time = None
+        self._client = None
+
+    def _schedule(self, due, action, consumer):
+        """Queue ``action`` for ``consumer`` to run at time ``due``."""
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        self._queue.put((due, sequence, action, consumer))
+
+    def _schedule_next(self, action, consumer):
+        """Queue the next periodic ``action`` if it still fits in the
+        simulation duration.
+        """
+        interval = self.intervals.get(action)
+        if interval is None or self._end_time is None:
+            return
+        due = time.time() + interval
+        if due <= self._end_time:
+            self._schedule(due, action, consumer)
+
+    def _perform(self, action, consumer):
+        """Execute ``action`` recording its latency and queue follow ups."""
+        try:
+            with self.recorder.measure(action):
+                if action == REGISTER:
+                    self._client.register(
+                        consumer, self.organization, self.activation_key)
+                else:
+                    getattr(self._client, action)(consumer)
+        except Exception as err:
+            LOGGER.debug('%s failed for %s: %s', action, consumer.name, err)
+            return
+        if action == REGISTER:
+            with self._lock:
+                self.registered.append(consumer)
+            for periodic_action in self.intervals:
+                self._schedule_next(periodic_action, consumer)
+        else:
+            self._schedule_next(action, consumer)
+
+    def _worker(self):
+        """Run queued actions once they are due until a stop marker is
+        found.
+        """
+        while True:
+            item = self._queue.get()
+            try:
+                due, _, action, consumer = item
+                if action is None:
+                    return
+                delay = due - time.time()
+                if delay > 0:
+                    # Put it back so earlier actions queued meanwhile are not
+                    # delayed by this one.
+                    self._queue.put(item)
+                    time.sleep(min(delay, 0.05))
+                    continue
+                self._perform(action, consumer)
+            finally:
+                self._queue.task_done()
+
+    def run(self):
+        """Run the simulation and block until it is finished.
+
+        :return: the latency recorder with one histogram per action
+        :rtype: robottelo.metrics.LatencyRecorder
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.auth = self.auth
+        session.verify = False
+        cert_dir = tempfile.mkdtemp(prefix='robottelo-consumers-')
+        self._client = RHSMClient(self.url, session, cert_dir)
+        start = time.time()
+        if self.duration is not None:
+            self._end_time = start + self.duration
+        for index in range(self.consumers):
+            self._schedule(
+                start + float(index) / self.arrival_rate,
+                REGISTER,
+                SimulatedConsumer(packages=self.packages),
+            )
+        workers = [
+            threading.Thread(target=self._worker)
+            for _ in range(self.concurrency)
+        ]
+        try:
+            for worker in workers:
+                worker.daemon = True
+                worker.start()
+            self._queue.join()
+        finally:
+            for _ in workers:
+                self._schedule(0, None, None)
+            for worker in workers:
+                worker.join()
+            session.close()
+            shutil.rmtree(cert_dir, ignore_errors=True)
+        LOGGER.info(
+            'Simulated %s consumers in %.2f seconds: %s',
+            len(self.registered),
+            time.time() - start,
+            self.recorder.summary(),
+        )
+        return self.recorder
+
+
+class _StubCandlepinHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer the RHSM calls issued by :class:`RHSMClient`."""
+
+    consumer_path = re.compile(
+        r'^/rhsm/consumers/(?P<uuid>[^/]+)(?P<rest>/.*)?$')
+
+    def log_message(self, format, *args):
+        """Keep the stub quiet, requests are logged at debug level only."""
+        LOGGER.debug('stub candlepin: ' + format, *args)
+
+    def _reply(self, status, data=None):
+        """Send ``data`` as a JSON response."""
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        """Read and decode the JSON request body."""
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def _handle(self):
+        """Dispatch the request after the configured latency."""
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path = self.path.split('?', 1)[0]
+        body = self._read_body()
+        consumers = self.server.consumers
+        if path == '/rhsm/consumers' and self.command == 'POST':
+            consumer = {
+                u'uuid': str(uuid.uuid4()),
+                u'name': body.get(u'name'),
+                u'facts': body.get(u'facts'),
+            }
+            consumers[consumer[u'uuid']] = consumer
+            return self._reply(200, consumer)
+        match = self.consumer_path.match(path)
+        if not match or match.group('uuid') not in consumers:
+            return self._reply(404, {u'displayMessage': u'Not found'})
+        consumer = consumers[match.group('uuid')]
+        rest = match.group('rest')
+        if rest is None and self.command == 'GET':
+            return self._reply(200, consumer)
+        if rest is None and self.command == 'PUT':
+            consumer[u'facts'] = (body or {}).get(u'facts', consumer['facts'])
+            return self._reply(204)
+        if rest == '/certificates/serials' and self.command == 'GET':
+            return self._reply(200, [])
+        if rest == '/packages' and self.command == 'PUT':
+            consumer[u'packages'] = body
+            return self._reply(204)
+        return self._reply(404, {u'displayMessage': u'Not found'})
+
+    do_GET = do_POST = do_PUT = _handle
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    """HTTP server handling every request in its own thread."""
+    daemon_threads = True
+
+
+class StubCandlepinServer(object):
+    """In-process HTTP server faking the RHSM endpoints used by
+    :class:`ConsumerSimulator`.
+
+    :param float latency: seconds to wait before answering each request
+    :param int port: port to listen on, a free one is picked by default
+    """
+
+    def __init__(self, latency=0, port=0):
+        self.latency = latency
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL of the running server."""
+        return 'http://127.0.0.1:{0}'.format(self._server.server_address[1])
+
+    @property
+    def consumers(self):
+        """Dictionary of registered consumers by UUID."""
+        return self._server.consumers
+
+    def start(self):
+        """Start serving requests in a background thread."""
+        self._server = _ThreadingHTTPServer(
+            ('127.0.0.1', self.port), _StubCandlepinHandler)
+        self._server.latency = self.latency
+        self._server.consumers = {}
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and wait for its thread to finish."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -38,11 +38,17 @@ Usage::
        def test_that_conflict_with_test_to_lock(self)
             with locking_function(self.test_to_lock):
                 # do some operations that conflict with test_to_lock
+
+    # when up to a number of workers can run some operations at the same time
+    with FileSemaphore('candlepin_import', 2):
+        # at most two workers are running this block
 """
+import fcntl
 import functools
 import logging
 import os
 import tempfile
+import time
 import unittest2
 
 from contextlib import contextmanager
@@ -169,3 +175,73 @@ def locking_function(function, context=None):
         logger.info('locking function using file path:{}'.format(
             lock_file_path))
         yield lock_handler
+
+
+class FileSemaphore(object):
+    """Counting semaphore shared by all the processes of the host, e.g. the
+    pytest xdist workers.
+
+    The semaphore is made of ``size`` slot files, a slot is acquired by
+    holding an exclusive lock on its file. As the lock is released by the
+    system when the process dies, crashed workers never hold slots.
+
+    :param str name: the semaphore name, processes using the same name share
+        the same slots
+    :param int size: maximum number of holders at the same time
+    :param float poll_rate: seconds between attempts when all slots are busy
+    """
+
+    def __init__(self, name, size, poll_rate=0.5):
+        self.name = name
+        self.size = max(1, size)
+        self.poll_rate = poll_rate
+        self.slot = None
+        self.wait_time = None
+        self._handler = None
+
+    def _get_slot_path(self, slot):
+        """Return the path of the file of ``slot``"""
+        return os.path.join(
+            _get_temp_lock_function_dir(),
+            '{0}.semaphore-{1}'.format(self.name, slot)
+        )
+
+    def acquire(self):
+        """Wait for a free slot and acquire it.
+
+        :return: the acquired slot number. The time spent waiting is stored
+            in ``wait_time``.
+        """
+        start = time.time()
+        while True:
+            for slot in range(self.size):
+                handler = open(self._get_slot_path(slot), 'a')
+                try:
+                    fcntl.flock(handler, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (IOError, OSError):
+                    handler.close()
+                    continue
+                self._handler = handler
+                self.slot = slot
+                self.wait_time = time.time() - start
+                logger.info(
+                    'acquired semaphore %s slot %s after %.2f seconds',
+                    self.name, slot, self.wait_time)
+                return slot
+            time.sleep(self.poll_rate)
+
+    def release(self):
+        """Release the acquired slot"""
+        if self._handler is None:
+            return
+        fcntl.flock(self._handler, fcntl.LOCK_UN)
+        self._handler.close()
+        self._handler = None
+        self.slot = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
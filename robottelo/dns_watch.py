@@ -0,0 +1,180 @@
+"""Wait for a DNS record to be published and resolved.
+
+Hosts registered through dynamic DNS, like the capsule virtual machines, are
+only usable once the resolver of the hosts talking to them returns their
+record. :func:`watch_resolution` runs a single script on a host which checks
+the host resolver until it returns the expected address. Meanwhile it also
+queries the authoritative name servers of the record zone directly, to report
+when the record was published. The authoritative name servers may never
+return the record, e.g. when it is only served by an internal dynamic DNS
+server, so only the resolver decides whether the record is resolved. Checks
+start every 0.2 seconds and back off up to every 5 seconds, so the script
+returns shortly after the record propagated.
+
+Usage::
+
+    from robottelo.dns_watch import watch_resolution
+
+    report = watch_resolution('capsule.example.com', '192.168.0.10')
+    if not report.resolved:
+        raise Exception(u'capsule hostname not resolved: {0}'.format(report))
+    print(report.latency)
+
+When ``dig`` is not available on the host, or no authoritative name server is
+found, only the host resolver is checked.
+"""
+import logging
+import time
+
+from six.moves import shlex_quote
+
+from robottelo import ssh
+
+LOGGER = logging.getLogger(__name__)
+
+#: Seconds given to a record to be published and resolved
+WATCH_TIMEOUT = 600
+#: Seconds between the first checks
+WATCH_INTERVAL = 0.2
+#: Maximum seconds between two checks
+WATCH_MAX_INTERVAL = 5
+
+# Reports, as "<stage> <elapsed milliseconds>" lines, when the authoritative
+# name servers and the resolver return the expected address, and exits once
+# the resolver does. Expects the hostname, ip_addr, authoritative, timeout,
+# interval and max_interval variables to be set.
+_WATCH_SCRIPT = u'''
+start=$(date +%s%N)
+deadline=$((SECONDS + timeout))
+report() { echo "$1 $((($(date +%s%N) - start) / 1000000))"; }
+servers=
+if [ "$authoritative" = 1 ] && command -v dig >/dev/null; then
+    zone=${hostname#*.}
+    while [ -z "$servers" ]; do
+        servers=$(dig +short NS "$zone" 2>/dev/null)
+        [ "$zone" = "${zone#*.}" ] && break
+        zone=${zone#*.}
+    done
+fi
+authoritative_lookup() {
+    for server in $servers; do
+        dig +short +time=1 +tries=1 A "$hostname" "@$server" 2>/dev/null
+    done
+}
+resolver_lookup() { getent ahostsv4 "$hostname" | awk '{print $1}'; }
+delay=$interval
+while :; do
+    if [ -n "$servers" ] && authoritative_lookup | grep -qxF "$ip_addr"; then
+        report authoritative
+        servers=
+    fi
+    resolver_lookup | grep -qxF "$ip_addr" && { report resolver; exit 0; }
+    [ $SECONDS -ge $deadline ] && { report timeout; exit 1; }
+    sleep "$delay"
+    delay=$(awk -v d="$delay" -v m="$max_interval" \\
+        'BEGIN {d *= 2; print (d > m ? m : d)}')
+done
+'''
+
+
+class ResolutionReport(object):
+    """Outcome of watching a DNS record.
+
+    :param str hostname: the watched host name
+    :param float authoritative_latency: seconds the authoritative name
+        servers took to return the address, ``None`` if they were not queried
+        or did not return it
+    :param float latency: seconds the resolver took to return the address,
+        ``None`` if it did not
+    :param float elapsed: seconds spent watching, including the SSH
+        connection
+    """
+
+    def __init__(self, hostname, authoritative_latency=None, latency=None,
+                 elapsed=0):
+        self.hostname = hostname
+        self.authoritative_latency = authoritative_latency
+        self.latency = latency
+        self.elapsed = elapsed
+
+    @property
+    def resolved(self):
+        """Whether the resolver returned the address."""
+        return self.latency is not None
+
+    def __str__(self):
+        latencies = u'authoritative={0}, resolver={1}'.format(*(
+            u'-' if latency is None else u'{0:.2f}s'.format(latency)
+            for latency in (self.authoritative_latency, self.latency)
+        ))
+        return u'{0} {1} in {2:.2f}s, {3}'.format(
+            self.hostname,
+            u'resolved' if self.resolved else u'not resolved',
+            self.elapsed,
+            latencies,
+        )
+
+
+def parse_report(hostname, lines, elapsed=0):
+    """Return the :class:`ResolutionReport` of the watch script output.
+
+    :param str hostname: the watched host name
+    :param lines: lines printed by the watch script
+    :param float elapsed: seconds spent running the script
+    """
+    latencies = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) != 2 or not fields[1].isdigit():
+            continue
+        latencies[fields[0]] = int(fields[1]) / 1000.0
+    return ResolutionReport(
+        hostname,
+        latencies.get('authoritative'),
+        latencies.get('resolver'),
+        elapsed,
+    )
+
+
+def watch_resolution(hostname, ip_addr, run=None, authoritative=True,
+                     timeout=WATCH_TIMEOUT, interval=WATCH_INTERVAL,
+                     max_interval=WATCH_MAX_INTERVAL):
+    """Wait until ``hostname`` resolves to ``ip_addr``.
+
+    :param str hostname: the host name to resolve
+    :param str ip_addr: the expected IPv4 address
+    :param run: callable running a command on the resolving host and
+        returning a :class:`robottelo.ssh.SSHCommandResult`, e.g.
+        :meth:`robottelo.vm.VirtualMachine.run`. The command runs on the
+        Satellite server by default.
+    :param bool authoritative: whether to also query the authoritative name
+        servers, only to report when they return the address. Disable it for
+        records which are not in DNS, e.g. from ``/etc/hosts``
+    :param int timeout: seconds given to the record to resolve
+    :param float interval: seconds between the first checks
+    :param float max_interval: maximum seconds between two checks
+    :return: a :class:`ResolutionReport`
+    """
+    script = (
+        u'hostname={0}; ip_addr={1}; authoritative={2}; timeout={3}; '
+        u'interval={4}; max_interval={5}{6}'.format(
+            shlex_quote(hostname),
+            shlex_quote(ip_addr),
+            int(authoritative),
+            int(timeout),
+            interval,
+            max_interval,
+            _WATCH_SCRIPT,
+        )
+    )
+    start = time.time()
+    if run is None:
+        result = ssh.command(script, timeout=int(timeout) + 30)
+    else:
+        result = run(script)
+    stdout = result.stdout or []
+    if not isinstance(stdout, list):
+        stdout = stdout.splitlines()
+    report = parse_report(hostname, stdout, time.time() - start)
+    LOGGER.info('DNS record %s', report)
+    return report
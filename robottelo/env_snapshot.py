@@ -0,0 +1,171 @@
+"""Persist and reuse the entities of expensive test environments.
+
+Setting up some environments, like the provisioning one, means creating and
+synchronizing content and updating many entities. An
+:class:`EnvironmentSnapshot` fingerprints the inputs of such a setup and
+records the ids of every piece built, so the next setup with the same inputs
+only verifies that the pieces still exist and rebuilds the missing ones.
+
+Usage::
+
+    from robottelo.env_snapshot import EnvironmentSnapshot
+
+    inputs = {'org': org.id, 'repo_url': settings.rhel7_os}
+    with EnvironmentSnapshot('provisioning', inputs) as snapshot:
+        lce = snapshot.get_or_build(
+            'lce',
+            build=lambda: {'id': make_lce(org).id},
+            verify=lambda stored: stored if lce_exists(stored) else None,
+        )
+        cv = snapshot.get_or_build(
+            'content_view',
+            build=lambda: {'id': make_cv(org, lce).id},
+            verify=verify_cv,
+            requires=('lce',),
+        )
+
+A piece is rebuilt when it was never built with these inputs, when its
+``verify`` callable returns ``None`` or when any piece it requires was rebuilt
+during the current setup. Snapshots are stored as JSON files in the temporary
+directory and every setup holds a file lock, so concurrent workers share a
+single environment instead of building one each. Within a setup, independent
+pieces may be built from different threads.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from pytest_services.locks import file_lock
+
+LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.path.join(
+    tempfile.gettempdir(), 'robottelo', 'env_snapshots')
+#: Seconds a setup waits for a concurrent setup with the same inputs, which
+#: may synchronize repositories and publish content views
+SETUP_LOCK_TIMEOUT = 7200
+
+
+def fingerprint(inputs):
+    """Return a stable hash of the JSON serializable ``inputs``."""
+    data = json.dumps(inputs, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+class EnvironmentSnapshot(object):
+    """Records the pieces of an environment built for a set of inputs.
+
+    :param str name: name of the environment, e.g. the setup function name
+    :param dict inputs: JSON serializable inputs the environment depends on
+    :param bool reuse: whether previously built pieces may be reused. When
+        ``False`` every piece is rebuilt and the snapshot is overwritten.
+    :param str snapshot_dir: directory where snapshots are stored
+    """
+
+    def __init__(self, name, inputs, reuse=True, snapshot_dir=None):
+        self.name = name
+        self.inputs = inputs
+        self.reuse = reuse
+        self.snapshot_dir = snapshot_dir or SNAPSHOT_DIR
+        self.path = os.path.join(
+            self.snapshot_dir,
+            '{0}-{1}.json'.format(name, fingerprint(inputs))
+        )
+        self.entities = {}
+        self.reused = set()
+        self.rebuilt = set()
+        self._stored = {}
+        self._lock = None
+        self._pieces_lock = threading.Lock()
+
+    def __enter__(self):
+        if not os.path.exists(self.snapshot_dir):
+            try:
+                os.makedirs(self.snapshot_dir)
+            except OSError:
+                if not os.path.exists(self.snapshot_dir):
+                    raise
+        self._lock = file_lock(
+            self.path + '.lock', timeout=SETUP_LOCK_TIMEOUT)
+        self._lock.__enter__()
+        self._stored = self._load() if self.reuse else {}
+        return self
+
+    def __exit__(self, *exc):
+        LOGGER.info(
+            'Environment %s reused: %s, rebuilt: %s',
+            self.name,
+            ', '.join(sorted(self.reused)) or '-',
+            ', '.join(sorted(self.rebuilt)) or '-',
+        )
+        self._lock.__exit__(*exc)
+        self._lock = None
+
+    def _load(self):
+        """Load the pieces stored by a previous setup."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as handler:
+                return json.load(handler).get('entities', {})
+        except ValueError:
+            LOGGER.warning('Ignoring corrupted snapshot %s', self.path)
+            return {}
+
+    def _save(self):
+        """Save the stored pieces along with the inputs."""
+        with open(self.path, 'w') as handler:
+            json.dump(
+                {'inputs': self.inputs, 'entities': self._stored},
+                handler,
+                sort_keys=True,
+            )
+
+    def stored(self, piece):
+        """Return the value stored for ``piece`` by a previous setup, or
+        ``None``. The value is not verified.
+        """
+        with self._pieces_lock:
+            return self._stored.get(piece)
+
+    def get_or_build(self, piece, build, verify=None, requires=()):
+        """Return the stored ``piece`` if it is still valid or build it.
+
+        :param str piece: name of the piece
+        :param build: callable without arguments building the piece and
+            returning a JSON serializable value, usually ids and names
+        :param verify: callable receiving the stored value and returning the
+            value to use, or ``None`` if the piece is no longer intact. When
+            not provided stored values are trusted.
+        :param requires: names of the pieces this one depends on
+        :return: the reused or built value
+        """
+        with self._pieces_lock:
+            stored = self._stored.get(piece)
+            required_rebuilt = self.rebuilt.intersection(requires)
+        if stored is not None and not required_rebuilt:
+            value = verify(stored) if verify is not None else stored
+            if value is not None:
+                with self._pieces_lock:
+                    self.reused.add(piece)
+                    self.entities[piece] = self._stored[piece] = value
+                    if value != stored:
+                        self._save()
+                return value
+            LOGGER.info(
+                'Environment %s piece %s is not intact', self.name, piece)
+        value = build()
+        with self._pieces_lock:
+            self.rebuilt.add(piece)
+            self.entities[piece] = self._stored[piece] = value
+            self._save()
+        return value
+
+    def discard(self):
+        """Remove the stored snapshot."""
+        self._stored = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,6 +1,7 @@
 # -*- encoding: utf-8 -*-
 """Several helper methods and functions."""
 import contextlib
+import errno
 import logging
 import os
 import random
@@ -403,6 +404,15 @@ def get_func_name(func):
     return '{0}.{1}'.format(func.__module__, func.__name__)
 
 
+def process_alive(pid):
+    """Whether process ``pid`` is running on this host."""
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno == errno.EPERM
+    return True
+
+
 def get_services_status():
     """Check if core services are running"""
     major_version = get_host_info()[1]
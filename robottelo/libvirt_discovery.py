@@ -8,15 +8,32 @@ Make sure to configure the ``compute_resources`` section on the configuration
 file. Also make sure that the ``vlan_networking`` section is properly
 configured.
 """
+import json
 import logging
 import os
+import tempfile
+import threading
+import time
 
+from contextlib import contextmanager
 from fauxfactory import gen_mac
+from functools import partial
+from pytest_services.locks import file_lock
 from robottelo import ssh
 from robottelo.config import settings
+from robottelo.helpers import process_alive
+from robottelo.vm import VirtualMachineGroup
+from robottelo.vm_reaper import get_reaper
+from robottelo.vm_scheduler import get_scheduler
 
 logger = logging.getLogger(__name__)
 
+#: Local directory where the guest registries are stored
+GUEST_REGISTRY_DIR = os.path.join(
+    tempfile.gettempdir(), 'robottelo', 'libvirt_guests')
+#: Disk size of the guests in gigabytes
+GUEST_DISK_SIZE = 8
+
 
 def _gen_mac_for_libvirt():
     # fe:* MAC range is considered reserved in libvirt
@@ -33,6 +50,152 @@ class LibvirtGuestError(Exception):
     """Exception raised for failed virtual guests on external libvirt"""
 
 
+class GuestRegistry(object):
+    """Allocations of the guests of a libvirt server, shared by all the test
+    processes of the host (e.g. pytest-xdist workers).
+
+    The registry records the MAC addresses and name of every guest, so two
+    processes never pick the same ones, and which guests are running on each
+    bridge. When ``max_guests`` is set, starting a guest waits for one of
+    the bridge slots to be free. The allocations of processes which are gone
+    are released automatically.
+
+    :param str libvirt_server: the libvirt server of the guests
+    :param int max_guests: maximum number of guests running at the same time
+        on a bridge, 0 for no limit
+    :param str registry_dir: local directory where the registry is stored
+    """
+
+    def __init__(self, libvirt_server, max_guests=0, registry_dir=None):
+        self.libvirt_server = libvirt_server
+        self.max_guests = max_guests
+        self.registry_dir = registry_dir or GUEST_REGISTRY_DIR
+        self.path = os.path.join(
+            self.registry_dir, '{0}.json'.format(libvirt_server))
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _guests(self):
+        """Lock the registry and yield the guests allocations, by guest name.
+        The changes are saved unless an exception is raised.
+        """
+        if not os.path.isdir(self.registry_dir):
+            try:
+                os.makedirs(self.registry_dir)
+            except OSError:
+                if not os.path.isdir(self.registry_dir):
+                    raise
+        # File locks are held by processes, also exclude the other threads
+        with self._lock, file_lock(self.path + '.lock'):
+            guests = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as handler:
+                        guests = json.load(handler)
+                except ValueError:
+                    logger.warning('Ignoring corrupted registry %s', self.path)
+            for name, guest in list(guests.items()):
+                if not process_alive(guest['owner']):
+                    del guests[name]
+            yield guests
+            with open(self.path + '.tmp', 'w') as handler:
+                json.dump(guests, handler, indent=2, sort_keys=True)
+            os.rename(self.path + '.tmp', self.path)
+
+    @staticmethod
+    def _new_mac(guests):
+        """Return a MAC address not allocated to any of ``guests``."""
+        allocated = set(
+            mac for guest in guests.values() for mac in guest['macs'])
+        for _ in range(0, 10):
+            mac = _gen_mac_for_libvirt()
+            if mac not in allocated:
+                return mac
+        raise LibvirtGuestError('Unable to allocate a free MAC address')
+
+    def allocate(self, bridge, mac=None):
+        """Allocate a MAC address and a name to a new guest.
+
+        :param str bridge: bridge the guest will be connected to
+        :param str mac: MAC address to use, a free one is generated when
+            ``None``
+        :return: the guest name and its MAC address
+        :raises robottelo.libvirt_discovery.LibvirtGuestError: If ``mac`` is
+            already allocated.
+        """
+        with self._guests() as guests:
+            if mac is None:
+                mac = self._new_mac(guests)
+            elif any(mac in guest['macs'] for guest in guests.values()):
+                raise LibvirtGuestError(
+                    u'MAC address {0} is already allocated'.format(mac))
+            name = 'mac{0}'.format(mac.replace(':', ''))
+            guests[name] = {
+                'bridge': bridge,
+                'macs': [mac],
+                'owner': os.getpid(),
+                'running': False,
+                'since': time.time(),
+            }
+        return name, mac
+
+    def allocate_mac(self, name):
+        """Allocate an additional MAC address to guest ``name``."""
+        with self._guests() as guests:
+            mac = self._new_mac(guests)
+            guests[name]['macs'].append(mac)
+        return mac
+
+    def acquire_slot(self, name, timeout=3600, interval=5):
+        """Wait for a free slot on the bridge of guest ``name`` and mark the
+        guest running.
+
+        :raises robottelo.libvirt_discovery.LibvirtGuestError: If no slot
+            was free before ``timeout`` seconds.
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self._guests() as guests:
+                bridge = guests[name]['bridge']
+                running = len([
+                    guest for guest in guests.values()
+                    if guest['running'] and guest['bridge'] == bridge
+                ])
+                if not self.max_guests or running < self.max_guests:
+                    guests[name]['running'] = True
+                    return
+            if time.time() > deadline:
+                raise LibvirtGuestError(
+                    u'No free guest slot on bridge {0} after {1} seconds'
+                    .format(bridge, timeout)
+                )
+            time.sleep(interval)
+
+    def release(self, name):
+        """Release the allocations of guest ``name``."""
+        with self._guests() as guests:
+            guests.pop(name, None)
+
+
+# Guest registries by libvirt server, see get_guest_registry
+_guest_registries = {}
+_guest_registries_lock = threading.Lock()
+
+
+def get_guest_registry(libvirt_server):
+    """Return the :class:`GuestRegistry` of ``libvirt_server``, limiting the
+    guests running on each bridge to the ``compute_resources`` section
+    ``libvirt_max_guests``.
+    """
+    with _guest_registries_lock:
+        if libvirt_server not in _guest_registries:
+            _guest_registries[libvirt_server] = GuestRegistry(
+                libvirt_server,
+                max_guests=settings.compute_resources.libvirt_max_guests,
+            )
+        return _guest_registries[libvirt_server]
+
+
 class LibvirtGuest(object):
     """Manages a Libvirt guests to allow host discovery and provisioning
 
@@ -44,6 +207,13 @@ class LibvirtGuest(object):
     It is possible to customize the ``libvirt_host`` and ``image_dir``
     as per virtual machine basis. Just set the expected values when
     instantiating.
+
+    MAC addresses and guest names are allocated through the
+    :class:`GuestRegistry` of the libvirt server, so guests created by
+    concurrent test processes never collide. Use :meth:`create_many` to
+    create several guests at once. When the scheduler of
+    :mod:`robottelo.vm_scheduler` is enabled, guests are created once the
+    libvirt server has the headroom for them.
     """
 
     def __init__(
@@ -66,8 +236,6 @@ class LibvirtGuest(object):
             self.image_dir = settings.compute_resources.libvirt_image_dir
         else:
             self.image_dir = image_dir
-        if mac is None:
-            self.mac = _gen_mac_for_libvirt()
         if bridge is None:
             self.bridge = settings.vlan_networking.bridge
         else:
@@ -85,7 +253,36 @@ class LibvirtGuest(object):
         self.ip_addr = None
         self._domain = None
         self._created = False
-        self.guest_name = 'mac{0}'.format(self.mac.replace(':', ""))
+        self._registry = get_guest_registry(self.libvirt_server)
+        self.guest_name, self.mac = self._registry.allocate(self.bridge, mac)
+
+    @classmethod
+    def create_many(cls, count, workers=None, **kwargs):
+        """Create ``count`` guests concurrently.
+
+        Usage::
+
+            with LibvirtGuest.create_many(3, boot_iso=True) as guests:
+                for guest in guests:
+                    wait_for_discovery(guest.guest_name)
+
+        :param int count: number of guests to create
+        :param int workers: number of guests created at the same time, all of
+            them by default. The guests running on a bridge are also limited
+            by the ``compute_resources`` section ``libvirt_max_guests``.
+        :param kwargs: arguments used to instantiate every guest, except
+            ``mac`` which must be unique
+        :return: a :class:`LibvirtGuestGroup` with the created guests
+        :raises robottelo.libvirt_discovery.LibvirtGuestError: If any guest
+            could not be created, in which case all of them are destroyed.
+        """
+        if kwargs.get('mac') is not None:
+            raise LibvirtGuestError(
+                'mac can not be shared by several guests')
+        group = LibvirtGuestGroup(
+            [cls(**kwargs) for _ in range(count)], workers or count)
+        group.create()
+        return group
 
     def create(self):
         """Creates a virtual machine on the libvirt server using
@@ -107,7 +304,7 @@ class LibvirtGuest(object):
             '--vcpus={vm_cpu}',
             '--os-type=linux',
             '--os-variant=rhel7',
-            '--disk path={image_name},size=8',
+            '--disk path={image_name},size={disk_size}',
             '--noautoconsole',
         ]
 
@@ -123,7 +320,7 @@ class LibvirtGuest(object):
             command_args.append('--cdrom={0}'.format(boot_iso_dir))
 
         if self.extra_nic:
-            nic_mac = _gen_mac_for_libvirt()
+            nic_mac = self._registry.allocate_mac(self.guest_name)
             command_args.append('--network=bridge:{vm_bridge}')
             command_args.append('--mac={0}'.format(nic_mac))
 
@@ -142,12 +339,31 @@ class LibvirtGuest(object):
             vm_name=self.hostname,
             vm_ram=self.ram,
             vm_cpu=self.cpu,
-            image_name=u'{0}/{1}.img'.format(self.image_dir, self.hostname)
+            image_name=u'{0}/{1}.img'.format(self.image_dir, self.hostname),
+            disk_size=GUEST_DISK_SIZE,
         )
 
+        self._registry.acquire_slot(self.guest_name)
+        scheduler = get_scheduler()
+        admission = None
+        if scheduler is not None:
+            try:
+                admission = scheduler.admit(
+                    [self.libvirt_server], self.image_dir, self.cpu,
+                    self.ram, GUEST_DISK_SIZE * 1024)
+            except Exception:
+                self._registry.release(self.guest_name)
+                raise
+        reaper = get_reaper()
+        if reaper is not None:
+            reaper.register(
+                self.libvirt_server, self.hostname, self._image_path())
         result = ssh.command(command, self.libvirt_server)
+        if admission is not None:
+            scheduler.complete(admission, booted=result.return_code == 0)
 
         if result.return_code != 0:
+            self._registry.release(self.guest_name)
             raise LibvirtGuestError(
                 u'Failed to run virt-install: {0}'.format(result.stderr))
 
@@ -158,6 +374,14 @@ class LibvirtGuest(object):
         if not self._created:
             return
 
+        self._created = False
+        reaper = get_reaper()
+        if reaper is not None:
+            # The guest allocations are released once it is destroyed
+            reaper.destroy(
+                self.libvirt_server, self.hostname, self._image_path(),
+                callback=partial(self._registry.release, self.guest_name))
+            return
         ssh.command(
             u'virsh destroy {0}'.format(self.hostname),
             hostname=self.libvirt_server
@@ -166,11 +390,15 @@ class LibvirtGuest(object):
             u'virsh undefine {0}'.format(self.hostname),
             hostname=self.libvirt_server
         )
-        image_name = u'{0}.img'.format(self.hostname)
         ssh.command(
-            u'rm {0}'.format(os.path.join(self.image_dir, image_name)),
+            u'rm {0}'.format(self._image_path()),
             hostname=self.libvirt_server
         )
+        self._registry.release(self.guest_name)
+
+    def _image_path(self):
+        """Return the path of the guest image on the libvirt server."""
+        return os.path.join(self.image_dir, u'{0}.img'.format(self.hostname))
 
     def attach_nic(self):
         """Add a new NIC to existing host"""
@@ -178,7 +406,7 @@ class LibvirtGuest(object):
             raise LibvirtGuestError(
                 'The virtual guest should be created before updating it'
             )
-        nic_mac = _gen_mac_for_libvirt()
+        nic_mac = self._registry.allocate_mac(self.guest_name)
         command_args = [
             'virsh attach-interface',
             '--domain={vm_name}',
@@ -207,3 +435,15 @@ class LibvirtGuest(object):
 
     def __exit__(self, *exc):
         self.destroy()
+
+
+class LibvirtGuestGroup(VirtualMachineGroup):
+    """Libvirt guests created and destroyed together, concurrently. See
+    :meth:`LibvirtGuest.create_many`.
+
+    :param guests: the :class:`LibvirtGuest` instances of the group
+    :param int workers: number of guests created or destroyed at the same
+        time
+    """
+
+    error_class = LibvirtGuestError
@@ -1,39 +1,411 @@
 """Manifest clonning tools.."""
 import json
+import logging
+import os
 import requests
 import six
+import struct
+import tempfile
+import threading
 import time
 import uuid
 import zipfile
+import zlib
+
+from collections import deque, OrderedDict
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
 from nailgun import entities
+from pytest_services.locks import file_lock
 
 from robottelo.cli.subscription import Subscription
 from robottelo.config import settings
 from robottelo.constants import INTERFACE_API, INTERFACE_CLI
-from robottelo.decorators.func_locker import lock_function
+from robottelo.decorators.func_locker import (
+    FileSemaphore,
+    locking_function,
+)
+from robottelo.metrics import LatencyRecorder
 from robottelo.ssh import upload_file
 
+LOGGER = logging.getLogger(__name__)
+
+#: Directory where the downloaded manifest template and key are cached
+MANIFEST_CACHE_DIR = os.path.join(
+    tempfile.gettempdir(), 'robottelo', 'manifest_cache')
+#: Seconds during which a cached download is used without revalidating it
+MANIFEST_CACHE_MAX_AGE = 300
+#: Seconds a download waits for the server to respond
+DOWNLOAD_TIMEOUT = 120
+#: Seconds a process waits for another one downloading the same URL
+DOWNLOAD_LOCK_TIMEOUT = 600
+#: Time spent by :func:`upload_manifest_locked` waiting for an upload slot
+#: (``slot_wait``) and uploading (``upload``)
+UPLOAD_METRICS = LatencyRecorder()
+
+
+def download_cached(url, cache_dir=None, max_age=MANIFEST_CACHE_MAX_AGE):
+    """Download ``url`` through an on-disk cache shared by all processes.
+
+    The cached content is used as is for ``max_age`` seconds after it was
+    last validated, later it is revalidated with a conditional request using
+    the ``ETag`` and ``Last-Modified`` headers of the cached response. A file
+    lock makes sure only one process downloads while the others wait for the
+    cached content. The cached content is also used when the server can not
+    be reached.
+
+    :param str url: URL to download
+    :param str cache_dir: cache directory, ``MANIFEST_CACHE_DIR`` by default
+    :param int max_age: seconds before revalidating the cached content
+    :return: the downloaded content
+    """
+    cache_dir = cache_dir or MANIFEST_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
+    path = os.path.join(
+        cache_dir, uuid.uuid5(uuid.NAMESPACE_URL, str(url)).hex)
+    with file_lock(path + '.lock', timeout=DOWNLOAD_LOCK_TIMEOUT):
+        meta = {}
+        if os.path.exists(path) and os.path.exists(path + '.json'):
+            with open(path + '.json') as handler:
+                meta = json.load(handler)
+            if time.time() - meta.get('validated', 0) < max_age:
+                with open(path, 'rb') as handler:
+                    return handler.read()
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            response = requests.get(
+                url, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except requests.exceptions.RequestException as err:
+            if not meta:
+                raise
+            LOGGER.warning(
+                'Using cached %s, download failed: %s', url, err)
+            response = None
+        if response is not None and response.status_code != 304:
+            with open(path + '.tmp', 'wb') as handler:
+                handler.write(response.content)
+            os.rename(path + '.tmp', path)
+            meta = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+        meta['validated'] = time.time()
+        with open(path + '.json', 'w') as handler:
+            json.dump(meta, handler)
+        with open(path, 'rb') as handler:
+            return handler.read()
+
+
+class RawZipMember(object):
+    """A zip archive member kept compressed.
+
+    Members are copied between archives as is, so building an archive only
+    compresses the members whose content changed.
+
+    :param str name: member name
+    :param int compress_type: ``zipfile.ZIP_STORED`` or
+        ``zipfile.ZIP_DEFLATED``
+    :param int crc: CRC-32 of the uncompressed content
+    :param int file_size: size of the uncompressed content
+    :param bytes data: compressed content
+    :param tuple date_time: modification time as in ``zipfile.ZipInfo``
+    """
+
+    def __init__(self, name, compress_type, crc, file_size, data,
+                 date_time=(1980, 1, 1, 0, 0, 0)):
+        self.name = name
+        self.compress_type = compress_type
+        self.crc = crc
+        self.file_size = file_size
+        self.data = data
+        self.date_time = date_time
+
+    @classmethod
+    def from_content(cls, name, content, date_time=None):
+        """Return a member deflating ``content``."""
+        if isinstance(content, six.text_type):
+            content = content.encode('utf-8')
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        return cls(
+            name,
+            zipfile.ZIP_DEFLATED,
+            zlib.crc32(content) & 0xffffffff,
+            len(content),
+            compressor.compress(content) + compressor.flush(),
+            date_time or time.localtime(time.time())[:6],
+        )
+
+    def read(self):
+        """Return the uncompressed content."""
+        if self.compress_type == zipfile.ZIP_STORED:
+            return self.data
+        if self.compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(self.data, -15)
+        raise ValueError(
+            'Unsupported compression {0} of zip member {1}'.format(
+                self.compress_type, self.name))
+
+
+def read_raw_zip(content):
+    """Return the members of the zip archive ``content`` as a list of
+    :class:`RawZipMember`, without decompressing them.
+    """
+    members = []
+    for info in zipfile.ZipFile(six.BytesIO(content)).infolist():
+        # The local header has a fixed size part followed by the name and
+        # the extra field, which may differ from the central directory ones
+        name_length, extra_length = struct.unpack(
+            '<HH', content[info.header_offset + 26:info.header_offset + 30])
+        start = info.header_offset + 30 + name_length + extra_length
+        members.append(RawZipMember(
+            info.filename,
+            info.compress_type,
+            info.CRC,
+            info.file_size,
+            content[start:start + info.compress_size],
+            info.date_time,
+        ))
+    return members
+
+
+def write_raw_zip(members):
+    """Return a zip archive made of the :class:`RawZipMember` list."""
+    archive = six.BytesIO()
+    central_directory = []
+    for member in members:
+        name = member.name.encode('utf-8')
+        # Flag the name as utf-8 encoded when it is not ascii
+        flags = 0x800 if len(name) != len(member.name) else 0
+        year, month, day, hour, minute, second = member.date_time
+        dos_time = hour << 11 | minute << 5 | second // 2
+        dos_date = (year - 1980) << 9 | month << 5 | day
+        fields = (
+            20, flags, member.compress_type, dos_time, dos_date, member.crc,
+            len(member.data), member.file_size, len(name), 0,
+        )
+        offset = archive.tell()
+        archive.write(struct.pack('<IHHHHHIIIHH', 0x04034b50, *fields))
+        archive.write(name)
+        archive.write(member.data)
+        central_directory.append(
+            struct.pack('<IH', 0x02014b50, 20) +
+            struct.pack('<HHHHHIIIHH', *fields) +
+            struct.pack('<HHHII', 0, 0, 0, 0o600 << 16, offset) +
+            name
+        )
+    directory_offset = archive.tell()
+    for header in central_directory:
+        archive.write(header)
+    archive.write(struct.pack(
+        '<IHHHHIIH',
+        0x06054b50, 0, 0, len(members), len(members),
+        archive.tell() - directory_offset, directory_offset, 0,
+    ))
+    return archive.getvalue()
+
+
+def _sign(private_key, data):
+    """Return the manifest signature of ``data``."""
+    signer = private_key.signer(padding.PKCS1v15(), hashes.SHA256())
+    signer.update(data)
+    return signer.finalize()
+
+
+class ManifestBuilder(object):
+    """Build manifests by editing the consumer and the entitlements of a
+    template.
+
+    Members of the template consumer_export.zip are copied compressed, only
+    the edited ones are decompressed and compressed again. The rebuilt
+    consumer_export.zip is then signed.
+
+    Usage::
+
+        builder = manifests.ManifestBuilder.from_cloner()
+        for entitlement_id, entitlement in builder.entitlements().items():
+            if entitlement['pool']['productId'] != 'RH00001':
+                builder.remove_entitlement(entitlement_id)
+            else:
+                builder.set_quantity(entitlement_id, 5)
+        with manifests.Manifest(builder.build()) as manifest:
+            upload_manifest_locked(org_id, manifest)
+
+    :param members: list of :class:`RawZipMember` of the template
+        consumer_export.zip
+    :param private_key: key used to sign the manifest
+    """
+
+    CONSUMER = 'export/consumer.json'
+    ENTITLEMENTS = 'export/entitlements/'
+    ENTITLEMENT_CERTIFICATES = 'export/entitlement_certificates/'
+
+    def __init__(self, members, private_key):
+        self._members = OrderedDict(
+            (member.name, member) for member in members)
+        self.private_key = private_key
+        self._decoded = {}
+        self._entitlement_names = None
+
+    @classmethod
+    def from_cloner(cls, cloner=None):
+        """Return a builder for the template of ``cloner``, the cached
+        manifest cloner by default.
+        """
+        return (cloner or _manifest_cloner).builder()
+
+    def _json(self, name):
+        """Return the decoded JSON member ``name``, which will be encoded
+        again when building the manifest.
+        """
+        if name not in self._decoded:
+            self._decoded[name] = json.loads(
+                self._members[name].read().decode('utf-8'))
+        return self._decoded[name]
+
+    @property
+    def consumer(self):
+        """The consumer data of the manifest."""
+        return self._json(self.CONSUMER)
+
+    def set_consumer_uuid(self, consumer_uuid=None):
+        """Change the consumer uuid, a new one by default."""
+        self.consumer['uuid'] = consumer_uuid or six.text_type(uuid.uuid1())
+
+    def entitlements(self):
+        """Return a dictionary mapping the id of every entitlement to its
+        data. Changing the data changes the built manifest.
+        """
+        if self._entitlement_names is None:
+            self._entitlement_names = OrderedDict()
+            for name in self._members:
+                if (name.startswith(self.ENTITLEMENTS) and
+                        name.endswith('.json')):
+                    self._entitlement_names[self._json(name)['id']] = name
+        return OrderedDict(
+            (entitlement_id, self._json(name))
+            for entitlement_id, name in self._entitlement_names.items()
+        )
+
+    def _entitlement(self, entitlement_id):
+        """Return the data of entitlement ``entitlement_id``."""
+        try:
+            return self.entitlements()[entitlement_id]
+        except KeyError:
+            raise KeyError(
+                'Manifest has no entitlement {0}'.format(entitlement_id))
+
+    def set_quantity(self, entitlement_id, quantity):
+        """Set the quantity of an entitlement and of its pool."""
+        entitlement = self._entitlement(entitlement_id)
+        entitlement['quantity'] = quantity
+        if entitlement.get('pool'):
+            entitlement['pool']['quantity'] = quantity
+
+    def update_pool(self, entitlement_id, **fields):
+        """Update the pool fields of an entitlement."""
+        self._entitlement(entitlement_id).setdefault('pool', {}).update(
+            fields)
+
+    def remove_entitlement(self, entitlement_id):
+        """Remove an entitlement and its certificates."""
+        entitlement = self._entitlement(entitlement_id)
+        name = self._entitlement_names.pop(entitlement_id)
+        del self._members[name]
+        self._decoded.pop(name, None)
+        for certificate in entitlement.get('certificates') or []:
+            serial = (certificate.get('serial') or {}).get('id')
+            self._members.pop(
+                '{0}{1}.pem'.format(self.ENTITLEMENT_CERTIFICATES, serial),
+                None
+            )
+
+    def build(self):
+        """Build and sign the manifest.
+
+        :return: A file-like object with the contents of the manifest, see
+            :meth:`ManifestCloner.clone`.
+        """
+        members = [
+            RawZipMember.from_content(
+                name, json.dumps(self._decoded[name]), member.date_time)
+            if name in self._decoded else member
+            for name, member in self._members.items()
+        ]
+        consumer_export = write_raw_zip(members)
+        manifest = six.BytesIO()
+        with zipfile.ZipFile(
+                manifest, 'w', zipfile.ZIP_DEFLATED) as manifest_zip:
+            manifest_zip.writestr('consumer_export.zip', consumer_export)
+            manifest_zip.writestr(
+                'signature', _sign(self.private_key, consumer_export))
+        # Make sure that the file-like object is at the beginning and
+        # ready to be read.
+        manifest.seek(0)
+        return manifest
+
 
 class ManifestCloner(object):
     """Manifest clonning utility class."""
     def __init__(self, template=None, signing_key=None):
         self.template = template
         self.signing_key = signing_key
+        self.private_key = None
+        self._template_entries = None
 
     def _download_manifest_info(self):
         """Download and cache the manifest information."""
-        self.template = requests.get(settings.fake_manifest.url).content
-        self.signing_key = requests.get(settings.fake_manifest.key_url).content
+        self.template = download_cached(settings.fake_manifest.url)
+        self.signing_key = download_cached(settings.fake_manifest.key_url)
         self.private_key = serialization.load_pem_private_key(
             self.signing_key,
             password=None,
             backend=default_backend()
         )
 
+    def _prepare(self):
+        """Make sure the template and the private key are available."""
+        if self.signing_key is None or self.template is None:
+            self._download_manifest_info()
+        elif self.private_key is None:
+            self.private_key = serialization.load_pem_private_key(
+                self.signing_key,
+                password=None,
+                backend=default_backend()
+            )
+        self._template_members()
+
+    def _template_members(self):
+        """Return the raw members of the template consumer_export.zip, read
+        once per template.
+        """
+        entries = self._template_entries
+        if entries is None or entries[0] is not self.template:
+            template_zip = zipfile.ZipFile(six.BytesIO(self.template))
+            # Extract the consumer_export.zip from the template manifest.
+            entries = (self.template, read_raw_zip(
+                template_zip.read('consumer_export.zip')))
+            self._template_entries = entries
+        return entries[1]
+
+    def builder(self):
+        """Return a :class:`ManifestBuilder` for the template manifest."""
+        self._prepare()
+        return ManifestBuilder(self._template_members(), self.private_key)
+
     def clone(self):
         """Clones a RedHat-manifest file.
 
@@ -46,55 +418,9 @@ class ManifestCloner(object):
             ``StringIO`` on Python 2) with the contents of the cloned
             manifest.
         """
-        if self.signing_key is None or self.template is None:
-            self._download_manifest_info()
-
-        template_zip = zipfile.ZipFile(six.BytesIO(self.template))
-        # Extract the consumer_export.zip from the template manifest.
-        consumer_export_zip = zipfile.ZipFile(
-            six.BytesIO(template_zip.read('consumer_export.zip')))
-
-        # Generate a new consumer_export.zip file changing the consumer
-        # uuid.
-        consumer_export = six.BytesIO()
-        with zipfile.ZipFile(consumer_export, 'w') as new_consumer_export_zip:
-            for name in consumer_export_zip.namelist():
-                if name == 'export/consumer.json':
-                    consumer_data = json.loads(
-                        consumer_export_zip.read(name).decode('utf-8'))
-                    consumer_data['uuid'] = six.text_type(uuid.uuid1())
-                    new_consumer_export_zip.writestr(
-                        name,
-                        json.dumps(consumer_data)
-                    )
-                else:
-                    new_consumer_export_zip.writestr(
-                        name,
-                        consumer_export_zip.read(name)
-                    )
-
-        # Generate a new manifest.zip file with the generated
-        # consumer_export.zip and new signature.
-        manifest = six.BytesIO()
-        with zipfile.ZipFile(
-                manifest, 'w', zipfile.ZIP_DEFLATED) as manifest_zip:
-            consumer_export.seek(0)
-            manifest_zip.writestr(
-                'consumer_export.zip',
-                consumer_export.read()
-            )
-            consumer_export.seek(0)
-            signer = self.private_key.signer(
-                padding.PKCS1v15(), hashes.SHA256())
-            signer.update(consumer_export.read())
-            manifest_zip.writestr(
-                'signature',
-                signer.finalize()
-            )
-        # Make sure that the file-like object is at the beginning and
-        # ready to be read.
-        manifest.seek(0)
-        return manifest
+        builder = self.builder()
+        builder.set_consumer_uuid()
+        return builder.build()
 
     def original(self):
         """Returns the original manifest as a file-like object.
@@ -110,9 +436,197 @@ class ManifestCloner(object):
         return six.BytesIO(self.template)
 
 
+class ManifestPool(object):
+    """Pool of manifest clones generated in background.
+
+    Cloning a manifest means unzipping the template, rewriting the consumer,
+    zipping and signing it again. The pool generates clones with ``workers``
+    threads ahead of time, so :meth:`get` returns a ready one.
+
+    When ``spill_dir`` is provided, up to ``spill_size`` clones are stored
+    there as files, which are shared by all the processes using the same
+    directory (e.g. pytest-xdist workers or forked tests). Up to ``size``
+    extra clones are kept in memory.
+
+    The clones are generated by the process which created the pool only, the
+    processes forked from it take the clones stored in ``spill_dir`` or clone
+    the manifest themselves.
+
+    :param ManifestCloner cloner: the cloner generating the clones
+    :param int size: maximum number of clones kept in memory
+    :param str spill_dir: directory where extra clones are stored
+    :param int spill_size: maximum number of clones stored in ``spill_dir``
+    :param int workers: number of threads generating clones
+    """
+
+    def __init__(self, cloner, size=5, spill_dir=None, spill_size=0,
+                 workers=2):
+        self.cloner = cloner
+        self.size = size
+        self.spill_dir = spill_dir
+        self.spill_size = spill_size if spill_dir else 0
+        self.workers = workers
+        self._pid = os.getpid()
+        self._clones = deque()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopped = False
+
+    def _spilled(self):
+        """Return the paths of the clones stored in ``spill_dir``."""
+        if not self.spill_dir or not os.path.isdir(self.spill_dir):
+            return []
+        return sorted(
+            os.path.join(self.spill_dir, name)
+            for name in os.listdir(self.spill_dir)
+            if name.endswith('.zip')
+        )
+
+    def _has_room(self):
+        """Whether there is room for a new clone."""
+        return (len(self._clones) < self.size or
+                len(self._spilled()) < self.spill_size)
+
+    def _spill(self, content):
+        """Store a clone in ``spill_dir``. The file is renamed once written,
+        so other processes never read partial clones.
+        """
+        if not os.path.isdir(self.spill_dir):
+            try:
+                os.makedirs(self.spill_dir)
+            except OSError:
+                if not os.path.isdir(self.spill_dir):
+                    raise
+        path = os.path.join(self.spill_dir, uuid.uuid4().hex)
+        with open(path + '.tmp', 'wb') as handler:
+            handler.write(content)
+        os.rename(path + '.tmp', path + '.zip')
+
+    def _take_spilled(self):
+        """Claim and return the content of a stored clone, or ``None``.
+
+        A clone is claimed by renaming it, which only one process succeeds
+        to do.
+        """
+        for path in self._spilled():
+            claimed = '{0}.{1}'.format(path, os.getpid())
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                # Claimed by another process
+                continue
+            try:
+                with open(claimed, 'rb') as handler:
+                    return handler.read()
+            finally:
+                os.remove(claimed)
+        return None
+
+    def _generate(self):
+        """Generate clones while there is room for them."""
+        while True:
+            with self._condition:
+                while not self._stopped and not self._has_room():
+                    # Time out as other processes may take spilled clones
+                    self._condition.wait(1)
+                if self._stopped:
+                    return
+            try:
+                content = self.cloner.clone().getvalue()
+            except Exception as err:
+                LOGGER.warning('Failed to generate manifest clone: %s', err)
+                return
+            with self._condition:
+                # Stored clones are also available to the forked processes
+                if len(self._spilled()) < self.spill_size:
+                    self._spill(content)
+                else:
+                    self._clones.append(content)
+                self._condition.notify_all()
+
+    def _forked(self):
+        """Whether this process was forked from the one which created the
+        pool. The generator threads and the condition protecting the clones
+        kept in memory belong to the latter.
+        """
+        return self._pid != os.getpid()
+
+    def start(self):
+        """Start the generator threads, if not running already. Does
+        nothing in the processes forked from the one which created the pool.
+        """
+        if self._forked():
+            return
+        with self._condition:
+            if self._threads:
+                return
+            self.cloner._prepare()
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._generate)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """Stop the generator threads. Stored clones are kept."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._stopped = False
+
+    def get(self):
+        """Return a clone from the pool, generating one if the pool is empty.
+
+        :return: A file-like object with the contents of the cloned manifest,
+            see :meth:`ManifestCloner.clone`.
+        """
+        if self._forked():
+            content = self._take_spilled()
+        else:
+            self.start()
+            with self._condition:
+                content = self._clones.popleft() if self._clones else None
+                if content is None:
+                    content = self._take_spilled()
+                self._condition.notify_all()
+        if content is None:
+            return self.cloner.clone()
+        return six.BytesIO(content)
+
+
 # Cache the ManifestCloner in order to avoid downloading the manifest template
 # every single time.
 _manifest_cloner = ManifestCloner()
+# Created when first used if the fake_manifest pool_size setting is set
+_manifest_pool = None
+
+
+def get_manifest_pool():
+    """Return the pool configured by the ``fake_manifest`` section, or
+    ``None`` if the pool is disabled.
+    """
+    global _manifest_pool  # pylint:disable=global-statement
+    if not settings.fake_manifest.pool_size:
+        return None
+    if _manifest_pool is None:
+        _manifest_pool = ManifestPool(
+            _manifest_cloner,
+            size=settings.fake_manifest.pool_size,
+            spill_dir=settings.fake_manifest.pool_spill_dir,
+            spill_size=settings.fake_manifest.pool_spill_size,
+        )
+    return _manifest_pool
+
+
+def _clone_manifest():
+    """Return a manifest clone, from the manifest pool when enabled."""
+    pool = get_manifest_pool()
+    if pool is None:
+        return _manifest_cloner.clone()
+    return pool.get()
 
 
 class Manifest(object):
@@ -129,14 +643,16 @@ class Manifest(object):
         self._content = content
         self.filename = filename
 
-        if self._content is None:
-            self._content = _manifest_cloner.clone()
         if self.filename is None:
-            self.filename = u'/var/tmp/manifest-{0}.zip'.format(
-                    int(time.time()))
+            self.filename = u'/var/tmp/manifest-{0}-{1}.zip'.format(
+                    int(time.time()), uuid.uuid4().hex[:8])
 
     @property
     def content(self):
+        # The manifest is cloned when its content is first needed, so it can
+        # be generated while waiting for an upload slot
+        if self._content is None:
+            self._content = _clone_manifest()
         if not self._content.closed:
             # Make sure that the content is always ready to read
             self._content.seek(0)
@@ -146,8 +662,8 @@ class Manifest(object):
         return self
 
     def __exit__(self, type, value, traceback):
-        if not self.content.closed:
-            self.content.close()
+        if self._content is not None and not self._content.closed:
+            self._content.close()
 
 
 def clone():
@@ -177,10 +693,30 @@ def original_manifest():
     return Manifest(_manifest_cloner.original())
 
 
-@lock_function
+def _acquire_upload_slot(org_id, semaphore, locks, errors):
+    """Acquire the lock of organization ``org_id`` then an upload slot of
+    ``semaphore``. The organization lock is appended to ``locks`` and any
+    error to ``errors``.
+    """
+    try:
+        org_lock = locking_function(
+            upload_manifest_locked, context='org-{0}'.format(org_id))
+        org_lock.__enter__()
+        locks.append(org_lock)
+        semaphore.acquire()
+    except Exception as err:
+        errors.append(err)
+
+
 def upload_manifest_locked(org_id, manifest,  interface=INTERFACE_API):
     """Upload a manifest with locking, using the requested interface.
 
+    Uploads to the same organization are serialized and at most
+    ``[fake_manifest] upload_concurrency`` uploads run at the same time
+    across all the workers. The manifest is cloned and, for the CLI
+    interface, transferred to the server while waiting for an upload slot.
+    The time spent waiting for a slot is recorded in ``UPLOAD_METRICS``.
+
     :type org_id: int
     :type manifest: robottelo.manifests.Manifest
     :type interface: str
@@ -210,20 +746,44 @@ def upload_manifest_locked(org_id, manifest,  interface=INTERFACE_API):
             'upload manifest with interface "{0}" not supported'
             .format(interface)
         )
-    if interface == INTERFACE_API:
-        with manifest:
-            result = entities.Subscription().upload(
-                data={'organization_id': org_id},
-                files={'content': manifest.content},
-            )
-    else:
-        # interface is INTERFACE_CLI
-        with manifest:
-            upload_file(manifest.content, manifest.filename)
-
-        result = Subscription.upload({
-            'file': manifest.filename,
-            'organization-id': org_id,
-        })
+    semaphore = FileSemaphore(
+        'manifest_upload', settings.fake_manifest.upload_concurrency)
+    locks = []
+    errors = []
+    waiter = threading.Thread(
+        target=_acquire_upload_slot,
+        args=(org_id, semaphore, locks, errors),
+    )
+    waiter.daemon = True
+    start = time.time()
+    waiter.start()
+    try:
+        try:
+            with manifest:
+                if interface == INTERFACE_API:
+                    content = six.BytesIO(manifest.content.read())
+                else:
+                    # interface is INTERFACE_CLI
+                    upload_file(manifest.content, manifest.filename)
+        finally:
+            waiter.join()
+        UPLOAD_METRICS.record('slot_wait', time.time() - start)
+        if errors:
+            raise errors[0]
+        with UPLOAD_METRICS.measure('upload'):
+            if interface == INTERFACE_API:
+                result = entities.Subscription().upload(
+                    data={'organization_id': org_id},
+                    files={'content': content},
+                )
+            else:
+                result = Subscription.upload({
+                    'file': manifest.filename,
+                    'organization-id': org_id,
+                })
+    finally:
+        semaphore.release()
+        for lock in locks:
+            lock.__exit__(None, None, None)
 
     return result
@@ -0,0 +1,162 @@
+"""Lightweight latency metrics shared by robottelo's load and timing tools.
+
+Usage::
+
+    from robottelo.metrics import LatencyRecorder
+
+    recorder = LatencyRecorder()
+    with recorder.measure('register'):
+        register_consumer()
+
+    for name, histogram in recorder.items():
+        print(name, histogram.summary())
+"""
+import bisect
+import random
+import threading
+import time
+
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0, 120.0, 300.0,
+)
+#: Number of values kept by a histogram to compute its percentiles
+RESERVOIR_SIZE = 2048
+
+
+class LatencyHistogram(object):
+    """Thread safe bucketed histogram of latencies.
+
+    Every recorded value is counted in the bucket of the smallest upper bound
+    greater than or equal to it. Values greater than the last bound are
+    counted in an overflow bucket. Count, sum, min and max are exact, while
+    percentiles are computed from a uniform random sample of at most
+    ``reservoir_size`` values, so the memory used does not grow with the
+    number of recorded values. Percentiles are exact until more values are
+    recorded.
+
+    :param buckets: sorted sequence of bucket upper bounds in seconds
+    :param int reservoir_size: number of values kept for the percentiles
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS,
+                 reservoir_size=RESERVOIR_SIZE):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.reservoir_size = reservoir_size
+        self.values = []
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def record(self, value, error=False):
+        """Record a latency ``value`` in seconds.
+
+        :param bool error: whether the measured operation failed
+        """
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+            if len(self.values) < self.reservoir_size:
+                self.values.append(value)
+            else:
+                # Keeps every recorded value with the same probability
+                index = self._random.randrange(self.count)
+                if index < self.reservoir_size:
+                    self.values[index] = value
+            if error:
+                self.errors += 1
+
+    def percentile(self, percent):
+        """Return the ``percent`` percentile of the recorded values using
+        the nearest-rank method, or ``None`` if nothing was recorded.
+        """
+        with self._lock:
+            values = sorted(self.values)
+        if not values:
+            return None
+        rank = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+        return values[max(0, min(rank, len(values) - 1))]
+
+    def summary(self):
+        """Return a dictionary with count, errors, min, mean, max and the
+        50th, 90th and 99th percentiles.
+        """
+        with self._lock:
+            result = {
+                'count': self.count,
+                'errors': self.errors,
+                'min': self.min,
+                'mean': self.total / self.count if self.count else None,
+                'max': self.max,
+            }
+        for percent in (50, 90, 99):
+            result['p{0}'.format(percent)] = self.percentile(percent)
+        return result
+
+    def bucket_counts(self):
+        """Return a list of ``(upper_bound, count)`` tuples, the overflow
+        bucket having ``None`` as upper bound.
+        """
+        with self._lock:
+            counts = list(self.counts)
+        return list(zip(self.buckets + (None,), counts))
+
+
+class LatencyRecorder(object):
+    """Collection of named :class:`LatencyHistogram`, created on demand."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        """Return the histogram for ``name``, creating it if needed."""
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = LatencyHistogram(self.buckets)
+            return self._histograms[name]
+
+    def record(self, name, value, error=False):
+        """Record a latency ``value`` for ``name``."""
+        self.histogram(name).record(value, error=error)
+
+    @contextmanager
+    def measure(self, name):
+        """Measure the time spent in the ``with`` block and record it for
+        ``name``. Exceptions are recorded as errors and re-raised.
+        """
+        start = time.time()
+        try:
+            yield
+        except Exception:
+            self.record(name, time.time() - start, error=True)
+            raise
+        self.record(name, time.time() - start)
+
+    def items(self):
+        """Return a sorted list of ``(name, histogram)`` tuples."""
+        with self._lock:
+            return sorted(self._histograms.items())
+
+    def summary(self):
+        """Return a dictionary mapping each name to its histogram summary."""
+        return {name: histogram.summary() for name, histogram in self.items()}
+
+    def reset(self):
+        """Drop all recorded histograms."""
+        with self._lock:
+            self._histograms = {}
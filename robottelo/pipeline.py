@@ -0,0 +1,213 @@
+"""Run dependent setup stages concurrently, with timing and resume support.
+
+A :class:`Pipeline` is made of named stages, each one declaring the stages it
+requires. Stages whose requirements are met run at the same time in their own
+thread, so independent work (e.g. preparing a virtual machine while Satellite
+generates certificates) overlaps.
+
+Usage::
+
+    from robottelo.pipeline import Pipeline
+
+    pipeline = Pipeline('my-setup', state_path='/tmp/my-setup.json')
+    pipeline.add_stage('org', lambda results: make_org()['id'])
+    pipeline.add_stage('certs', generate_certs)
+    pipeline.add_stage(
+        'install', install, requires=('org', 'certs'))
+    results = pipeline.run()
+    print(pipeline.timings)
+
+Every stage callable receives a dictionary with the results of all the stages
+already completed, and its return value is stored under the stage name. When
+``state_path`` is set, the results of completed stages are saved after each
+stage, so running the same pipeline again after a failure resumes from the
+stages which did not complete. For that reason stage results must be JSON
+serializable.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from six.moves import queue
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PipelineError(Exception):
+    """Indicates that a pipeline stage failed.
+
+    :param stage: the name of the failed stage
+    :param error: the exception raised by the stage
+    :param timings: the timings of the stages run so far
+    :param traceback: the traceback of ``error``, to re-raise it with
+        ``six.reraise``
+    """
+
+    def __init__(self, stage, error, timings, traceback=None):
+        self.stage = stage
+        self.error = error
+        self.timings = timings
+        self.traceback = traceback
+        super(PipelineError, self).__init__(
+            u'Pipeline stage "{0}" failed: {1}'.format(stage, error))
+
+
+class Pipeline(object):
+    """A set of dependent stages executed concurrently.
+
+    :param str name: pipeline name, used for logging
+    :param str state_path: file where completed stage results are saved. When
+        ``None`` the pipeline can not be resumed.
+    :param int workers: maximum number of stages running at the same time
+    """
+
+    def __init__(self, name, state_path=None, workers=4):
+        self.name = name
+        self.state_path = state_path
+        self.workers = workers
+        self.stages = OrderedDict()
+        self.results = {}
+        self.timings = OrderedDict()
+
+    def add_stage(self, name, function, requires=()):
+        """Add a stage to the pipeline.
+
+        :param str name: unique stage name
+        :param function: callable receiving the completed stage results
+        :param requires: names of the stages which must complete first
+        """
+        if name in self.stages:
+            raise ValueError(u'Stage "{0}" already defined'.format(name))
+        for required in requires:
+            if required not in self.stages:
+                raise ValueError(
+                    u'Stage "{0}" requires unknown stage "{1}"'.format(
+                        name, required)
+                )
+        self.stages[name] = (function, tuple(requires))
+
+    def _load_state(self):
+        """Load the results saved by a previous failed run."""
+        if self.state_path is None or not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as handler:
+            results = json.load(handler)
+        return {
+            name: result for name, result in results.items()
+            if name in self.stages
+        }
+
+    def _save_state(self):
+        """Save the results of the completed stages."""
+        if self.state_path is None:
+            return
+        with open(self.state_path, 'w') as handler:
+            json.dump(self.results, handler)
+
+    def clear_state(self):
+        """Remove the saved state, next run will start from scratch."""
+        if self.state_path is not None and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def _run_stage(self, name, results, done):
+        """Run stage ``name`` and report its outcome to ``done``."""
+        function, _ = self.stages[name]
+        start = time.time()
+        try:
+            result = function(results)
+        except Exception as err:
+            done.put((name, None, (err, sys.exc_info()[2]),
+                      time.time() - start))
+        else:
+            done.put((name, result, None, time.time() - start))
+
+    def _required(self, targets):
+        """Return the names of the ``targets`` stages and of all the stages
+        they require, directly or not.
+        """
+        required = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name in required:
+                continue
+            if name not in self.stages:
+                raise ValueError(u'Unknown stage "{0}"'.format(name))
+            required.add(name)
+            pending.extend(self.stages[name][1])
+        return required
+
+    def run(self, resume=True, targets=None):
+        """Run all the stages not completed yet.
+
+        :param bool resume: whether to skip the stages completed by a previous
+            failed run with the same ``state_path``
+        :param targets: names of the stages to run along with the stages they
+            require, all the stages by default
+        :return: a dictionary with the result of every stage run
+        :raises robottelo.pipeline.PipelineError: when a stage fails. Stages
+            already running are waited for before raising.
+        """
+        if targets is None:
+            selected = set(self.stages)
+        else:
+            selected = self._required(targets)
+        self.results = self._load_state() if resume else {}
+        if self.results:
+            LOGGER.info(
+                'Pipeline %s resuming after stages: %s',
+                self.name, ', '.join(sorted(self.results)))
+        self.timings = OrderedDict()
+        done = queue.Queue()
+        running = set()
+        failure = None
+        start = time.time()
+        while True:
+            if failure is None:
+                ready = [
+                    name for name, (_, requires) in self.stages.items()
+                    if name in selected and name not in self.results and
+                    name not in running and
+                    all(required in self.results for required in requires)
+                ]
+                for name in ready[:max(0, self.workers - len(running))]:
+                    LOGGER.debug('Pipeline %s starting %s', self.name, name)
+                    running.add(name)
+                    thread = threading.Thread(
+                        target=self._run_stage,
+                        args=(name, dict(self.results), done),
+                    )
+                    thread.daemon = True
+                    thread.start()
+            if not running:
+                break
+            name, result, error, elapsed = done.get()
+            running.discard(name)
+            self.timings[name] = elapsed
+            LOGGER.info(
+                'Pipeline %s stage %s %s in %.2f seconds',
+                self.name, name, 'failed' if error else 'finished', elapsed)
+            if error is not None:
+                if failure is None:
+                    failure = (name,) + error
+                continue
+            self.results[name] = result
+            self._save_state()
+        if failure is not None:
+            raise PipelineError(
+                failure[0], failure[1], self.timings, failure[2])
+        LOGGER.info(
+            'Pipeline %s finished in %.2f seconds, stage timings: %s',
+            self.name,
+            time.time() - start,
+            ', '.join(
+                '{0}={1:.2f}s'.format(name, elapsed)
+                for name, elapsed in self.timings.items()
+            ),
+        )
+        self.clear_state()
+        return self.results
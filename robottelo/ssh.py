@@ -308,7 +308,7 @@ def execute_command(cmd, connection, output_format=None, timeout=None,
         while time.time() < end_time:
             if stdout.channel.exit_status_ready():
                 break
-            time.sleep(1)
+            time.sleep(0.1)
         else:
             logger.error('ssh command did not respond in the predefined time'
                          ' (timeout=%s) and will be interrupted', timeout)
@@ -0,0 +1,1090 @@
+"""In-process stubs of the Satellite API and of its SSH endpoint.
+
+The stubs keep organizations, locations, lifecycle environments, products,
+repositories, content views and their versions in memory and answer the API
+requests NailGun sends for them, and the hammer commands of
+:mod:`robottelo.cli` sent through :mod:`robottelo.ssh`. Syncing, publishing
+and promoting start tasks which finish after ``task_duration`` seconds.
+Every request and command waits ``latency`` seconds before being answered,
+which makes it possible to measure the overhead of the framework itself
+(parsing, connection handling, factories orchestration) without a Satellite.
+
+Usage::
+
+    from nailgun import entities, entity_mixins
+    from robottelo.stub_satellite import StubSatelliteServer, StubSSHServer
+
+    with StubSatelliteServer(latency=0.01) as server:
+        entity_mixins.DEFAULT_SERVER_CONFIG = server.server_config()
+        org = entities.Organization().create()
+        with StubSSHServer(store=server.store):
+            # hammer commands are answered from the same data
+            Org.info({'id': org.id})
+
+Besides emulating hammer, the SSH stub can replay recorded outputs::
+
+    with StubSSHServer() as ssh_server:
+        ssh_server.add_reply(r'^rpm -q', stdout='katello-3.4.5-1.noarch')
+        ssh_server.load_replies('/tmp/recorded_hammer_replies.json')
+"""
+import itertools
+import json
+import logging
+import re
+import shlex
+import threading
+import time
+import uuid
+
+import six
+
+from collections import OrderedDict
+from nailgun import entities
+from nailgun.config import ServerConfig
+from nailgun.entity_fields import OneToManyField, OneToOneField
+from robottelo import ssh
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qsl, urlsplit
+
+LOGGER = logging.getLogger(__name__)
+
+#: Resources served by the stubs: name, NailGun entity, API path and hammer
+#: resource name
+RESOURCES = (
+    ('organizations', entities.Organization,
+     'katello/api/v2/organizations', 'organization'),
+    ('locations', entities.Location, 'api/v2/locations', 'location'),
+    ('environments', entities.LifecycleEnvironment,
+     'katello/api/v2/environments', 'lifecycle-environment'),
+    ('products', entities.Product, 'katello/api/v2/products', 'product'),
+    ('repositories', entities.Repository,
+     'katello/api/v2/repositories', 'repository'),
+    ('content_views', entities.ContentView,
+     'katello/api/v2/content_views', 'content-view'),
+    ('content_view_versions', entities.ContentViewVersion,
+     'katello/api/v2/content_view_versions', 'content-view version'),
+    ('tasks', entities.ForemanTask, 'foreman_tasks/api/tasks', 'task'),
+)
+
+# Paths also answering for a resource, NailGun uses both for organizations
+_PATH_ALIASES = {'api/v2/organizations': 'organizations'}
+
+# Query parameters which do not filter search results
+_PAGING_PARAMS = (
+    'full_result', 'order', 'page', 'per_page', 'search', 'sort_by',
+    'sort_order', 'thin',
+)
+
+_SEARCH_TOKEN = re.compile(
+    r'\s*(?:(?P<open>\()|(?P<close>\))|(?P<bool>and|or)(?=[\s(])|'
+    r'(?P<field>[\w.]+)\s*(?P<op>!=|=|!~|~)\s*'
+    r'(?P<value>"(?:[^"\\]|\\.)*"|[^\s()]+))',
+    re.IGNORECASE
+)
+
+
+class StubSearchError(ValueError):
+    """Indicates a search query the stubs can not parse."""
+
+
+def _tokenize_search(search):
+    """Split a search query in tokens."""
+    tokens = []
+    position = 0
+    search = search.strip()
+    while position < len(search):
+        match = _SEARCH_TOKEN.match(search, position)
+        if match is None:
+            raise StubSearchError(
+                u'Unable to parse search "{0}" at position {1}'.format(
+                    search, position))
+        position = match.end()
+        if match.group('open'):
+            tokens.append('(')
+        elif match.group('close'):
+            tokens.append(')')
+        elif match.group('bool'):
+            tokens.append(match.group('bool').lower())
+        else:
+            value = match.group('value')
+            if value.startswith('"'):
+                value = re.sub(r'\\(.)', r'\1', value[1:-1])
+            tokens.append(
+                (match.group('field'), match.group('op'), value))
+    return tokens
+
+
+def _term_matches(record, term):
+    """Return whether ``record`` matches a ``(field, op, value)`` term."""
+    field, operator, value = term
+    actual = record.get(field)
+    if actual is None:
+        return operator.startswith('!')
+    actual = u'{0}'.format(actual)
+    if operator in ('~', '!~'):
+        found = value.lower().strip('%') in actual.lower()
+    else:
+        found = actual == value
+    return found != operator.startswith('!')
+
+
+def parse_search(search):
+    """Return a function telling whether a record matches ``search``.
+
+    Terms like ``name = "foo"``, ``label ~ bar`` or ``id != 1`` can be
+    combined with ``and``, ``or`` and parentheses, terms without a boolean
+    operator between them are combined with ``and``.
+
+    :raises robottelo.stub_satellite.StubSearchError: if the search can not
+        be parsed
+    """
+    tokens = _tokenize_search(search or '')
+
+    def expression(position):
+        """Parse an ``or`` expression."""
+        alternatives = []
+        while True:
+            terms, position = conjunction(position)
+            alternatives.append(terms)
+            if position < len(tokens) and tokens[position] == 'or':
+                position += 1
+                continue
+            return (
+                lambda record: any(
+                    predicate(record) for predicate in alternatives),
+                position,
+            )
+
+    def conjunction(position):
+        """Parse an ``and`` expression."""
+        predicates = []
+        while position < len(tokens) and tokens[position] not in (')', 'or'):
+            if tokens[position] == 'and':
+                position += 1
+                continue
+            if tokens[position] == '(':
+                predicate, position = expression(position + 1)
+                if position >= len(tokens) or tokens[position] != ')':
+                    raise StubSearchError(
+                        u'Unbalanced parentheses in "{0}"'.format(search))
+                position += 1
+            else:
+                term = tokens[position]
+                predicate = (
+                    lambda record, term=term: _term_matches(record, term))
+                position += 1
+            predicates.append(predicate)
+        return (
+            lambda record: all(
+                predicate(record) for predicate in predicates),
+            position,
+        )
+
+    if not tokens:
+        return lambda record: True
+    predicate, position = expression(0)
+    if position != len(tokens):
+        raise StubSearchError(u'Unable to parse search "{0}"'.format(search))
+    return predicate
+
+
+class StubSatelliteStore(object):
+    """Thread safe in-memory data shared by the stub servers.
+
+    :param float task_duration: seconds tasks take to finish
+    """
+
+    def __init__(self, task_duration=0):
+        self.task_duration = task_duration
+        self.collections = OrderedDict(
+            (name, OrderedDict()) for name, _, _, _ in RESOURCES)
+        self._entities = {
+            name: entity for name, entity, _, _ in RESOURCES}
+        self._resource_by_entity = {
+            entity.__name__: name for name, entity, _, _ in RESOURCES}
+        self._fields = {}
+        self._ids = itertools.count(1)
+        self._finishers = {}
+        self._lock = threading.RLock()
+
+    def fields(self, resource):
+        """Return a dictionary mapping the NailGun fields of ``resource`` to
+        ``None`` for plain fields or to the referenced resource class name
+        and whether it is a one to many relation.
+        """
+        if resource not in self._fields:
+            entity = self._entities[resource](ServerConfig('http://stub'))
+            fields = OrderedDict()
+            for name, field in entity.get_fields().items():
+                if isinstance(field, (OneToOneField, OneToManyField)):
+                    fields[name] = (
+                        field.entity.__name__,
+                        isinstance(field, OneToManyField),
+                    )
+                else:
+                    fields[name] = None
+            self._fields[resource] = fields
+        return self._fields[resource]
+
+    def _normalize(self, resource, attrs):
+        """Store relations as ``<field>_id`` and ``<field>_ids`` keys."""
+        normalized = {}
+        fields = self.fields(resource)
+        for key, value in attrs.items():
+            relation = fields.get(key)
+            if relation is None:
+                normalized[key] = value
+            elif relation[1]:
+                normalized[key + '_ids'] = [
+                    item['id'] if isinstance(item, dict) else item
+                    for item in value or []
+                ]
+            else:
+                normalized[key + '_id'] = (
+                    value['id'] if isinstance(value, dict) else value)
+        return normalized
+
+    def create(self, resource, attrs):
+        """Create a record of ``resource`` and return it."""
+        with self._lock:
+            record = self._normalize(resource, attrs)
+            record['id'] = next(self._ids)
+            if 'name' in record and 'label' in self.fields(resource):
+                record.setdefault(
+                    'label', re.sub(r'\W', '_', u'{0}'.format(record['name'])))
+            self.collections[resource][record['id']] = record
+            if resource == 'organizations':
+                library = self.create('environments', {
+                    'name': 'Library',
+                    'library': True,
+                    'organization_id': record['id'],
+                })
+                view = self.create('content_views', {
+                    'name': 'Default Organization View',
+                    'default': True,
+                    'organization_id': record['id'],
+                })
+                record['library_id'] = library['id']
+                record['default_content_view_id'] = view['id']
+            return record
+
+    def get(self, resource, record_id):
+        """Return a record of ``resource`` or ``None`` if missing."""
+        with self._lock:
+            if resource == 'tasks':
+                return self.task(record_id)
+            try:
+                return self.collections[resource].get(int(record_id))
+            except (TypeError, ValueError):
+                return None
+
+    def update(self, resource, record_id, attrs):
+        """Update a record and return it, ``None`` if missing."""
+        with self._lock:
+            record = self.get(resource, record_id)
+            if record is not None:
+                attrs = self._normalize(resource, attrs)
+                attrs.pop('id', None)
+                record.update(attrs)
+            return record
+
+    def delete(self, resource, record_id):
+        """Delete a record and return it, ``None`` if missing."""
+        with self._lock:
+            record = self.get(resource, record_id)
+            if record is not None:
+                del self.collections[resource][record['id']]
+            return record
+
+    def search(self, resource, params=None):
+        """Return the records of ``resource`` matching ``params``.
+
+        :param dict params: the search query parameters. ``search`` is parsed
+            with :func:`parse_search` and other parameters, but the paging
+            ones, must be equal to the records values.
+        """
+        params = params or {}
+        predicate = parse_search(params.get('search'))
+        filters = {
+            key: value for key, value in params.items()
+            if key not in _PAGING_PARAMS and not isinstance(value, list)
+        }
+        with self._lock:
+            if resource == 'tasks':
+                for task_id in list(self.collections['tasks']):
+                    self.task(task_id)
+            records = list(self.collections[resource].values())
+        return [
+            record for record in records
+            if predicate(record) and all(
+                _term_matches(record, (key, '=', u'{0}'.format(value)))
+                for key, value in filters.items()
+            )
+        ]
+
+    def start_task(self, action, finish=None):
+        """Start a task and return it.
+
+        :param str action: the task action, e.g. ``Synchronize repository``
+        :param finish: callable run with the task when it finishes. The task
+            fails if it raises.
+        """
+        with self._lock:
+            task = {
+                'id': str(uuid.uuid4()),
+                'label': action,
+                'humanized': {'action': action},
+                'input': {},
+                'output': {},
+                'state': 'running',
+                'result': 'pending',
+                'pending': True,
+                'progress': 0.0,
+                'started_at': time.strftime('%Y-%m-%d %H:%M:%S UTC'),
+                'ended_at': None,
+                'username': 'admin',
+                'cli_example': None,
+                '_start': time.time(),
+            }
+            self.collections['tasks'][task['id']] = task
+            self._finishers[task['id']] = finish
+            self.task(task['id'])
+            return task
+
+    def task(self, task_id):
+        """Return a task, finishing it if its duration has elapsed."""
+        with self._lock:
+            task = self.collections['tasks'].get(task_id)
+            if task is None or task['state'] != 'running':
+                return task
+            if time.time() - task['_start'] < self.task_duration:
+                return task
+            finish = self._finishers.pop(task_id, None)
+            task['result'] = 'success'
+            if finish is not None:
+                try:
+                    finish(task)
+                except Exception as err:
+                    task['result'] = 'error'
+                    task['output'] = {'error': u'{0}'.format(err)}
+            task.update({
+                'state': 'stopped',
+                'pending': False,
+                'progress': 1.0,
+                'ended_at': time.strftime('%Y-%m-%d %H:%M:%S UTC'),
+            })
+            return task
+
+    def wait_task(self, task):
+        """Wait for ``task`` to finish and return it."""
+        while True:
+            task = self.task(task['id'])
+            if task['state'] != 'running':
+                return task
+            time.sleep(min(self.task_duration, 0.1))
+
+    def sync(self, resource, record):
+        """Start syncing a repository or all the repositories of a product.
+        """
+        def finish(task):
+            """Record the sync task on the synced repositories"""
+            if resource == 'repositories':
+                repositories = [record]
+            else:
+                repositories = self.search(
+                    'repositories', {'product_id': record['id']})
+            for repository in repositories:
+                repository['last_sync_id'] = task['id']
+                repository.setdefault('content_counts', {})
+        return self.start_task(
+            u'Synchronize {0}'.format(record.get('name')), finish)
+
+    def publish(self, content_view):
+        """Start publishing a new version of ``content_view``."""
+        def finish(task):
+            """Create the new version promoted to Library"""
+            library = self.search('environments', {
+                'organization_id': content_view.get('organization_id'),
+                'name': 'Library',
+            })
+            major = content_view.get('next_version') or 1
+            version = self.create('content_view_versions', {
+                'content_view_id': content_view['id'],
+                'version': u'{0}.0'.format(major),
+                'major': major,
+                'minor': 0,
+                'environment_ids': [env['id'] for env in library],
+            })
+            content_view['version_ids'] = (
+                content_view.get('version_ids', []) + [version['id']])
+            content_view['next_version'] = major + 1
+            content_view['last_published'] = task['started_at']
+        return self.start_task(
+            u'Publish {0}'.format(content_view.get('name')), finish)
+
+    def promote(self, version, environment_ids):
+        """Start promoting a content view version to environments."""
+        def finish(task):  # pylint:disable=unused-argument
+            """Add the environments to the version"""
+            version['environment_ids'] = sorted(
+                set(version.get('environment_ids', [])) |
+                set(int(env_id) for env_id in environment_ids)
+            )
+        return self.start_task(
+            u'Promote {0}'.format(version.get('version')), finish)
+
+    def entity_resource(self, entity_name):
+        """Return the resource of a NailGun entity class name, ``None`` if
+        it is not stored.
+        """
+        return self._resource_by_entity.get(entity_name)
+
+    def summary(self, entity_name, record_id):
+        """Return the nested representation of a related record."""
+        resource = self.entity_resource(entity_name)
+        record = None
+        if resource is not None and record_id is not None:
+            record = self.get(resource, record_id)
+        if record is None:
+            return {'id': record_id}
+        return {
+            key: record.get(key) for key in ('id', 'name', 'label')
+            if key in record
+        }
+
+    def render(self, resource, record):
+        """Return the API representation of a record.
+
+        Every NailGun field is present, relations as both ``<field>_id`` (or
+        ``<field>_ids``) and nested objects.
+        """
+        with self._lock:
+            data = {
+                key: value for key, value in record.items()
+                if not key.startswith('_')
+            }
+            for name, relation in self.fields(resource).items():
+                if relation is None:
+                    data.setdefault(name, None)
+                elif relation[1]:
+                    data.setdefault(name + '_ids', [])
+                else:
+                    related_id = data.setdefault(name + '_id', None)
+                    data[name] = (
+                        None if related_id is None
+                        else self.summary(relation[0], related_id)
+                    )
+            return data
+
+
+def _resource_singular(resource):
+    """Return the key wrapping the attributes of ``resource`` payloads."""
+    if resource == 'repositories':
+        return 'repository'
+    return resource[:-1]
+
+
+class _StubSatelliteHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer the API calls issued by NailGun for the stub resources."""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this kept alive
+    # connections wait for delayed acknowledgements on every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        """Keep the stub quiet, requests are logged at debug level only."""
+        LOGGER.debug('stub satellite: ' + format, *args)
+
+    def _reply(self, status, data=None):
+        """Send ``data`` as a JSON response."""
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_params(self):
+        """Read the query string and the JSON request body."""
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+            if isinstance(body, dict):
+                params.update(body)
+        return url.path.strip('/'), params
+
+    def _route(self, path):
+        """Return the resource, record id and action of ``path``."""
+        for name, _, api_path, _ in RESOURCES:
+            for prefix in [api_path] + [
+                    alias for alias, aliased in _PATH_ALIASES.items()
+                    if aliased == name]:
+                if path == prefix:
+                    return name, None, None
+                if path.startswith(prefix + '/'):
+                    parts = path[len(prefix) + 1:].split('/', 1)
+                    return name, parts[0], (
+                        parts[1] if len(parts) > 1 else None)
+        return None, None, None
+
+    def _handle(self):
+        """Dispatch the request after the configured latency."""
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        try:
+            self._dispatch()
+        except Exception as err:
+            LOGGER.exception('stub satellite failed to answer %s', self.path)
+            self._reply(500, {'error': {'message': u'{0}'.format(err)}})
+
+    def _dispatch(self):
+        """Answer the request from the store."""
+        store = self.server.store
+        path, params = self._read_params()
+        resource, record_id, action = self._route(path)
+        if resource is None:
+            return self._reply(404, {'error': {'message': 'Not found'}})
+        if record_id is None:
+            if self.command == 'GET':
+                try:
+                    records = store.search(resource, params)
+                except StubSearchError as err:
+                    return self._reply(
+                        400, {'error': {'message': u'{0}'.format(err)}})
+                results = [store.render(resource, rec) for rec in records]
+                return self._reply(200, {
+                    'total': len(store.collections[resource]),
+                    'subtotal': len(results),
+                    'page': 1,
+                    'per_page': len(results),
+                    'search': params.get('search'),
+                    'results': results,
+                })
+            if self.command == 'POST' and resource != 'tasks':
+                attrs = params.get(_resource_singular(resource), params)
+                record = store.create(resource, attrs)
+                return self._reply(201, store.render(resource, record))
+            return self._reply(405, {'error': {'message': 'Not allowed'}})
+        record = store.get(resource, record_id)
+        if record is None:
+            return self._reply(404, {'error': {'message': 'Not found'}})
+        if action is None:
+            if self.command == 'GET':
+                return self._reply(200, store.render(resource, record))
+            if self.command == 'PUT':
+                attrs = params.get(_resource_singular(resource), params)
+                store.update(resource, record_id, attrs)
+                return self._reply(200, store.render(resource, record))
+            if self.command == 'DELETE':
+                store.delete(resource, record_id)
+                return self._reply(200, store.render(resource, record))
+        elif self.command == 'POST':
+            task = None
+            if action == 'sync' and resource in ('products', 'repositories'):
+                task = store.sync(resource, record)
+            elif action == 'publish' and resource == 'content_views':
+                task = store.publish(record)
+            elif action == 'promote' and resource == 'content_view_versions':
+                environment_ids = params.get('environment_ids') or [
+                    params.get('environment_id')]
+                task = store.promote(record, environment_ids)
+            if task is not None:
+                return self._reply(202, store.render('tasks', task))
+        return self._reply(404, {'error': {'message': 'Not found'}})
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    """HTTP server handling every connection in its own thread."""
+    daemon_threads = True
+
+
+class StubSatelliteServer(object):
+    """In-process HTTP server faking the Satellite API used by NailGun for
+    the :data:`RESOURCES`.
+
+    Connections are kept alive, so clients reusing connections, like
+    :class:`robottelo.api.session.NailgunSession`, are measured as such.
+
+    :param float latency: seconds to wait before answering each request
+    :param float task_duration: seconds tasks take to finish
+    :param int port: port to listen on, a free one is picked by default
+    :param store: :class:`StubSatelliteStore` to serve, a new one by default
+    """
+
+    def __init__(self, latency=0, task_duration=0, port=0, store=None):
+        self.latency = latency
+        self.port = port
+        self.store = store or StubSatelliteStore(task_duration)
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL of the running server."""
+        return 'http://127.0.0.1:{0}'.format(self._server.server_address[1])
+
+    def server_config(self, auth=('admin', 'changeme')):
+        """Return a NailGun server config pointing to the server."""
+        return ServerConfig(self.url, auth=auth, verify=False)
+
+    def start(self):
+        """Start serving requests in a background thread."""
+        self._server = _ThreadingHTTPServer(
+            ('127.0.0.1', self.port), _StubSatelliteHandler)
+        self._server.latency = self.latency
+        self._server.store = self.store
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and wait for its thread to finish."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _StubChannel(object):
+    """Channel of a finished stub command."""
+
+    def __init__(self, return_code):
+        self.return_code = return_code
+
+    def exit_status_ready(self):
+        """Stub commands are always finished."""
+        return True
+
+    def recv_exit_status(self):
+        """Return the command exit status."""
+        return self.return_code
+
+
+class _StubFile(object):
+    """Standard output or error of a stub command."""
+
+    def __init__(self, data, channel):
+        self.data = data.encode('utf-8') if data else b''
+        self.channel = channel
+
+    def read(self):
+        """Return the whole output."""
+        data = self.data
+        if not six.PY2:
+            data = data.decode('utf-8')
+        return data
+
+
+class _StubSFTPClient(object):
+    """SFTP client storing the uploaded files in ``files``."""
+
+    def __init__(self, files):
+        self.files = files
+
+    def put(self, local_file, remote_file):
+        """Upload a local file."""
+        with open(local_file, 'rb') as handler:
+            self.files[remote_file] = handler.read()
+
+    def putfo(self, file_object, remote_file):
+        """Upload a file-like object."""
+        self.files[remote_file] = file_object.read()
+
+    def get(self, remote_file, local_file):
+        """Download a previously uploaded file."""
+        with open(local_file, 'wb') as handler:
+            handler.write(self.files[remote_file])
+
+    def close(self):
+        """Nothing to close."""
+
+
+class _StubSSHClient(object):
+    """Stand-in for :class:`robottelo.ssh.SSHClient`."""
+
+    def __init__(self, server):
+        self.server = server
+
+    def set_missing_host_key_policy(self, policy):
+        """Host keys are not checked."""
+
+    def connect(self, **kwargs):
+        """Wait for the connection latency."""
+        if self.server.connection_latency:
+            time.sleep(self.server.connection_latency)
+        self.server.connections += 1
+
+    def exec_command(self, cmd, timeout=None):
+        """Answer ``cmd`` and return its stdin, stdout and stderr."""
+        if isinstance(cmd, bytes):
+            cmd = cmd.decode('utf-8')
+        stdout, stderr, return_code = self.server.answer(cmd)
+        channel = _StubChannel(return_code)
+        return (
+            None, _StubFile(stdout, channel), _StubFile(stderr, channel))
+
+    def run(self, cmd, *args, **kwargs):
+        """See :meth:`robottelo.ssh.SSHClient.run`."""
+        return ssh.execute_command(cmd, self, *args, **kwargs)
+
+    def open_sftp(self):
+        """Return a SFTP client storing files in the server."""
+        return _StubSFTPClient(self.server.files)
+
+    def close(self):
+        """Nothing to close."""
+
+
+class StubSSHServer(object):
+    """Answer the commands sent through :mod:`robottelo.ssh` without
+    connecting anywhere.
+
+    Commands are answered by the first matching reply added with
+    :meth:`add_reply` or :meth:`load_replies`. Hammer commands without a
+    matching reply are emulated for the :data:`RESOURCES` of ``store``. Other
+    commands succeed without output and are recorded in ``unmatched``.
+
+    :param store: :class:`StubSatelliteStore` used to emulate hammer, a new
+        one by default
+    :param float latency: seconds to wait before answering each command
+    :param float connection_latency: seconds to wait on every connection
+    """
+
+    def __init__(self, store=None, latency=0, connection_latency=0):
+        self.store = store or StubSatelliteStore()
+        self.latency = latency
+        self.connection_latency = connection_latency
+        self.replies = []
+        self.commands = []
+        self.unmatched = []
+        self.files = {}
+        self.connections = 0
+        self._previous_client = None
+        self._lock = threading.Lock()
+
+    def add_reply(self, pattern, stdout='', stderr='', return_code=0):
+        """Answer the commands matching the ``pattern`` regular expression.
+
+        :param stdout: the output, or a callable receiving the match object
+            and returning a ``(stdout, stderr, return_code)`` tuple
+        """
+        self.replies.append(
+            (re.compile(pattern), stdout, stderr, return_code))
+
+    def load_replies(self, path):
+        """Add the replies of a JSON file.
+
+        The file contains a list of objects with a ``command`` regular
+        expression and optional ``stdout``, ``stderr`` and ``return_code``.
+        """
+        with open(path) as handler:
+            for reply in json.load(handler):
+                self.add_reply(
+                    reply['command'],
+                    reply.get('stdout', ''),
+                    reply.get('stderr', ''),
+                    reply.get('return_code', 0),
+                )
+
+    def answer(self, cmd):
+        """Return the ``(stdout, stderr, return_code)`` of ``cmd``."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.commands.append(cmd)
+        for pattern, stdout, stderr, return_code in self.replies:
+            match = pattern.search(cmd)
+            if match is not None:
+                if callable(stdout):
+                    return stdout(match)
+                return stdout, stderr, return_code
+        hammer = HammerEmulator.parse(cmd)
+        if hammer is not None:
+            return HammerEmulator(self.store).run(*hammer)
+        with self._lock:
+            self.unmatched.append(cmd)
+        return '', '', 0
+
+    def start(self):
+        """Make :mod:`robottelo.ssh` connect to this server."""
+        self._previous_client = ssh._call_paramiko_sshclient
+        ssh._call_paramiko_sshclient = lambda: _StubSSHClient(self)
+        return self
+
+    def stop(self):
+        """Make :mod:`robottelo.ssh` open real connections again."""
+        ssh._call_paramiko_sshclient = self._previous_client
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class HammerEmulator(object):
+    """Run hammer commands against a :class:`StubSatelliteStore`.
+
+    ``create``, ``info``, ``list``, ``update`` and ``delete`` are emulated for
+    all the :data:`RESOURCES`, as well as ``repository synchronize``,
+    ``content-view publish``, ``content-view version promote`` and ``task
+    progress``. Outputs are formatted like hammer does for the requested
+    ``--output``, so they go through the same parsing as real ones.
+    """
+
+    # Exit codes used by hammer
+    EX_USAGE = 64
+    EX_NOT_FOUND = 65
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def parse(cmd):
+        """Split a hammer command line.
+
+        :return: a tuple with the output format, the resource, the
+            subcommand and the options dictionary, ``None`` if ``cmd`` is not
+            a hammer command.
+        """
+        try:
+            words = shlex.split(cmd)
+        except ValueError:
+            return None
+        if 'hammer' not in words:
+            return None
+        words = words[words.index('hammer') + 1:]
+        output_format = None
+        positional = []
+        options = OrderedDict()
+        index = 0
+        while index < len(words):
+            word = words[index]
+            index += 1
+            if word in ('-u', '-p', '--username', '--password'):
+                index += 1
+            elif word.startswith('--output='):
+                output_format = word.split('=', 1)[1]
+            elif word.startswith('--'):
+                key, separator, value = word[2:].partition('=')
+                options[key] = value if separator else True
+            elif not word.startswith('-'):
+                positional.append(word)
+        for _, _, _, hammer_name in sorted(
+                RESOURCES, key=lambda resource: -len(resource[3])):
+            names = hammer_name.split()
+            if positional[:len(names)] == names:
+                subcommand = ' '.join(positional[len(names):])
+                return output_format, hammer_name, subcommand, options
+        return output_format, ' '.join(positional[:-1]), (
+            positional[-1] if positional else ''), options
+
+    def _resource(self, hammer_name):
+        """Return the store resource of a hammer resource name."""
+        for name, _, _, resource_hammer_name in RESOURCES:
+            if resource_hammer_name == hammer_name:
+                return name
+        return None
+
+    def _attributes(self, resource, options):
+        """Convert hammer options to record attributes."""
+        fields = self.store.fields(resource)
+        attrs = {}
+        for key, value in options.items():
+            key = key.replace('-', '_')
+            if key in ('async', 'id'):
+                continue
+            relation = fields.get(key)
+            if key.endswith('_ids'):
+                attrs[key] = [int(item) for item in value.split(',') if item]
+            elif key.endswith('_id'):
+                attrs[key] = int(value)
+            elif relation is not None and not relation[1]:
+                related_resource = self.store.entity_resource(relation[0])
+                related = self.store.search(
+                    related_resource, {'name': value}
+                ) if related_resource is not None else []
+                if related:
+                    attrs[key + '_id'] = related[0]['id']
+            else:
+                attrs[key] = value
+        return attrs
+
+    @staticmethod
+    def _title(key):
+        """Return the hammer column title of ``key``."""
+        return ' '.join(
+            'ID' if word == 'id' else word.capitalize()
+            for word in key.split('_')
+        )
+
+    def _format(self, output_format, rows, columns=None, single=False):
+        """Format ``rows`` as hammer does for ``output_format``.
+
+        :param bool single: whether the output is a single object, like the
+            ``info`` one, instead of a list
+        """
+        if columns is None:
+            columns = []
+            for row in rows:
+                columns.extend(key for key in row if key not in columns)
+        if output_format == 'json':
+            data = [
+                OrderedDict(
+                    (self._title(column), row.get(column))
+                    for column in columns
+                )
+                for row in rows
+            ]
+            return json.dumps(data[0] if single else data, indent=2)
+        if output_format == 'csv':
+            lines = [','.join(self._title(column) for column in columns)]
+            for row in rows:
+                lines.append(','.join(
+                    _csv_value(row.get(column)) for column in columns))
+            return '\n'.join(lines) + '\n'
+        return '\n'.join(
+            u'{0}:{1}{2}'.format(
+                self._title(column),
+                ' ' * max(1, 24 - len(self._title(column))),
+                _plain_value(row.get(column)),
+            )
+            for row in rows for column in columns
+        ) + '\n'
+
+    def _message(self, output_format, message):
+        """Format a message as hammer does for ``output_format``."""
+        if output_format in ('csv', 'json'):
+            return self._format(output_format, [{'message': message}])
+        return message + '\n'
+
+    def _info_row(self, resource, record):
+        """Return the info values of a record."""
+        row = OrderedDict([('id', record['id'])])
+        data = self.store.render(resource, record)
+        for name, relation in self.store.fields(resource).items():
+            if name == 'id':
+                continue
+            if relation is None:
+                value = data.get(name)
+                if value is not None and not isinstance(value, (dict, list)):
+                    row[name] = value
+            elif not relation[1] and data.get(name):
+                row[name] = data[name].get('name', data[name]['id'])
+                row[name + '_id'] = data[name]['id']
+        return row
+
+    def run(self, output_format, hammer_name, subcommand, options):
+        """Run a parsed hammer command.
+
+        :return: a ``(stdout, stderr, return_code)`` tuple
+        """
+        try:
+            return self._run(output_format, hammer_name, subcommand, options)
+        except (StubSearchError, ValueError) as err:
+            return '', u'Error: {0}\n'.format(err), self.EX_USAGE
+
+    def _run(self, output_format, hammer_name, subcommand, options):
+        """Run a parsed hammer command, see :meth:`run`."""
+        resource = self._resource(hammer_name)
+        if resource is None:
+            return '', u'Error: unknown resource {0}\n'.format(
+                hammer_name), self.EX_USAGE
+        title = self._title(_resource_singular(resource))
+        if subcommand == 'create' and resource != 'tasks':
+            record = self.store.create(
+                resource, self._attributes(resource, options))
+            return self._format(
+                output_format,
+                [{'message': u'{0} created'.format(title),
+                  'id': record['id'],
+                  'name': record.get('name')}],
+                ['message', 'id', 'name'],
+            ), '', 0
+        if subcommand == 'list':
+            records = self.store.search(
+                resource, self._attributes(resource, options))
+            if resource == 'tasks':
+                columns = ['id', 'action', 'state', 'result']
+                rows = [
+                    dict(record, action=record['label'])
+                    for record in records
+                ]
+            else:
+                columns = ['id', 'name']
+                if 'label' in self.store.fields(resource):
+                    columns.append('label')
+                rows = records
+            return self._format(output_format or 'csv', rows, columns), '', 0
+        record = self.store.get(resource, options.get('id'))
+        if record is None:
+            return '', u'Could not find {0}, please set option --id.\n'.format(
+                _resource_singular(resource)), self.EX_NOT_FOUND
+        task = None
+        if subcommand == 'info':
+            return self._format(
+                output_format,
+                [self._info_row(resource, record)],
+                single=True,
+            ), '', 0
+        elif subcommand == 'update':
+            self.store.update(
+                resource, record['id'], self._attributes(resource, options))
+            return self._message(
+                output_format, u'{0} updated'.format(title)), '', 0
+        elif subcommand == 'delete':
+            self.store.delete(resource, record['id'])
+            return self._message(
+                output_format, u'{0} deleted'.format(title)), '', 0
+        elif subcommand == 'synchronize' and resource == 'repositories':
+            task = self.store.sync(resource, record)
+        elif subcommand == 'publish' and resource == 'content_views':
+            task = self.store.publish(record)
+        elif subcommand == 'promote' and resource == 'content_view_versions':
+            attrs = self._attributes(resource, options)
+            environment_id = attrs.get('to_lifecycle_environment_id') or (
+                attrs.get('environment_id'))
+            task = self.store.promote(record, [environment_id])
+        elif subcommand == 'progress' and resource == 'tasks':
+            task = record
+        if task is None:
+            return '', u'Error: unknown command {0}\n'.format(
+                subcommand), self.EX_USAGE
+        if options.get('async'):
+            message = u'Task {0} running.'.format(task['id'])
+        else:
+            task = self.store.wait_task(task)
+            if task['result'] != 'success':
+                return '', u'Task {0} failed.\n'.format(
+                    task['id']), self.EX_NOT_FOUND
+            message = u'Task {0} success.'.format(task['id'])
+        return self._message(output_format, message), '', 0
+
+
+def _csv_value(value):
+    """Format a CSV field the way hammer does."""
+    value = u'' if value is None else u'{0}'.format(value)
+    if any(char in value for char in (',', '"', '\n')):
+        value = u'"{0}"'.format(value.replace('"', '""'))
+    return value
+
+
+def _plain_value(value):
+    """Format an info value the way hammer does."""
+    if value is None:
+        return u''
+    if isinstance(value, bool):
+        return u'yes' if value else u'no'
+    return u'{0}'.format(value)
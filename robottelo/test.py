@@ -6,9 +6,11 @@ to help writing API, CLI and UI tests.
 
 """
 import logging
+import os
 import pytest
 import re
 import unittest2
+import uuid
 
 try:
     import sauceclient
@@ -20,7 +22,7 @@ except ImportError:
 from fauxfactory import gen_string
 from nailgun import entities
 from robottelo import manifests
-from robottelo.cleanup import EntitiesCleaner
+from robottelo.cleanup import get_entities_cleaner
 from robottelo.config import settings
 from robottelo.constants import (
     INTERFACE_API,
@@ -211,7 +213,12 @@ class TestCase(unittest2.TestCase):
         cls.foreman_user = settings.server.admin_username
         cls.foreman_password = settings.server.admin_password
         if settings.cleanup:
-            cls.cleaner = EntitiesCleaner(
+            # Test cases may run in several processes at the same time, the
+            # owner of their entities must be unique
+            cls.cleaner = get_entities_cleaner(
+                '{0}.{1}.{2}.{3}'.format(
+                    cls.__module__, cls.__name__, os.getpid(),
+                    uuid.uuid4().hex),
                 entities.Organization,
                 entities.Host,
                 entities.HostGroup
@@ -12,14 +12,24 @@ snap-guest and its dependencies and the ``image_dir`` path created.
 import logging
 import os
 
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from robottelo import ssh
 from robottelo.config import settings
 from robottelo.constants import DISTRO_RHEL6, DISTRO_RHEL7, REPOS
 from robottelo.decorators import bz_bug_is_open
 from robottelo.helpers import install_katello_ca, remove_katello_ca
+from robottelo.vm_packages import PackageTransaction
+from robottelo.vm_pool import get_vm_pool
+from robottelo.vm_readiness import wait_ready
+from robottelo.vm_reaper import get_reaper, tagged
+from robottelo.vm_scheduler import get_scheduler
 
 logger = logging.getLogger(__name__)
 
+#: Disk space in megabytes reserved for a virtual machine by the scheduler
+VM_DISK = 2048
+
 
 class VirtualMachineError(Exception):
     """Exception raised for failed virtual machine management operations"""
@@ -45,12 +55,33 @@ class VirtualMachine(object):
     as per virtual machine basis. Just set the wanted values when
     instantiating.
 
+    When the pool of :mod:`robottelo.vm_pool` is enabled, virtual machines
+    with the default provisioning server, image directory, hardware, name,
+    tag and network are leased from it instead of being created. Pass
+    ``use_pool=False`` to always create a new one.
+
+    When the reaper of :mod:`robottelo.vm_reaper` is enabled, :meth:`destroy`
+    returns right away and the virtual machine is destroyed in background.
+    Unless ``target_image`` is given, the name of the virtual machine starts
+    with the ``clients`` section ``sweep_tag``, so the reaper can sweep it.
+
+    When the scheduler of :mod:`robottelo.vm_scheduler` is enabled, virtual
+    machines are created once a provisioning server has the headroom for
+    them, and those with the default provisioning server are spread across
+    the ``clients`` section ``provisioning_servers``.
+
+    ``source_image`` selects the base image snap-guest creates the virtual
+    machine from, ``<distro>-base`` by default. See
+    :class:`robottelo.vm_image.VirtualMachineImage` for images saved from
+    configured virtual machines.
+
     """
 
     def __init__(
             self, cpu=1, ram=512, distro=None, provisioning_server=None,
             image_dir=None, tag=None, hostname=None, domain=None,
-            target_image=None, bridge=None):
+            target_image=None, bridge=None, use_pool=True,
+            source_image=None):
         distro_el6 = settings.distro.image_el6
         distro_el7 = settings.distro.image_el7
         self.cpu = cpu
@@ -69,8 +100,14 @@ class VirtualMachine(object):
             )
         if provisioning_server is None:
             self.provisioning_server = settings.clients.provisioning_server
+            # The scheduler may spread the virtual machines across servers
+            self._provisioning_servers = (
+                settings.clients.provisioning_servers or
+                [self.provisioning_server]
+            )
         else:
             self.provisioning_server = provisioning_server
+            self._provisioning_servers = [provisioning_server]
         if self.provisioning_server is None or self.provisioning_server == '':
             raise VirtualMachineError(
                 'A provisioning server must be provided. Make sure to fill '
@@ -91,7 +128,28 @@ class VirtualMachine(object):
         self._target_image = target_image or str(id(self))
         if tag:
             self._target_image = tag + self._target_image
+        if target_image is None:
+            self._target_image = tagged(self._target_image)
         self.bridge = bridge
+        self.source_image = source_image
+        self.registration = None
+        self._snapshots = []
+        self._use_pool = use_pool and all((
+            cpu == 1,
+            ram == 512,
+            provisioning_server is None,
+            image_dir is None,
+            hostname is None,
+            domain is None,
+            tag is None,
+            target_image is None,
+            bridge is None,
+            source_image is None,
+        ))
+        self._pool = None
+        # Whether the reaper destroys the virtual machine once its process is
+        # gone, the pool virtual machines outlive the processes
+        self._sweep_orphan = True
 
     @property
     def subscribed(self):
@@ -135,6 +193,37 @@ class VirtualMachine(object):
         if self._created:
             return
 
+        if self._lease():
+            return
+
+        scheduler = get_scheduler()
+        if scheduler is None:
+            self._boot()
+            return
+        admission = scheduler.admit(
+            self._provisioning_servers, self.image_dir, self.cpu, self.ram,
+            VM_DISK)
+        self.provisioning_server = admission.host
+        try:
+            self._boot()
+        finally:
+            scheduler.complete(admission, booted=self.ip_addr is not None)
+
+    def _boot(self):
+        """Run snap-guest and wait for the virtual machine to accept SSH
+        connections.
+        """
+        reaper = get_reaper()
+        if reaper is not None:
+            # A virtual machine with the same name may be still destroyed
+            reaper.wait(self.provisioning_server, self.target_image)
+            if self._sweep_orphan:
+                # Recorded before snap-guest runs, so the tagged sweep never
+                # takes a booting virtual machine for an orphan
+                reaper.register(
+                    self.provisioning_server, self.target_image,
+                    self._image_path())
+
         command_args = [
             'snap-guest',
             '-b {source_image}',
@@ -157,7 +246,7 @@ class VirtualMachine(object):
             self.bridge = 'br0'
 
         command = u' '.join(command_args).format(
-            source_image=u'{0}-base'.format(self.distro),
+            source_image=self.source_image or u'{0}-base'.format(self.distro),
             target_image=self.target_image,
             vm_ram=self.ram,
             vm_cpu=self.cpu,
@@ -175,29 +264,73 @@ class VirtualMachine(object):
         else:
             self._created = True
 
-        # Give some time to machine boot
-        result = ssh.command(
-            u'for i in {{1..60}}; do ping -c1 {0}.local && exit 0; sleep 1;'
-            u' done; exit 1'.format(self._target_image),
-            self.provisioning_server
-        )
-        if result.return_code != 0:
-            logger.error('Failed to obtain VM IP, reverting changes')
+        # Wait for the machine to boot and its SSH server to start
+        report = wait_ready(
+            self.target_image, self._target_image, self.provisioning_server)
+        if not report.ready:
+            if report.failed_stage == 'ip':
+                logger.error('Failed to obtain VM IP, reverting changes')
+                message = (
+                    'Failed to fetch virtual machine IP address information')
+            else:
+                logger.error('Failed to SSH to the VM, reverting changes')
+                message = (
+                    'Failed to connect to SSH port of the virtual machine')
             self.destroy()
-            raise VirtualMachineError(
-                'Failed to fetch virtual machine IP address information')
-        output = ''.join(result.stdout)
-        self.ip_addr = output.split('(')[1].split(')')[0]
-        ssh_check = ssh.command(
-            u'for i in {{1..60}}; do nc -vn {0} 22 <<< "" && exit 0; sleep 1;'
-            u' done; exit 1'.format(self.ip_addr),
-            self.provisioning_server
-        )
-        if ssh_check.return_code != 0:
-            logger.error('Failed to SSH to the VM, reverting changes')
-            self.destroy()
-            raise VirtualMachineError(
-                'Failed to connect to SSH port of the virtual machine')
+            raise VirtualMachineError(u'{0}: {1}'.format(message, report))
+        self.ip_addr = report.ip_addr
+
+    @classmethod
+    def create_many(cls, count, workers=None, **kwargs):
+        """Create ``count`` virtual machines concurrently.
+
+        Usage::
+
+            with VirtualMachine.create_many(3, distro=DISTRO_RHEL7) as vms:
+                for vm in vms:
+                    vm.install_katello_ca()
+
+        :param int count: number of virtual machines to create
+        :param int workers: number of virtual machines created at the same
+            time, the ``clients`` section ``provisioning_concurrency`` by
+            default
+        :param kwargs: arguments used to instantiate every virtual machine.
+            ``hostname`` and ``target_image`` can not be used as they must be
+            unique.
+        :return: a :class:`VirtualMachineGroup` with the created virtual
+            machines
+        :raises robottelo.vm.VirtualMachineError: If any virtual machine could
+            not be created, in which case all of them are destroyed.
+        """
+        for argument in ('hostname', 'target_image'):
+            if kwargs.get(argument) is not None:
+                raise VirtualMachineError(
+                    u'{0} can not be shared by several virtual machines'
+                    .format(argument)
+                )
+        group = VirtualMachineGroup(
+            [cls(**kwargs) for _ in range(count)], workers)
+        group.create()
+        return group
+
+    def _lease(self):
+        """Lease a booted virtual machine from the pool, when enabled.
+
+        :return: whether a virtual machine was leased
+        """
+        if not self._use_pool:
+            return False
+        pool = get_vm_pool()
+        if pool is None:
+            return False
+        entry = pool.lease(self.distro)
+        if entry is None:
+            return False
+        self._target_image = entry['name']
+        self.ip_addr = entry['ip_addr']
+        self._created = True
+        self._pool = pool
+        return True
 
     def destroy(self):
         """Destroys the virtual machine on the provisioning server"""
@@ -206,40 +339,130 @@ class VirtualMachine(object):
             return
         if self._subscribed:
             self.unregister()
-
+        if self._pool is not None:
+            self._pool.release(self._target_image)
+            self._pool = None
+
+        reaper = get_reaper()
+        if reaper is not None:
+            reaper.destroy(
+                self.provisioning_server, self.target_image,
+                self._image_path(), snapshots=bool(self._snapshots))
+            self._snapshots = []
+            return
         ssh.command(
             u'virsh destroy {0}'.format(self.target_image),
             hostname=self.provisioning_server
         )
+        undefine = u'virsh undefine {0}'.format(self.target_image)
+        if self._snapshots:
+            undefine += u' --snapshots-metadata'
+            self._snapshots = []
+        ssh.command(undefine, hostname=self.provisioning_server)
         ssh.command(
-            u'virsh undefine {0}'.format(self.target_image),
+            u'rm {0}'.format(self._image_path()),
             hostname=self.provisioning_server
         )
-        image_name = u'{0}.img'.format(self.target_image)
-        ssh.command(
-            u'rm {0}'.format(os.path.join(self.image_dir, image_name)),
+
+    def _image_path(self):
+        """Return the path of the virtual machine image on the provisioning
+        server.
+        """
+        return os.path.join(
+            self.image_dir, u'{0}.img'.format(self.target_image))
+
+    def snapshot(self, name):
+        """Take a libvirt snapshot of the running virtual machine, including
+        its memory, which :meth:`revert` can restore.
+
+        :param str name: name of the snapshot
+        :raises robottelo.vm.VirtualMachineError: If the snapshot could not
+            be taken.
+        """
+        if not self._created:
+            raise VirtualMachineError(
+                'The virtual machine should be created before taking any '
+                'snapshot'
+            )
+        result = ssh.command(
+            u'virsh snapshot-create-as {0} {1} --atomic'.format(
+                self.target_image, name),
+            hostname=self.provisioning_server
+        )
+        if result.return_code != 0:
+            raise VirtualMachineError(
+                u'Failed to take snapshot {0}: {1}'.format(
+                    name, result.stderr))
+        self._snapshots.append(name)
+
+    def revert(self, name):
+        """Restore a snapshot taken by :meth:`snapshot` and wait for the
+        virtual machine to accept SSH connections.
+
+        :param str name: name of the snapshot
+        :raises robottelo.vm.VirtualMachineError: If the snapshot could not
+            be restored.
+        """
+        if name not in self._snapshots:
+            raise VirtualMachineError(
+                u'Unknown snapshot {0}'.format(name))
+        result = ssh.command(
+            u'virsh snapshot-revert {0} {1} --running'.format(
+                self.target_image, name),
             hostname=self.provisioning_server
         )
+        if result.return_code != 0:
+            raise VirtualMachineError(
+                u'Failed to revert to snapshot {0}: {1}'.format(
+                    name, result.stderr))
+        report = wait_ready(
+            self.target_image, self._target_image, self.provisioning_server)
+        if not report.ready:
+            raise VirtualMachineError(
+                u'Virtual machine not ready after reverting to snapshot '
+                u'{0}: {1}'.format(name, report)
+            )
+        self.ip_addr = report.ip_addr
+
+    def packages(self):
+        """Return a :class:`robottelo.vm_packages.PackageTransaction` to
+        install several packages on the virtual machine at once.
+
+        The methods installing packages accept the transaction, so they are
+        merged in a single yum transaction::
+
+            with vm.packages() as transaction:
+                vm.install_katello_agent(transaction)
+                vm.download_install_rpm(repo_url, package, transaction)
+
+        """
+        return PackageTransaction(self)
+
+    @contextmanager
+    def _transaction(self, transaction):
+        """Yield ``transaction``, or a new transaction committed after
+        yielding it when ``transaction`` is ``None``.
+        """
+        if transaction is not None:
+            yield transaction
+        else:
+            with self.packages() as transaction:
+                yield transaction
 
-    def download_install_rpm(self, repo_url, package_name):
+    def download_install_rpm(self, repo_url, package_name, transaction=None):
         """Downloads and installs custom rpm on the virtual machine.
 
         :param repo_url: URL to repository, where package is located.
         :param package_name: Desired package name.
+        :param transaction: a :class:`robottelo.vm_packages.PackageTransaction`
+            to install the rpm with, the rpm is installed right away when
+            ``None``
         :return: None.
         :raises robottelo.vm.VirtualMachineError: If package wasn't installed.
 
         """
-        self.run(
-            u'wget -nd -r -l1 --no-parent -A \'{0}.rpm\' {1}'
-            .format(package_name, repo_url)
-        )
-        self.run(u'rpm -i {0}.rpm'.format(package_name))
-        result = self.run(u'rpm -q {0}'.format(package_name))
-        if result.return_code != 0:
-            raise VirtualMachineError(
-                u'Failed to install {0} rpm.'.format(package_name)
-            )
+        with self._transaction(transaction) as transaction:
+            transaction.add_rpm(repo_url, package_name)
 
     def enable_repo(self, repo, force=False):
         """Enables specified Red Hat repository on the virtual machine. Does
@@ -263,18 +486,23 @@ class VirtualMachine(object):
         if force or settings.cdn or not downstream_repo:
             self.run(u'subscription-manager repos --enable {0}'.format(repo))
 
-    def install_katello_agent(self):
+    def install_katello_agent(self, transaction=None):
         """Installs katello agent on the virtual machine.
 
+        :param transaction: a :class:`robottelo.vm_packages.PackageTransaction`
+            to install katello-agent with, it is installed right away when
+            ``None``
         :return: None.
         :raises robottelo.vm.VirtualMachineError: If katello-ca wasn't
             installed.
 
         """
-        self.run('yum install -y katello-agent')
-        result = self.run('rpm -q katello-agent')
-        if result.return_code != 0:
-            raise VirtualMachineError('Failed to install katello-agent')
+        with self._transaction(transaction) as transaction:
+            transaction.install('katello-agent')
+            transaction.after(self._start_katello_agent)
+
+    def _start_katello_agent(self):
+        """Ensure the installed katello-agent is running."""
         if bz_bug_is_open('1431747'):
             gofer_start = self.run('service goferd start')
             if gofer_start.return_code != 0:
@@ -351,6 +579,15 @@ class VirtualMachine(object):
         if (u'The system has been registered with ID' in
                 u''.join(result.stdout)):
             self._subscribed = True
+            # Used to register again the clones of saved images, see
+            # robottelo.vm_image
+            self.registration = {
+                'org': org,
+                'activation_key': activation_key,
+                'lce': lce,
+                'releasever': releasever,
+                'auto_attach': auto_attach,
+            }
         return result
 
     def remove_katello_ca(self):
@@ -427,15 +664,25 @@ class VirtualMachine(object):
             .format(rhel_repo)
         )
 
-    def configure_puppet(self, rhel_repo=None):
+    def configure_puppet(self, rhel_repo=None, transaction=None):
         """Configures puppet on the virtual machine/Host.
 
         :param rhel_repo: Red Hat repository link from properties file.
+        :param transaction: a :class:`robottelo.vm_packages.PackageTransaction`
+            to install puppet with, puppet is installed and configured right
+            away when ``None``
         :return: None.
 
         """
+        with self._transaction(transaction) as transaction:
+            if rhel_repo is not None:
+                transaction.add_repo_file('rhel', rhel_repo)
+            transaction.install('puppet')
+            transaction.after(self._configure_puppet_agent)
+
+    def _configure_puppet_agent(self):
+        """Configure the installed puppet agent and sign its certificate."""
         sat6_hostname = settings.server.hostname
-        self.configure_rhel_repo(rhel_repo)
         puppet_conf = (
             'pluginsync      = true\n'
             'report          = true\n'
@@ -445,10 +692,6 @@ class VirtualMachine(object):
             'server          = {1}\n'
             .format(sat6_hostname, sat6_hostname)
         )
-        result = self.run(u'yum install puppet -y')
-        if result.return_code != 0:
-            raise VirtualMachineError(
-                'Failed to install the puppet rpm')
         self.run(
             'echo "{0}" >> /etc/puppet/puppet.conf'
             .format(puppet_conf)
@@ -482,7 +725,8 @@ class VirtualMachine(object):
             raise VirtualMachineError(
                 'Failed to execute foreman_scap_client run.')
 
-    def configure_rhai_client(self, activation_key, org, rhel_distro):
+    def configure_rhai_client(self, activation_key, org, rhel_distro,
+                              transaction=None):
         """ Configures a Red Hat Access Insights service on the system by
         installing the redhat-access-insights package and registering to the
         service.
@@ -491,6 +735,9 @@ class VirtualMachine(object):
             system to satellite
         :param org: The org to which the system is required to be registered
         :param rhel_distro: rhel distribution for
+        :param transaction: a :class:`robottelo.vm_packages.PackageTransaction`
+            to install redhat-access-insights with, it is installed and
+            registered right away when ``None``
         :return: None
         """
         # Download and Install ketello-ca rpm
@@ -517,27 +764,18 @@ class VirtualMachine(object):
                 .format(' and '.join(missing_repos), rhel_distro)
             )
 
-        self.configure_rhel_repo(rhel_repo)
-
-        self.run(
-            'wget -O /etc/yum.repos.d/insights.repo {0}'.format(insights_repo))
-
         # Install redhat-access-insights package
-        package_name = 'redhat-access-insights'
-        result = self.run('yum install -y {0}'.format(package_name))
-        if result.return_code != 0:
-            raise VirtualMachineError(
-                'Unable to install redhat-access-insights package'
-            )
-
-        # Verify if package is installed by query it
-        result = self.run('rpm -qi {0}'.format(package_name))
+        with self._transaction(transaction) as transaction:
+            transaction.add_repo_file('rhel', rhel_repo)
+            transaction.add_repo_file('insights', insights_repo)
+            transaction.install('redhat-access-insights')
+            transaction.after(self._register_rhai_client)
+
+    def _register_rhai_client(self):
+        """Register the installed Red Hat Access Insights client."""
+        result = self.run('rpm -qi redhat-access-insights')
         logger.info('Insights client rpm version: {0}'.format(
             result.stdout))
-        if result.return_code != 0:
-            raise VirtualMachineError(
-                'Unable to install redhat-access-insights package'
-            )
 
         # Register client with Red Hat Access Insights
         result = self.run('redhat-access-insights --register')
@@ -559,3 +797,99 @@ class VirtualMachine(object):
 
     def __exit__(self, *exc):
         self.destroy()
+
+
+class VirtualMachineGroup(object):
+    """Virtual machines created and destroyed together, concurrently.
+
+    The group is a sequence of the virtual machines and can be used as a
+    context manager, destroying all of them on exit. See
+    :meth:`VirtualMachine.create_many`.
+
+    :param vms: the :class:`VirtualMachine` instances of the group
+    :param int workers: number of virtual machines created or destroyed at the
+        same time, the ``clients`` section ``provisioning_concurrency`` by
+        default
+    """
+
+    #: Exception raised when creating or destroying virtual machines fails
+    error_class = VirtualMachineError
+
+    def __init__(self, vms, workers=None):
+        self.vms = list(vms)
+        if workers is None:
+            workers = settings.clients.provisioning_concurrency
+        self.workers = max(1, workers)
+        self._created = False
+
+    def __iter__(self):
+        return iter(self.vms)
+
+    def __len__(self):
+        return len(self.vms)
+
+    def __getitem__(self, index):
+        return self.vms[index]
+
+    def _map(self, method):
+        """Call ``method`` on every virtual machine concurrently.
+
+        :return: the exceptions raised, one per virtual machine, ``None`` for
+            the virtual machines which did not raise any
+        """
+        def call(vm):
+            """Call the method, returning its exception"""
+            try:
+                getattr(vm, method)()
+            except Exception as err:
+                logger.exception(err)
+                return err
+            return None
+
+        if len(self.vms) <= 1:
+            return [call(vm) for vm in self.vms]
+        pool = ThreadPool(min(self.workers, len(self.vms)))
+        try:
+            return pool.map(call, self.vms)
+        finally:
+            pool.close()
+            pool.join()
+
+    def create(self):
+        """Create all the virtual machines concurrently, waiting for all of
+        them to be ready.
+
+        :raises robottelo.vm.VirtualMachineError: If any virtual machine could
+            not be created, in which case all of them are destroyed.
+        """
+        if self._created:
+            return
+        errors = [error for error in self._map('create') if error]
+        if errors:
+            self.destroy()
+            raise self.error_class(
+                u'Failed to create {0} of {1} virtual machines: {2}'.format(
+                    len(errors), len(self.vms), errors[0])
+            )
+        self._created = True
+
+    def destroy(self):
+        """Destroy all the virtual machines concurrently.
+
+        :raises robottelo.vm.VirtualMachineError: If any virtual machine could
+            not be destroyed. All of them are attempted.
+        """
+        self._created = False
+        errors = [error for error in self._map('destroy') if error]
+        if errors:
+            raise self.error_class(
+                u'Failed to destroy {0} of {1} virtual machines: {2}'.format(
+                    len(errors), len(self.vms), errors[0])
+            )
+
+    def __enter__(self):
+        self.create()
+        return self
+
+    def __exit__(self, *exc):
+        self.destroy()
@@ -2,6 +2,8 @@
 import logging
 import time
 
+from collections import OrderedDict
+from contextlib import contextmanager
 from robottelo import ssh
 from robottelo.config import settings
 from robottelo.constants import (
@@ -15,8 +17,11 @@ from robottelo.cli.factory import (
 )
 from robottelo.cli.host import Host
 from robottelo.decorators import setting_is_set
+from robottelo.dns_watch import watch_resolution
+from robottelo.env_snapshot import fingerprint
 from robottelo.host_info import get_host_os_version
 from robottelo.vm import VirtualMachine
+from robottelo.vm_image import VirtualMachineImage
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +38,7 @@ class CapsuleVirtualMachine(VirtualMachine):
     def __init__(
             self, cpu=4, ram=16384, distro=None, provisioning_server=None,
             image_dir=None, org_id=None, lce_id=None,
-            organization_ids=None, location_ids=None):
+            organization_ids=None, location_ids=None, use_image=None):
         """Manage a virtual machine with satellite capsule product setup for
         client provisioning.
 
@@ -54,6 +59,14 @@ class CapsuleVirtualMachine(VirtualMachine):
          organizations that will use the capsule.
         :param List[int] location_ids: the location ids for which the content
          will be synchronized.
+        :param bool use_image: whether to create the virtual machine from the
+         capsule image, which has the capsule packages installed already. The
+         image is built first when missing. The ``capsule`` section
+         ``use_image`` by default.
+
+        The seconds taken by every phase of :meth:`create` are recorded in
+        :attr:`timings`, and the seconds the capsule hostname took to resolve
+        from the server in :attr:`dns_latency`.
         """
         # ensure that capsule configuration exist and validate
         if not setting_is_set('capsule'):
@@ -97,6 +110,11 @@ class CapsuleVirtualMachine(VirtualMachine):
         self._capsule = None
         self._capsule_org = None
         self._capsule_lce = None
+        if use_image is None:
+            use_image = settings.capsule.use_image
+        self._use_image = use_image
+        self.timings = OrderedDict()
+        self.dns_latency = None
 
     @property
     def capsule_distro(self):
@@ -127,6 +145,51 @@ class CapsuleVirtualMachine(VirtualMachine):
     def capsule_organization_ids(self):
         return self._capsule_organization_ids
 
+    @contextmanager
+    def _timed(self, phase):
+        """Record the seconds taken by ``phase`` in :attr:`timings`."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] = time.time() - start
+
+    def capsule_image(self):
+        """Return the :class:`robottelo.vm_image.VirtualMachineImage` with
+        the capsule packages installed. Its name depends on the distro and on
+        where the packages come from.
+        """
+        inputs = {
+            'distro': self.capsule_distro,
+            'server': settings.server.hostname,
+            'cdn': settings.cdn,
+            'capsule_repo': settings.capsule_repo,
+        }
+        return VirtualMachineImage(
+            u'capsule-{0}-{1}'.format(
+                self.capsule_distro, fingerprint(inputs)[:8]),
+            distro=self.capsule_distro,
+            provisioning_server=self.provisioning_server,
+            image_dir=self.image_dir,
+        )
+
+    def _configure_image(self, vm):
+        """Install the capsule packages on the virtual machine ``vm`` saved
+        as the capsule image.
+        """
+        _, org, lce = setup_capsule_virtual_machine(
+            vm,
+            org_id=self._capsule_org_id,
+            lce_id=self._capsule_lce_id,
+            distro=self.capsule_distro,
+            install=False,
+        )
+        # The content prepared for the image is reused by the capsule setup
+        self._capsule_org_id = org['id']
+        self._capsule_lce_id = lce['id']
+        # Clones are registered by the capsule setup
+        vm.registration = None
+
     def _capsule_setup_ddns(self):
         """Setup and configure ddns client and ensure it's functionality"""
         self.run('yum localinstall -y {}'.format(self._ddns_package_url))
@@ -159,37 +222,24 @@ class CapsuleVirtualMachine(VirtualMachine):
         if ddns_bin_client_support_update:
             self.run('{0} update'.format(ddns_bin_client))
 
-        def ensure_host_resolved(
-                ssh_func, host_to_ping, ip_addr, time_sleep=60, retries=10):
-            resolved = False
-            retry_max_index = retries - 1
-            for retry_index in range(retries):
-                ssh_func_result = ssh_func('ping -c 1 {}'.format(host_to_ping))
-                ssh_func_output = ''.join(ssh_func_result.stdout)
-                if ssh_func_result.return_code == 0 and (
-                            '({})'.format(ip_addr) in ssh_func_output):
-                    resolved = True
-                    break
-
-                if retry_index != retry_max_index:
-                    # do not sleep at last index
-                    time.sleep(time_sleep)
-
-            return resolved
-
         # Ensure capsule hostname is resolvable from the server host
-        hostname_resolved = ensure_host_resolved(
-            ssh.command, self._capsule_hostname, self.ip_addr)
-        if not hostname_resolved:
+        report = watch_resolution(self._capsule_hostname, self.ip_addr)
+        self.dns_latency = report.latency
+        if not report.resolved:
             raise CapsuleVirtualMachineError(
-                'Failed to resolver the capsule hostname from the server')
+                u'Failed to resolver the capsule hostname from the server: '
+                u'{0}'.format(report)
+            )
 
         # Ensure capsule hostname is resolvable at capsule host
-        hostname_resolved = ensure_host_resolved(
-            self.run, self._capsule_hostname, '127.0.0.1', retries=1)
-        if not hostname_resolved:
+        report = watch_resolution(
+            self._capsule_hostname, '127.0.0.1', run=self.run,
+            authoritative=False, timeout=0)
+        if not report.resolved:
             raise CapsuleVirtualMachineError(
-                'Failed to resolver the capsule hostname from capsule')
+                u'Failed to resolver the capsule hostname from capsule: '
+                u'{0}'.format(report)
+            )
 
         if self.capsule_distro == DISTRO_RHEL7:
             # Add RH-Satellite-6 service to firewall public zone
@@ -223,14 +273,16 @@ class CapsuleVirtualMachine(VirtualMachine):
     def _setup_capsule(self):
         """Prepare the virtual machine to host a capsule node"""
         # setup the ddns client to have a resolvable capsule hostname
-        self._capsule_setup_ddns()
+        with self._timed('ddns'):
+            self._capsule_setup_ddns()
 
         setup_result = setup_capsule_virtual_machine(
             self,
             org_id=self._capsule_org_id,
             lce_id=self._capsule_lce_id,
             organization_ids=self._capsule_organization_ids,
-            location_ids=self._capsule_location_ids
+            location_ids=self._capsule_location_ids,
+            timings=self.timings,
         )
 
         self._capsule, self._capsule_org, self._capsule_lce = setup_result
@@ -239,14 +291,41 @@ class CapsuleVirtualMachine(VirtualMachine):
         self._capsule_lce_id = self._capsule_lce['id']
 
     def create(self):
-        super(CapsuleVirtualMachine, self).create()
+        """Create the virtual machine and setup the capsule, from the capsule
+        image when enabled.
+        """
+        start = time.time()
+        self.timings.clear()
+        image = None
+        if self._use_image:
+            image = self.capsule_image()
+            with self._timed('image'):
+                image.get_or_build(
+                    self._configure_image, cpu=self.cpu, ram=self.ram)
+            self.source_image = image.base_image
+        with self._timed('vm'):
+            super(CapsuleVirtualMachine, self).create()
         try:
+            if image is not None:
+                with self._timed('reidentify'):
+                    image.reidentify(self)
             self._setup_capsule()
         except:
             # handle exception as VirtualMachine has no exception handling
             # in __enter__ function
             self._capsule_cleanup()
             raise
+        finally:
+            logger.info(
+                'Capsule virtual machine %s setup took %.2f seconds, '
+                'phase timings: %s',
+                self.hostname,
+                time.time() - start,
+                ', '.join(
+                    '{0}={1:.2f}s'.format(phase, elapsed)
+                    for phase, elapsed in self.timings.items()
+                ),
+            )
 
     def suspend(self, ensure=False):
         """Suspend the virtual machine.
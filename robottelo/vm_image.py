@@ -0,0 +1,277 @@
+"""Base images saved from configured client virtual machines.
+
+Preparing a content host means installing the katello-ca rpm, registering it
+and installing katello-agent, which takes minutes on every freshly booted
+virtual machine. A :class:`VirtualMachineImage` saves such a configured
+virtual machine as a new snap-guest base image on the provisioning server,
+then every clone boots from a qcow2 overlay of that image, already
+configured::
+
+    from robottelo.vm_image import VirtualMachineImage
+
+    def configure(vm):
+        vm.install_katello_ca()
+        vm.register_contenthost(org.label, activation_key.name)
+        vm.install_katello_agent()
+
+    image = VirtualMachineImage(
+        'agent-org{0}'.format(org.id), distro=DISTRO_RHEL7)
+    image.get_or_build(configure)
+    with image.clone() as vm:
+        vm.run('yum install -y walrus')
+
+Clones are identical copies of the configured virtual machine, so they are
+re-identified when created: they get their own hostname and machine id, and
+the virtual machine registered when the image was saved is registered again
+to obtain a new consumer. Before being saved, the configured virtual machine
+is unregistered and its identity (consumer certificates, katello-ca rpm, SSH
+host keys, network interface bindings) removed, so the clones always trust
+the current CA of the server.
+
+Images are kept on the provisioning server along with a JSON file recording
+their distro and registration, so later test sessions reuse them. Call
+:meth:`VirtualMachineImage.delete` when the entities the image is registered
+to are removed.
+"""
+import json
+import logging
+import os
+import tempfile
+import uuid
+
+from pytest_services.locks import file_lock
+from six.moves import shlex_quote
+
+from robottelo import ssh
+from robottelo.config import settings
+from robottelo.vm import VirtualMachine, VirtualMachineError
+
+LOGGER = logging.getLogger(__name__)
+
+#: Local directory holding the locks of the images being built
+VM_IMAGE_LOCK_DIR = os.path.join(
+    tempfile.gettempdir(), 'robottelo', 'vm_images')
+#: Seconds given to a virtual machine to shut down before saving it
+SHUTDOWN_TIMEOUT = 120
+#: Seconds a process waits for another one building the same image
+BUILD_LOCK_TIMEOUT = 3600
+
+# Removes the identity of a virtual machine before it is saved
+_GENERALIZE_SCRIPT = u'''
+subscription-manager unregister
+subscription-manager clean
+rpm -qa 'katello-ca-consumer*' | xargs -r rpm -e
+rm -f /etc/ssh/ssh_host_*
+rm -f /etc/udev/rules.d/70-persistent-net.rules
+sed -i '/^HWADDR=/d;/^UUID=/d' /etc/sysconfig/network-scripts/ifcfg-eth*
+sync
+'''
+
+# Gives a clone its own hostname and machine id, expects the hostname
+# variable to be set
+_REIDENTIFY_SCRIPT = u'''
+hostnamectl set-hostname "$hostname" 2>/dev/null || {
+    hostname "$hostname"
+    sed -i "s/^HOSTNAME=.*/HOSTNAME=$hostname/" /etc/sysconfig/network
+}
+if [ -f /etc/machine-id ]; then
+    rm -f /etc/machine-id
+    systemd-machine-id-setup
+fi
+'''
+
+
+class VirtualMachineImage(object):
+    """A snap-guest base image saved from a configured virtual machine.
+
+    :param str name: image name, the base image is ``<name>-base``
+    :param str distro: distro of the virtual machines, see
+        :class:`robottelo.vm.VirtualMachine`
+    :param str provisioning_server: server storing the image, the ``clients``
+        section one by default
+    :param str image_dir: path of the images on ``provisioning_server``, the
+        ``clients`` section one by default
+    """
+
+    def __init__(self, name, distro=None, provisioning_server=None,
+                 image_dir=None):
+        self.name = name
+        self.distro = distro
+        self.provisioning_server = (
+            provisioning_server or settings.clients.provisioning_server)
+        self.image_dir = image_dir or settings.clients.image_dir
+        self.base_image = u'{0}-base'.format(name)
+        self.path = os.path.join(
+            self.image_dir, u'{0}.img'.format(self.base_image))
+        self.metadata_path = os.path.join(
+            self.image_dir, u'{0}.json'.format(self.base_image))
+
+    def _command(self, cmd, **kwargs):
+        """Run ``cmd`` on the provisioning server."""
+        return ssh.command(cmd, hostname=self.provisioning_server, **kwargs)
+
+    def metadata(self):
+        """Return the metadata recorded when the image was saved, ``None`` if
+        the image does not exist.
+        """
+        result = self._command(u'test -f {0} && cat {1}'.format(
+            shlex_quote(self.path), shlex_quote(self.metadata_path)))
+        if result.return_code != 0:
+            return None
+        return json.loads(u''.join(result.stdout))
+
+    def exists(self):
+        """Whether the image was saved."""
+        return self.metadata() is not None
+
+    def save(self, vm):
+        """Save the configured virtual machine ``vm`` as the image.
+
+        The virtual machine is generalized, shut down and its disk flattened
+        into the base image. The virtual machine is destroyed afterwards.
+
+        Processes of other hosts may save the same image at the same time, so
+        the disk is flattened into a temporary file of its own, then linked
+        as the base image unless one was saved meanwhile.
+
+        :param robottelo.vm.VirtualMachine vm: the configured virtual machine
+        :raises robottelo.vm.VirtualMachineError: If the virtual machine could
+            not be saved.
+        """
+        metadata = {'distro': vm.distro, 'registration': vm.registration}
+        vm.run(_GENERALIZE_SCRIPT)
+        # Unregistered already
+        vm._subscribed = False
+        disk = os.path.join(vm.image_dir, u'{0}.img'.format(vm.target_image))
+        suffix = u'.{0}.tmp'.format(uuid.uuid4().hex)
+        # ln fails when the base image exists, the one saved by the other
+        # process is kept. The temporary files are removed in any case.
+        result = self._command(
+            u'virsh shutdown {domain} && '
+            u'for i in $(seq {timeout}); do '
+            u'virsh domstate {domain} | grep -q "shut off" && break; '
+            u'sleep 1; done && '
+            u'virsh domstate {domain} | grep -q "shut off" && '
+            u'qemu-img convert -O qcow2 {disk} {path_tmp} && '
+            u'echo {metadata} > {metadata_tmp} && '
+            u'{{ ln {path_tmp} {path} && mv {metadata_tmp} {metadata_path}; '
+            u'test -f {path}; }}; '
+            u'status=$?; rm -f {path_tmp} {metadata_tmp}; exit $status'.format(
+                domain=shlex_quote(vm.target_image),
+                timeout=SHUTDOWN_TIMEOUT,
+                disk=shlex_quote(disk),
+                path=shlex_quote(self.path),
+                path_tmp=shlex_quote(self.path + suffix),
+                metadata=shlex_quote(json.dumps(metadata)),
+                metadata_path=shlex_quote(self.metadata_path),
+                metadata_tmp=shlex_quote(self.metadata_path + suffix),
+            ),
+            timeout=SHUTDOWN_TIMEOUT + 600,
+        )
+        vm.destroy()
+        if result.return_code != 0:
+            raise VirtualMachineError(
+                u'Failed to save image {0}: {1}'.format(
+                    self.name, result.stderr))
+        LOGGER.info('Saved virtual machine image %s', self.name)
+
+    def get_or_build(self, configure, **kwargs):
+        """Build the image unless it exists already.
+
+        Building creates a virtual machine, configures it and saves it.
+        Processes building the same image wait for each other, so the image
+        is built once.
+
+        :param configure: callable receiving the created
+            :class:`robottelo.vm.VirtualMachine` to configure
+        :param kwargs: arguments of :class:`robottelo.vm.VirtualMachine` used
+            to create the configured virtual machine, e.g. its ``ram``
+        """
+        if not os.path.isdir(VM_IMAGE_LOCK_DIR):
+            try:
+                os.makedirs(VM_IMAGE_LOCK_DIR)
+            except OSError:
+                if not os.path.isdir(VM_IMAGE_LOCK_DIR):
+                    raise
+        lock_path = os.path.join(
+            VM_IMAGE_LOCK_DIR,
+            u'{0}-{1}.lock'.format(self.provisioning_server, self.name)
+        )
+        with file_lock(lock_path, timeout=BUILD_LOCK_TIMEOUT):
+            if self.exists():
+                return
+            LOGGER.info('Building virtual machine image %s', self.name)
+            vm = VirtualMachine(
+                distro=self.distro,
+                provisioning_server=self.provisioning_server,
+                image_dir=self.image_dir,
+                **kwargs
+            )
+            try:
+                vm.create()
+                configure(vm)
+            except Exception:
+                vm.destroy()
+                raise
+            self.save(vm)
+
+    def clone(self, **kwargs):
+        """Create a virtual machine from the image.
+
+        The clone is re-identified, see :meth:`reidentify`.
+
+        :param kwargs: arguments of :class:`robottelo.vm.VirtualMachine`
+        :return: the created :class:`robottelo.vm.VirtualMachine`
+        :raises robottelo.vm.VirtualMachineError: If the image does not exist
+            or the clone could not be created.
+        """
+        metadata = self.metadata()
+        if metadata is None:
+            raise VirtualMachineError(
+                u'Image {0} does not exist'.format(self.name))
+        kwargs.setdefault('provisioning_server', self.provisioning_server)
+        kwargs.setdefault('image_dir', self.image_dir)
+        vm = VirtualMachine(
+            distro=metadata['distro'],
+            source_image=self.base_image,
+            **kwargs
+        )
+        vm.create()
+        try:
+            self.reidentify(vm, metadata)
+        except Exception:
+            vm.destroy()
+            raise
+        return vm
+
+    def reidentify(self, vm, metadata=None):
+        """Give its own identity to a virtual machine created from the image.
+
+        The virtual machine gets its own hostname and machine id, and is
+        registered again like the saved virtual machine was, after installing
+        the katello-ca rpm of the server. Its katello-agent, if installed, is
+        restarted to use the new consumer.
+
+        :param robottelo.vm.VirtualMachine vm: the created virtual machine,
+            its ``source_image`` being :attr:`base_image`
+        :param dict metadata: the image metadata, read when not provided
+        :raises robottelo.vm.VirtualMachineError: If the virtual machine could
+            not be registered.
+        """
+        if metadata is None:
+            metadata = self.metadata() or {}
+        vm.run(u'hostname={0}{1}'.format(
+            shlex_quote(vm.hostname), _REIDENTIFY_SCRIPT))
+        if metadata.get('registration'):
+            vm.install_katello_ca()
+            vm.register_contenthost(**metadata['registration'])
+            if not vm.subscribed:
+                raise VirtualMachineError(
+                    u'Failed to register clone of image {0}'.format(
+                        self.name))
+            vm.run(u'rpm -q katello-agent && service goferd restart')
+
+    def delete(self):
+        """Remove the image from the provisioning server."""
+        self._command(u'rm -f {0} {1}'.format(
+            shlex_quote(self.path), shlex_quote(self.metadata_path)))
@@ -0,0 +1,168 @@
+"""Package installations on clients merged into a single yum transaction.
+
+Preparing a client usually installs several packages: katello-agent, puppet,
+custom rpms... Installing them one by one runs yum several times, every run
+refreshing the metadata of all the enabled repositories. A
+:class:`PackageTransaction` collects the repository files, rpms and packages
+needed, installs all of them with a single yum command, checks they are
+installed, then runs the configuration steps which depend on them::
+
+    with vm.packages() as transaction:
+        vm.install_katello_agent(transaction)
+        vm.configure_puppet(settings.rhel7_repo, transaction)
+        transaction.install('walrus')
+
+When the ``package_mirror`` option of the ``clients`` section is set, the
+clients also get a repository of the given mirror, usually served from the
+provisioning network. Its cost is lower than the other repositories one, so
+yum downloads the packages available from several repositories from the
+mirror::
+
+    [clients]
+    package_mirror=rhel6=http://mirror.example.com/el6,
+        rhel7=http://mirror.example.com/el7
+"""
+import logging
+
+from collections import OrderedDict
+from six.moves import shlex_quote
+
+from robottelo.config import settings
+from robottelo.constants import DISTRO_RHEL6, DISTRO_RHEL7
+
+LOGGER = logging.getLogger(__name__)
+
+#: Name of the package mirror repository on the clients
+MIRROR_REPO = 'robottelo-mirror'
+
+_MIRROR_REPO_FILE = u'''
+cat > /etc/yum.repos.d/{name}.repo <<'EOF'
+[{name}]
+name=Robottelo package mirror
+baseurl={url}
+enabled=1
+gpgcheck=0
+cost=100
+skip_if_unavailable=1
+EOF
+'''
+
+
+def package_mirror(distro):
+    """Return the package mirror URL of the ``distro`` base image, ``None``
+    when no mirror is configured.
+    """
+    mirrors = settings.clients.package_mirror
+    if distro == settings.distro.image_el6:
+        return mirrors.get(DISTRO_RHEL6)
+    if distro == settings.distro.image_el7:
+        return mirrors.get(DISTRO_RHEL7)
+    return None
+
+
+class PackageTransaction(object):
+    """Packages installed on a virtual machine with a single yum command.
+
+    Use it as a context manager to :meth:`commit` it when leaving the
+    context, unless an exception is raised.
+
+    :param vm: the :class:`robottelo.vm.VirtualMachine` to install the
+        packages on
+    """
+
+    def __init__(self, vm):
+        self.vm = vm
+        self.repo_files = OrderedDict()
+        self.rpms = []
+        self.packages = []
+        self._after = []
+
+    def add_repo_file(self, name, url):
+        """Download the yum repository file ``url`` as ``name`` before
+        installing the packages.
+        """
+        self.repo_files[name] = url
+
+    def add_rpm(self, repo_url, package_name):
+        """Install the rpm ``package_name`` downloaded from the ``repo_url``
+        directory.
+        """
+        self.rpms.append((repo_url, package_name))
+
+    def install(self, *packages):
+        """Install ``packages`` from the enabled repositories."""
+        for package in packages:
+            if package not in self.packages:
+                self.packages.append(package)
+
+    def after(self, function):
+        """Call ``function`` without arguments once the packages are
+        installed, e.g. to configure them.
+        """
+        self._after.append(function)
+
+    def _script(self):
+        """Return the script installing the packages."""
+        lines = []
+        mirror = package_mirror(self.vm.distro)
+        if mirror is not None:
+            lines.append(_MIRROR_REPO_FILE.format(
+                name=MIRROR_REPO, url=mirror))
+        for name, url in self.repo_files.items():
+            lines.append(u'wget -O /etc/yum.repos.d/{0}.repo {1}'.format(
+                shlex_quote(name), shlex_quote(url)))
+        for repo_url, package_name in self.rpms:
+            lines.append(
+                u'wget -nd -r -l1 --no-parent -A {0} {1}'.format(
+                    shlex_quote(u'{0}.rpm'.format(package_name)),
+                    shlex_quote(repo_url))
+            )
+        if self.packages or self.rpms:
+            lines.append(u'yum install -y {0}'.format(u' '.join(
+                [shlex_quote(package) for package in self.packages] +
+                [shlex_quote(u'./{0}.rpm'.format(package_name))
+                 for _, package_name in self.rpms]
+            )))
+        return u'\n'.join(lines)
+
+    def commit(self):
+        """Install the packages, then run the functions registered with
+        :meth:`after`.
+
+        :raises robottelo.vm.VirtualMachineError: If any package could not
+            be installed.
+        """
+        from robottelo.vm import VirtualMachineError
+        names = self.packages + [
+            package_name for _, package_name in self.rpms]
+        if self.repo_files or names:
+            result = self.vm.run(self._script())
+        if names:
+            check = self.vm.run(u'rpm -q {0}'.format(u' '.join(
+                shlex_quote(name) for name in names)))
+            if check.return_code != 0:
+                output = u'\n'.join(check.stdout or [])
+                missing = [
+                    name for name in names
+                    if u'package {0} is not installed'.format(name) in output
+                ]
+                raise VirtualMachineError(
+                    u'Failed to install {0}: {1}'.format(
+                        u', '.join(missing or names), result.stderr)
+                )
+            LOGGER.info(
+                'Installed %s on %s', ', '.join(names), self.vm.hostname)
+        after = self._after
+        self.repo_files = OrderedDict()
+        self.rpms = []
+        self.packages = []
+        self._after = []
+        for function in after:
+            function()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.commit()
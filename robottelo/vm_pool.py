@@ -0,0 +1,414 @@
+"""Pool of booted client virtual machines leased by the tests.
+
+Creating a :class:`robottelo.vm.VirtualMachine` runs snap-guest on the
+provisioning server and waits for the machine to boot and to accept SSH
+connections, which takes minutes. A :class:`VMPool` keeps virtual machines of
+each distro booted ahead of time, so creating a virtual machine only leases a
+ready one. Leased virtual machines are destroyed when released, and the pool
+boots new ones in background to replace them.
+
+The pool state is stored in a JSON file protected by a file lock, so all the
+test processes of the host (e.g. pytest-xdist workers) share the same pool.
+Each entry records its state (``booting``, ``ready`` or ``leased``), the
+process owning it and since when. Virtual machines leased for longer than
+``max_lease_age`` seconds, or owned by a process which is gone, are
+considered abandoned and destroyed.
+
+The pool is enabled by the ``pool_size`` option of the ``clients`` section,
+and :meth:`robottelo.vm.VirtualMachine.create` leases from it::
+
+    [clients]
+    provisioning_server=provisioning.example.com
+    pool_size=4
+    pool_quotas=rhel7=3,rhel6=1
+
+The pool is refilled by :meth:`VMPool.maintain`, from a long lived process.
+With pytest-xdist ``--boxed`` every test runs in a process forked from the
+worker one, and killed once the test is done: the ``tests/foreman`` session
+start maintains the pool from the worker process, the forked test processes
+only lease from it. Processes which do not maintain the pool, nor were forked
+from one which does, refill it in background after each lease.
+
+Idle virtual machines are kept booted between test sessions, call
+:meth:`VMPool.drain` to destroy them.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+from pytest_services.locks import file_lock
+
+from robottelo import ssh
+from robottelo.config import settings
+from robottelo.constants import DISTRO_RHEL6, DISTRO_RHEL7
+from robottelo.helpers import process_alive
+
+LOGGER = logging.getLogger(__name__)
+
+#: Local directory where the pool state is stored by default
+VM_POOL_DIR = os.path.join(tempfile.gettempdir(), 'robottelo', 'vm_pool')
+#: Prefix of the names of the pool virtual machines
+POOL_TAG = 'pool'
+#: Seconds between two fills of a maintained pool
+MAINTAIN_INTERVAL = 10
+
+BOOTING = 'booting'
+READY = 'ready'
+LEASED = 'leased'
+
+
+class VMPool(object):
+    """Pool of booted virtual machines on a provisioning server.
+
+    :param dict quotas: number of ready virtual machines kept for each distro
+        base image name
+    :param int size: maximum number of virtual machines booting or ready,
+        the sum of ``quotas`` by default
+    :param int max_lease_age: seconds after which a leased virtual machine is
+        considered abandoned
+    :param str provisioning_server: server where the virtual machines are
+        created, the ``clients`` section one by default
+    :param str image_dir: path of the images on ``provisioning_server``, the
+        ``clients`` section one by default
+    :param str pool_dir: local directory where the pool state is stored
+    :param int workers: number of virtual machines booted at the same time
+    """
+
+    def __init__(self, quotas, size=None, max_lease_age=7200,
+                 provisioning_server=None, image_dir=None, pool_dir=None,
+                 workers=2):
+        self.quotas = quotas
+        self.size = sum(quotas.values()) if size is None else size
+        self.max_lease_age = max_lease_age
+        self.provisioning_server = (
+            provisioning_server or settings.clients.provisioning_server)
+        self.image_dir = image_dir or settings.clients.image_dir
+        self.pool_dir = pool_dir or VM_POOL_DIR
+        self.path = os.path.join(
+            self.pool_dir, '{0}.json'.format(self.provisioning_server))
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._filler = None
+        self._maintainer = None
+        self._stop = threading.Event()
+
+    def _after_fork(self):
+        """Recreate the locks inherited from the parent process, if this
+        process was forked since the last call. They may have been held by
+        threads of the parent, which do not survive the fork.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._state_lock = threading.Lock()
+            # The filler thread does not survive a fork either
+            self._filler = None
+
+    @contextmanager
+    def _state(self):
+        """Lock the pool state and yield its list of virtual machines. The
+        changes made to the list are saved unless an exception is raised.
+        """
+        if not os.path.isdir(self.pool_dir):
+            try:
+                os.makedirs(self.pool_dir)
+            except OSError:
+                if not os.path.isdir(self.pool_dir):
+                    raise
+        self._after_fork()
+        # File locks are held by processes, also exclude the other threads
+        with self._state_lock, file_lock(self.path + '.lock'):
+            vms = []
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as handler:
+                        vms = json.load(handler)
+                except ValueError:
+                    LOGGER.warning('Ignoring corrupted pool %s', self.path)
+            yield vms
+            with open(self.path + '.tmp', 'w') as handler:
+                json.dump(vms, handler, indent=2, sort_keys=True)
+            os.rename(self.path + '.tmp', self.path)
+
+    def _abandoned(self, vms):
+        """Remove the abandoned virtual machines from ``vms`` and return
+        them.
+        """
+        now = time.time()
+        abandoned = [
+            vm for vm in vms
+            if (vm['state'] != READY and
+                not process_alive(vm['owner'])) or
+            (vm['state'] == LEASED and
+             now - vm['since'] > self.max_lease_age)
+        ]
+        for vm in abandoned:
+            vms.remove(vm)
+        return abandoned
+
+    def _virtual_machine(self, entry):
+        """Return a :class:`robottelo.vm.VirtualMachine` for ``entry``, not
+        using the pool.
+        """
+        from robottelo.vm import VirtualMachine
+        vm = VirtualMachine(
+            distro=entry['distro'],
+            provisioning_server=self.provisioning_server,
+            image_dir=self.image_dir,
+            target_image=entry['name'],
+            use_pool=False,
+        )
+        vm.ip_addr = entry['ip_addr']
+        # Pool virtual machines outlive the process which booted them
+        vm._sweep_orphan = False
+        return vm
+
+    def _destroy(self, entries):
+        """Destroy the virtual machines of ``entries``."""
+        for entry in entries:
+            LOGGER.info(
+                'Destroying %s pool virtual machine %s',
+                entry['state'], entry['name'])
+            vm = self._virtual_machine(entry)
+            vm._created = True
+            try:
+                vm.destroy()
+            except Exception as err:
+                LOGGER.warning(
+                    'Failed to destroy pool virtual machine %s: %s',
+                    entry['name'], err)
+
+    def _reachable(self, entry):
+        """Whether the SSH port of a ready virtual machine is open."""
+        result = ssh.command(
+            u'nc -vn {0} 22 <<< ""'.format(entry['ip_addr']),
+            self.provisioning_server
+        )
+        return result.return_code == 0
+
+    def _boot(self, entry):
+        """Create the virtual machine of a ``booting`` entry and mark it
+        ready.
+        """
+        vm = self._virtual_machine(entry)
+        try:
+            vm.create()
+        except Exception as err:
+            LOGGER.warning(
+                'Failed to boot pool virtual machine %s: %s',
+                entry['name'], err)
+            with self._state() as vms:
+                vms[:] = [
+                    item for item in vms if item['name'] != entry['name']]
+            return
+        with self._state() as vms:
+            booted = [item for item in vms if item['name'] == entry['name']]
+            for item in booted:
+                item.update(
+                    state=READY, ip_addr=vm.ip_addr, since=time.time())
+        if not booted:
+            # Considered abandoned while booting, not in the pool anymore
+            vm.destroy()
+
+    def fill(self):
+        """Boot virtual machines until every distro has its quota of booting
+        or ready ones, without exceeding the pool size.
+
+        :return: the number of virtual machines booted
+        """
+        with self._state() as vms:
+            abandoned = self._abandoned(vms)
+            available = self.size - len(
+                [vm for vm in vms if vm['state'] != LEASED])
+            missing = []
+            for distro, quota in sorted(self.quotas.items()):
+                count = len([
+                    vm for vm in vms
+                    if vm['distro'] == distro and vm['state'] != LEASED
+                ])
+                for _ in range(max(0, min(quota - count, available))):
+                    entry = {
+                        'name': u'{0}{1}'.format(
+                            POOL_TAG, uuid.uuid4().hex[:12]),
+                        'distro': distro,
+                        'ip_addr': None,
+                        'state': BOOTING,
+                        'owner': os.getpid(),
+                        'since': time.time(),
+                    }
+                    vms.append(entry)
+                    missing.append(entry)
+                    available -= 1
+        self._destroy(abandoned)
+        if not missing:
+            return 0
+        pool = ThreadPool(min(self.workers, len(missing)))
+        try:
+            pool.map(self._boot, missing)
+        finally:
+            pool.close()
+            pool.join()
+        return len(missing)
+
+    def refill(self):
+        """Fill the pool in a background thread, unless this process is
+        already filling it.
+        """
+        self._after_fork()
+        with self._lock:
+            if self._filler is not None and self._filler.is_alive():
+                return
+            self._filler = threading.Thread(target=self.fill)
+            self._filler.daemon = True
+            self._filler.start()
+
+    def maintain(self, interval=MAINTAIN_INTERVAL):
+        """Fill the pool every ``interval`` seconds from a background thread
+        of this process, until it exits or :meth:`stop` is called.
+
+        The processes forked from this one afterwards do not refill the pool
+        themselves.
+
+        :param int interval: seconds between two fills
+        """
+        self._after_fork()
+        with self._lock:
+            if self._maintainer is not None and self._maintainer.is_alive():
+                return
+            self._stop.clear()
+            self._maintainer = threading.Thread(
+                target=self._maintain, args=(interval,))
+            self._maintainer.daemon = True
+            self._maintainer.start()
+
+    def _maintain(self, interval):
+        """Fill the pool until :meth:`stop` is called."""
+        while True:
+            try:
+                self.fill()
+            except Exception as err:
+                LOGGER.warning('Failed to fill the pool: %s', err)
+            if self._stop.wait(interval):
+                return
+
+    def stop(self):
+        """Stop maintaining the pool, once the current fill is done."""
+        self._after_fork()
+        with self._lock:
+            maintainer, self._maintainer = self._maintainer, None
+        if maintainer is not None:
+            self._stop.set()
+            maintainer.join()
+
+    def lease(self, distro):
+        """Lease a ready virtual machine of ``distro``.
+
+        Unless the pool is maintained, it is refilled in background after
+        each lease.
+
+        :param str distro: base image name of the virtual machine
+        :return: the pool entry of the leased virtual machine, a dictionary
+            with its ``name`` and ``ip_addr``, or ``None`` when no virtual
+            machine is ready
+        """
+        while True:
+            with self._state() as vms:
+                abandoned = self._abandoned(vms)
+                entry = next(
+                    (vm for vm in vms
+                     if vm['state'] == READY and vm['distro'] == distro),
+                    None
+                )
+                if entry is not None:
+                    entry.update(
+                        state=LEASED, owner=os.getpid(), since=time.time())
+            self._destroy(abandoned)
+            if self._maintainer is None:
+                self.refill()
+            if entry is None:
+                LOGGER.info('No %s pool virtual machine ready', distro)
+                return None
+            if self._reachable(entry):
+                LOGGER.info('Leased pool virtual machine %s', entry['name'])
+                return entry
+            LOGGER.warning(
+                'Pool virtual machine %s is not reachable', entry['name'])
+            if self.release(entry['name']) is not None:
+                self._destroy([entry])
+
+    def release(self, name, recycle=False):
+        """Release a leased virtual machine.
+
+        :param str name: name of the leased virtual machine
+        :param bool recycle: whether the virtual machine is returned to the
+            pool, only when it was not changed. Otherwise it is removed from
+            the pool and the caller must destroy it.
+        :return: the pool entry of the virtual machine or ``None`` if it is
+            not in the pool anymore
+        """
+        with self._state() as vms:
+            entry = next((vm for vm in vms if vm['name'] == name), None)
+            if entry is not None:
+                if recycle:
+                    entry.update(state=READY, since=time.time())
+                else:
+                    vms.remove(entry)
+        return entry
+
+    def drain(self):
+        """Destroy the ready and abandoned virtual machines.
+
+        :return: the number of virtual machines destroyed
+        """
+        with self._state() as vms:
+            drained = self._abandoned(vms) + [
+                vm for vm in vms if vm['state'] == READY]
+            vms[:] = [vm for vm in vms if vm not in drained]
+        self._destroy(drained)
+        return len(drained)
+
+
+def _distro_image(distro):
+    """Return the base image name of ``distro``, which may be already an
+    image name.
+    """
+    if distro == DISTRO_RHEL6:
+        return settings.distro.image_el6
+    if distro == DISTRO_RHEL7:
+        return settings.distro.image_el7
+    return distro
+
+
+# Created on the first lease when the clients pool_size setting is set
+_vm_pool = None
+
+
+def get_vm_pool():
+    """Return the pool configured by the ``clients`` section, or ``None`` if
+    the pool is disabled.
+    """
+    global _vm_pool  # pylint:disable=global-statement
+    if not settings.clients.pool_size:
+        return None
+    if _vm_pool is None:
+        quotas = settings.clients.pool_quotas or {
+            DISTRO_RHEL7: settings.clients.pool_size}
+        _vm_pool = VMPool(
+            {
+                _distro_image(distro): int(quota)
+                for distro, quota in quotas.items()
+            },
+            size=settings.clients.pool_size,
+            max_lease_age=settings.clients.pool_max_lease_age,
+            pool_dir=settings.clients.pool_dir,
+        )
+    return _vm_pool
@@ -0,0 +1,184 @@
+"""Detect when a client virtual machine is ready to be used.
+
+After snap-guest starts a virtual machine, the virtual machine is usable once
+it got an IP address and its SSH server answers. :func:`wait_ready` runs a
+single script on the provisioning server which watches the libvirt domain
+addresses (DHCP leases and ARP table) and the mDNS name of the guest until an
+IP address shows up, then opens TCP connections to the guest SSH port until
+it receives the ``SSH-`` banner. The script checks every half a second and
+returns as soon as the guest is usable, all the stages sharing a single
+deadline.
+
+Usage::
+
+    from robottelo.vm_readiness import wait_ready
+
+    report = wait_ready(
+        'client.example.com', 'client', 'provisioning.example.com')
+    if not report.ready:
+        raise Exception(u'{0} stage timed out'.format(report.failed_stage))
+    print(report.ip_addr, report.stages)
+
+The :class:`ReadinessReport` tells how long every stage took, which helps
+finding out whether a slow virtual machine creation is caused by the boot
+(``ip`` stage) or by the services startup (``ssh`` stage).
+"""
+import logging
+import time
+
+from collections import OrderedDict
+from six.moves import shlex_quote
+
+from robottelo import ssh
+
+LOGGER = logging.getLogger(__name__)
+
+#: Seconds given to a virtual machine to get an IP and accept SSH connections
+READINESS_TIMEOUT = 120
+#: Seconds between two checks of the same stage
+READINESS_INTERVAL = 0.5
+#: Readiness stages, in order
+STAGES = ('ip', 'ssh')
+
+# Reports, as "<stage> <elapsed milliseconds> <value>" lines, when the guest
+# got an IP address and when its SSH server answered. Expects the domain,
+# name, timeout and interval variables to be set.
+_READINESS_SCRIPT = u'''
+start=$(date +%s%N)
+deadline=$((SECONDS + timeout))
+report() { echo "$1 $((($(date +%s%N) - start) / 1000000)) $2"; }
+domain_ip() {
+    virsh domifaddr "$domain" --source "$1" 2>/dev/null |
+        awk '$3 == "ipv4" {sub("/.*", "", $4); print $4; exit}'
+}
+ip=
+while [ -z "$ip" ]; do
+    ip=$(domain_ip lease)
+    [ -z "$ip" ] && ip=$(domain_ip arp)
+    [ -z "$ip" ] && ip=$(ping -c1 -W1 "$name.local" 2>/dev/null |
+        sed -n '1s/^[^(]*(\\([0-9.]*\\)).*/\\1/p')
+    if [ -z "$ip" ]; then
+        [ $SECONDS -ge $deadline ] && { report timeout ip; exit 1; }
+        sleep "$interval"
+    fi
+done
+report ip "$ip"
+until [ "$(timeout 2 bash -c "exec 3<>/dev/tcp/$ip/22 && head -c4 <&3" \\
+        2>/dev/null)" = SSH- ]; do
+    [ $SECONDS -ge $deadline ] && { report timeout ssh; exit 1; }
+    sleep "$interval"
+done
+report ssh "$ip"
+'''
+
+
+class ReadinessReport(object):
+    """Outcome of waiting for a virtual machine to be ready.
+
+    :param str domain: libvirt domain name of the virtual machine
+    :param stages: ordered mapping of the completed stages to the seconds
+        they took
+    :param str ip_addr: IP address of the virtual machine, ``None`` if not
+        found
+    :param str failed_stage: stage which did not complete before the
+        deadline, ``None`` if the virtual machine is ready
+    :param float elapsed: seconds spent waiting, including the SSH connection
+        to the provisioning server
+    """
+
+    def __init__(self, domain, stages, ip_addr=None, failed_stage=None,
+                 elapsed=0):
+        self.domain = domain
+        self.stages = stages
+        self.ip_addr = ip_addr
+        self.failed_stage = failed_stage
+        self.elapsed = elapsed
+
+    @property
+    def ready(self):
+        """Whether all the stages completed."""
+        return self.failed_stage is None and len(self.stages) == len(STAGES)
+
+    @property
+    def slowest_stage(self):
+        """The completed stage which took the longest, ``None`` if no stage
+        completed.
+        """
+        if not self.stages:
+            return None
+        return max(self.stages, key=self.stages.get)
+
+    def __str__(self):
+        stages = u', '.join(
+            u'{0}={1:.2f}s'.format(stage, elapsed)
+            for stage, elapsed in self.stages.items()
+        ) or u'-'
+        if self.ready:
+            outcome = u'ready'
+        else:
+            outcome = u'not ready, {0} stage timed out'.format(
+                self.failed_stage)
+        return u'{0} {1} in {2:.2f}s, stages: {3}'.format(
+            self.domain, outcome, self.elapsed, stages)
+
+
+def parse_report(domain, lines, elapsed=0):
+    """Return the :class:`ReadinessReport` of the readiness script output.
+
+    :param str domain: libvirt domain name of the virtual machine
+    :param lines: lines printed by the readiness script
+    :param float elapsed: seconds spent running the script
+    """
+    stages = OrderedDict()
+    ip_addr = None
+    failed_stage = None
+    previous = 0
+    for line in lines:
+        fields = line.split()
+        if len(fields) != 3:
+            continue
+        stage, milliseconds, value = fields
+        if stage == 'timeout':
+            failed_stage = value
+            continue
+        if stage not in STAGES:
+            continue
+        stages[stage] = (int(milliseconds) - previous) / 1000.0
+        previous = int(milliseconds)
+        ip_addr = value
+    if failed_stage is None and len(stages) != len(STAGES):
+        failed_stage = next(
+            stage for stage in STAGES if stage not in stages)
+    return ReadinessReport(domain, stages, ip_addr, failed_stage, elapsed)
+
+
+def wait_ready(domain, name, provisioning_server, timeout=READINESS_TIMEOUT,
+               interval=READINESS_INTERVAL):
+    """Wait until a virtual machine got an IP address and accepts SSH
+    connections.
+
+    :param str domain: libvirt domain name of the virtual machine
+    :param str name: host name of the virtual machine, without domain, which
+        is resolved with mDNS when libvirt does not know its address
+    :param str provisioning_server: server running the virtual machine
+    :param int timeout: seconds given to the virtual machine for all the
+        stages
+    :param float interval: seconds between two checks of the same stage
+    :return: a :class:`ReadinessReport`
+    """
+    script = u'domain={0}; name={1}; timeout={2}; interval={3}{4}'.format(
+        shlex_quote(domain),
+        shlex_quote(name),
+        int(timeout),
+        interval,
+        _READINESS_SCRIPT,
+    )
+    start = time.time()
+    result = ssh.command(
+        script, provisioning_server, timeout=int(timeout) + 30)
+    stdout = result.stdout or []
+    if not isinstance(stdout, list):
+        stdout = stdout.splitlines()
+    report = parse_report(domain, stdout, time.time() - start)
+    LOGGER.info('Virtual machine %s', report)
+    return report
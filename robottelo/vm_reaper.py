@@ -0,0 +1,323 @@
+"""Destroy virtual machines in background, in batches.
+
+Destroying a virtual machine runs ``virsh destroy``, ``virsh undefine`` and
+removes its image on the provisioning server, and the test destroying it
+waits for those commands before the next test starts. A :class:`VMReaper`
+destroys the virtual machines from a background thread instead: all the
+virtual machines queued meanwhile on a provisioning server are destroyed by a
+single SSH command.
+
+Every virtual machine is recorded before its creation, along with the
+process owning it, in a JSON file protected by a file lock and shared by all
+the test processes of the host. The virtual machines of the processes which
+are gone are orphaned: crashed pytest-xdist workers, or ``--boxed`` test
+processes which exited before their queued destructions ran. The reaper
+destroys them when it starts and when it is flushed.
+
+The reaper is enabled by the ``background_destroy`` option of the
+``clients`` section. When ``sweep_tag`` is set, it prefixes the names of the
+virtual machines and :meth:`VMReaper.flush` also destroys the virtual
+machines of the provisioning servers with that prefix which are not recorded,
+e.g. left by a process killed while recording one. Call
+:meth:`VMReaper.flush` to wait for all the destructions, as the
+``tests/foreman`` session finish does::
+
+    [clients]
+    background_destroy=true
+    sweep_tag=run42-
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from pytest_services.locks import file_lock
+from six.moves import queue, shlex_quote
+
+from robottelo import ssh
+from robottelo.config import settings
+from robottelo.helpers import process_alive
+from robottelo.vm_pool import POOL_TAG
+
+LOGGER = logging.getLogger(__name__)
+
+#: Local directory where the created virtual machines are recorded by default
+VM_REAPER_DIR = os.path.join(tempfile.gettempdir(), 'robottelo', 'vm_reaper')
+
+
+class VMReaper(object):
+    """Destroys virtual machines from a background thread.
+
+    :param str registry_dir: local directory where the created virtual
+        machines are recorded
+    """
+
+    def __init__(self, registry_dir=None):
+        self.registry_dir = registry_dir or VM_REAPER_DIR
+        self.path = os.path.join(self.registry_dir, 'domains.json')
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @contextmanager
+    def _domains(self):
+        """Lock the registry and yield the recorded virtual machines. The
+        changes are saved unless an exception is raised.
+        """
+        if not os.path.isdir(self.registry_dir):
+            try:
+                os.makedirs(self.registry_dir)
+            except OSError:
+                if not os.path.isdir(self.registry_dir):
+                    raise
+        # File locks are held by processes, also exclude the other threads
+        with self._lock, file_lock(self.path + '.lock'):
+            domains = []
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as handler:
+                        domains = json.load(handler)
+                except ValueError:
+                    LOGGER.warning('Ignoring corrupted registry %s', self.path)
+            yield domains
+            with open(self.path + '.tmp', 'w') as handler:
+                json.dump(domains, handler, indent=2, sort_keys=True)
+            os.rename(self.path + '.tmp', self.path)
+
+    def register(self, host, name, image):
+        """Record a virtual machine about to be created, owned by this
+        process. The reaper is started, destroying the orphaned virtual
+        machines meanwhile.
+
+        :param str host: provisioning server of the virtual machine
+        :param str name: libvirt domain name of the virtual machine
+        :param str image: path of its image on ``host``
+        """
+        with self._domains() as domains:
+            domains.append({
+                'host': host,
+                'name': name,
+                'image': image,
+                'owner': os.getpid(),
+            })
+        self._start()
+
+    def _start(self):
+        """Start the reaper thread unless running, then destroy the virtual
+        machines of the processes which are gone.
+        """
+        with self._condition:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            # The reaper thread does not survive a fork
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        self.sweep()
+
+    def destroy(self, host, name, image, snapshots=False, callback=None):
+        """Queue the destruction of a virtual machine.
+
+        :param str host: provisioning server of the virtual machine
+        :param str name: libvirt domain name of the virtual machine
+        :param str image: path of its image on ``host``
+        :param bool snapshots: whether the virtual machine has snapshots
+        :param callback: callable without arguments called once the virtual
+            machine is destroyed
+        """
+        self._start()
+        with self._condition:
+            key = (host, name)
+            self._pending[key] = self._pending.get(key, 0) + 1
+        self._queue.put((host, name, image, snapshots, callback))
+
+    def _run(self):
+        """Destroy the queued virtual machines, in batches."""
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            hosts = OrderedDict()
+            for item in batch:
+                hosts.setdefault(item[0], []).append(item)
+            for host, items in hosts.items():
+                self._destroy_batch(host, items)
+            with self._condition:
+                for host, name, _, _, _ in batch:
+                    self._pending[(host, name)] -= 1
+                    if not self._pending[(host, name)]:
+                        del self._pending[(host, name)]
+                self._condition.notify_all()
+
+    def _destroy_batch(self, host, items):
+        """Destroy ``items`` virtual machines of ``host`` with a single SSH
+        command.
+        """
+        lines = []
+        for _, name, image, snapshots, _ in items:
+            undefine = u'virsh undefine {0}'.format(shlex_quote(name))
+            if snapshots:
+                undefine += u' --snapshots-metadata'
+            lines.append(u'virsh destroy {0}; {1}; rm -f {2}'.format(
+                shlex_quote(name), undefine, shlex_quote(image)))
+        names = set(item[1] for item in items)
+        try:
+            ssh.command(u'\n'.join(lines), hostname=host)
+            with self._domains() as domains:
+                domains[:] = [
+                    domain for domain in domains
+                    if domain['host'] != host or domain['name'] not in names
+                ]
+        except Exception as err:
+            LOGGER.warning(
+                'Failed to destroy %s on %s: %s',
+                ', '.join(sorted(names)), host, err)
+        else:
+            LOGGER.info(
+                'Destroyed %s on %s', ', '.join(sorted(names)), host)
+        for item in items:
+            callback = item[4]
+            if callback is None:
+                continue
+            try:
+                callback()
+            except Exception as err:
+                LOGGER.warning(
+                    'Failed to run callback of %s: %s', item[1], err)
+
+    def wait(self, host=None, name=None, timeout=None):
+        """Wait for the queued destructions to complete.
+
+        :param str host: only wait for the virtual machines of this
+            provisioning server
+        :param str name: only wait for the virtual machines with this domain
+            name
+        :param float timeout: seconds to wait at most
+        :return: whether the destructions completed
+        """
+        def pending():
+            return [
+                key for key in self._pending
+                if host in (None, key[0]) and name in (None, key[1])
+            ]
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while pending():
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def flush(self, timeout=None):
+        """Destroy the orphaned virtual machines, then wait for all the
+        queued destructions, logging the virtual machines not destroyed
+        before ``timeout`` seconds.
+
+        The tagged virtual machines of the ``clients`` section provisioning
+        servers are destroyed too when its ``sweep_tag`` is set.
+        """
+        hosts = (
+            settings.clients.provisioning_servers or
+            [settings.clients.provisioning_server]
+        )
+        try:
+            self.sweep(
+                [host for host in hosts if host],
+                tag=settings.clients.sweep_tag
+            )
+        except Exception as err:
+            LOGGER.warning(
+                'Failed to sweep orphaned virtual machines: %s', err)
+        if not self.wait(timeout=timeout):
+            LOGGER.warning(
+                'Virtual machines not destroyed: %s',
+                ', '.join(name for _, name in sorted(self._pending)))
+
+    def sweep(self, hosts=(), tag=None):
+        """Destroy the orphaned virtual machines.
+
+        Recorded virtual machines owned by processes which are gone are
+        orphaned. When ``tag`` is given, the virtual machines of ``hosts``
+        whose name starts with ``tag`` and which are not recorded are
+        orphaned too, except the pool ones.
+
+        :param hosts: provisioning servers where to look for tagged virtual
+            machines
+        :param str tag: name prefix of the tagged virtual machines
+        :return: the number of virtual machines queued for destruction
+        """
+        with self._domains() as domains:
+            orphans = [
+                domain for domain in domains
+                if not process_alive(domain['owner'])
+            ]
+            for domain in orphans:
+                # Destroyed by this process now
+                domain['owner'] = os.getpid()
+            owned = set(
+                (domain['host'], domain['name']) for domain in domains)
+        orphans = [
+            (domain['host'], domain['name'], domain['image'])
+            for domain in orphans
+        ]
+        for host in hosts if tag else ():
+            result = ssh.command(u'virsh list --all --name', hostname=host)
+            if result.return_code != 0:
+                LOGGER.warning(
+                    'Failed to list the virtual machines of %s: %s',
+                    host, result.stderr)
+                continue
+            for name in result.stdout or []:
+                name = name.strip()
+                if (name.startswith(tag) and
+                        not name.startswith(POOL_TAG) and
+                        (host, name) not in owned):
+                    orphans.append((host, name, os.path.join(
+                        settings.clients.image_dir, u'{0}.img'.format(name))))
+        for host, name, image in orphans:
+            LOGGER.info('Destroying orphaned %s on %s', name, host)
+            self.destroy(host, name, image, snapshots=True)
+        return len(orphans)
+
+
+def tagged(name):
+    """Return the virtual machine ``name`` prefixed with the ``clients``
+    section ``sweep_tag``, if any.
+    """
+    return (settings.clients.sweep_tag or '') + name
+
+
+# Created on the first destruction when the clients background_destroy
+# setting is set
+_reaper = None
+
+
+def get_reaper():
+    """Return the reaper, or ``None`` if the ``clients`` section
+    ``background_destroy`` is disabled.
+    """
+    global _reaper  # pylint:disable=global-statement
+    if not settings.clients.background_destroy:
+        return None
+    if _reaper is None:
+        _reaper = VMReaper()
+        atexit.register(_reaper.flush, 600)
+    return _reaper
@@ -0,0 +1,394 @@
+"""Admission of virtual machines on the provisioning hosts by capacity.
+
+Large pytest-xdist runs create many virtual machines at the same time, which
+overcommits the provisioning servers: boots slow down and eventually time
+out. A :class:`ProvisioningScheduler` admits a virtual machine on a host only
+when the host has enough CPU, RAM and disk headroom for it, otherwise the
+request is queued until some headroom is available. When several hosts can
+run the virtual machine, the one with the most free RAM is picked, spreading
+the virtual machines across the hosts.
+
+The headroom of a host is its measured capacity minus the resources reserved
+by the virtual machines being booted there. The capacity (CPU count and load,
+available RAM, free disk space of the image directory) is read with a single
+SSH command and cached for a few seconds. Reservations are stored in a JSON
+file protected by a file lock, so all the test processes of the host share
+them, and are released once the virtual machine booted.
+
+The scheduler is enabled by the ``scheduling`` option of the ``clients``
+section, virtual machines being spread across the ``provisioning_servers``::
+
+    [clients]
+    provisioning_server=provisioning1.example.com
+    provisioning_servers=provisioning1.example.com,provisioning2.example.com
+    scheduling=true
+
+The time every virtual machine waited to be admitted and took to boot is
+logged and summed up per host in the same file, next to the reservations, so
+:meth:`ProvisioningScheduler.report` covers the virtual machines of all the
+test processes.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+
+from pytest_services.locks import file_lock
+from six.moves import shlex_quote
+
+from robottelo import ssh
+from robottelo.config import settings
+from robottelo.helpers import process_alive
+
+LOGGER = logging.getLogger(__name__)
+
+#: Local directory where the reservations and metrics are stored by default
+SCHEDULER_DIR = os.path.join(
+    tempfile.gettempdir(), 'robottelo', 'vm_scheduler')
+#: Seconds a measured host capacity is reused
+CAPACITY_CACHE_TTL = 10
+#: Virtual CPUs allowed per host CPU
+CPU_OVERCOMMIT = 2.0
+#: RAM in megabytes kept free on every host
+RAM_RESERVE = 2048
+#: Disk space in megabytes kept free on every host
+DISK_RESERVE = 10240
+
+# Prints the CPU count, the 1 minute load average, the available RAM and the
+# free space of a directory, in megabytes
+_CAPACITY_COMMAND = (
+    u'nproc && cut -d " " -f 1 /proc/loadavg && '
+    u'awk \'/^MemAvailable:/ {{print int($2 / 1024)}}\' /proc/meminfo && '
+    u'df -Pm {0} | awk \'NR == 2 {{print $4}}\''
+)
+
+
+class SchedulerError(Exception):
+    """Indicates that a virtual machine could not be admitted."""
+
+
+class HostCapacity(object):
+    """Resources of a provisioning host, as measured.
+
+    :param str host: the provisioning host
+    :param int cpus: number of CPUs
+    :param float load: 1 minute load average
+    :param int ram: available RAM in megabytes
+    :param int disk: free disk space of the image directory in megabytes
+    """
+
+    def __init__(self, host, cpus, load, ram, disk):
+        self.host = host
+        self.cpus = cpus
+        self.load = load
+        self.ram = ram
+        self.disk = disk
+        self.measured_at = time.time()
+
+    def __str__(self):
+        return u'{0}: {1} cpus, load {2}, {3}MB ram, {4}MB disk'.format(
+            self.host, self.cpus, self.load, self.ram, self.disk)
+
+
+class Admission(object):
+    """A virtual machine admitted on a provisioning host.
+
+    :param str host: the provisioning host
+    :param str ticket: id of the reservation
+    :param float queue_wait: seconds the request waited to be admitted
+    """
+
+    def __init__(self, host, ticket, queue_wait):
+        self.host = host
+        self.ticket = ticket
+        self.queue_wait = queue_wait
+        self.admitted_at = time.time()
+
+
+class ProvisioningScheduler(object):
+    """Admits virtual machines on provisioning hosts with enough headroom.
+
+    :param int cache_ttl: seconds a measured host capacity is reused
+    :param float cpu_overcommit: virtual CPUs allowed per host CPU
+    :param int ram_reserve: RAM in megabytes kept free on every host
+    :param int disk_reserve: disk space in megabytes kept free on every
+        host
+    :param str state_dir: local directory where the reservations and
+        metrics are stored
+    """
+
+    def __init__(self, cache_ttl=CAPACITY_CACHE_TTL,
+                 cpu_overcommit=CPU_OVERCOMMIT, ram_reserve=RAM_RESERVE,
+                 disk_reserve=DISK_RESERVE, state_dir=None):
+        self.cache_ttl = cache_ttl
+        self.cpu_overcommit = cpu_overcommit
+        self.ram_reserve = ram_reserve
+        self.disk_reserve = disk_reserve
+        self.state_dir = state_dir or SCHEDULER_DIR
+        self.path = os.path.join(self.state_dir, 'state.json')
+        self._capacities = {}
+        self._capacities_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _after_fork(self):
+        """Recreate the locks inherited from the parent process, if this
+        process was forked since the last call. They may have been held by
+        threads of the parent, which do not survive the fork.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._capacities_lock = threading.Lock()
+            self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        """Lock the shared state and yield it, a dictionary with the list of
+        ``reservations``, without the reservations of processes which are
+        gone, and the ``metrics`` per host. The changes are saved unless an
+        exception is raised.
+        """
+        if not os.path.isdir(self.state_dir):
+            try:
+                os.makedirs(self.state_dir)
+            except OSError:
+                if not os.path.isdir(self.state_dir):
+                    raise
+        self._after_fork()
+        # File locks are held by processes, also exclude the other threads
+        with self._lock, file_lock(self.path + '.lock'):
+            state = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as handler:
+                        state = json.load(handler)
+                except ValueError:
+                    LOGGER.warning(
+                        'Ignoring corrupted scheduler state %s', self.path)
+            state['reservations'] = [
+                reservation for reservation in state.get('reservations', [])
+                if process_alive(reservation['owner'])
+            ]
+            state.setdefault('metrics', {})
+            yield state
+            with open(self.path + '.tmp', 'w') as handler:
+                json.dump(state, handler, indent=2, sort_keys=True)
+            os.rename(self.path + '.tmp', self.path)
+
+    @contextmanager
+    def _reservations(self):
+        """Lock the shared state and yield the list of reservations. See
+        :meth:`_state`.
+        """
+        with self._state() as state:
+            yield state['reservations']
+
+    @property
+    def metrics(self):
+        """The queue wait and boot time metrics per host, recorded by all the
+        processes.
+        """
+        with self._state() as state:
+            return state['metrics']
+
+    def reset_metrics(self):
+        """Forget the metrics recorded so far, e.g. when a session starts."""
+        with self._state() as state:
+            state['metrics'] = {}
+
+    def capacity(self, host, path):
+        """Return the :class:`HostCapacity` of ``host``, measured at most
+        ``cache_ttl`` seconds ago.
+
+        :param str host: the provisioning host
+        :param str path: directory storing the images on ``host``
+        :return: the capacity or ``None`` if it could not be measured
+        """
+        self._after_fork()
+        with self._capacities_lock:
+            capacity = self._capacities.get((host, path))
+        if (capacity is not None and
+                time.time() - capacity.measured_at < self.cache_ttl):
+            return capacity
+        result = ssh.command(
+            _CAPACITY_COMMAND.format(shlex_quote(path)), host, timeout=30)
+        try:
+            cpus, load, ram, disk = result.stdout[:4]
+            capacity = HostCapacity(
+                host, int(cpus), float(load), int(ram), int(disk))
+        except (TypeError, ValueError):
+            LOGGER.warning(
+                'Failed to measure the capacity of %s: %s',
+                host, result.stderr)
+            return None
+        LOGGER.debug('Measured capacity of %s', capacity)
+        with self._capacities_lock:
+            self._capacities[(host, path)] = capacity
+        return capacity
+
+    def _headroom(self, capacity, reservations):
+        """Return the CPUs, RAM and disk space left on a host by the
+        ``reservations`` made on it.
+        """
+        reserved = [
+            reservation for reservation in reservations
+            if reservation['host'] == capacity.host
+        ]
+        return (
+            capacity.cpus * self.cpu_overcommit - capacity.load -
+            sum(reservation['cpu'] for reservation in reserved),
+            capacity.ram - self.ram_reserve -
+            sum(reservation['ram'] for reservation in reserved),
+            capacity.disk - self.disk_reserve -
+            sum(reservation['disk'] for reservation in reserved),
+        )
+
+    def admit(self, hosts, path, cpu, ram, disk, timeout=1800, interval=5):
+        """Wait for one of ``hosts`` to have the headroom for a virtual
+        machine and reserve it.
+
+        Hosts whose capacity can not be measured are not considered. When no
+        host capacity can be measured, the virtual machine is admitted on the
+        first host.
+
+        :param hosts: the provisioning hosts which can run the virtual machine
+        :param str path: directory storing the images on the hosts
+        :param int cpu: number of CPUs of the virtual machine
+        :param int ram: RAM of the virtual machine in megabytes
+        :param int disk: disk space of the virtual machine in megabytes
+        :param int timeout: seconds to wait for headroom
+        :param int interval: seconds between two capacity checks
+        :return: an :class:`Admission`, to :meth:`complete` once the virtual
+            machine booted
+        :raises robottelo.vm_scheduler.SchedulerError: If no host had enough
+            headroom before ``timeout`` seconds.
+        """
+        start = time.time()
+        while True:
+            capacities = [self.capacity(host, path) for host in hosts]
+            capacities = [
+                capacity for capacity in capacities if capacity is not None]
+            with self._reservations() as reservations:
+                candidates = []
+                for capacity in capacities:
+                    cpus, rams, disks = self._headroom(
+                        capacity, reservations)
+                    if cpus >= cpu and rams >= ram and disks >= disk:
+                        candidates.append((rams, capacity.host))
+                if candidates:
+                    host = max(candidates)[1]
+                elif not capacities:
+                    LOGGER.warning(
+                        'No capacity measured for %s, admitting on %s',
+                        ', '.join(hosts), hosts[0])
+                    host = hosts[0]
+                else:
+                    host = None
+                if host is not None:
+                    ticket = uuid.uuid4().hex
+                    reservations.append({
+                        'ticket': ticket,
+                        'host': host,
+                        'cpu': cpu,
+                        'ram': ram,
+                        'disk': disk,
+                        'owner': os.getpid(),
+                        'since': time.time(),
+                    })
+            if host is not None:
+                admission = Admission(host, ticket, time.time() - start)
+                LOGGER.info(
+                    'Virtual machine admitted on %s after waiting %.2f '
+                    'seconds', host, admission.queue_wait)
+                return admission
+            if time.time() - start > timeout:
+                raise SchedulerError(
+                    u'No provisioning host with {0} cpus, {1}MB ram and '
+                    u'{2}MB disk available after {3} seconds: {4}'.format(
+                        cpu, ram, disk, timeout,
+                        u'; '.join(str(item) for item in capacities))
+                )
+            LOGGER.debug(
+                'No headroom for the virtual machine, queued: %s',
+                '; '.join(str(item) for item in capacities))
+            time.sleep(interval)
+
+    def complete(self, admission, booted=True):
+        """Release the reservation of an admitted virtual machine and record
+        its metrics.
+
+        :param Admission admission: the admission returned by :meth:`admit`
+        :param bool booted: whether the virtual machine booted
+        """
+        boot_time = time.time() - admission.admitted_at
+        with self._state() as state:
+            state['reservations'][:] = [
+                reservation for reservation in state['reservations']
+                if reservation['ticket'] != admission.ticket
+            ]
+            metrics = state['metrics'].setdefault(admission.host, {
+                'admitted': 0,
+                'failed': 0,
+                'queue_wait': 0.0,
+                'max_queue_wait': 0.0,
+                'boot_time': 0.0,
+                'max_boot_time': 0.0,
+            })
+            metrics['admitted'] += 1
+            if not booted:
+                metrics['failed'] += 1
+            metrics['queue_wait'] += admission.queue_wait
+            metrics['max_queue_wait'] = max(
+                metrics['max_queue_wait'], admission.queue_wait)
+            metrics['boot_time'] += boot_time
+            metrics['max_boot_time'] = max(
+                metrics['max_boot_time'], boot_time)
+        self._after_fork()
+        with self._capacities_lock:
+            # The virtual machine resources are now part of the host load
+            for key in list(self._capacities):
+                if key[0] == admission.host:
+                    del self._capacities[key]
+        LOGGER.info(
+            'Virtual machine on %s %s in %.2f seconds',
+            admission.host, 'booted' if booted else 'failed', boot_time)
+
+    def report(self):
+        """Return a summary of the queue wait and boot time per host, of the
+        virtual machines admitted by all the processes.
+        """
+        return u'\n'.join(
+            u'{0}: {1} virtual machines ({2} failed), queue wait '
+            u'avg {3:.2f}s max {4:.2f}s, boot time avg {5:.2f}s max '
+            u'{6:.2f}s'.format(
+                host,
+                metrics['admitted'],
+                metrics['failed'],
+                metrics['queue_wait'] / metrics['admitted'],
+                metrics['max_queue_wait'],
+                metrics['boot_time'] / metrics['admitted'],
+                metrics['max_boot_time'],
+            )
+            for host, metrics in sorted(self.metrics.items())
+        )
+
+
+# Created on the first admission when the clients scheduling setting is set
+_scheduler = None
+
+
+def get_scheduler():
+    """Return the scheduler, or ``None`` if the ``clients`` section
+    ``scheduling`` is disabled.
+    """
+    global _scheduler  # pylint:disable=global-statement
+    if not settings.clients.scheduling:
+        return None
+    if _scheduler is None:
+        _scheduler = ProvisioningScheduler()
+    return _scheduler
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Measure the throughput of manifest cloning.
+
+Compare cloning manifests on demand with getting them from a
+:class:`robottelo.manifests.ManifestPool` filled in background::
+
+    python scripts/manifest_clone_benchmark.py --count 50 --workers 4
+
+By default a synthetic manifest template and signing key are generated, use
+``--real`` to use the ``[fake_manifest]`` ones from robottelo.properties.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import time
+import zipfile
+
+import six
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from robottelo.config import settings
+from robottelo.manifests import ManifestCloner, ManifestPool
+
+
+def synthetic_cloner(entitlements=200):
+    """Return a cloner with a generated template of ``entitlements``
+    entitlement files, similar in size to real manifests.
+    """
+    consumer_export = six.BytesIO()
+    with zipfile.ZipFile(consumer_export, 'w') as export_zip:
+        export_zip.writestr(
+            'export/consumer.json', json.dumps({'uuid': 'template'}))
+        for index in range(entitlements):
+            export_zip.writestr(
+                'export/entitlements/{0}.json'.format(index),
+                json.dumps({'id': index, 'pool': 'x' * 2048}),
+            )
+    template = six.BytesIO()
+    with zipfile.ZipFile(template, 'w') as template_zip:
+        template_zip.writestr(
+            'consumer_export.zip', consumer_export.getvalue())
+    key = rsa.generate_private_key(65537, 2048, default_backend())
+    return ManifestCloner(
+        template=template.getvalue(),
+        signing_key=key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        ),
+    )
+
+
+def report(name, count, elapsed):
+    """Print the throughput of ``count`` clones in ``elapsed`` seconds."""
+    print('{0:<24} {1:>4} clones in {2:>7.3f}s {3:>8.1f} clones/s '
+          '{4:>8.2f} ms/clone'.format(
+              name, count, elapsed, count / elapsed, elapsed / count * 1000))
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--real', action='store_true')
+    args = parser.parse_args()
+
+    if args.real:
+        settings.configure()
+        cloner = ManifestCloner()
+        cloner._prepare()
+    else:
+        cloner = synthetic_cloner()
+
+    start = time.time()
+    for _ in range(args.count):
+        cloner.clone()
+    report('on demand', args.count, time.time() - start)
+
+    pool = ManifestPool(cloner, size=args.count, workers=args.workers)
+    start = time.time()
+    pool.start()
+    while len(pool._clones) < args.count:
+        time.sleep(0.01)
+    report('pool generation', args.count, time.time() - start)
+
+    start = time.time()
+    for _ in range(args.count):
+        pool.get()
+    report('pool get (warm)', args.count, time.time() - start)
+    pool.stop()
+
+
+if __name__ == '__main__':
+    main()
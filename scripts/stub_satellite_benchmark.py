@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Measure the overhead of robottelo's factories against stub servers.
+
+Creates organizations, lifecycle environments, products, repositories and
+content views, syncing, publishing and promoting them, through NailGun
+against a :class:`robottelo.stub_satellite.StubSatelliteServer`::
+
+    python scripts/stub_satellite_benchmark.py --count 20 --latency 0.01
+
+Use ``--no-session`` to compare with NailGun sending requests without the
+keep-alive session of :mod:`robottelo.api.session`. ``--cli`` runs the same
+flow through the CLI factories and the SSH stub, it uses the credentials and
+locale of robottelo.properties but does not connect to its server.
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+from nailgun import entities, entity_mixins
+
+from robottelo.api.session import API_METRICS, install_session
+from robottelo.cli import factory
+from robottelo.cli.contentview import ContentView
+from robottelo.cli.repository import Repository
+from robottelo.config import settings
+from robottelo.stub_satellite import StubSatelliteServer, StubSSHServer
+
+
+def api_flow():
+    """Create and publish a content view through NailGun."""
+    org = entities.Organization().create()
+    lce = entities.LifecycleEnvironment(organization=org).create()
+    product = entities.Product(organization=org).create()
+    repo = entities.Repository(product=product).create()
+    repo.sync()
+    content_view = entities.ContentView(
+        organization=org, repository=[repo]).create()
+    content_view.publish()
+    version = content_view.read().version[0]
+    version.promote(data={'environment_id': lce.id})
+
+
+def cli_flow():
+    """Create and publish a content view through the CLI factories."""
+    org = factory.make_org()
+    factory.make_lifecycle_environment({u'organization-id': org['id']})
+    product = factory.make_product({u'organization-id': org['id']})
+    repo = factory.make_repository({u'product-id': product['id']})
+    Repository.synchronize({u'id': repo['id']})
+    content_view = factory.make_content_view({
+        u'organization-id': org['id'],
+        u'repository-ids': [repo['id']],
+    })
+    ContentView.publish({u'id': content_view['id']})
+
+
+def report(name, count, elapsed):
+    """Print the time spent running the flow ``count`` times."""
+    print('{0:<12} {1:>4} flows in {2:>7.3f}s {3:>8.2f} ms/flow'.format(
+        name, count, elapsed, elapsed / count * 1000))
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--no-session', action='store_true')
+    parser.add_argument('--cli', action='store_true')
+    args = parser.parse_args()
+
+    with StubSatelliteServer(latency=args.latency) as server:
+        entity_mixins.CREATE_MISSING = True
+        entity_mixins.DEFAULT_SERVER_CONFIG = server.server_config()
+        if not args.no_session:
+            install_session()
+        start = time.time()
+        for _ in range(args.count):
+            api_flow()
+        report('nailgun', args.count, time.time() - start)
+        for endpoint, histogram in API_METRICS.items():
+            summary = histogram.summary()
+            print('  {0:<60} {1:>5} {2:>8.2f} ms'.format(
+                endpoint, summary['count'], summary['mean'] * 1000))
+
+        if args.cli:
+            settings.configure()
+            with StubSSHServer(
+                    store=server.store, latency=args.latency) as ssh_server:
+                start = time.time()
+                for _ in range(args.count):
+                    cli_flow()
+                report('hammer', args.count, time.time() - start)
+                print('  {0} commands, {1} connections, {2} unmatched'.format(
+                    len(ssh_server.commands),
+                    ssh_server.connections,
+                    len(ssh_server.unmatched),
+                ))
+
+
+if __name__ == '__main__':
+    main()
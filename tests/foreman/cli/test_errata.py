@@ -134,16 +134,14 @@ class HostCollectionErrataInstallTestCase(CLITestCase):
     def setUp(self):
         """Create and setup host collection, hosts and virtual machines."""
         super(HostCollectionErrataInstallTestCase, self).setUp()
-        self.virtual_machines = []
         self.host_collection = make_host_collection({
             'organization-id': self.org['id']
         })
-        for _ in range(self.VIRTUAL_MACHINES_COUNT):
-            # create VM
-            virtual_machine = VirtualMachine(distro=DISTRO_RHEL7)
-            virtual_machine.create()
-            self.addCleanup(vm_cleanup, virtual_machine)
-            self.virtual_machines.append(virtual_machine)
+        # create VMs
+        self.virtual_machines = VirtualMachine.create_many(
+            self.VIRTUAL_MACHINES_COUNT, distro=DISTRO_RHEL7)
+        self.addCleanup(vm_cleanup, self.virtual_machines)
+        for virtual_machine in self.virtual_machines:
             virtual_machine.install_katello_ca()
             # register content host
             virtual_machine.register_contenthost(
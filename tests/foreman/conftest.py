@@ -3,8 +3,13 @@
 import datetime
 import pytest
 from robottelo.config import settings
+from robottelo.cleanup import finish_session_cleanup, start_session_cleanup
 from robottelo.bz_helpers import get_deselect_bug_ids, group_by_key
 from robottelo.helpers import get_func_name
+from robottelo.manifests import get_manifest_pool
+from robottelo.vm_pool import get_vm_pool
+from robottelo.vm_reaper import get_reaper
+from robottelo.vm_scheduler import get_scheduler
 
 
 def log(message, level="DEBUG"):
@@ -84,3 +89,42 @@ def pytest_collection_modifyitems(items, config):
 
     config.hook.pytest_deselected(items=deselected_items)
     items[:] = [item for item in items if item not in deselected_items]
+
+
+def pytest_sessionstart(session):
+    """Keep the pools of client virtual machines and manifest clones filled
+    from the session process, the ``--boxed`` test processes forked from it
+    only take from the pools. Unless this is a pytest-xdist worker, also
+    start the session cleanup and recording the provisioning hosts usage.
+    """
+    if settings.configured and settings.clients.pool_size:
+        get_vm_pool().maintain()
+    if settings.configured and settings.fake_manifest.pool_size:
+        get_manifest_pool().start()
+    if hasattr(session.config, 'slaveinput'):
+        return
+    if settings.configured and settings.cleanup:
+        start_session_cleanup()
+    if settings.configured and settings.clients.scheduling:
+        get_scheduler().reset_metrics()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """Wait for the virtual machines destroyed in background. Unless this is
+    a pytest-xdist worker, also clean the entities left by the tests and wait
+    for the asynchronous deletions of all the workers, once every test is
+    done, and report the virtual machines queue wait and boot time per
+    provisioning host.
+    """
+    worker = hasattr(session.config, 'slaveinput')
+    if settings.configured and settings.cleanup and not worker:
+        failed = finish_session_cleanup()
+        if failed:
+            log('{0} cleanup tasks did not succeed'.format(len(failed)),
+                level='WARNING')
+    if settings.configured and settings.clients.background_destroy:
+        get_reaper().flush()
+    if settings.configured and settings.clients.scheduling and not worker:
+        report = get_scheduler().report()
+        if report:
+            log('Provisioning hosts usage:\n{0}'.format(report), level='INFO')
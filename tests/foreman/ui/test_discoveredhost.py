@@ -542,31 +542,26 @@ class DiscoveryTestCase(UITestCase):
         """
         with Session(self) as session:
             session.nav.go_to_select_org(self.org_name)
-            with LibvirtGuest() as pxe_1_host:
-                host_1_name = pxe_1_host.guest_name
-                self.assertTrue(
-                    self.discoveredhosts.waitfordiscoveredhost(host_1_name)
-                )
-                with LibvirtGuest() as pxe_2_host:
-                    host_2_name = pxe_2_host.guest_name
+            with LibvirtGuest.create_many(2) as pxe_hosts:
+                hostnames = [pxe_host.guest_name for pxe_host in pxe_hosts]
+                for hostname in hostnames:
                     self.assertTrue(
-                        self.discoveredhosts.waitfordiscoveredhost(host_2_name)
+                        self.discoveredhosts.waitfordiscoveredhost(hostname)
                     )
-                    hostnames = [host_1_name, host_2_name]
-                    for hostname in hostnames:
-                        host = self.discoveredhosts.search(hostname)
-                        if not host:
-                            raise UIError(
-                                'Could not find the selected discovered host '
-                                '"{0}"'.format(hostname)
-                            )
-                    self.discoveredhosts.navigate_to_entity()
-                    # To delete multiple discovered hosts
-                    self.discoveredhosts.multi_delete(hostnames)
-                    for hostname in [host_1_name, host_2_name]:
-                        self.assertIsNone(
-                            self.discoveredhosts.search(hostname)
+                for hostname in hostnames:
+                    host = self.discoveredhosts.search(hostname)
+                    if not host:
+                        raise UIError(
+                            'Could not find the selected discovered host '
+                            '"{0}"'.format(hostname)
                         )
+                self.discoveredhosts.navigate_to_entity()
+                # To delete multiple discovered hosts
+                self.discoveredhosts.multi_delete(hostnames)
+                for hostname in hostnames:
+                    self.assertIsNone(
+                        self.discoveredhosts.search(hostname)
+                    )
 
     @run_only_on('sat')
     @tier3
@@ -491,12 +491,10 @@ class HostCollectionPackageManagementTest(UITestCase):
         associate it with previously created hosts.
         """
         super(HostCollectionPackageManagementTest, self).setUp()
-        self.hosts = []
-        for _ in range(self.hosts_number):
-            client = VirtualMachine(distro=DISTRO_RHEL7)
-            self.addCleanup(vm_cleanup, client)
-            self.hosts.append(client)
-            client.create()
+        self.hosts = VirtualMachine.create_many(
+            self.hosts_number, distro=DISTRO_RHEL7)
+        self.addCleanup(vm_cleanup, self.hosts)
+        for client in self.hosts:
             client.install_katello_ca()
             client.register_contenthost(
                 self.session_org.label, self.activation_key.name)
@@ -0,0 +1,98 @@
+"""Tests for :mod:`robottelo.api.session`"""
+import pytest
+import requests
+
+from nailgun import client
+from requests.adapters import HTTPAdapter
+from robottelo.api import session
+from robottelo.metrics import LatencyRecorder
+
+
+@pytest.fixture
+def installed():
+    """Install the session for a test and restore ``requests`` after it"""
+    session.install_session(pool_size=2, max_retries=0)
+    yield client.requests
+    session.uninstall_session()
+
+
+def _response(request, status_code=200, cookie=None):
+    """Build a response to ``request``"""
+    response = requests.Response()
+    response.status_code = status_code
+    response.request = request
+    response.url = request.url
+    response._content = b'{}'
+    if cookie is not None:
+        response.headers['Set-Cookie'] = cookie
+    return response
+
+
+@pytest.mark.parametrize(
+    'url, expected',
+    [
+        ('https://sat.example.com/api/v2/hosts', 'GET /api/v2/hosts'),
+        ('https://sat.example.com/api/v2/hosts/42?x=1',
+         'GET /api/v2/hosts/:id'),
+        ('https://sat.example.com/foreman_tasks/api/tasks/'
+         '0f8c1a0e-3a7c-4cb0-8a0b-4e5e6d2c9a10',
+         'GET /foreman_tasks/api/tasks/:id'),
+    ]
+)
+def test_endpoint_name(url, expected):
+    """Ids are stripped from endpoint names"""
+    assert session.endpoint_name('get', url) == expected
+
+
+def test_session_records_latencies(mocker):
+    """Every request latency is recorded under its endpoint"""
+    url = 'https://sat.example.com/api/v2/hosts/{0}'
+    mocker.patch.object(HTTPAdapter, 'send', side_effect=[
+        _response(requests.Request('GET', url.format(1)).prepare()),
+        _response(requests.Request('GET', url.format(2)).prepare(), 404),
+    ])
+    metrics = LatencyRecorder()
+    nailgun_session = session.NailgunSession(metrics=metrics)
+    nailgun_session.get(url.format(1))
+    nailgun_session.get(url.format(2))
+    summary = metrics.summary()['GET /api/v2/hosts/:id']
+    assert summary['count'] == 2
+    assert summary['errors'] == 1
+
+
+def test_session_ignores_cookies(mocker):
+    """Session cookies are not kept between requests"""
+    url = 'https://sat.example.com/api/v2/status'
+    mocker.patch.object(HTTPAdapter, 'send', return_value=_response(
+        requests.Request('GET', url).prepare(),
+        cookie='_session_id=abc; path=/',
+    ))
+    nailgun_session = session.NailgunSession(metrics=None)
+    nailgun_session.get(url)
+    assert len(nailgun_session.cookies) == 0
+
+
+def test_install_session(installed, mocker):
+    """NailGun requests are sent through the installed session"""
+    request = mocker.patch.object(session.NailgunSession, 'request')
+    request.return_value.status_code = 200
+    client.post('https://sat.example.com/api/v2/hosts', json={'a': 1})
+    request.assert_called_once_with(
+        'POST', 'https://sat.example.com/api/v2/hosts',
+        data=None, json={'a': 1},
+        headers={'content-type': 'application/json'},
+    )
+
+
+def test_session_per_process(installed, mocker):
+    """A new session is created after a fork"""
+    first = installed.session
+    assert installed.session is first
+    mocker.patch('robottelo.api.session.os.getpid', return_value=-1)
+    assert installed.session is not first
+
+
+def test_uninstall_session(installed):
+    """Uninstalling restores the requests module"""
+    session.uninstall_session()
+    assert client.requests is requests
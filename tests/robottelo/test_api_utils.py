@@ -1,4 +1,6 @@
 """Unit tests for :mod:`robottelo.api.utils`."""
+import mock
+
 from robottelo.api import utils
 from unittest2 import TestCase
 
@@ -19,3 +21,134 @@ class UtilsTestCase(TestCase):
             utils.one_to_many_names('person'),
             {'person', 'person_ids', 'people'},
         )
+
+    def test_entity_verifier(self):
+        """Reused entities must be readable and keep their associations."""
+        entity_cls = mock.Mock(__name__='Domain')
+        stored = {'id': 1}
+        check = mock.Mock(return_value=True)
+        verify = utils._entity_verifier(entity_cls, check)
+        self.assertEqual(verify(stored), stored)
+        check.assert_called_once_with(
+            entity_cls.return_value.read.return_value, stored)
+        check.return_value = False
+        self.assertIsNone(verify(stored))
+        entity_cls.return_value.read.side_effect = utils.HTTPError
+        self.assertIsNone(verify(stored))
+
+
+class BatchedHelpersTestCase(TestCase):
+    """Tests for the batched search and read helpers."""
+
+    def setUp(self):
+        utils._permissions_index = None
+
+    def tearDown(self):
+        utils._permissions_index = None
+
+    def test_search_by_names(self):
+        """Names are searched in batches combined with ``or``."""
+        entity_cls = mock.MagicMock()
+        entity_cls.return_value.search.side_effect = [
+            [mock.Mock(label='a'), mock.Mock(label='c')],
+            [mock.Mock(label='b')],
+        ]
+        with mock.patch.object(utils, 'SEARCH_BATCH_SIZE', 2):
+            results = utils.search_by_names(
+                entity_cls,
+                ['a', 'c', 'b'],
+                field='label',
+                query={'search': 'organization_id = 1'},
+            )
+        self.assertEqual(list(results), ['a', 'c', 'b'])
+        self.assertEqual([len(found) for found in results.values()], [1] * 3)
+        searches = [
+            call[1]['query']['search']
+            for call in entity_cls.return_value.search.call_args_list
+        ]
+        self.assertEqual(searches, [
+            '(organization_id = 1) and (label = "a" or label = "c")',
+            '(organization_id = 1) and (label = "b")',
+        ])
+
+    def test_read_entities(self):
+        """Entities are read from the responses of the shared session."""
+        session = mock.Mock()
+        entity_list = [mock.Mock(), mock.Mock(), mock.Mock()]
+        for index, entity in enumerate(entity_list):
+            entity.path.return_value = '/api/entity/{0}'.format(index)
+            entity._server_config.get_client_kwargs.return_value = {}
+        with mock.patch.object(
+                utils, '_get_read_session', return_value=session):
+            read = utils.read_entities(entity_list, workers=2)
+        self.assertEqual(
+            read, [entity.read.return_value for entity in entity_list])
+        self.assertEqual(session.get.call_count, 3)
+        for entity in entity_list:
+            entity.read.assert_called_once_with(
+                attrs=session.get.return_value.json.return_value)
+
+    def test_read_session_per_process(self):
+        """The read session is reused, but not by forked processes."""
+        with mock.patch.object(utils, 'NailgunSession') as session_cls:
+            with mock.patch.object(utils.os, 'getpid', return_value=1):
+                session = utils._get_read_session()
+                self.assertIs(utils._get_read_session(), session)
+            with mock.patch.object(utils.os, 'getpid', return_value=2):
+                utils._get_read_session()
+        self.assertEqual(session_cls.call_count, 2)
+        utils._read_session = None
+
+    def test_enable_rhrepo_and_fetchid(self):
+        """The product, repository set and repository are searched by
+        name.
+        """
+        with mock.patch.multiple(
+                utils.entities, Product=mock.DEFAULT,
+                RepositorySet=mock.DEFAULT,
+                Repository=mock.DEFAULT) as entity_classes:
+            product = mock.Mock()
+            product.name = 'RHEL'
+            reposet = mock.Mock()
+            reposet.name = 'RHEL RPMs'
+            repo = mock.Mock(id=42)
+            repo.name = 'RHEL RPMs x86_64'
+            for name, found in (('Product', product),
+                                ('RepositorySet', reposet),
+                                ('Repository', repo)):
+                entity_classes[name].return_value.search.return_value = [
+                    found]
+            with mock.patch.object(
+                    utils, 'bz_bug_is_open', return_value=False):
+                repo_id = utils.enable_rhrepo_and_fetchid(
+                    'x86_64', 1, 'RHEL', 'RHEL RPMs x86_64', 'RHEL RPMs',
+                    None)
+        self.assertEqual(repo_id, 42)
+        entity_classes['RepositorySet'].assert_called_once_with(
+            product=product)
+        reposet.enable.assert_called_once_with(data={'basearch': 'x86_64'})
+        search = entity_classes['Repository'].return_value.search
+        self.assertEqual(search.call_args[1]['query']['search'],
+                         'name = "RHEL RPMs x86_64"')
+        self.assertEqual(search.call_args[1]['query']['organization_id'], 1)
+
+    def test_permissions_index_memoized(self):
+        """Permissions are searched only once per session."""
+        with mock.patch.object(utils.entities, 'Permission') as permission:
+            permission.return_value.search.return_value = [
+                mock.Mock(resource_type='Host'),
+            ]
+            permission.return_value.search.return_value[0].name = 'view_hosts'
+            index = utils.get_permissions_index()
+            self.assertIs(utils.get_permissions_index(), index)
+        self.assertEqual(list(index), ['view_hosts'])
+        self.assertEqual(permission.return_value.search.call_count, 1)
+
+    def test_create_role_permissions_not_found(self):
+        """Unknown permissions are reported without extra searches."""
+        utils._permissions_index = {}
+        with mock.patch.object(utils.entities, 'Filter') as filter_cls:
+            with self.assertRaises(utils.entities.APIResponseError):
+                utils.create_role_permissions(
+                    mock.Mock(), {None: ['unknown']})
+        filter_cls.assert_not_called()
@@ -0,0 +1,243 @@
+"""Tests for module ``robottelo.cleanup``."""
+from nailgun import entities
+
+from robottelo import cleanup
+from robottelo.cleanup import (
+    CleanupJournal,
+    EntitiesCleaner,
+    JournalEntitiesCleaner,
+    wait_for_cleanup_tasks,
+)
+
+TASK_1 = u'8b7aa4f2-6a4b-4bd1-9d4b-c3c2de5e0a21'
+TASK_2 = u'0f8c1a0e-3a7c-4cb0-8a0b-4e5e6d2c9a10'
+
+
+def make_cleaner(mocker, workers=4):
+    """Return a cleaner without signals connected."""
+    mocker.patch.object(EntitiesCleaner, 'connect_cleanup_signals')
+    return EntitiesCleaner(entities.Organization, workers=workers)
+
+
+def make_org(mocker, org_id, task_id=None):
+    """Return an organization mock whose deletion returns ``task_id``."""
+    org = mocker.Mock(spec=entities.Organization, id=org_id)
+    org.delete.return_value = {'id': task_id} if task_id else None
+    return org
+
+
+def test_delete_entities_single_host_search(mocker, tmpdir):
+    """Organizations hosts are found with a single search and organizations
+    with hosts are not deleted
+    """
+    host = mocker.Mock(organization=mocker.Mock(id=2))
+    host_entity = mocker.patch('robottelo.cleanup.entities.Host')
+    search = host_entity.return_value.search
+    search.return_value = [host]
+    orgs = [make_org(mocker, 1, TASK_1), make_org(mocker, 2, TASK_2)]
+    cleaner = make_cleaner(mocker)
+    cleaner.journal = CleanupJournal(str(tmpdir))
+    cleaner.delete_entities(orgs, synchronous=False)
+    assert search.call_count == 1
+    query = search.call_args[1]['query']
+    assert query['search'] == 'organization_id = 1 or organization_id = 2'
+    orgs[0].delete.assert_called_once_with(synchronous=False)
+    assert not orgs[1].delete.called
+    assert cleaner.deleted_entities[orgs[0].__class__.__name__] == {1}
+    assert cleaner.journal.pending_tasks() == [TASK_1]
+
+
+def test_delete_entities_skip_deleted(mocker):
+    """Already deleted entities are not deleted again"""
+    host_entity = mocker.patch('robottelo.cleanup.entities.Host')
+    host_entity.return_value.search.return_value = []
+    org = make_org(mocker, 1)
+    cleaner = make_cleaner(mocker, workers=1)
+    cleaner.delete_entities([org])
+    cleaner.delete_entities([org])
+    assert org.delete.call_count == 1
+
+
+def test_update_entities(mocker):
+    """Every entity is updated with the given fields"""
+    hosts = [mocker.Mock() for _ in range(5)]
+    cleaner = make_cleaner(mocker)
+    cleaner.update_entities(hosts, managed=False)
+    for host in hosts:
+        assert host.managed is False
+        host.update.assert_called_once_with(fields=['managed'])
+
+
+def test_clean_order(mocker):
+    """Organizations are deleted after hosts and host groups updates"""
+    calls = []
+    cleaner = make_cleaner(mocker)
+    org_entity = mocker.patch('robottelo.cleanup.entities.Organization')
+    org_entity.__name__ = 'Organization'
+    mocker.patch.object(
+        cleaner, 'update_entities',
+        side_effect=lambda entity_list, **kwargs: calls.append(
+            'hostgroup' if 'content_view' in kwargs else 'host'),
+    )
+    mocker.patch.object(
+        cleaner, 'delete_entities',
+        side_effect=lambda entity_list, **kwargs: calls.append('org'),
+    )
+    cleaner.clean()
+    assert calls == ['host', 'hostgroup', 'org']
+
+
+def test_wait_for_cleanup_tasks(mocker, tmpdir):
+    """Pending tasks of all the processes are polled together until they are
+    finished
+    """
+    mocker.patch('robottelo.cleanup.time.sleep')
+    journal = CleanupJournal(str(tmpdir))
+    journal.register_task(TASK_1)
+    mocker.patch('os.getpid', return_value=1)
+    journal.register_task(TASK_2)
+    task = mocker.patch('robottelo.cleanup.entities.ForemanTask')
+    task.__name__ = 'ForemanTask'
+    search = task.return_value.search
+    search.side_effect = [
+        [
+            mocker.Mock(id=TASK_1, state='stopped', result='success'),
+            mocker.Mock(id=TASK_2, state='running', result='pending'),
+        ],
+        [mocker.Mock(id=TASK_2, state='stopped', result='error')],
+    ]
+    failed = wait_for_cleanup_tasks(journal=journal)
+    assert failed == [TASK_2]
+    assert search.call_count == 2
+    assert search.call_args[1]['query']['search'] == 'id = {0}'.format(
+        TASK_2)
+    assert journal.pending_tasks() == []
+
+
+def test_wait_for_cleanup_tasks_timeout(mocker, tmpdir):
+    """Unfinished tasks stay pending, missing tasks are not awaited"""
+    mocker.patch('robottelo.cleanup.time.sleep')
+    journal = CleanupJournal(str(tmpdir))
+    journal.register_task(TASK_1)
+    journal.register_task(TASK_2)
+    task = mocker.patch('robottelo.cleanup.entities.ForemanTask')
+    task.__name__ = 'ForemanTask'
+    task.return_value.search.return_value = [
+        mocker.Mock(id=TASK_1, state='running', result='pending')]
+    assert wait_for_cleanup_tasks(timeout=0, journal=journal) == [TASK_1]
+    assert journal.pending_tasks() == [TASK_1]
+
+
+def test_journal_pending(mocker, tmpdir):
+    """Only the released and not cleaned entities are pending"""
+    journal = CleanupJournal(str(tmpdir))
+    journal.register(make_org(mocker, 1), 'TestA')
+    journal.register(make_org(mocker, 2), 'TestB')
+    journal.register(make_org(mocker, 3), 'TestA')
+    journal.release('TestA')
+    journal.mark_cleaned('Organization', 3)
+    assert [record['id'] for record in journal.pending()] == [1]
+    assert sorted(
+        record['id'] for record in journal.pending(released_only=False)
+    ) == [1, 2]
+
+
+def test_journal_ignores_truncated_records(mocker, tmpdir):
+    """Lines truncated by crashed processes are ignored"""
+    journal = CleanupJournal(str(tmpdir))
+    journal.register(make_org(mocker, 1), 'TestA')
+    tmpdir.join('0.jsonl').write('{"event": "crea')
+    assert len(journal.records()) == 1
+
+
+def test_journal_reap(mocker, tmpdir):
+    """Released entities are cleaned and organizations which could not be
+    deleted stay pending
+    """
+    def clean(cleaner):
+        orgs = cleaner.cleanup_queue['Organization']
+        assert sorted(org.id for org in orgs) == [1, 2]
+        cleaner.deleted_entities['Organization'].add(1)
+
+    journal = CleanupJournal(str(tmpdir))
+    for org_id in (1, 2):
+        journal.register(make_org(mocker, org_id), 'TestA')
+    journal.release('TestA')
+    mocker.patch(
+        'robottelo.cleanup.entities.Organization',
+        side_effect=lambda id: mocker.Mock(id=id),
+    ).__name__ = 'Organization'
+    mocker.patch.object(EntitiesCleaner, 'clean', autospec=True,
+                        side_effect=clean)
+    assert journal.reap() == 1
+    assert [record['id'] for record in journal.pending()] == [2]
+
+
+def test_journal_entities_cleaner(mocker, tmpdir):
+    """Journal cleaner records its entities and releases them on clean"""
+    mocker.patch.object(JournalEntitiesCleaner, 'connect_cleanup_signals')
+    mocker.patch.object(JournalEntitiesCleaner, 'disconnect_cleanup_signals')
+    journal = CleanupJournal(str(tmpdir))
+    cleaner = JournalEntitiesCleaner(
+        journal, 'TestA', entities.Organization)
+    cleaner.register_entity_for_cleanup(
+        entities.Organization, make_org(mocker, 1))
+    assert journal.pending() == []
+    cleaner.clean()
+    assert [record['id'] for record in journal.pending()] == [1]
+    assert cleaner.disconnect_cleanup_signals.called
+
+
+def test_journal_compact(mocker, tmpdir):
+    """The files of gone processes are merged without the cleaned entities
+    """
+    journal = CleanupJournal(str(tmpdir))
+    mocker.patch('os.getpid', return_value=1)
+    for org_id in (1, 2):
+        journal.register(make_org(mocker, org_id), 'TestA')
+    journal.release('TestA')
+    journal.register(make_org(mocker, 3), 'TestB')
+    journal.mark_cleaned('Organization', 1)
+    mocker.patch('os.getpid', return_value=2)
+    mocker.patch(
+        'robottelo.cleanup.process_alive', side_effect=lambda pid: pid == 2)
+    assert journal.compact() == 2
+    assert tmpdir.listdir() == [tmpdir.join('2.jsonl')]
+    assert [record['id'] for record in journal.pending()] == [2]
+    assert sorted(
+        record['id'] for record in journal.pending(released_only=False)
+    ) == [2, 3]
+    assert journal.compact() == 0
+
+
+def test_journal_compact_tasks(mocker, tmpdir):
+    """Finished tasks are dropped, unfinished ones stay pending"""
+    journal = CleanupJournal(str(tmpdir))
+    mocker.patch('os.getpid', return_value=1)
+    journal.register_task(TASK_1)
+    journal.register_task(TASK_2)
+    journal.mark_cleaned('ForemanTask', TASK_1)
+    mocker.patch('os.getpid', return_value=2)
+    mocker.patch(
+        'robottelo.cleanup.process_alive', side_effect=lambda pid: pid == 2)
+    assert journal.compact() == 2
+    assert journal.pending_tasks() == [TASK_2]
+
+
+def test_start_session_cleanup(mocker):
+    """The reaper is started by the session only in background mode"""
+    settings = mocker.patch('robottelo.cleanup.settings')
+    compact = mocker.patch.object(CleanupJournal, 'compact')
+    reaper = mocker.patch('robottelo.cleanup.CleanupReaper')
+    mocker.patch('robottelo.cleanup._REAPER', None)
+    for mode in ('class', 'deferred'):
+        settings.cleanup_mode = mode
+        cleanup.start_session_cleanup()
+    assert compact.call_count == 2
+    assert not reaper.called
+    settings.cleanup_mode = 'background'
+    mocker.patch.object(JournalEntitiesCleaner, 'connect_cleanup_signals')
+    cleanup.get_entities_cleaner('TestA', entities.Organization)
+    assert not reaper.called
+    cleanup.start_session_cleanup()
+    reaper.return_value.start.assert_called_once_with()
@@ -0,0 +1,56 @@
+"""Tests for Robottelo's CLI factory helpers"""
+from robottelo.cli import factory
+
+
+def test_create_objects_empty(mocker):
+    """No factory call is made when no entity is requested"""
+    make = mocker.Mock()
+    assert factory.create_objects(make, 0) == []
+    assert not make.called
+
+
+def test_create_objects_single_worker(mocker):
+    """Entities are created inline when only one worker is allowed"""
+    pool = mocker.patch('robottelo.cli.factory.Pool')
+    make = mocker.Mock(side_effect=[{'id': 1}, {'id': 2}])
+    assert factory.create_objects(
+        make, 2, {'name': 'foo'}, workers=1) == [{'id': 1}, {'id': 2}]
+    assert not pool.called
+    make.assert_called_with({'name': 'foo'})
+
+
+def test_create_objects_uses_process_pool(mocker):
+    """Entities are created by a reseeded pool bound to ``count``"""
+    pool = mocker.patch('robottelo.cli.factory.Pool')
+    make = mocker.Mock()
+    result = factory.create_objects(make, 3, {'organization-id': 1})
+    pool.assert_called_once_with(3, initializer=factory.random.seed)
+    pool.return_value.map.assert_called_once_with(
+        make, [{'organization-id': 1}] * 3)
+    assert result is pool.return_value.map.return_value
+    assert pool.return_value.join.called
+
+
+def test_make_fake_hosts_prepares_options_once(mocker):
+    """Shared fake host entities are resolved once for the whole batch"""
+    prepare = mocker.patch(
+        'robottelo.cli.factory._prepare_fake_host_options')
+    create = mocker.patch('robottelo.cli.factory.create_objects')
+    factory.make_fake_hosts(5, {'organization-id': 1})
+    prepare.assert_called_once_with({'organization-id': 1})
+    create.assert_called_once_with(
+        factory.make_host, 5, prepare.return_value, None)
+
+
+def test_capsule_setup_state_path(mocker):
+    """Capsule setups of the same virtual machine with other inputs do not
+    share their saved stages
+    """
+    capsule_vm = mocker.Mock(hostname='capsule.example.com')
+    path = factory._get_capsule_setup_state_path(
+        capsule_vm, {'org_id': 1, 'lce_id': 2})
+    assert path == factory._get_capsule_setup_state_path(
+        capsule_vm, {'lce_id': 2, 'org_id': 1})
+    assert path != factory._get_capsule_setup_state_path(
+        capsule_vm, {'org_id': 3, 'lce_id': 4})
+    assert 'capsule.example.com-' in path
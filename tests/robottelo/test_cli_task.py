@@ -0,0 +1,127 @@
+"""Tests for the async task helpers of Robottelo's CLI wrappers"""
+import pytest
+
+from robottelo.cli.base import CLIError
+from robottelo.cli.contentview import ContentView
+from robottelo.cli.repository import Repository
+from robottelo.cli.task import (
+    TASKS_TIMEOUT,
+    Task,
+    TaskFailedError,
+    TaskTimeoutError,
+)
+
+TASK_1 = u'8b7aa4f2-6a4b-4bd1-9d4b-c3c2de5e0a21'
+TASK_2 = u'0f8c1a0e-3a7c-4cb0-8a0b-4e5e6d2c9a10'
+
+
+@pytest.mark.parametrize(
+    'result',
+    [
+        [{u'id': TASK_1}],
+        [{u'message': u'Repository is being synchronized in task ' + TASK_1}],
+        {u'id': TASK_1},
+        u'Content view is being published with task {0}.'.format(TASK_1),
+    ]
+)
+def test_get_task_id(result):
+    """Task id is found on any of the known async outputs"""
+    assert Task.get_task_id(result) == TASK_1
+
+
+def test_get_task_id_not_found():
+    """CLIError is raised when async output has no task id"""
+    with pytest.raises(CLIError):
+        Task.get_task_id([{u'message': u'nothing here'}])
+
+
+def test_wait_for_tasks_single_poller(mocker):
+    """All pending tasks are polled with a single list command"""
+    mocker.patch('robottelo.cli.task.time.sleep')
+    task_list = mocker.patch('robottelo.cli.task.Task.list')
+    task_list.side_effect = [
+        [
+            {u'id': TASK_1, u'state': u'stopped', u'result': u'success'},
+            {u'id': TASK_2, u'state': u'running', u'result': u'pending'},
+        ],
+        [
+            {u'id': TASK_2, u'state': u'stopped', u'result': u'success'},
+        ],
+    ]
+    finished = Task.wait_for_tasks([TASK_1, TASK_2])
+    assert set(finished) == {TASK_1, TASK_2}
+    assert task_list.call_count == 2
+    first_search = task_list.call_args_list[0][0][0][u'search']
+    assert TASK_1 in first_search and TASK_2 in first_search
+    second_search = task_list.call_args_list[1][0][0][u'search']
+    assert second_search == u'id = {0}'.format(TASK_2)
+
+
+def test_wait_for_tasks_failed(mocker):
+    """TaskFailedError is raised when a task does not succeed"""
+    mocker.patch('robottelo.cli.task.Task.list', return_value=[
+        {u'id': TASK_1, u'state': u'stopped', u'result': u'success'},
+        {u'id': TASK_2, u'state': u'stopped', u'result': u'error'},
+    ])
+    with pytest.raises(TaskFailedError) as context:
+        Task.wait_for_tasks([TASK_1, TASK_2])
+    assert [task['id'] for task in context.value.tasks] == [TASK_2]
+
+
+def test_wait_for_tasks_paused(mocker):
+    """Paused tasks are finished and reported as failed"""
+    mocker.patch('robottelo.cli.task.Task.list', return_value=[
+        {u'id': TASK_1, u'state': u'stopped', u'result': u'success'},
+        {u'id': TASK_2, u'state': u'paused', u'result': u'error'},
+    ])
+    with pytest.raises(TaskFailedError) as context:
+        Task.wait_for_tasks([TASK_1, TASK_2])
+    assert [task['id'] for task in context.value.tasks] == [TASK_2]
+
+
+def test_wait_for_tasks_timeout(mocker):
+    """TaskTimeoutError is raised when tasks keep running"""
+    mocker.patch('robottelo.cli.task.time.sleep')
+    mocker.patch('robottelo.cli.task.Task.list', return_value=[
+        {u'id': TASK_1, u'state': u'running', u'result': u'pending'},
+    ])
+    with pytest.raises(TaskTimeoutError):
+        Task.wait_for_tasks([TASK_1], timeout=0)
+
+
+def test_repository_synchronize_many(mocker):
+    """Repositories syncs are started async and awaited together"""
+    synchronize = mocker.patch(
+        'robottelo.cli.repository.Repository.synchronize',
+        side_effect=[[{u'id': TASK_1}], [{u'id': TASK_2}]],
+    )
+    wait = mocker.patch('robottelo.cli.repository.Task.wait_for_tasks')
+    assert Repository.synchronize_many(
+        [{u'id': 1}, {u'id': 2}]) == wait.return_value
+    synchronize.assert_any_call({u'id': 1, u'async': True})
+    wait.assert_called_once_with([TASK_1, TASK_2], timeout=TASKS_TIMEOUT)
+
+
+def test_content_view_publish_many(mocker):
+    """Content view publishes are started async and awaited together"""
+    execute = mocker.patch(
+        'robottelo.cli.contentview.ContentView.execute',
+        side_effect=[[{u'id': TASK_1}], [{u'id': TASK_2}]],
+    )
+    wait = mocker.patch('robottelo.cli.contentview.Task.wait_for_tasks')
+    ContentView.publish_many([{u'id': 1}, {u'id': 2}], timeout=60)
+    assert u'--async' in execute.call_args[0][0]
+    assert ContentView.command_sub == 'publish'
+    wait.assert_called_once_with([TASK_1, TASK_2], timeout=60)
+
+
+def test_content_view_version_promote_many(mocker):
+    """Content view promotions are started async and awaited together"""
+    mocker.patch(
+        'robottelo.cli.contentview.ContentView.execute',
+        side_effect=[[{u'id': TASK_1}]],
+    )
+    wait = mocker.patch('robottelo.cli.contentview.Task.wait_for_tasks')
+    ContentView.version_promote_many([{u'id': 1, u'to-lifecycle-id': 2}])
+    assert ContentView.command_sub == 'version promote'
+    wait.assert_called_once_with([TASK_1], timeout=TASKS_TIMEOUT)
@@ -0,0 +1,98 @@
+"""Tests for the RHSM consumer simulator"""
+import unittest2
+
+from robottelo.consumer_simulator import (
+    CHECKIN,
+    REGISTER,
+    UPLOAD_PACKAGE_PROFILE,
+    ConsumerSimulator,
+    StubCandlepinServer,
+    generate_package_profile,
+)
+from robottelo.metrics import LatencyHistogram
+
+
+class LatencyHistogramTestCase(unittest2.TestCase):
+    """Tests for the latency histogram"""
+
+    def test_summary(self):
+        """Summary reports count, errors and percentiles"""
+        histogram = LatencyHistogram(buckets=(0.1, 1))
+        for value in (0.05, 0.2, 0.3, 2):
+            histogram.record(value)
+        histogram.record(0.5, error=True)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 5)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['min'], 0.05)
+        self.assertEqual(summary['max'], 2)
+        self.assertEqual(summary['p50'], 0.3)
+        self.assertEqual(
+            histogram.bucket_counts(), [(0.1, 1), (1, 3), (None, 1)])
+
+    def test_bounded_reservoir(self):
+        """Only a sample of the values is kept, the summary stays exact"""
+        histogram = LatencyHistogram(reservoir_size=100)
+        for value in range(1, 10001):
+            histogram.record(value / 1000.0)
+        self.assertEqual(len(histogram.values), 100)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 10000)
+        self.assertEqual(summary['min'], 0.001)
+        self.assertEqual(summary['max'], 10)
+        self.assertAlmostEqual(summary['mean'], 5.0005)
+        self.assertTrue(1 < summary['p50'] < 9)
+
+    def test_empty_summary(self):
+        """Empty histogram has no percentiles"""
+        summary = LatencyHistogram().summary()
+        self.assertEqual(summary['count'], 0)
+        self.assertIsNone(summary['p99'])
+
+
+class ConsumerSimulatorTestCase(unittest2.TestCase):
+    """Run the simulator against the local stub server"""
+
+    def test_generate_package_profile(self):
+        """Package profile has the requested size"""
+        profile = generate_package_profile(5)
+        self.assertEqual(len(profile), 5)
+        self.assertIn(u'name', profile[0])
+
+    def test_register_only(self):
+        """All consumers get registered when no duration is set"""
+        with StubCandlepinServer() as server:
+            recorder = ConsumerSimulator(
+                consumers=20,
+                organization='org',
+                url=server.url,
+                arrival_rate=1000,
+                concurrency=5,
+                packages=3,
+            ).run()
+            self.assertEqual(len(server.consumers), 20)
+        summary = recorder.summary()
+        self.assertEqual(list(summary), [REGISTER])
+        self.assertEqual(summary[REGISTER]['count'], 20)
+        self.assertEqual(summary[REGISTER]['errors'], 0)
+
+    def test_periodic_actions(self):
+        """Registered consumers check in and upload their profiles"""
+        with StubCandlepinServer(latency=0.01) as server:
+            simulator = ConsumerSimulator(
+                consumers=5,
+                organization='org',
+                url=server.url,
+                arrival_rate=1000,
+                concurrency=5,
+                checkin_interval=0.1,
+                profile_interval=0.2,
+                duration=0.5,
+                packages=3,
+            )
+            summary = simulator.run().summary()
+            self.assertEqual(len(simulator.registered), 5)
+            for consumer in server.consumers.values():
+                self.assertEqual(len(consumer[u'packages']), 3)
+        self.assertGreaterEqual(summary[CHECKIN]['count'], 10)
+        self.assertGreaterEqual(summary[UPLOAD_PACKAGE_PROFILE]['count'], 5)
@@ -0,0 +1,85 @@
+"""Tests for module ``robottelo.dns_watch``."""
+import os
+import subprocess
+
+import pytest
+
+from distutils.spawn import find_executable
+
+from robottelo import ssh
+from robottelo.dns_watch import parse_report, watch_resolution
+
+
+def test_parse_report_resolved():
+    """Latencies are read from the elapsed milliseconds"""
+    report = parse_report(
+        'capsule.example.com', ['authoritative 1500', 'resolver 4000'], 5)
+    assert report.resolved
+    assert report.authoritative_latency == 1.5
+    assert report.latency == 4.0
+    assert str(report) == (
+        'capsule.example.com resolved in 5.00s, '
+        'authoritative=1.50s, resolver=4.00s'
+    )
+
+
+def test_parse_report_not_resolved():
+    """Records not returned by the resolver are not resolved"""
+    report = parse_report('capsule.example.com', ['timeout 600000'])
+    assert not report.resolved
+    assert report.authoritative_latency is None
+    assert u'not resolved' in str(report)
+
+
+def test_watch_resolution_server(mocker):
+    """Records are watched from the Satellite server by default"""
+    command = mocker.patch('robottelo.ssh.command', return_value=(
+        ssh.SSHCommandResult(stdout=['authoritative 300', 'resolver 500'])))
+    report = watch_resolution(
+        'capsule.example.com', '192.168.0.10', timeout=60)
+    assert report.resolved
+    assert command.call_count == 1
+    assert command.call_args[1] == {'timeout': 90}
+    assert command.call_args[0][0].startswith(
+        'hostname=capsule.example.com; ip_addr=192.168.0.10; '
+        'authoritative=1; timeout=60; interval=0.2; max_interval=5'
+    )
+
+
+def test_watch_resolution_run(mocker):
+    """Records can be watched from any host"""
+    run = mocker.Mock(return_value=ssh.SSHCommandResult(
+        stdout='resolver 10\n'))
+    report = watch_resolution(
+        'capsule.example.com', '127.0.0.1', run=run, authoritative=False,
+        timeout=0)
+    assert report.latency == 0.01
+    assert 'authoritative=0; timeout=0;' in run.call_args[0][0]
+
+
+@pytest.mark.skipif(
+    not find_executable('bash') or not find_executable('getent'),
+    reason='Requires bash and getent')
+def test_watch_script_resolver_only(tmpdir):
+    """Records resolved but not served by the authoritative name servers are
+    resolved
+    """
+    # Name servers answering the NS queries only
+    dig = tmpdir.join('dig')
+    dig.write('#!/bin/sh\n[ "$2" = NS ] && echo ns1.localdomain.\n')
+    dig.chmod(0o755)
+    env = dict(os.environ)
+    env['PATH'] = u'{0}:{1}'.format(tmpdir, env['PATH'])
+
+    def run(script):
+        process = subprocess.Popen(
+            ['bash', '-c', script], env=env, stdout=subprocess.PIPE,
+            universal_newlines=True)
+        stdout = process.communicate()[0]
+        return ssh.SSHCommandResult(
+            stdout=stdout, return_code=process.returncode)
+
+    report = watch_resolution('localhost', '127.0.0.1', run=run, timeout=10)
+    assert report.resolved
+    assert report.authoritative_latency is None
+    assert report.elapsed < 10
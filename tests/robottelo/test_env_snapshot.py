@@ -0,0 +1,142 @@
+"""Tests for module ``robottelo.env_snapshot``."""
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import unittest2
+
+from robottelo.env_snapshot import EnvironmentSnapshot, fingerprint
+
+
+class EnvironmentSnapshotTestCase(unittest2.TestCase):
+    """Tests for :class:`robottelo.env_snapshot.EnvironmentSnapshot`."""
+
+    def setUp(self):
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.snapshot_dir)
+        self.built = []
+
+    def builder(self, piece, value):
+        """Return a build callable recording that ``piece`` was built."""
+        def build():
+            self.built.append(piece)
+            return value
+        return build
+
+    def setup_environment(self, inputs=None, reuse=True, verify=None):
+        """Build an environment with a ``base`` piece and a dependent
+        ``leaf`` piece.
+        """
+        with EnvironmentSnapshot(
+                'test', inputs or {'org': 1}, reuse=reuse,
+                snapshot_dir=self.snapshot_dir) as snapshot:
+            snapshot.get_or_build(
+                'base', self.builder('base', {'id': 1}), verify)
+            snapshot.get_or_build(
+                'leaf', self.builder('leaf', {'id': 2}), requires=('base',))
+        return snapshot
+
+    def test_fingerprint_is_stable(self):
+        """Fingerprint does not depend on the inputs ordering"""
+        self.assertEqual(
+            fingerprint({'a': 1, 'b': [1, 2]}),
+            fingerprint({'b': [1, 2], 'a': 1}),
+        )
+        self.assertNotEqual(fingerprint({'a': 1}), fingerprint({'a': 2}))
+
+    def test_reuse(self):
+        """Intact pieces are reused by the next setup"""
+        self.setup_environment()
+        snapshot = self.setup_environment()
+        self.assertEqual(self.built, ['base', 'leaf'])
+        self.assertEqual(snapshot.reused, {'base', 'leaf'})
+        self.assertEqual(
+            snapshot.entities, {'base': {'id': 1}, 'leaf': {'id': 2}})
+
+    def test_different_inputs(self):
+        """Pieces built for other inputs are not reused"""
+        self.setup_environment({'org': 1})
+        self.setup_environment({'org': 2})
+        self.assertEqual(self.built, ['base', 'leaf'] * 2)
+
+    def test_rebuild_not_intact(self):
+        """A piece failing verification is rebuilt along with the pieces
+        requiring it
+        """
+        self.setup_environment()
+        snapshot = self.setup_environment(verify=lambda stored: None)
+        self.assertEqual(self.built, ['base', 'leaf'] * 2)
+        self.assertEqual(snapshot.rebuilt, {'base', 'leaf'})
+
+    def test_verify_updates_value(self):
+        """The value returned by verify is used and saved"""
+        self.setup_environment()
+        snapshot = self.setup_environment(
+            verify=lambda stored: dict(stored, name='base'))
+        self.assertEqual(snapshot.entities['base'], {'id': 1, 'name': 'base'})
+        with open(snapshot.path) as handler:
+            saved = json.load(handler)
+        self.assertEqual(saved['entities']['base'], {'id': 1, 'name': 'base'})
+
+    def test_no_reuse(self):
+        """All pieces are rebuilt when reuse is disabled"""
+        self.setup_environment()
+        snapshot = self.setup_environment(reuse=False)
+        self.assertEqual(self.built, ['base', 'leaf'] * 2)
+        self.assertEqual(snapshot.reused, set())
+
+    def test_failed_setup_is_resumed(self):
+        """Pieces built before a failure are reused by the next setup"""
+        def fail():
+            raise ValueError('fail')
+        with self.assertRaises(ValueError):
+            with EnvironmentSnapshot(
+                    'test', {'org': 1},
+                    snapshot_dir=self.snapshot_dir) as snapshot:
+                snapshot.get_or_build('base', self.builder('base', {'id': 1}))
+                snapshot.get_or_build('leaf', fail, requires=('base',))
+        snapshot = self.setup_environment()
+        self.assertEqual(self.built, ['base', 'leaf'])
+        self.assertEqual(snapshot.reused, {'base'})
+
+    def test_discard(self):
+        """Discarded snapshots are rebuilt"""
+        snapshot = self.setup_environment()
+        snapshot.discard()
+        self.assertFalse(os.path.exists(snapshot.path))
+        self.setup_environment()
+        self.assertEqual(self.built, ['base', 'leaf'] * 2)
+
+    def test_stored(self):
+        """Values stored by a previous setup are returned unverified"""
+        self.setup_environment()
+        with EnvironmentSnapshot(
+                'test', {'org': 1},
+                snapshot_dir=self.snapshot_dir) as snapshot:
+            self.assertEqual(snapshot.stored('base'), {'id': 1})
+            self.assertIsNone(snapshot.stored('unknown'))
+            self.assertEqual(snapshot.reused, set())
+
+    def test_build_from_threads(self):
+        """Pieces built from different threads are all saved"""
+        pieces = ['piece{0}'.format(index) for index in range(10)]
+        with EnvironmentSnapshot(
+                'test', {'org': 1},
+                snapshot_dir=self.snapshot_dir) as snapshot:
+            threads = [
+                threading.Thread(
+                    target=snapshot.get_or_build,
+                    args=(piece, self.builder(piece, {'id': piece})),
+                )
+                for piece in pieces
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(snapshot.rebuilt, set(pieces))
+        with open(snapshot.path) as handler:
+            self.assertEqual(
+                sorted(json.load(handler)['entities']), sorted(pieces))
@@ -0,0 +1,48 @@
+"""Tests for module ``robottelo.decorators.func_locker``."""
+import threading
+import time
+
+import pytest
+
+from robottelo.decorators import func_locker
+from robottelo.decorators.func_locker import FileSemaphore
+
+
+@pytest.fixture(autouse=True)
+def lock_dir(mocker, tmpdir):
+    """Keep the lock files in a temporary directory."""
+    mocker.patch.object(func_locker, 'LOCK_DIR', str(tmpdir))
+
+
+def test_semaphore_slots():
+    """Up to ``size`` holders acquire different slots"""
+    first = FileSemaphore('test', 2)
+    second = FileSemaphore('test', 2)
+    assert {first.acquire(), second.acquire()} == {0, 1}
+    first.release()
+    second.release()
+
+
+def test_semaphore_waits_for_free_slot():
+    """Acquiring waits until a slot is released"""
+    holder = FileSemaphore('test', 1)
+    waiter = FileSemaphore('test', 1, poll_rate=0.01)
+    holder.acquire()
+    thread = threading.Thread(target=waiter.acquire)
+    thread.start()
+    time.sleep(0.1)
+    assert waiter.slot is None
+    holder.release()
+    thread.join(5)
+    assert waiter.slot == 0
+    assert waiter.wait_time >= 0.1
+    waiter.release()
+
+
+def test_semaphore_context_manager():
+    """Slot is released when leaving the with block"""
+    with FileSemaphore('test', 1) as semaphore:
+        assert semaphore.slot == 0
+    assert semaphore.slot is None
+    with FileSemaphore('test', 1) as semaphore:
+        assert semaphore.slot == 0
@@ -0,0 +1,118 @@
+"""Tests for module ``robottelo.libvirt_discovery``."""
+import json
+
+import pytest
+
+from robottelo import libvirt_discovery, ssh
+from robottelo.libvirt_discovery import (
+    GuestRegistry,
+    LibvirtGuest,
+    LibvirtGuestError,
+)
+
+
+@pytest.fixture
+def registry(tmpdir):
+    """Return a registry stored in a temporary directory."""
+    return GuestRegistry('libvirt.example.com', registry_dir=str(tmpdir))
+
+
+@pytest.fixture
+def guest_registry(registry, mocker):
+    """Make the guests use ``registry``."""
+    mocker.patch.object(
+        libvirt_discovery, 'get_guest_registry', return_value=registry)
+    return registry
+
+
+def read_guests(registry):
+    """Return the guests stored in the registry."""
+    with open(registry.path) as handler:
+        return json.load(handler)
+
+
+def test_allocate(registry):
+    """Allocated MAC addresses and names are unique"""
+    allocations = [registry.allocate('br0') for _ in range(20)]
+    assert len(set(name for name, _ in allocations)) == 20
+    assert len(set(mac for _, mac in allocations)) == 20
+    name, mac = allocations[0]
+    assert name == 'mac{0}'.format(mac.replace(':', ''))
+    extra_mac = registry.allocate_mac(name)
+    assert read_guests(registry)[name]['macs'] == [mac, extra_mac]
+
+
+def test_allocate_given_mac(registry):
+    """Given MAC addresses are used once"""
+    assert registry.allocate('br0', '52:54:00:00:00:01') == (
+        'mac525400000001', '52:54:00:00:00:01')
+    with pytest.raises(LibvirtGuestError):
+        registry.allocate('br0', '52:54:00:00:00:01')
+    registry.release('mac525400000001')
+    registry.allocate('br0', '52:54:00:00:00:01')
+
+
+def test_dead_owner(registry, mocker):
+    """Allocations of processes which are gone are released"""
+    name, _ = registry.allocate('br0')
+    mocker.patch.object(
+        libvirt_discovery, 'process_alive', return_value=False)
+    registry.allocate('br0')
+    assert name not in read_guests(registry)
+
+
+def test_slots(registry, mocker):
+    """Running guests on a bridge are limited to max_guests"""
+    registry.max_guests = 1
+    first, _ = registry.allocate('br0')
+    second, _ = registry.allocate('br0')
+    other, _ = registry.allocate('br1')
+    registry.acquire_slot(first)
+    registry.acquire_slot(other)
+    mocker.patch('time.sleep')
+    with pytest.raises(LibvirtGuestError):
+        registry.acquire_slot(second, timeout=0)
+    registry.release(first)
+    registry.acquire_slot(second, timeout=0)
+    assert read_guests(registry)[second]['running']
+
+
+def test_guest_lifecycle(guest_registry, mocker):
+    """Guests allocate their MAC and release it when destroyed"""
+    command = mocker.patch(
+        'robottelo.ssh.command', return_value=ssh.SSHCommandResult())
+    guest = LibvirtGuest(
+        libvirt_server='libvirt.example.com', bridge='br0',
+        image_dir='/var/lib/libvirt/images', extra_nic=True)
+    with guest:
+        guests = read_guests(guest_registry)
+        assert guests[guest.guest_name]['running']
+        macs = guests[guest.guest_name]['macs']
+        assert macs[0] == guest.mac
+        assert '--mac={0}'.format(macs[1]) in command.call_args_list[0][0][0]
+    assert guest.guest_name not in read_guests(guest_registry)
+
+
+def test_create_many(guest_registry, mocker):
+    """Guests are created concurrently and destroyed together"""
+    command = mocker.patch(
+        'robottelo.ssh.command', return_value=ssh.SSHCommandResult())
+    with LibvirtGuest.create_many(
+            3, libvirt_server='libvirt.example.com', bridge='br0',
+            image_dir='/var/lib/libvirt/images') as guests:
+        assert len(set(guest.mac for guest in guests)) == 3
+        assert command.call_count == 3
+        assert len(read_guests(guest_registry)) == 3
+    assert command.call_count == 12
+    assert read_guests(guest_registry) == {}
+
+
+def test_create_many_failure(guest_registry, mocker):
+    """All the guests are destroyed when one can not be created"""
+    mocker.patch('robottelo.ssh.command', side_effect=lambda cmd, host: (
+        ssh.SSHCommandResult(return_code=1)))
+    with pytest.raises(LibvirtGuestError):
+        LibvirtGuest.create_many(
+            2, libvirt_server='libvirt.example.com', bridge='br0',
+            image_dir='/var/lib/libvirt/images')
+    assert read_guests(guest_registry) == {}
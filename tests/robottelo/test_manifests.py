@@ -0,0 +1,266 @@
+"""Tests for module ``robottelo.manifests``."""
+import json
+import os
+import time
+import zipfile
+
+import pytest
+import requests
+import six
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from robottelo import manifests
+from robottelo.decorators import func_locker
+from robottelo.manifests import ManifestCloner, ManifestPool, download_cached
+
+
+@pytest.fixture(scope='module')
+def private_key():
+    """Generate a manifest signing key."""
+    return rsa.generate_private_key(65537, 1024, default_backend())
+
+
+@pytest.fixture
+def cloner(private_key):
+    """Return a cloner with a minimal manifest template."""
+    consumer_export = six.BytesIO()
+    with zipfile.ZipFile(
+            consumer_export, 'w', zipfile.ZIP_DEFLATED) as export_zip:
+        export_zip.writestr(
+            'export/consumer.json', json.dumps({'uuid': 'template'}))
+        export_zip.writestr('export/meta.json', '{}')
+        for index in (1, 2):
+            export_zip.writestr(
+                'export/entitlements/ent{0}.json'.format(index),
+                json.dumps({
+                    'id': 'ent{0}'.format(index),
+                    'quantity': 10,
+                    'pool': {'id': 'pool{0}'.format(index), 'quantity': 10},
+                    'certificates': [{'serial': {'id': index}}],
+                })
+            )
+            export_zip.writestr(
+                'export/entitlement_certificates/{0}.pem'.format(index),
+                'certificate {0}'.format(index)
+            )
+    template = six.BytesIO()
+    with zipfile.ZipFile(template, 'w') as template_zip:
+        template_zip.writestr(
+            'consumer_export.zip', consumer_export.getvalue())
+    return ManifestCloner(
+        template=template.getvalue(),
+        signing_key=private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        ),
+    )
+
+
+def read_consumer_export(manifest, private_key):
+    """Verify the manifest signature and return its consumer export zip."""
+    manifest_zip = zipfile.ZipFile(manifest)
+    consumer_export = manifest_zip.read('consumer_export.zip')
+    verifier = private_key.public_key().verifier(
+        manifest_zip.read('signature'), padding.PKCS1v15(), hashes.SHA256())
+    verifier.update(consumer_export)
+    verifier.verify()
+    consumer_zip = zipfile.ZipFile(six.BytesIO(consumer_export))
+    assert consumer_zip.testzip() is None
+    return consumer_zip
+
+
+def read_manifest(manifest, private_key):
+    """Verify the manifest signature and return its consumer uuid."""
+    consumer_zip = read_consumer_export(manifest, private_key)
+    return json.loads(
+        consumer_zip.read('export/consumer.json').decode('utf-8'))['uuid']
+
+
+def test_clone(cloner, private_key):
+    """Clones are signed and have a new consumer uuid"""
+    uuids = {
+        read_manifest(cloner.clone(), private_key) for _ in range(2)}
+    assert len(uuids) == 2
+    assert 'template' not in uuids
+
+
+def test_pool_get(cloner, private_key):
+    """Pool clones are pre-generated and unique"""
+    pool = ManifestPool(cloner, size=3, workers=2)
+    try:
+        uuids = {read_manifest(pool.get(), private_key) for _ in range(6)}
+    finally:
+        pool.stop()
+    assert len(uuids) == 6
+    assert len(pool._clones) <= 3 + pool.workers
+
+
+def test_pool_spill(cloner, private_key, tmpdir):
+    """Extra clones are spilled to disk and shared between pools"""
+    spill_dir = str(tmpdir)
+    pool = ManifestPool(
+        cloner, size=1, spill_dir=spill_dir, spill_size=2, workers=1)
+    pool.start()
+    try:
+        deadline = time.time() + 30
+        while len(pool._spilled()) < 2:
+            if time.time() > deadline:
+                pytest.fail('Clones were not spilled to disk')
+            time.sleep(0.01)
+    finally:
+        pool.stop()
+    other = ManifestPool(cloner, size=0, spill_dir=spill_dir, spill_size=2)
+    other._threads = ['running']  # do not generate clones
+    uuids = {read_manifest(other.get(), private_key) for _ in range(2)}
+    assert len(uuids) == 2
+    assert os.listdir(spill_dir) == []
+
+
+def test_pool_after_fork(cloner, mocker, tmpdir):
+    """Forked processes take stored clones and never generate any"""
+    pool = ManifestPool(
+        cloner, size=1, spill_dir=str(tmpdir), spill_size=1, workers=1)
+    pool._clones.append(b'parent clone')
+    pool._spill(b'stored clone')
+    pool._pid = -1
+    generate = mocker.patch.object(ManifestPool, '_generate')
+    assert pool.get().getvalue() == b'stored clone'
+    manifest = pool.get()
+    assert manifest.getvalue() not in (b'parent clone', b'stored clone')
+    assert not generate.called
+    assert pool._threads == []
+
+
+def test_template_entries_memoized(cloner, mocker):
+    """The template zip is read only once for all the clones"""
+    zip_file = mocker.spy(zipfile, 'ZipFile')
+    cloner.clone()
+    reads = zip_file.call_count
+    cloner.clone()
+    # Only the manifest zip written by the second clone is opened
+    assert zip_file.call_count == reads + 1
+
+
+def test_download_cached(mocker, tmpdir):
+    """Downloads are cached on disk and revalidated with their ETag"""
+    get = mocker.patch('robottelo.manifests.requests.get')
+    get.return_value = mocker.Mock(
+        status_code=200, content=b'template', headers={'ETag': '"v1"'})
+    url = 'http://example.org/manifest.zip'
+    cache_dir = str(tmpdir)
+    assert download_cached(url, cache_dir) == b'template'
+    assert download_cached(url, cache_dir) == b'template'
+    assert get.call_count == 1
+
+    get.return_value = mocker.Mock(status_code=304)
+    assert download_cached(url, cache_dir, max_age=0) == b'template'
+    assert get.call_args[1]['headers'] == {'If-None-Match': '"v1"'}
+
+    get.side_effect = requests.exceptions.ConnectionError('unreachable')
+    assert download_cached(url, cache_dir, max_age=0) == b'template'
+
+
+def test_download_cached_lock_timeout(mocker, tmpdir):
+    """Processes wait longer than the download for the cache lock"""
+    lock = mocker.patch('robottelo.manifests.file_lock')
+    get = mocker.patch('robottelo.manifests.requests.get')
+    get.return_value = mocker.Mock(
+        status_code=200, content=b'template', headers={})
+    download_cached('http://example.org/manifest.zip', str(tmpdir))
+    assert lock.call_args[1]['timeout'] == manifests.DOWNLOAD_LOCK_TIMEOUT
+    assert get.call_args[1]['timeout'] < manifests.DOWNLOAD_LOCK_TIMEOUT
+
+
+def test_download_cached_failure(mocker, tmpdir):
+    """Download errors are raised when nothing is cached"""
+    mocker.patch(
+        'robottelo.manifests.requests.get',
+        side_effect=requests.exceptions.ConnectionError('unreachable'),
+    )
+    with pytest.raises(requests.exceptions.ConnectionError):
+        download_cached('http://example.org/manifest.zip', str(tmpdir))
+
+
+def test_upload_manifest_locked(mocker, tmpdir):
+    """Manifest is uploaded holding an upload slot, which is released"""
+    mocker.patch.object(func_locker, 'LOCK_DIR', str(tmpdir))
+    subscription = mocker.patch('robottelo.manifests.entities.Subscription')
+    mocker.patch.object(manifests.settings.fake_manifest,
+                        'upload_concurrency', 1)
+    manifests.UPLOAD_METRICS.reset()
+    manifest = manifests.Manifest(six.BytesIO(b'manifest'))
+    result = manifests.upload_manifest_locked(1, manifest)
+    assert result == subscription.return_value.upload.return_value
+    files = subscription.return_value.upload.call_args[1]['files']
+    assert files['content'].read() == b'manifest'
+    assert manifests.UPLOAD_METRICS.histogram('slot_wait').count == 1
+    # The slot was released
+    with func_locker.FileSemaphore('manifest_upload', 1) as semaphore:
+        assert semaphore.slot == 0
+
+
+def test_raw_zip_round_trip():
+    """Raw members are copied without changes"""
+    archive = six.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as archive_zip:
+        archive_zip.writestr('deflated.txt', 'a' * 100)
+        archive_zip.writestr(
+            zipfile.ZipInfo('stored.txt', (2017, 1, 2, 3, 4, 6)), 'stored')
+    members = manifests.read_raw_zip(archive.getvalue())
+    members.append(
+        manifests.RawZipMember.from_content(u'n\xe9w.json', u'{}'))
+    rebuilt = zipfile.ZipFile(six.BytesIO(manifests.write_raw_zip(members)))
+    assert rebuilt.testzip() is None
+    assert rebuilt.read('deflated.txt') == b'a' * 100
+    assert rebuilt.read('stored.txt') == b'stored'
+    assert rebuilt.getinfo('stored.txt').date_time == (2017, 1, 2, 3, 4, 6)
+    assert rebuilt.read(u'n\xe9w.json') == b'{}'
+
+
+def test_builder_edit_entitlements(cloner, private_key):
+    """Entitlements are edited and removed along with their certificates"""
+    builder = cloner.builder()
+    assert list(builder.entitlements()) == ['ent1', 'ent2']
+    builder.set_quantity('ent1', 3)
+    builder.update_pool('ent1', productId='RH1')
+    builder.remove_entitlement('ent2')
+    builder.set_consumer_uuid('consumer')
+    consumer_zip = read_consumer_export(builder.build(), private_key)
+    assert sorted(consumer_zip.namelist()) == [
+        'export/consumer.json',
+        'export/entitlement_certificates/1.pem',
+        'export/entitlements/ent1.json',
+        'export/meta.json',
+    ]
+    entitlement = json.loads(consumer_zip.read(
+        'export/entitlements/ent1.json').decode('utf-8'))
+    assert entitlement['quantity'] == 3
+    assert entitlement['pool'] == {
+        'id': 'pool1', 'quantity': 3, 'productId': 'RH1'}
+    consumer = json.loads(
+        consumer_zip.read('export/consumer.json').decode('utf-8'))
+    assert consumer['uuid'] == 'consumer'
+
+
+def test_builder_copies_unchanged_members(cloner):
+    """Only the edited members are compressed again"""
+    builder = cloner.builder()
+    builder.set_quantity('ent1', 3)
+    template = dict(
+        (member.name, member) for member in cloner._template_members())
+    members = dict(
+        (member.name, member) for member in manifests.read_raw_zip(
+            zipfile.ZipFile(builder.build()).read('consumer_export.zip')))
+    for name in ('export/meta.json', 'export/entitlements/ent2.json'):
+        assert members[name].data == template[name].data
+    assert (members['export/entitlements/ent1.json'].data !=
+            template['export/entitlements/ent1.json'].data)
+
+
+def test_builder_unknown_entitlement(cloner):
+    """KeyError is raised for unknown entitlements"""
+    with pytest.raises(KeyError):
+        cloner.builder().set_quantity('unknown', 1)
@@ -0,0 +1,105 @@
+"""Tests for the concurrent stage pipeline"""
+import os
+import tempfile
+import threading
+import traceback
+import unittest2
+
+from robottelo.pipeline import Pipeline, PipelineError
+
+
+class PipelineTestCase(unittest2.TestCase):
+    """Tests for :class:`robottelo.pipeline.Pipeline`"""
+
+    def setUp(self):
+        """Create a temporary state file path"""
+        handler, self.state_path = tempfile.mkstemp(suffix='.json')
+        os.close(handler)
+        os.remove(self.state_path)
+
+    def tearDown(self):
+        """Remove the state file if left behind"""
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def test_unknown_requirement(self):
+        """Stages can only require already defined stages"""
+        pipeline = Pipeline('test')
+        with self.assertRaises(ValueError):
+            pipeline.add_stage('b', lambda results: None, requires=('a',))
+
+    def test_targets(self):
+        """Only the target stages and their requirements are run"""
+        pipeline = Pipeline('test')
+        pipeline.add_stage('a', lambda results: 1)
+        pipeline.add_stage('b', lambda results: results['a'] + 1,
+                           requires=('a',))
+        pipeline.add_stage('c', lambda results: 3)
+        self.assertEqual(pipeline.run(targets=('b',)), {'a': 1, 'b': 2})
+        with self.assertRaises(ValueError):
+            pipeline.run(targets=('d',))
+
+    def test_results_and_requirements(self):
+        """Stages get the results of their requirements"""
+        pipeline = Pipeline('test', state_path=self.state_path)
+        pipeline.add_stage('a', lambda results: 1)
+        pipeline.add_stage('b', lambda results: 2)
+        pipeline.add_stage(
+            'c', lambda results: results['a'] + results['b'],
+            requires=('a', 'b'))
+        self.assertEqual(pipeline.run(), {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(set(pipeline.timings), {'a', 'b', 'c'})
+        self.assertFalse(os.path.exists(self.state_path))
+
+    def test_independent_stages_overlap(self):
+        """Independent stages run at the same time"""
+        barrier = threading.Event()
+
+        def first(results):
+            """Wait until second stage runs"""
+            if not barrier.wait(5):
+                raise AssertionError('stages did not overlap')
+
+        pipeline = Pipeline('test')
+        pipeline.add_stage('first', first)
+        pipeline.add_stage('second', lambda results: barrier.set())
+        pipeline.run()
+
+    def test_resume_after_failure(self):
+        """A failed pipeline resumes from the failed stage"""
+        calls = []
+
+        def fail_once(results):
+            """Fail only on the first call"""
+            calls.append('b')
+            if calls.count('b') == 1:
+                raise RuntimeError('boom')
+            return results['a']
+
+        pipeline = Pipeline('test', state_path=self.state_path)
+        pipeline.add_stage('a', lambda results: calls.append('a') or 'a')
+        pipeline.add_stage('b', fail_once, requires=('a',))
+        with self.assertRaises(PipelineError) as context:
+            pipeline.run()
+        self.assertEqual(context.exception.stage, 'b')
+        self.assertIsInstance(context.exception.error, RuntimeError)
+        self.assertEqual(
+            traceback.extract_tb(context.exception.traceback)[-1][2],
+            'fail_once'
+        )
+        self.assertTrue(os.path.exists(self.state_path))
+        self.assertEqual(pipeline.run(), {'a': 'a', 'b': 'a'})
+        self.assertEqual(calls, ['a', 'b', 'b'])
+
+    def test_no_resume(self):
+        """All stages run again when resume is disabled"""
+        calls = []
+        pipeline = Pipeline('test', state_path=self.state_path)
+        pipeline.add_stage('a', lambda results: calls.append('a'))
+        pipeline.add_stage(
+            'b', lambda results: 1 / 0, requires=('a',))
+        with self.assertRaises(PipelineError):
+            pipeline.run()
+        with self.assertRaises(PipelineError):
+            pipeline.run(resume=False)
+        self.assertEqual(calls, ['a', 'a'])
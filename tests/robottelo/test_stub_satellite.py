@@ -0,0 +1,143 @@
+"""Tests for :mod:`robottelo.stub_satellite`"""
+import pytest
+
+from nailgun import entities, entity_mixins
+from robottelo.cli.base import Base
+from robottelo.cli.contentview import ContentView
+from robottelo.cli.org import Org
+from robottelo.cli.repository import Repository
+from robottelo.cli.task import Task
+from robottelo.stub_satellite import (
+    StubSatelliteServer,
+    StubSatelliteStore,
+    StubSearchError,
+    StubSSHServer,
+    parse_search,
+)
+from robottelo import ssh
+
+
+@pytest.mark.parametrize(
+    'search, expected',
+    [
+        ('name = "a"', ['a']),
+        ('name=a or name="b c"', ['a', 'b c']),
+        ('label ~ "x" and name != "a"', ['b c']),
+        ('(id = 2) and (name = "a" or name = "b c")', ['b c']),
+        ('name ~ a', ['a']),
+        ('', ['a', 'b c']),
+    ]
+)
+def test_parse_search(search, expected):
+    """Search queries are matched like the server does"""
+    records = [
+        {'id': 1, 'name': 'a', 'label': 'x_a'},
+        {'id': 2, 'name': 'b c', 'label': 'x_b'},
+    ]
+    predicate = parse_search(search)
+    assert [rec['name'] for rec in records if predicate(rec)] == expected
+
+
+def test_parse_search_invalid():
+    """Unbalanced searches are reported"""
+    with pytest.raises(StubSearchError):
+        parse_search('(name = a')
+
+
+def test_store_tasks_finish_after_duration(mocker):
+    """Tasks keep running for the task duration then run their action"""
+    store = StubSatelliteStore(task_duration=10)
+    now = mocker.patch('robottelo.stub_satellite.time.time')
+    now.return_value = 100
+    finish = mocker.Mock()
+    task = store.start_task('Publish', finish)
+    assert store.task(task['id'])['state'] == 'running'
+    now.return_value = 110
+    assert store.task(task['id'])['result'] == 'success'
+    finish.assert_called_once_with(task)
+
+
+@pytest.fixture
+def server_config():
+    """Run a stub server and make NailGun use it"""
+    previous = (
+        entity_mixins.DEFAULT_SERVER_CONFIG, entity_mixins.CREATE_MISSING)
+    with StubSatelliteServer() as server:
+        entity_mixins.DEFAULT_SERVER_CONFIG = server.server_config()
+        entity_mixins.CREATE_MISSING = True
+        yield server
+    (entity_mixins.DEFAULT_SERVER_CONFIG,
+     entity_mixins.CREATE_MISSING) = previous
+
+
+def test_nailgun_content_flow(server_config):
+    """NailGun factories work against the stub server"""
+    org = entities.Organization().create()
+    lce = entities.LifecycleEnvironment(organization=org).create()
+    assert lce.prior.id == org.library.id
+    product = entities.Product(organization=org).create()
+    repo = entities.Repository(product=product).create()
+    assert repo.sync()['result'] == 'success'
+    content_view = entities.ContentView(
+        organization=org, repository=[repo]).create()
+    content_view.publish()
+    version = content_view.read().version[0]
+    version.promote(data={'environment_id': lce.id})
+    assert {env.id for env in version.read().environment} == {
+        org.library.id, lce.id}
+    found = entities.Organization().search(
+        query={'search': 'name="{0}"'.format(org.name)})
+    assert [entity.id for entity in found] == [org.id]
+
+
+@pytest.fixture
+def ssh_server(mocker):
+    """Run the SSH stub with the settings needed by the CLI"""
+    settings = mocker.Mock()
+    settings.locale = 'en_US.UTF-8'
+    settings.performance = None
+    settings.server.admin_username = 'admin'
+    settings.server.admin_password = 'changeme'
+    settings.ssh_client.command_timeout = 30
+    mocker.patch('robottelo.cli.base.settings', settings)
+    mocker.patch('robottelo.ssh.settings', settings)
+    mocker.patch.object(Base, 'command_requires_org', False)
+    with StubSSHServer() as server:
+        yield server
+
+
+def test_hammer_content_flow(ssh_server):
+    """CLI factories work against the hammer emulation"""
+    org = Org.create({'name': 'stub org'})
+    assert org['library'] == 'Library'
+    repo = Repository.create({'name': 'repo', 'product-id': 1})
+    task_id = Task.get_task_id(
+        Repository.synchronize({'id': repo['id'], 'async': True}))
+    assert Task.wait_for_tasks([task_id])[task_id]['result'] == 'success'
+    content_view = ContentView.create(
+        {'name': 'cv', 'organization-id': org['id']})
+    ContentView.publish({'id': content_view['id']})
+    assert ContentView.info(
+        {'id': content_view['id']})['next-version'] == '2'
+    assert Org.list({'search': 'name=\\"stub org\\"'}) == [
+        {'id': org['id'], 'name': 'stub org', 'label': 'stub_org'}]
+    assert ssh_server.unmatched == []
+
+
+def test_hammer_not_found(ssh_server):
+    """Missing entities exit with an error"""
+    result = ssh.command('hammer -u admin -p pass organization info --id 9')
+    assert result.return_code == 65
+
+
+def test_replies(ssh_server, tmpdir):
+    """Recorded replies are used before the hammer emulation"""
+    replies = tmpdir.join('replies.json')
+    replies.write('[{"command": "organization list", "stdout": "Id\\n7\\n"}]')
+    ssh_server.load_replies(str(replies))
+    ssh_server.add_reply(r'^rpm -q (\w+)', lambda match: (
+        match.group(1) + '-1.0', '', 0))
+    assert Org.list() == [{'id': '7'}]
+    assert ssh.command('rpm -q katello').stdout == ['katello-1.0']
+    assert ssh.command('ls /tmp').return_code == 0
+    assert ssh_server.unmatched == ['ls /tmp']
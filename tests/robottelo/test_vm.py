@@ -34,8 +34,8 @@ class VirtualMachineTestCase(unittest2.TestCase):
     @patch('time.sleep')
     @patch('robottelo.ssh.command', side_effect=[
         ssh.SSHCommandResult(),
-        ssh.SSHCommandResult(stdout=['(192.168.0.1)']),
-        ssh.SSHCommandResult()
+        ssh.SSHCommandResult(
+            stdout=['ip 1000 192.168.0.1', 'ssh 2000 192.168.0.1']),
     ])
     def test_dont_create_if_already_created(
             self, ssh_command, sleep):
@@ -51,7 +51,7 @@ class VirtualMachineTestCase(unittest2.TestCase):
             vm.create()
             vm.create()
         self.assertEqual(vm.ip_addr, '192.168.0.1')
-        self.assertEqual(ssh_command.call_count, 3)
+        self.assertEqual(ssh_command.call_count, 2)
 
     def test_invalid_distro(self):
         """Check if an exception is raised if an invalid distro is passed"""
@@ -113,3 +113,63 @@ class VirtualMachineTestCase(unittest2.TestCase):
         ]
 
         self.assertListEqual(ssh_command.call_args_list, ssh_command_args_list)
+
+    def test_create_many(self):
+        """Check if create_many creates and destroys all the VMs"""
+        self.configure_provisoning_server()
+        with patch.object(VirtualMachine, 'create') as create, \
+                patch.object(VirtualMachine, 'destroy') as destroy:
+            with VirtualMachine.create_many(3, workers=2, tag='many') as vms:
+                self.assertEqual(len(vms), 3)
+                self.assertEqual(create.call_count, 3)
+                self.assertEqual(destroy.call_count, 0)
+                self.assertEqual(
+                    len(set(vm.hostname for vm in vms)), 3)
+        self.assertEqual(create.call_count, 3)
+        self.assertEqual(destroy.call_count, 3)
+
+    def test_create_many_failure(self):
+        """Check if all the VMs are destroyed when one fails"""
+        self.configure_provisoning_server()
+        with patch.object(
+                VirtualMachine, 'create', side_effect=[
+                    None, VirtualMachineError('snap-guest'), None]), \
+                patch.object(VirtualMachine, 'destroy') as destroy:
+            with self.assertRaises(VirtualMachineError):
+                VirtualMachine.create_many(3, workers=1)
+        self.assertEqual(destroy.call_count, 3)
+
+    def test_create_many_unique_arguments(self):
+        """Check if create_many rejects arguments which must be unique"""
+        self.configure_provisoning_server()
+        with self.assertRaises(VirtualMachineError):
+            VirtualMachine.create_many(2, hostname='client.example.com')
+
+    @patch('robottelo.vm.wait_ready')
+    @patch('robottelo.ssh.command', return_value=ssh.SSHCommandResult())
+    def test_snapshot_revert(self, ssh_command, wait_ready):
+        """Check if snapshots are taken, restored and removed"""
+        self.configure_provisoning_server()
+        vm = VirtualMachine(image_dir='/opt/robottelo/images')
+        vm._created = True
+        vm.snapshot('registered')
+        wait_ready.return_value.ready = True
+        wait_ready.return_value.ip_addr = '192.168.0.2'
+        vm.revert('registered')
+        self.assertEqual(vm.ip_addr, '192.168.0.2')
+        with self.assertRaises(VirtualMachineError):
+            vm.revert('unknown')
+        vm.destroy()
+        self.assertListEqual(
+            [args[0][0] for args in ssh_command.call_args_list[:2]],
+            [
+                'virsh snapshot-create-as {0} registered --atomic'.format(
+                    vm.hostname),
+                'virsh snapshot-revert {0} registered --running'.format(
+                    vm.hostname),
+            ]
+        )
+        self.assertEqual(
+            ssh_command.call_args_list[3][0][0],
+            'virsh undefine {0} --snapshots-metadata'.format(vm.hostname)
+        )
@@ -0,0 +1,64 @@
+"""Tests for module ``robottelo.vm_capsule``."""
+import pytest
+
+from robottelo.vm import VirtualMachine
+from robottelo.vm_capsule import CapsuleVirtualMachine
+from robottelo.vm_image import VirtualMachineImage
+
+
+@pytest.fixture
+def settings(mocker):
+    """Configure the distros and the capsule."""
+    mocker.patch('robottelo.vm_capsule.setting_is_set', return_value=True)
+    settings = mocker.patch('robottelo.vm_capsule.settings')
+    settings.capsule.domain = 'example.com'
+    settings.capsule.instance_name = 'capsule'
+    settings.capsule.hostname = 'capsule.example.com'
+    settings.capsule.use_image = True
+    settings.server.hostname = 'satellite.example.com'
+    settings.cdn = True
+    settings.capsule_repo = None
+    vm_settings = mocker.patch('robottelo.vm.settings')
+    vm_settings.distro.image_el6 = 'rhel68'
+    vm_settings.distro.image_el7 = 'rhel73'
+    vm_settings.clients.provisioning_server = 'provisioning.example.com'
+    vm_settings.clients.image_dir = '/opt/images'
+    return settings
+
+
+def test_capsule_image(settings):
+    """The capsule image depends on the distro and the packages origin"""
+    image = CapsuleVirtualMachine(distro='rhel7').capsule_image()
+    assert image.name.startswith('capsule-rhel7-')
+    assert image.provisioning_server == 'provisioning.example.com'
+    settings.capsule_repo = 'http://capsule/repo'
+    assert CapsuleVirtualMachine(
+        distro='rhel7').capsule_image().name != image.name
+
+
+def test_create_from_image(settings, mocker):
+    """Capsules created from the image are re-identified, then set up"""
+    get_or_build = mocker.patch.object(VirtualMachineImage, 'get_or_build')
+    reidentify = mocker.patch.object(VirtualMachineImage, 'reidentify')
+    create = mocker.patch.object(VirtualMachine, 'create')
+    setup = mocker.patch.object(CapsuleVirtualMachine, '_setup_capsule')
+    capsule_vm = CapsuleVirtualMachine(distro='rhel7')
+    capsule_vm.create()
+    assert get_or_build.call_args[1] == {'cpu': 4, 'ram': 16384}
+    assert capsule_vm.source_image.endswith('-base')
+    assert create.call_count == 1
+    reidentify.assert_called_once_with(capsule_vm)
+    assert setup.call_count == 1
+    assert list(capsule_vm.timings) == ['image', 'vm', 'reidentify']
+
+
+def test_create_without_image(settings, mocker):
+    """Capsules are created from the distro image when disabled"""
+    get_or_build = mocker.patch.object(VirtualMachineImage, 'get_or_build')
+    mocker.patch.object(VirtualMachine, 'create')
+    mocker.patch.object(CapsuleVirtualMachine, '_setup_capsule')
+    capsule_vm = CapsuleVirtualMachine(distro='rhel7', use_image=False)
+    capsule_vm.create()
+    assert get_or_build.call_count == 0
+    assert capsule_vm.source_image is None
+    assert list(capsule_vm.timings) == ['vm']
@@ -0,0 +1,156 @@
+"""Tests for module ``robottelo.vm_image``."""
+import json
+import re
+
+import pytest
+
+from robottelo import ssh
+from robottelo.vm import VirtualMachine, VirtualMachineError
+from robottelo.vm_image import VirtualMachineImage
+
+REGISTRATION = {
+    'org': 'org1',
+    'activation_key': 'ak1',
+    'lce': None,
+    'releasever': None,
+    'auto_attach': False,
+}
+
+
+@pytest.fixture
+def settings(mocker):
+    """Configure the distros."""
+    settings = mocker.patch('robottelo.vm.settings')
+    settings.distro.image_el6 = 'rhel68'
+    settings.distro.image_el7 = 'rhel73'
+    return settings
+
+
+@pytest.fixture
+def image(settings):
+    """Return an image on a fake provisioning server."""
+    return VirtualMachineImage(
+        'agent', distro='rhel7',
+        provisioning_server='provisioning.example.com',
+        image_dir='/opt/images',
+    )
+
+
+def test_metadata(image, mocker):
+    """The metadata is read along with the image existence"""
+    command = mocker.patch('robottelo.ssh.command', return_value=(
+        ssh.SSHCommandResult(stdout=[json.dumps({'distro': 'rhel73'})])))
+    assert image.metadata() == {'distro': 'rhel73'}
+    assert image.exists()
+    assert command.call_args[0][0] == (
+        'test -f /opt/images/agent-base.img && '
+        'cat /opt/images/agent-base.json')
+    command.return_value = ssh.SSHCommandResult(return_code=1)
+    assert image.metadata() is None
+    assert not image.exists()
+
+
+def test_save(image, mocker):
+    """The generalized virtual machine disk is flattened into the image"""
+    command = mocker.patch(
+        'robottelo.ssh.command', return_value=ssh.SSHCommandResult())
+    vm = VirtualMachine(
+        provisioning_server='provisioning.example.com',
+        image_dir='/opt/images', target_image='client')
+    vm._created = True
+    vm.registration = REGISTRATION
+    image.save(vm)
+    commands = [call[0][0] for call in command.call_args_list]
+    assert 'subscription-manager clean' in commands[0]
+    assert "rpm -qa 'katello-ca-consumer*' | xargs -r rpm -e" in commands[0]
+    assert (
+        'done && virsh domstate client.example.com | grep -q "shut off" && '
+        'qemu-img convert -O qcow2 /opt/images/client.example.com.img '
+        '/opt/images/agent-base.img.') in commands[1]
+    assert re.search(
+        r'ln (/opt/images/agent-base\.img\.\w+\.tmp) '
+        r'/opt/images/agent-base\.img && .*rm -f \1 ', commands[1])
+    assert json.dumps(
+        {'distro': 'rhel73', 'registration': REGISTRATION},
+    ) in commands[1]
+    assert commands[2] == 'virsh destroy client.example.com'
+
+
+def test_save_failure(image, mocker):
+    """The virtual machine is destroyed even if it could not be saved"""
+    command = mocker.patch('robottelo.ssh.command', side_effect=[
+        ssh.SSHCommandResult(),
+        ssh.SSHCommandResult(return_code=1, stderr='no space left'),
+        ssh.SSHCommandResult(),
+        ssh.SSHCommandResult(),
+        ssh.SSHCommandResult(),
+    ])
+    vm = VirtualMachine(
+        provisioning_server='provisioning.example.com',
+        image_dir='/opt/images')
+    vm._created = True
+    with pytest.raises(VirtualMachineError):
+        image.save(vm)
+    assert command.call_count == 5
+
+
+def test_clone(image, mocker):
+    """Clones are re-identified and registered again with the current CA"""
+    mocker.patch.object(image, 'metadata', return_value={
+        'distro': 'rhel73', 'registration': REGISTRATION})
+    create = mocker.patch.object(VirtualMachine, 'create', autospec=True)
+    run = mocker.patch.object(VirtualMachine, 'run')
+    install_ca = mocker.patch.object(VirtualMachine, 'install_katello_ca')
+
+    def register_mock(vm, **kwargs):
+        assert install_ca.called
+        vm._subscribed = True
+
+    register = mocker.patch.object(
+        VirtualMachine, 'register_contenthost', side_effect=register_mock,
+        autospec=True)
+    vm = image.clone(tag='clone')
+    assert vm.source_image == 'agent-base'
+    assert vm.provisioning_server == 'provisioning.example.com'
+    assert create.call_count == 1
+    assert register.call_args[1] == REGISTRATION
+    assert run.call_args_list[0][0][0].startswith(
+        u'hostname={0}\n'.format(vm.hostname))
+    assert 'service goferd restart' in run.call_args_list[1][0][0]
+
+
+def test_reidentify_unregistered(image, mocker):
+    """Clones of images saved unregistered are not registered"""
+    run = mocker.patch.object(VirtualMachine, 'run')
+    register = mocker.patch.object(VirtualMachine, 'register_contenthost')
+    install_ca = mocker.patch.object(VirtualMachine, 'install_katello_ca')
+    vm = VirtualMachine(
+        distro='rhel7', provisioning_server='provisioning.example.com',
+        source_image=image.base_image)
+    image.reidentify(vm, {'distro': 'rhel73', 'registration': None})
+    assert run.call_count == 1
+    assert register.call_count == 0
+    assert install_ca.call_count == 0
+
+
+def test_clone_missing(image, mocker):
+    """Cloning an image which was not saved fails"""
+    mocker.patch.object(image, 'metadata', return_value=None)
+    with pytest.raises(VirtualMachineError):
+        image.clone()
+
+
+def test_get_or_build(image, mocker, tmpdir):
+    """Images are built only when missing"""
+    mocker.patch('robottelo.vm_image.VM_IMAGE_LOCK_DIR', str(tmpdir))
+    exists = mocker.patch.object(image, 'exists', return_value=True)
+    save = mocker.patch.object(image, 'save')
+    create = mocker.patch.object(VirtualMachine, 'create')
+    configure = mocker.Mock()
+    image.get_or_build(configure)
+    assert configure.call_count == 0
+    exists.return_value = False
+    image.get_or_build(configure)
+    assert create.call_count == 1
+    assert configure.call_count == 1
+    assert save.call_count == 1
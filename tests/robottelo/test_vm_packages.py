@@ -0,0 +1,88 @@
+"""Tests for module ``robottelo.vm_packages``."""
+import pytest
+
+from robottelo import ssh
+from robottelo.vm import VirtualMachine, VirtualMachineError
+
+
+@pytest.fixture
+def vm(mocker):
+    """Return a created virtual machine."""
+    settings = mocker.patch('robottelo.vm.settings')
+    settings.distro.image_el6 = 'rhel68'
+    settings.distro.image_el7 = 'rhel73'
+    vm = VirtualMachine(
+        distro='rhel7', provisioning_server='provisioning.example.com')
+    vm._created = True
+    return vm
+
+
+@pytest.fixture
+def run(vm, mocker):
+    """Mock the commands run on the virtual machine, all succeeding."""
+    return mocker.patch.object(
+        vm, 'run', return_value=ssh.SSHCommandResult())
+
+
+def test_single_transaction(vm, run, mocker):
+    """Packages are installed by a single yum command, then configured"""
+    start = mocker.patch.object(vm, '_start_katello_agent')
+    with vm.packages() as transaction:
+        vm.install_katello_agent(transaction)
+        vm.download_install_rpm(
+            'http://repo.example.com/', 'bear-4.1-1.noarch', transaction)
+        transaction.install('katello-agent', 'walrus')
+        assert run.call_count == 0
+        assert start.call_count == 0
+    script = run.call_args_list[0][0][0]
+    assert script.count('yum install') == 1
+    assert script.endswith(
+        'yum install -y katello-agent walrus ./bear-4.1-1.noarch.rpm')
+    assert "-A bear-4.1-1.noarch.rpm http://repo.example.com/" in script
+    assert run.call_args_list[1][0][0] == (
+        'rpm -q katello-agent walrus bear-4.1-1.noarch')
+    assert start.call_count == 1
+
+
+def test_install_right_away(vm, run, mocker):
+    """Without a transaction packages are installed right away"""
+    mocker.patch.object(vm, '_configure_puppet_agent')
+    vm.configure_puppet('http://repo.example.com/rhel.repo')
+    script = run.call_args_list[0][0][0]
+    assert script.startswith(
+        'wget -O /etc/yum.repos.d/rhel.repo '
+        'http://repo.example.com/rhel.repo')
+    assert script.endswith('yum install -y puppet')
+
+
+def test_install_failure(vm, run, mocker):
+    """The packages not installed are reported"""
+    start = mocker.patch.object(vm, '_start_katello_agent')
+    run.side_effect = [
+        ssh.SSHCommandResult(),
+        ssh.SSHCommandResult(
+            stdout=['walrus-0.71-1.noarch',
+                    'package katello-agent is not installed'],
+            return_code=1,
+        ),
+    ]
+    with pytest.raises(VirtualMachineError) as context:
+        with vm.packages() as transaction:
+            transaction.install('walrus')
+            vm.install_katello_agent(transaction)
+    assert u'Failed to install katello-agent:' in str(context.value)
+    assert start.call_count == 0
+
+
+def test_package_mirror(vm, run, mocker):
+    """The package mirror of the distro is added to the clients"""
+    settings = mocker.patch('robottelo.vm_packages.settings')
+    settings.distro.image_el6 = 'rhel68'
+    settings.distro.image_el7 = 'rhel73'
+    settings.clients.package_mirror = {
+        'rhel7': 'http://mirror.example.com/el7'}
+    with vm.packages() as transaction:
+        transaction.install('walrus')
+    script = run.call_args_list[0][0][0]
+    assert 'baseurl=http://mirror.example.com/el7\n' in script
+    assert 'cost=100\n' in script
@@ -0,0 +1,213 @@
+"""Tests for module ``robottelo.vm_pool``."""
+import json
+import os
+import time
+
+import pytest
+
+from robottelo import ssh, vm_pool
+from robottelo.vm import VirtualMachine
+from robottelo.vm_pool import LEASED, READY, VMPool
+
+
+@pytest.fixture
+def settings(mocker):
+    """Configure the distros and the provisioning server."""
+    settings = mocker.patch('robottelo.vm.settings')
+    settings.distro.image_el6 = 'rhel68'
+    settings.distro.image_el7 = 'rhel73'
+    settings.clients.provisioning_server = 'provisioning.example.com'
+    settings.clients.image_dir = '/opt/robottelo/images'
+    return settings
+
+
+@pytest.fixture
+def pool(tmpdir, settings):
+    """Return a pool storing its state in a temporary directory."""
+    return VMPool(
+        {'rhel73': 2, 'rhel68': 1},
+        provisioning_server='provisioning.example.com',
+        image_dir='/opt/robottelo/images',
+        pool_dir=str(tmpdir),
+    )
+
+
+@pytest.fixture
+def ssh_command(mocker):
+    """Mock the SSH commands, all succeeding."""
+    return mocker.patch(
+        'robottelo.ssh.command', return_value=ssh.SSHCommandResult())
+
+
+@pytest.fixture
+def create(mocker):
+    """Mock the creation of virtual machines, giving them an IP address."""
+    created = []
+
+    def create_mock(vm):
+        vm._created = True
+        vm.ip_addr = '192.168.0.{0}'.format(len(created) + 1)
+        created.append(vm._target_image)
+
+    mocker.patch.object(
+        VirtualMachine, 'create', side_effect=create_mock, autospec=True)
+    return created
+
+
+def read_state(pool):
+    """Return the virtual machines stored in the pool state."""
+    with open(pool.path) as handler:
+        return json.load(handler)
+
+
+def test_fill(pool, create):
+    """Every distro quota is booted, up to the pool size"""
+    assert pool.fill() == 3
+    vms = read_state(pool)
+    assert sorted(vm['distro'] for vm in vms) == [
+        'rhel68', 'rhel73', 'rhel73']
+    assert {vm['state'] for vm in vms} == {READY}
+    assert sorted(vm['name'] for vm in vms) == sorted(create)
+    assert pool.fill() == 0
+    pool.size = 2
+    pool.release(vms[0]['name'])
+    assert pool.fill() == 0
+
+
+def test_fill_failure(pool, mocker):
+    """Virtual machines failing to boot are removed from the pool"""
+    mocker.patch.object(
+        VirtualMachine, 'create', side_effect=Exception('snap-guest'))
+    assert pool.fill() == 3
+    assert read_state(pool) == []
+
+
+def test_lease(pool, create, ssh_command, mocker):
+    """Ready virtual machines are leased once and the pool refilled"""
+    refill = mocker.patch.object(pool, 'refill')
+    pool.fill()
+    entry = pool.lease('rhel68')
+    assert entry['ip_addr'] in ('192.168.0.1', '192.168.0.2', '192.168.0.3')
+    assert entry['owner'] == os.getpid()
+    assert [vm['state'] for vm in read_state(pool)
+            if vm['name'] == entry['name']] == [LEASED]
+    assert pool.lease('rhel68') is None
+    assert refill.call_count == 2
+
+
+def test_lease_unreachable(pool, create, ssh_command, mocker):
+    """Unreachable virtual machines are destroyed instead of leased"""
+    mocker.patch.object(pool, 'refill')
+    pool.fill()
+    ssh_command.side_effect = [
+        ssh.SSHCommandResult(return_code=1),
+        ssh.SSHCommandResult(),
+        ssh.SSHCommandResult(),
+        ssh.SSHCommandResult(),
+        ssh.SSHCommandResult(),
+    ]
+    entry = pool.lease('rhel73')
+    assert entry is not None
+    assert [vm['name'] for vm in read_state(pool)
+            if vm['distro'] == 'rhel73'] == [entry['name']]
+    assert u'virsh destroy' in ssh_command.call_args_list[1][0][0]
+
+
+def test_maintain(pool, create, ssh_command, mocker):
+    """Maintained pools are filled in background and not refilled by the
+    leases
+    """
+    refill = mocker.patch.object(pool, 'refill')
+    pool.maintain(interval=0.01)
+    try:
+        for _ in range(500):
+            if os.path.exists(pool.path) and len([
+                    vm for vm in read_state(pool)
+                    if vm['state'] == READY]) == 3:
+                break
+            time.sleep(0.01)
+        else:
+            pytest.fail('The maintained pool was not filled')
+        assert pool.lease('rhel68') is not None
+        assert refill.call_count == 0
+    finally:
+        pool.stop()
+
+
+def test_release(pool, create, ssh_command, mocker):
+    """Released virtual machines are removed or recycled"""
+    mocker.patch.object(pool, 'refill')
+    pool.fill()
+    entry = pool.lease('rhel68')
+    pool.release(entry['name'], recycle=True)
+    assert pool.lease('rhel68')['name'] == entry['name']
+    assert pool.release(entry['name'])['name'] == entry['name']
+    assert pool.release(entry['name']) is None
+    assert pool.lease('rhel68') is None
+
+
+def test_state_after_fork(pool, mocker):
+    """Forked processes do not wait for the locks held by the parent"""
+    pool._state_lock.acquire()
+    mocker.patch('os.getpid', return_value=os.getpid() + 1)
+    with pool._state() as vms:
+        assert vms == []
+
+
+def test_abandoned(pool, create, ssh_command, mocker):
+    """Expired leases and leases of dead processes are destroyed"""
+    mocker.patch.object(pool, 'refill')
+    pool.fill()
+    expired = pool.lease('rhel73')
+    dead = pool.lease('rhel73')
+    with pool._state() as vms:
+        for vm in vms:
+            if vm['name'] == expired['name']:
+                vm['since'] = time.time() - pool.max_lease_age - 1
+            if vm['name'] == dead['name']:
+                vm['owner'] = -1
+    mocker.patch.object(
+        vm_pool, 'process_alive', side_effect=lambda pid: pid != -1)
+    ssh_command.reset_mock()
+    assert pool.fill() == 2
+    destroyed = ' '.join(
+        call[0][0] for call in ssh_command.call_args_list)
+    assert u'virsh destroy {0}'.format(expired['name']) in destroyed
+    assert u'virsh destroy {0}'.format(dead['name']) in destroyed
+
+
+def test_drain(pool, create, ssh_command, mocker):
+    """Draining destroys the ready virtual machines only"""
+    mocker.patch.object(pool, 'refill')
+    pool.fill()
+    entry = pool.lease('rhel68')
+    assert pool.drain() == 2
+    assert [vm['name'] for vm in read_state(pool)] == [entry['name']]
+
+
+def test_virtual_machine_lease(pool, settings, ssh_command, mocker):
+    """Default virtual machines are leased from the pool and released"""
+    mocker.patch('robottelo.vm.get_vm_pool', return_value=pool)
+    lease = mocker.patch.object(pool, 'lease', return_value={
+        'name': 'pool1234', 'ip_addr': '192.168.0.1'})
+    release = mocker.patch.object(pool, 'release')
+    vm = VirtualMachine(distro='rhel7')
+    vm.create()
+    lease.assert_called_once_with('rhel73')
+    assert vm.ip_addr == '192.168.0.1'
+    assert vm.target_image == 'pool1234.example.com'
+    assert ssh_command.call_count == 0
+    vm.destroy()
+    release.assert_called_once_with('pool1234')
+    assert u'virsh destroy pool1234.example.com' in (
+        ssh_command.call_args_list[0][0][0])
+
+
+def test_virtual_machine_not_leased(pool, settings, create, mocker):
+    """Customized virtual machines are not leased from the pool"""
+    mocker.patch('robottelo.vm.get_vm_pool', return_value=pool)
+    lease = mocker.patch.object(pool, 'lease')
+    VirtualMachine(ram=2048)._lease()
+    VirtualMachine(use_pool=False)._lease()
+    VirtualMachine(tag='longrun')._lease()
+    assert lease.call_count == 0
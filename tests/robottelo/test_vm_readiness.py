@@ -0,0 +1,69 @@
+"""Tests for module ``robottelo.vm_readiness``."""
+import pytest
+
+from robottelo import ssh
+from robottelo.vm import VirtualMachine, VirtualMachineError
+from robottelo.vm_readiness import parse_report, wait_ready
+
+
+def test_parse_report_ready():
+    """Stage timings are computed from the elapsed milliseconds"""
+    report = parse_report(
+        'client', ['ip 1500 10.0.0.2', 'ssh 4000 10.0.0.2'], 5)
+    assert report.ready
+    assert report.ip_addr == '10.0.0.2'
+    assert list(report.stages.items()) == [('ip', 1.5), ('ssh', 2.5)]
+    assert report.slowest_stage == 'ssh'
+    assert str(report) == (
+        'client ready in 5.00s, stages: ip=1.50s, ssh=2.50s')
+
+
+@pytest.mark.parametrize('lines, failed_stage', [
+    (['timeout 120000 ip'], 'ip'),
+    (['ip 1000 10.0.0.2', 'timeout 120000 ssh'], 'ssh'),
+    ([], 'ip'),
+    (['ip 1000 10.0.0.2'], 'ssh'),
+])
+def test_parse_report_not_ready(lines, failed_stage):
+    """The first stage not completed is reported as failed"""
+    report = parse_report('client', lines)
+    assert not report.ready
+    assert report.failed_stage == failed_stage
+    assert u'{0} stage timed out'.format(failed_stage) in str(report)
+
+
+def test_wait_ready(mocker):
+    """A single command waits for all the stages"""
+    command = mocker.patch('robottelo.ssh.command', return_value=(
+        ssh.SSHCommandResult(stdout=['ip 10 10.0.0.2', 'ssh 20 10.0.0.2'])))
+    report = wait_ready(
+        'client.example.com', 'client', 'provisioning.example.com',
+        timeout=60)
+    assert report.ready
+    assert command.call_count == 1
+    script, server = command.call_args[0]
+    assert server == 'provisioning.example.com'
+    assert command.call_args[1] == {'timeout': 90}
+    assert script.startswith(
+        'domain=client.example.com; name=client; timeout=60; interval=0.5')
+
+
+def test_virtual_machine_not_ready(mocker):
+    """The virtual machine is destroyed when a stage times out"""
+    settings = mocker.patch('robottelo.vm.settings')
+    settings.distro.image_el7 = 'rhel73'
+    command = mocker.patch('robottelo.ssh.command', side_effect=[
+        ssh.SSHCommandResult(),
+        ssh.SSHCommandResult(
+            stdout=['ip 10 10.0.0.2', 'timeout 120000 ssh'], return_code=1),
+        ssh.SSHCommandResult(),
+        ssh.SSHCommandResult(),
+        ssh.SSHCommandResult(),
+    ])
+    vm = VirtualMachine(
+        provisioning_server='provisioning.example.com',
+        image_dir='/opt/robottelo/images', use_pool=False)
+    with pytest.raises(VirtualMachineError) as context:
+        vm.create()
+    assert 'Failed to connect to SSH port' in str(context.value)
+    assert 'virsh destroy' in command.call_args_list[2][0][0]
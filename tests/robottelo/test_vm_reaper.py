@@ -0,0 +1,131 @@
+"""Tests for module ``robottelo.vm_reaper``."""
+import json
+
+import pytest
+
+from robottelo import ssh, vm_reaper
+from robottelo.vm import VirtualMachine
+from robottelo.vm_reaper import VMReaper
+
+
+@pytest.fixture
+def reaper(tmpdir):
+    """Return a reaper recording the virtual machines in a temporary
+    directory.
+    """
+    return VMReaper(registry_dir=str(tmpdir))
+
+
+@pytest.fixture
+def ssh_command(mocker):
+    """Mock the SSH commands, all succeeding."""
+    return mocker.patch(
+        'robottelo.ssh.command', return_value=ssh.SSHCommandResult())
+
+
+def read_registry(reaper):
+    """Return the names of the recorded virtual machines."""
+    with open(reaper.path) as handler:
+        return [domain['name'] for domain in json.load(handler)]
+
+
+def test_destroy_batch(reaper, ssh_command, mocker):
+    """The virtual machines of a host are destroyed by a single command"""
+    reaper.register('provisioning.example.com', 'vm1', '/images/vm1.img')
+    reaper.register('provisioning.example.com', 'vm2', '/images/vm2.img')
+    callback = mocker.Mock()
+    reaper._destroy_batch('provisioning.example.com', [
+        ('provisioning.example.com', 'vm1', '/images/vm1.img', False,
+         callback),
+        ('provisioning.example.com', 'vm2', '/images/vm2.img', True, None),
+    ])
+    assert ssh_command.call_count == 1
+    assert ssh_command.call_args[0][0] == (
+        'virsh destroy vm1; virsh undefine vm1; rm -f /images/vm1.img\n'
+        'virsh destroy vm2; virsh undefine vm2 --snapshots-metadata; '
+        'rm -f /images/vm2.img'
+    )
+    assert ssh_command.call_args[1] == {
+        'hostname': 'provisioning.example.com'}
+    assert read_registry(reaper) == []
+    assert callback.call_count == 1
+
+
+def test_destroy_wait(reaper, ssh_command):
+    """Queued destructions are waited for"""
+    reaper.destroy('provisioning1.example.com', 'vm1', '/images/vm1.img')
+    reaper.destroy('provisioning2.example.com', 'vm2', '/images/vm2.img')
+    assert reaper.wait(timeout=10)
+    assert reaper._pending == {}
+    hosts = sorted(call[1]['hostname'] for call in ssh_command.call_args_list)
+    assert hosts == ['provisioning1.example.com', 'provisioning2.example.com']
+
+
+def test_sweep(reaper, ssh_command, mocker):
+    """Virtual machines of gone processes or tagged are orphaned"""
+    reaper.register('provisioning.example.com', 'vm1', '/images/vm1.img')
+    reaper.register('provisioning.example.com', 'vm2', '/images/vm2.img')
+    with reaper._domains() as domains:
+        domains[0]['owner'] = -1
+    mocker.patch.object(
+        vm_reaper, 'process_alive', side_effect=lambda pid: pid != -1)
+    destroy = mocker.patch.object(reaper, 'destroy')
+    assert reaper.sweep() == 1
+    destroy.assert_called_once_with(
+        'provisioning.example.com', 'vm1', '/images/vm1.img',
+        snapshots=True)
+    ssh_command.return_value = ssh.SSHCommandResult(
+        stdout=['vm1', 'vm2', 'test3', 'other', 'pool1234'])
+    settings = mocker.patch('robottelo.vm_reaper.settings')
+    settings.clients.image_dir = '/images'
+    destroy.reset_mock()
+    assert reaper.sweep(['provisioning.example.com'], tag='test') == 1
+    destroy.assert_called_once_with(
+        'provisioning.example.com', 'test3', '/images/test3.img',
+        snapshots=True)
+    assert reaper.sweep(['provisioning.example.com'], tag='po') == 0
+
+
+def test_flush(reaper, ssh_command, mocker):
+    """Flushing destroys the orphaned and the tagged virtual machines, except
+    the pool ones
+    """
+    settings = mocker.patch('robottelo.vm_reaper.settings')
+    settings.clients.provisioning_servers = []
+    settings.clients.provisioning_server = 'provisioning.example.com'
+    settings.clients.image_dir = '/images'
+    settings.clients.sweep_tag = 'run-'
+    reaper.register('provisioning.example.com', 'run-1', '/images/run-1.img')
+    reaper.register('provisioning.example.com', 'run-2', '/images/run-2.img')
+    with reaper._domains() as domains:
+        domains[0]['owner'] = -1
+    mocker.patch.object(
+        vm_reaper, 'process_alive', side_effect=lambda pid: pid != -1)
+    ssh_command.return_value = ssh.SSHCommandResult(
+        stdout=['run-1', 'run-2', 'run-3', 'pool1234', 'other'])
+    reaper.flush(timeout=10)
+    commands = [call[0][0] for call in ssh_command.call_args_list]
+    assert commands[0] == 'virsh list --all --name'
+    destroyed = ' '.join(commands[1:])
+    assert 'virsh undefine run-1 ' in destroyed
+    assert 'virsh undefine run-3 ' in destroyed
+    for name in ('run-2', 'pool1234', 'other'):
+        assert name not in destroyed
+    assert read_registry(reaper) == ['run-2']
+
+
+def test_virtual_machine_destroy(mocker, ssh_command):
+    """Virtual machines are destroyed by the reaper when enabled"""
+    settings = mocker.patch('robottelo.vm.settings')
+    settings.distro.image_el7 = 'rhel73'
+    reaper = mocker.Mock()
+    mocker.patch('robottelo.vm.get_reaper', return_value=reaper)
+    vm = VirtualMachine(
+        distro='rhel7', provisioning_server='provisioning.example.com',
+        image_dir='/images', tag='test')
+    vm._created = True
+    vm.destroy()
+    reaper.destroy.assert_called_once_with(
+        'provisioning.example.com', vm.target_image,
+        '/images/{0}.img'.format(vm.target_image), snapshots=False)
+    assert ssh_command.call_count == 0
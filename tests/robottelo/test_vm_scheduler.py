@@ -0,0 +1,145 @@
+"""Tests for module ``robottelo.vm_scheduler``."""
+import os
+
+import pytest
+
+from robottelo import ssh
+from robottelo.vm import VirtualMachine
+from robottelo.vm_scheduler import ProvisioningScheduler, SchedulerError
+
+#: Measured capacities of the fake hosts
+CAPACITIES = {
+    'provisioning1.example.com': ['4', '1.50', '12288', '51200'],
+    'provisioning2.example.com': ['4', '0.20', '14336', '51200'],
+}
+
+
+@pytest.fixture
+def scheduler(tmpdir):
+    """Return a scheduler storing its reservations in a temporary
+    directory.
+    """
+    return ProvisioningScheduler(state_dir=str(tmpdir))
+
+
+@pytest.fixture
+def ssh_command(mocker):
+    """Mock the capacity measurements of the fake hosts."""
+    def command_mock(cmd, hostname, **kwargs):
+        return ssh.SSHCommandResult(stdout=CAPACITIES.get(hostname, []))
+
+    return mocker.patch('robottelo.ssh.command', side_effect=command_mock)
+
+
+def test_capacity(scheduler, ssh_command):
+    """Capacities are measured with one command and cached"""
+    capacity = scheduler.capacity('provisioning1.example.com', '/opt/images')
+    assert (capacity.cpus, capacity.load, capacity.ram, capacity.disk) == (
+        4, 1.5, 12288, 51200)
+    assert u'df -Pm /opt/images' in ssh_command.call_args[0][0]
+    assert scheduler.capacity(
+        'provisioning1.example.com', '/opt/images') is capacity
+    assert ssh_command.call_count == 1
+    assert scheduler.capacity('unknown.example.com', '/opt/images') is None
+
+
+def test_admit_spread(scheduler, ssh_command):
+    """Virtual machines go to the host with the most RAM headroom"""
+    hosts = sorted(CAPACITIES)
+    admissions = [
+        scheduler.admit(hosts, '/opt/images', 1, 5120, 2048)
+        for _ in range(4)
+    ]
+    assert [admission.host for admission in admissions] == [
+        'provisioning2.example.com',
+        'provisioning1.example.com',
+        'provisioning2.example.com',
+        'provisioning1.example.com',
+    ]
+    with pytest.raises(SchedulerError):
+        scheduler.admit(hosts, '/opt/images', 1, 5120, 2048, timeout=0)
+    scheduler.complete(admissions[0])
+    assert scheduler.admit(
+        hosts, '/opt/images', 1, 5120, 2048, timeout=0).host == (
+        'provisioning2.example.com')
+
+
+def test_admit_cpu(scheduler, ssh_command):
+    """Hosts without CPU headroom are not used"""
+    admission = scheduler.admit(
+        ['provisioning1.example.com'], '/opt/images', 6, 512, 2048)
+    assert admission.host == 'provisioning1.example.com'
+    with pytest.raises(SchedulerError):
+        scheduler.admit(
+            ['provisioning1.example.com'], '/opt/images', 1, 512, 2048,
+            timeout=0)
+
+
+def test_admit_unmeasured(scheduler, ssh_command):
+    """Without any measured capacity the first host is used"""
+    admission = scheduler.admit(
+        ['unknown.example.com'], '/opt/images', 64, 1048576, 2048)
+    assert admission.host == 'unknown.example.com'
+
+
+def test_report(scheduler, ssh_command):
+    """Queue wait and boot time are summed up per host"""
+    hosts = ['provisioning2.example.com']
+    scheduler.complete(scheduler.admit(hosts, '/opt/images', 1, 512, 2048))
+    scheduler.complete(
+        scheduler.admit(hosts, '/opt/images', 1, 512, 2048), booted=False)
+    metrics = scheduler.metrics['provisioning2.example.com']
+    assert (metrics['admitted'], metrics['failed']) == (2, 1)
+    assert scheduler.report().startswith(
+        u'provisioning2.example.com: 2 virtual machines (1 failed), '
+        u'queue wait avg')
+
+
+def test_report_shared(scheduler, tmpdir, ssh_command):
+    """Metrics recorded by all the schedulers sharing the state are reported
+    """
+    hosts = ['provisioning2.example.com']
+    other = ProvisioningScheduler(state_dir=str(tmpdir))
+    scheduler.complete(scheduler.admit(hosts, '/opt/images', 1, 512, 2048))
+    other.complete(other.admit(hosts, '/opt/images', 1, 512, 2048))
+    assert other.metrics == scheduler.metrics
+    assert scheduler.report().startswith(
+        u'provisioning2.example.com: 2 virtual machines (0 failed)')
+    other.reset_metrics()
+    assert scheduler.report() == u''
+
+
+def test_reservations_after_fork(scheduler, mocker):
+    """Forked processes do not wait for the locks held by the parent"""
+    scheduler._lock.acquire()
+    mocker.patch('os.getpid', return_value=os.getpid() + 1)
+    with scheduler._reservations() as reservations:
+        assert reservations == []
+
+
+def test_virtual_machine_scheduled(scheduler, mocker):
+    """Default virtual machines are spread across the provisioning
+    servers
+    """
+    settings = mocker.patch('robottelo.vm.settings')
+    settings.distro.image_el7 = 'rhel73'
+    settings.clients.provisioning_server = 'provisioning1.example.com'
+    settings.clients.provisioning_servers = sorted(CAPACITIES)
+    settings.clients.image_dir = '/opt/images'
+    mocker.patch('robottelo.vm.get_vm_pool', return_value=None)
+    mocker.patch('robottelo.vm.get_scheduler', return_value=scheduler)
+    admit = mocker.patch.object(scheduler, 'admit')
+    admit.return_value.host = 'provisioning2.example.com'
+    complete = mocker.patch.object(scheduler, 'complete')
+
+    def boot_mock(vm):
+        vm.ip_addr = '192.168.0.1'
+
+    mocker.patch.object(
+        VirtualMachine, '_boot', side_effect=boot_mock, autospec=True)
+    vm = VirtualMachine(distro='rhel7')
+    vm.create()
+    assert admit.call_args[0] == (
+        sorted(CAPACITIES), '/opt/images', 1, 512, 2048)
+    assert vm.provisioning_server == 'provisioning2.example.com'
+    complete.assert_called_once_with(admit.return_value, booted=True)